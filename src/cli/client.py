@@ -0,0 +1,23 @@
+""" Entry point of the cid program. Forward the command to the cid daemon when
+one is running, otherwise run it in this process. Only the standard library and
+util.daemon are imported before knowing which, to keep forwarded commands fast.
+"""
+import sys
+from util.daemon import DaemonClient
+
+
+def main() -> None:
+    """ Run the cid command given on the command line
+    """
+    argv = sys.argv[1:]
+    # the daemon commands manage the daemon itself, always run them here
+    if not argv or argv[0] != 'daemon':
+        try:
+            exit_code = DaemonClient().run(argv)
+        except KeyboardInterrupt:
+            # the daemon interrupts the command when the connection is closed
+            sys.exit(130)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    from cli.__main__ import cid  # pylint: disable=import-outside-toplevel
+    cid()  # pylint: disable=no-value-for-parameter
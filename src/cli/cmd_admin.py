@@ -0,0 +1,93 @@
+""" Administration commands of the docker hosts running the pipelines
+"""
+import signal
+import sys
+import time
+import click
+from util.common_utils import (get_logger, parse_duration, parse_size)
+from controller.controller import (Controller)
+import util.constant as c
+
+logger = get_logger('cli.cmd_admin')
+
+
+@click.group()
+def admin():
+    """Maintain the docker hosts running the pipelines
+    """
+
+
+def _to_duration(_ctx, param, value) -> float | None:
+    """ Convert a duration option, i.e. 90, 30m or 2h, to a number of seconds """
+    if value is None:
+        return None
+    seconds = parse_duration(value)
+    if seconds is None or seconds <= 0:
+        raise click.BadParameter("must be a positive duration, i.e. 90, 30m or 2h",
+                                 param=param)
+    return seconds
+
+
+def _to_size(_ctx, param, value) -> int | None:
+    """ Convert a size option, i.e. 500m or 20g, to a number of bytes """
+    if value is None:
+        return None
+    size = parse_size(value)
+    if size is None:
+        raise click.BadParameter("must be a size, i.e. 500m or 20g", param=param)
+    return size
+
+
+@admin.command()
+@click.option('--local', 'local', is_flag=True,
+              help='collect the local docker engine instead of the docker hosts in '
+              'CID_DOCKER_HOSTS')
+@click.option('--max-age', 'max_age', default=f"{c.DEFAULT_GC_MAX_AGE // 3600}h",
+              callback=_to_duration,
+              help='age of the run volumes and dangling images to remove, i.e. 90, 30m '
+              'or 2h. Default to 24h')
+@click.option('--disk-budget', 'disk_budget', default=None, callback=_to_size,
+              help='disk each docker engine may use, i.e. 20g. The oldest unused run '
+              'volumes are removed until the engine fits')
+@click.option('--dry-run', 'dry_run', is_flag=True,
+              help='only list the resources to remove')
+@click.option('--every', 'every', default=None, callback=_to_duration,
+              help='keep collecting at this interval, i.e. 1h, until stopped')
+def gc(local: bool, max_age: float, disk_budget: int, dry_run: bool, every: float):
+    """
+    Remove the docker resources left by crashed or failed runs: the job
+    containers orphaned by their run, the run volumes and dangling images
+    older than the maximum age, then the oldest run volumes over the disk
+    budget. The volume of a failed run can be resumed until it is removed.
+    With --every, keep sweeping the hosts until stopped with Ctrl+C or SIGTERM. \f
+
+    Example usage:
+
+    $ cid admin gc --max-age 12h --disk-budget 50g
+
+    $ cid admin gc --every 1h &
+
+    Args:
+        local (bool, optional): If True, collect the local docker engine. Default False.
+        max_age (float, optional): seconds before a volume or image is stale. Default 24h.
+        disk_budget (int, optional): bytes each engine may use. Default None.
+        dry_run (bool, optional): If True, only list the resources. Default False.
+        every (float, optional): seconds between two collections. Default None for once.
+    """
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    controller = Controller()
+    try:
+        while True:
+            status, message = controller.collect_garbage(local=local, max_age=max_age,
+                                                         disk_budget=disk_budget,
+                                                         dry_run=dry_run)
+            logger.debug("gc status: %s, ", status)
+            click.secho(message, fg='green' if status else 'red')
+            if every is None:
+                break
+            time.sleep(every)
+    except KeyboardInterrupt:
+        click.echo("cid admin gc stopped")
+        return
+    if not status:
+        sys.exit(1)
@@ -4,8 +4,10 @@
 import os
 import pprint
 import sys
+import time
 import click
 from util.common_utils import (get_logger, ConfigOverride)
+from util.file_watcher import FileWatcher
 from controller.controller import Controller
 import util.constant as c
 
@@ -31,7 +33,11 @@ logger = get_logger('cli.cmd_config')
               help="specify the directory to check all configuration files.\
                   used with --check-all flag")
 @click.option('--json', is_flag=True, help="output in json format")
-def config(ctx, check: bool, check_all: bool, no_set: bool, config_file: str, dir: str, json:bool):
+@click.option('--watch', is_flag=True,
+              help="keep running, re-validate and dry-run each configuration file in --dir \
+                  when it changes. Implies --no-set")
+def config(ctx, check: bool, check_all: bool, no_set: bool, config_file: str, dir: str, json:bool,
+           watch: bool):
     """
     Command working with pipeline and repo configurations
 
@@ -62,6 +68,10 @@ def config(ctx, check: bool, check_all: bool, no_set: bool, config_file: str, di
     To check config files in a directory only without repo set up and saving:
 
     $ cid config --check-all --dir <absolute path to directory> --no-set
+
+    To re-validate and dry-run the config files in a directory while editing them:
+
+    $ cid config --watch --dir <directory>
     """
     # If subcommand is called return so it called the subcommand instead
     if ctx.invoked_subcommand is not None:
@@ -80,6 +90,13 @@ def config(ctx, check: bool, check_all: bool, no_set: bool, config_file: str, di
 
     controller = Controller()
 
+    if watch:
+        if not os.path.isdir(dir):
+            click.secho(f"Invalid directory:{dir}", fg='red')
+            sys.exit(2)
+        _watch_configs(controller, dir, json)
+        return
+
     repo_details = None
     if not no_set:
         # Check repo only if required saving
@@ -174,6 +191,58 @@ def config(ctx, check: bool, check_all: bool, no_set: bool, config_file: str, di
             click.secho(err_msg, fg='red')
             sys.exit(1)
 
+def _watch_configs(controller: Controller, directory: str, json_output: bool) -> None:
+    """ Validate every configuration file in the directory, then keep re-validating
+    and printing the dry run of each file when it changes, until interrupted.
+    The controller is kept for the whole session, so unchanged files and unchanged
+    jobs are served from its config cache and validation memo.
+
+    Args:
+        controller (Controller): controller used for validation
+        directory (str): configuration directory to watch
+        json_output (bool): print the processed config in json instead of the dry run
+    """
+    try:
+        with FileWatcher(directory) as watcher:
+            mode = 'inotify' if watcher.uses_inotify else 'polling'
+            click.echo(f"watching config files in directory {directory} ({mode}), "
+                       "press Ctrl+C to stop")
+            for file_path in watcher.get_files():
+                _check_watched_file(controller, file_path, json_output)
+            while True:
+                for file_path in sorted(watcher.wait()):
+                    _check_watched_file(controller, file_path, json_output)
+    except KeyboardInterrupt:
+        click.echo("stopped watching")
+
+
+def _check_watched_file(controller: Controller, file_path: str, json_output: bool) -> None:
+    """ Validate a single configuration file and print its dry run
+
+    Args:
+        controller (Controller): controller used for validation
+        file_path (str): path of the configuration file
+        json_output (bool): print the processed config in json instead of the dry run
+    """
+    if not os.path.isfile(file_path):
+        click.secho(f"\n{file_path} removed", fg='yellow')
+        return
+    start = time.perf_counter()
+    passed, err, pipeline_info = controller.validate_config(file_path)
+    elapsed = (time.perf_counter() - start) * 1000
+    if not passed:
+        click.secho(f"\n{file_path}: {c.STATUS_FAILED} ({elapsed:.0f} ms)", fg='red')
+        click.secho(err, fg='red')
+        return
+    click.secho(f"\n{file_path}: passed ({elapsed:.0f} ms)", fg='green')
+    if json_output:
+        click.echo(pipeline_info.pipeline_config.model_dump_json(by_alias=True, indent=2))
+    else:
+        _, dry_run_msg = controller.dry_run(
+            pipeline_info.pipeline_config.model_dump(by_alias=True), False)
+        click.echo(dry_run_msg)
+
+
 @config.command()
 @click.argument('repo_url', required=True)
 @click.option('--branch', default=c.DEFAULT_BRANCH, help="Specify the branch to retrieve.\
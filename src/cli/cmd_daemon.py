@@ -0,0 +1,90 @@
+""" All related commands for the resident cid daemon
+"""
+import signal
+import sys
+import click
+from util.common_utils import get_logger
+from util.daemon import (DaemonClient, DaemonServer, warm_up)
+import util.constant as c
+
+logger = get_logger('cli.cmd_daemon')
+
+
+@click.group()
+def daemon():
+    """Run cid as a resident daemon serving the other cid commands
+
+    The daemon keeps the program and its backends loaded. While it is running,
+    every cid command is forwarded to it over a local Unix socket, set with the
+    CID_DAEMON_SOCKET environment variable (default ~/.cid/cid.sock). Commands
+    run in-process as usual when no daemon is running.
+    """
+
+
+@daemon.command()
+@click.pass_context
+def start(ctx):
+    """
+    Start the daemon in the foreground, until stopped with Ctrl+C,
+    SIGTERM or `cid daemon stop`.
+
+    Example usage:
+
+    $ cid daemon start &
+    """
+    root_command = ctx.find_root().command
+
+    def run_command(argv: list) -> int:
+        return root_command.main(args=argv, prog_name='cid')
+
+    server = DaemonServer(run_command)
+    try:
+        server.bind()
+    except (RuntimeError, OSError) as e:
+        click.secho(str(e), fg='red')
+        sys.exit(2)
+    warm_up()
+    signal.signal(signal.SIGTERM, lambda *_: server.stop())
+    click.echo(f"cid daemon listening on {server.socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    click.echo("cid daemon stopped")
+
+
+@daemon.command()
+def stop():
+    """
+    Stop the running daemon, commands already started are completed.
+
+    Example usage:
+
+    $ cid daemon stop
+    """
+    response = DaemonClient().request(c.DAEMON_ACTION_STOP)
+    if response is None:
+        click.echo("cid daemon is not running")
+        sys.exit(1)
+    click.echo(f"cid daemon (pid {response[c.DAEMON_FIELD_PID]}) stopping")
+
+
+@daemon.command()
+def status():
+    """
+    Show if the daemon is running and how many commands it served.
+
+    Example usage:
+
+    $ cid daemon status
+    """
+    client = DaemonClient()
+    response = client.request(c.DAEMON_ACTION_STATUS)
+    if response is None:
+        click.echo("cid daemon is not running")
+        sys.exit(1)
+    click.echo(f"cid daemon running on {client.socket_path}")
+    click.echo(f"pid: {response[c.DAEMON_FIELD_PID]}")
+    click.echo(f"uptime: {response[c.DAEMON_FIELD_UPTIME]:.0f} s")
+    click.echo(f"commands served: {response[c.DAEMON_FIELD_SERVED]}")
+    click.echo(f"commands running: {response[c.DAEMON_FIELD_RUNNING]}")
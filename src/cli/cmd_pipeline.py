@@ -28,15 +28,42 @@ file path. if --file not specified, default to .cicd-pipelines/pipelines.yml')
 local directory path')
 @click.option('-b', '--branch', 'branch', default=None, help='repository branch name')
 @click.option('-c', '--commit', 'commit', default=None, help='commit hash')
-@click.option('--local', 'local', help='run pipeline locally', is_flag=True)
+@click.option('--local', 'local', is_flag=True,
+              help='run pipeline on the local docker engine instead of the docker hosts in '
+              'CID_DOCKER_HOSTS')
 @click.option('--dry-run', 'dry_run', help='dry-run options to simulate the pipeline \
 process', is_flag=True)
 @click.option('--yaml', 'yaml_output',
               help='print validated config in yaml format for dry run', is_flag=True)
 @click.option('--override', 'overrides', multiple=True,
               help="Override configuration in 'key=value' format")
+@click.option('--worktree', 'worktree', is_flag=True, help='run the branch / commit in a \
+separate git worktree, without changing the current checkout')
+@click.option('--commits', 'commit_range', default=None, help='run once per commit in the \
+range A..B, oldest first')
+@click.option('--commit-list', 'commit_list', default=None, type=click.File('r'),
+              help='file with one commit hash per line to run')
+@click.option('--parallel', 'parallel', default=1, type=click.IntRange(min=1),
+              help='number of commits to run at the same time for --commits/--commit-list')
+@click.option('--strategy', 'strategy', default=c.BATCH_BACKFILL,
+              type=click.Choice([c.BATCH_BACKFILL, c.BATCH_BISECT]),
+              help='backfill run every commit, bisect find the first failing commit')
+@click.option('--all', 'run_all', is_flag=True,
+              help='run all the pipelines of the repository concurrently')
+@click.option('--pipelines', 'pipeline_names', default=None,
+              help='comma separated pipeline names to run concurrently, i.e. a,b,c')
+@click.option('--max-containers', 'max_containers', default=None, type=click.IntRange(min=1),
+              help='maximum containers running at the same time on each docker host, for \
+--all/--pipelines and --commits/--commit-list. Default to CID_MAX_CONTAINERS or 4')
+@click.option('--enqueue', 'enqueue', is_flag=True,
+              help='add the run to the job queue for `cid runner` instead of running it')
+@click.option('--resume', 'resume', default=None, type=click.IntRange(min=1),
+              help='resume the failed or cancelled run RUN_NUMBER, from its first incomplete \
+job', metavar='RUN_NUMBER')
 def run(ctx, file_path: str, pipeline_name: str, repo: str, branch: str, commit: str, local: bool,
-        dry_run: bool, yaml_output: bool, overrides):
+        dry_run: bool, yaml_output: bool, overrides, worktree: bool, commit_range: str,
+        commit_list, parallel: int, strategy: str, run_all: bool, pipeline_names: str,
+        max_containers: int, enqueue: bool, resume: int):
     """ Run pipeline given the configuration file. Base command is cid pipeline run, this will
     run the pipeline specified in .cicd-pipelines/pipelines.yml for current repository or 
     previously set repository. 
@@ -57,6 +84,20 @@ def run(ctx, file_path: str, pipeline_name: str, repo: str, branch: str, commit:
         dry_run (bool, optional): If True, plan the pipeline without creating. Default False.
         yaml_output (bool, optional): If True, print output in yaml format. Default False.
         overrides (any, optional): override key/value of the config file for this run only.
+        worktree (bool, optional): If True, run in an isolated worktree of the current
+        repository. Default False.
+        commit_range (str, optional): commit range A..B to run once per commit. Default None.
+        commit_list (File, optional): file listing the commits to run. Default None.
+        parallel (int, optional): number of concurrent runs for a batch run. Default 1.
+        strategy (str, optional): batch strategy, backfill or bisect. Default backfill.
+        run_all (bool, optional): If True, run all the pipelines concurrently. Default False.
+        pipeline_names (str, optional): comma separated pipelines to run concurrently.
+        Default None.
+        max_containers (int, optional): container limit shared by the pipelines run
+        concurrently. Default None.
+        enqueue (bool, optional): If True, queue the run for a cid runner. Default False.
+        resume (int, optional): run number of a failed or cancelled run to resume.
+        Default None.
     """
     source_pipeline = ctx.get_parameter_source("pipeline_name")
     filepath_pipeline = ctx.get_parameter_source("file_path")
@@ -86,6 +127,31 @@ def run(ctx, file_path: str, pipeline_name: str, repo: str, branch: str, commit:
         if not os.path.isfile(file_path):
             click.echo(f"Invalid config_file_path: {ori_file_path}")
             sys.exit(2)
+        if worktree or commit_range or commit_list:
+            # resolve the file within the worktree instead of current checkout
+            file_path = os.path.relpath(file_path)
+
+    if worktree and repo:
+        click.secho("cid: invalid flag. --worktree can't be used with --repo.", fg='red')
+        sys.exit(2)
+    batch = commit_range is not None or commit_list is not None
+    if batch and (commit or (commit_range and commit_list)):
+        message = "cid: invalid flag. you can only pass one of --commit, --commits "
+        message += "or --commit-list."
+        click.secho(message, fg='red')
+        sys.exit(2)
+
+    if enqueue and batch:
+        message = "cid: invalid flag. --enqueue can't be used with --commits or --commit-list."
+        click.secho(message, fg='red')
+        sys.exit(2)
+
+    multi = run_all or pipeline_names is not None
+    if resume is not None and (batch or enqueue or overrides or multi):
+        message = "cid: invalid flag. --resume can't be used with --override, --enqueue, "
+        message += "--all, --pipelines, --commits or --commit-list."
+        click.secho(message, fg='red')
+        sys.exit(2)
 
     if overrides:
         try:
@@ -98,7 +164,89 @@ def run(ctx, file_path: str, pipeline_name: str, repo: str, branch: str, commit:
         # empty override will be an empty tuple.
         overrides = None
 
+    if multi:
+        if run_all and pipeline_names is not None:
+            click.secho("cid: invalid flag. you can only pass --all or --pipelines.", fg='red')
+            sys.exit(2)
+        if (source_pipeline != click.core.ParameterSource.DEFAULT or
+                filepath_pipeline != click.core.ParameterSource.DEFAULT or batch or worktree):
+            message = "cid: invalid flag. --all and --pipelines can't be used with --file, "
+            message += "--pipeline, --worktree, --commits or --commit-list."
+            click.secho(message, fg='red')
+            sys.exit(2)
+        if pipeline_names is not None:
+            pipeline_names = [name.strip() for name in pipeline_names.split(',') if name.strip()]
+            if not pipeline_names:
+                click.secho("cid: invalid flag. --pipelines requires pipeline names.", fg='red')
+                sys.exit(2)
+
     controller = Controller()
+    if multi:
+        _run_multi(controller, repo, branch, commit, pipeline_names, dry_run=dry_run,
+                   local=local, yaml_output=yaml_output, override_configs=overrides,
+                   max_containers=max_containers, enqueue=enqueue)
+        return
+    if batch:
+        _run_batch(controller, repo, branch, commit_range, commit_list, parallel, strategy,
+                   config_file=file_path, pipeline_name=pipeline_name, dry_run=dry_run,
+                   local=local, yaml_output=yaml_output, override_configs=overrides,
+                   max_containers=max_containers)
+        return
+
+    worktree_path = None
+    if worktree:
+        status, message, repo_details, worktree_path = controller.acquire_worktree(
+            branch=branch,
+            commit_hash=commit
+        )
+    else:
+        status, message, repo_details = controller.handle_repo(
+            repo_url=repo,
+            branch=branch,
+            commit_hash=commit
+        )
+    if not status:
+        click.secho(message, fg='red')
+        sys.exit(2)
+    click.secho(message, fg='green')
+
+    try:
+        status, message = controller.run_pipeline(
+            config_file=file_path,
+            pipeline_name=pipeline_name,
+            dry_run=dry_run,
+            git_details=repo_details,
+            local=local,
+            yaml_output=yaml_output,
+            override_configs=overrides,
+            repo_path=worktree_path,
+            enqueue=enqueue,
+            resume=resume)
+    finally:
+        if worktree_path:
+            controller.release_worktree(worktree_path)
+
+    logger.debug("pipeline run status: %s, ", status)
+    if status:
+        click.secho(f"{message}", fg='green')
+    else:
+        click.secho(f"{message}", fg='red')
+        sys.exit(1)
+
+
+def _run_multi(controller: Controller, repo: str, branch: str, commit: str,
+               pipeline_names: list | None, **run_options) -> None:
+    """ Run several pipelines of the same repository and commit concurrently,
+    and exit with the overall status.
+
+    Args:
+        controller (Controller): controller to run the pipelines
+        repo (str): repository url or local directory path, None for current repository
+        branch (str): branch name of the repository
+        commit (str): commit hash
+        pipeline_names (list | None): pipelines to run, None for all the pipelines
+        **run_options: options passed to Controller.run_pipelines
+    """
     status, message, repo_details = controller.handle_repo(
         repo_url=repo,
         branch=branch,
@@ -109,20 +257,54 @@ def run(ctx, file_path: str, pipeline_name: str, repo: str, branch: str, commit:
         sys.exit(2)
     click.secho(message, fg='green')
 
-    status, message = controller.run_pipeline(
-        config_file=file_path,
-        pipeline_name=pipeline_name,
-        dry_run=dry_run,
-        git_details=repo_details,
-        local=local,
-        yaml_output=yaml_output,
-        override_configs=overrides)
+    status, message = controller.run_pipelines(pipeline_names, repo_details, **run_options)
+    logger.debug("multi pipeline run status: %s, ", status)
+    if status:
+        click.secho(message, fg='green')
+    else:
+        click.secho(message, fg='red')
+        sys.exit(1)
 
-    logger.debug("pipeline run status: %s, ", status)
+
+def _run_batch(controller: Controller, repo: str, branch: str, commit_range: str,
+               commit_list, parallel: int, strategy: str, **run_options) -> None:
+    """ Run the pipeline across the commits of a range or a commit list file,
+    and exit with the batch status.
+
+    Args:
+        controller (Controller): controller to run the pipelines
+        repo (str): repository url or path to clone first, None for current repository
+        branch (str): branch of the commits
+        commit_range (str): commit range A..B
+        commit_list (File): opened file listing the commits
+        parallel (int): number of concurrent runs
+        strategy (str): backfill or bisect
+        **run_options: options passed to each pipeline run
+    """
+    if repo:
+        # The repository is cloned once, then each commit use its own worktree
+        status, message, _ = controller.handle_repo(repo_url=repo, branch=branch)
+        if not status:
+            click.secho(message, fg='red')
+            sys.exit(2)
+    revisions = None
+    if commit_list is not None:
+        revisions = [line.strip() for line in commit_list
+                     if line.strip() and not line.strip().startswith('#')]
+    status, message, commits = controller.resolve_commits(
+        rev_range=commit_range, revisions=revisions)
+    if not status:
+        click.secho(message, fg='red')
+        sys.exit(2)
+    click.secho(message, fg='green')
+
+    status, message = controller.run_pipeline_batch(
+        commits, branch=branch, strategy=strategy, parallel=parallel, **run_options)
+    logger.debug("batch run status: %s, ", status)
     if status:
-        click.secho(f"{message}", fg='green')
+        click.secho(message, fg='green')
     else:
-        click.secho(f"{message}", fg='red')
+        click.secho(message, fg='red')
         sys.exit(1)
 
 
@@ -0,0 +1,54 @@
+""" Command to run the pipeline runs queued with `cid pipeline run --enqueue`
+"""
+import signal
+import sys
+import click
+from util.common_utils import get_logger
+from controller.controller import (Controller)
+
+logger = get_logger('cli.cmd_runner')
+
+
+@click.command()
+@click.option('--name', 'name', default=None,
+              help='name of the runner, default to <hostname>-<pid>')
+@click.option('--local', 'local', is_flag=True,
+              help='run on the local docker engine instead of the docker hosts in '
+              'CID_DOCKER_HOSTS')
+@click.option('--concurrency', 'concurrency', default=1, type=click.IntRange(min=1),
+              help='number of pipeline runs at the same time')
+@click.option('--max-containers', 'max_containers', default=None, type=click.IntRange(min=1),
+              help='maximum containers running at the same time on each docker host. \
+Default to CID_MAX_CONTAINERS or 4')
+@click.option('--once', 'once', is_flag=True,
+              help='stop when the queue is empty instead of waiting for new runs')
+def runner(name: str, local: bool, concurrency: int, max_containers: int, once: bool):
+    """
+    Run the pipeline runs queued with `cid pipeline run --enqueue`, until
+    stopped with Ctrl+C or SIGTERM. Start more runners, on any machine
+    reaching the same MongoDB, to run more pipelines at the same time. The
+    runs of a runner that crashed are claimed again by the other runners
+    once their lease expires. \f
+
+    Example usage:
+
+    $ cid runner --concurrency 2
+
+    Args:
+        name (str, optional): name of the runner. Default None for <hostname>-<pid>.
+        local (bool, optional): If True, run on the local docker engine. Default False.
+        concurrency (int, optional): number of runs at the same time. Default 1.
+        max_containers (int, optional): container limit of each docker host. Default None.
+        once (bool, optional): If True, stop when the queue is empty. Default False.
+    """
+    # stop the runs and record them as cancelled, as with Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    controller = Controller()
+    status, message = controller.run_runner(name=name, local=local, concurrency=concurrency,
+                                            max_containers=max_containers, once=once)
+    logger.debug("runner status: %s, ", status)
+    if status:
+        click.secho(message, fg='green')
+    else:
+        click.secho(message, fg='red')
+        sys.exit(1)
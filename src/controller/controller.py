@@ -4,29 +4,84 @@
 """
 
 from datetime import datetime
-import copy
+import asyncio
 import os
-import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
 from pathlib import Path
 
 import click
-from docker.errors import DockerException
 from pydantic import ValidationError
 from ruamel.yaml import YAMLError
 import util.constant as c
-from util.container import (DockerManager)
-from util.model import (JobLog, SessionDetail, PipelineConfig,
-                        ValidatedStage, PipelineInfo, PipelineHist)
+from util.model import (SessionDetail, PipelineConfig, ValidationResult,
+                        PipelineInfo, PipelineHist)
 from util.common_utils import (
-    get_logger, ConfigOverride, DryRun, PipelineReport)
+    get_logger, get_cpu_count, ConfigOverride, DryRun, PipelineReport, LazyModule)
 from util.repo_manager import (RepoManager)
 from util.db_mongo import (MongoAdapter)
 from util.yaml_parser import YamlParser
+from util.config_cache import ConfigCache
 from util.config_tools import (ConfigChecker)
+from util.docker_pool import (DockerHostPool)
+from util.docker_gc import (DockerGarbageCollector)
+from controller.scheduler import (RunScheduler)
+from controller.runner import (QueueRunner)
 
 # pylint: disable=logging-fstring-interpolation
 # pylint: disable=logging-not-lazy
 
+# docker is only needed once a pipeline actually runs
+docker = LazyModule('docker')
+
+
+def _validate_config_file(pipeline_name: str | None, file_path: str, parser: YamlParser = None,
+                          config_checker: ConfigChecker = None,
+                          override_configs: dict = None) -> tuple[str, ValidationResult]:
+    """ Parse and validate a single configuration file. Defined at module level so it
+    can be dispatched to the worker processes of Controller.validate_n_save_configs.
+    The file is first loaded without lines and columns information, which is much
+    faster. Only when the validation fail, the file is parsed again in round-trip mode
+    and validated again so the error messages point to the lines and columns.
+
+    Args:
+        pipeline_name (str | None): pipeline_name declared in the file,
+            None to read it from the file.
+        file_path (str): path of the configuration file
+        parser (YamlParser, optional): parser to use. Defaults to a new YamlParser.
+        config_checker (ConfigChecker, optional): checker to use.
+            Defaults to a new ConfigChecker.
+        override_configs (dict, optional): override to apply before validation.
+            Defaults to None.
+
+    Returns:
+        tuple[str, ValidationResult]: pipeline_name and validation result,
+        the result is invalid if the file cannot be parsed
+    """
+    parser = parser or YamlParser()
+    config_checker = config_checker or ConfigChecker()
+    pipeline_file_name = os.path.basename(file_path)
+    result = None
+    try:
+        for track_lc in (False, True):
+            pipeline_config = parser.parse_yaml_file(file_path, track_lc=track_lc)
+            if pipeline_name is None:
+                pipeline_name = pipeline_config[c.KEY_GLOBAL][c.KEY_PIPE_NAME]
+            if override_configs:
+                pipeline_config = ConfigOverride.apply_overrides(pipeline_config,
+                                                                 override_configs)
+            result = config_checker.validate_config(pipeline_name, pipeline_config,
+                                                    pipeline_file_name, error_lc=track_lc)
+            if result.valid:
+                break
+    except (FileNotFoundError, YAMLError) as e:
+        return pipeline_name, ValidationResult(valid=False, error_msg=str(e), pipeline_config={})
+    except (KeyError, TypeError):
+        error_msg = f"{pipeline_file_name}: missing {c.KEY_GLOBAL}.{c.KEY_PIPE_NAME}"
+        return pipeline_name, ValidationResult(valid=False, error_msg=error_msg,
+                                               pipeline_config={})
+    return pipeline_name, result
+
 
 class Controller:
     """Controller class that integrates the CLI with the other class components"""
@@ -38,6 +93,22 @@ class Controller:
         self.mongo_ds = MongoAdapter()
         self.config_checker = ConfigChecker()
         self.logger = get_logger('cli.controller')
+        self.scheduler = RunScheduler(self.mongo_ds, self.repo_manager)
+        # Guard the validation shared by concurrent runs
+        self._validate_lock = threading.Lock()
+        self._config_cache = None
+
+    @property
+    def config_cache(self) -> ConfigCache:
+        """ Cache of parsed and validated configurations, configured from the
+        environment on first use.
+
+        Returns:
+            ConfigCache: the config cache
+        """
+        if self._config_cache is None:
+            self._config_cache = ConfigCache.from_env()
+        return self._config_cache
 
     def handle_repo(self, repo_url: str = None,
                     branch: str = None,
@@ -294,17 +365,70 @@ class Controller:
         return False, ("Working directory is not a git repository. "
                        "No previous repository has been set."), None
 
+    def acquire_worktree(self, branch: str = None, commit_hash: str = None
+                         ) -> tuple[bool, str, SessionDetail | None, str | None]:
+        """
+        Materialize the branch and commit of the current repository into an isolated
+        worktree, leaving the developer's checkout untouched. The worktree must be
+        released with release_worktree once the run ends.
+
+        Args:
+            branch (str, optional): The branch to use. Defaults to the current branch.
+            commit_hash (str, optional): Specific commit hash. Defaults to the latest commit.
+
+        Returns:
+            tuple: (bool, str, SessionDetail | None, str | None)
+                - bool: True if successful, False otherwise.
+                - str: Message about the result.
+                - SessionDetail or None: Repository details of the worktree.
+                - str or None: path of the worktree.
+        """
+        status, message, details = self.repo_manager.acquire_worktree(
+            branch=branch, commit_hash=commit_hash)
+        if not status:
+            return False, message, None, None
+        try:
+            repo_data = SessionDetail.model_validate({
+                c.FIELD_USER_ID: os.getlogin(),
+                c.FIELD_REPO_URL: details[c.FIELD_REPO_URL],
+                c.FIELD_REPO_NAME: details[c.FIELD_REPO_NAME],
+                c.FIELD_BRANCH: details[c.FIELD_BRANCH],
+                c.FIELD_COMMIT_HASH: details[c.FIELD_COMMIT_HASH],
+                c.FIELD_IS_REMOTE: False,
+                c.FIELD_TIME: datetime.now().strftime(c.DATETIME_FORMAT)
+            })
+        except ValidationError as e:
+            self.repo_manager.release_worktree(details["worktree_path"])
+            return False, f"Data validation error: {e}", None, None
+        return True, message, repo_data, details["worktree_path"]
+
+    def release_worktree(self, worktree_path: str) -> bool:
+        """
+        Release a worktree obtained from acquire_worktree.
+
+        Args:
+            worktree_path (str): path of the worktree
+
+        Returns:
+            bool: True if the worktree was removed
+        """
+        return self.repo_manager.release_worktree(worktree_path)
+
     ### CONFIG ###
     def validate_n_save_configs(self,
                                 directory: str,
                                 saving: bool = True,
                                 session_data: SessionDetail = None) -> dict:
-        """ Set Up repo, validate config, and save the config into datastore
+        """ Set Up repo, validate config, and save the config into datastore.
+        Files changed since their last successful validation are validated in worker
+        processes when there are many of them, and all valid pipelines are saved
+        in a single write.
 
         Args:
             directory (str): valid directory containing pipeline configuration
             saving (optional, bool): whether to save the result to db.
             Default to True
+            session_data (SessionDetail, optional): repository the pipelines are saved for.
 
         Raises:
             FileNotFoundError: if the directory does not exist
@@ -313,42 +437,112 @@ class Controller:
         Returns:
             dict: dictionary of {pipeline_name:single validation results}
         """
-        parser = YamlParser()
+        parser = YamlParser(cache=self.config_cache)
+        pipeline_files = parser.get_pipeline_files(directory)
         results = {}
-        pipeline_configs = parser.parse_yaml_directory(directory)
-
-        # Loop through each items
-        for pipeline_name, values in pipeline_configs.items():
-            response = self.config_checker.validate_config(
-                pipeline_name, values.pipeline_config, values.pipeline_file_name, True)
+        pending = []
+        for pipeline_name, file_path in pipeline_files.items():
+            results[pipeline_name] = self._get_cached_validation(file_path)
+            if results[pipeline_name] is None:
+                pending.append((pipeline_name, file_path))
+
+        # responses follow the order of pending whether validated serially or in parallel
+        responses = None
+        if len(pending) >= c.PARALLEL_CHECK_THRESHOLD and get_cpu_count() > 1:
+            responses = self._validate_files_in_processes(pending)
+        if responses is None:
+            with self._validate_lock:
+                responses = [_validate_config_file(pipeline_name, file_path,
+                                                   parser, self.config_checker)[1]
+                             for pipeline_name, file_path in pending]
+        for (pipeline_name, file_path), response in zip(pending, responses):
+            self._store_validation(file_path, pipeline_name, response)
             results[pipeline_name] = response
-            status = response.valid
+        self.config_cache.flush()
 
-            # Perform saving
-            if status and saving:
-                updates = {
+        # Perform saving of all the valid pipelines in a single write
+        pipelines = {}
+        for pipeline_name, response in results.items():
+            if response.valid and saving:
+                pipelines[pipeline_name] = {
                     c.FIELD_PIPELINE_NAME: pipeline_name,
-                    c.FIELD_PIPELINE_FILE_NAME: values.pipeline_file_name,
+                    c.FIELD_PIPELINE_FILE_NAME: os.path.basename(pipeline_files[pipeline_name]),
                     c.FIELD_PIPELINE_CONFIG: response.pipeline_config.model_dump(by_alias=True),
                     c.FIELD_LAST_COMMIT_HASH: session_data.commit_hash
                 }
-                status = self.mongo_ds.update_pipeline_info(
-                    repo_name=session_data.repo_name,
-                    repo_url=session_data.repo_url,
-                    branch=session_data.branch,
-                    pipeline_name=pipeline_name,
-                    updates=updates
-                )
-                if not status:
-                    response.valid = status
-                    response.error_msg = "Fail to save to datastore"
+        if pipelines and not self.mongo_ds.update_pipelines_info(
+                repo_name=session_data.repo_name,
+                repo_url=session_data.repo_url,
+                branch=session_data.branch,
+                pipelines=pipelines):
+            for pipeline_name in pipelines:
+                results[pipeline_name].valid = False
+                results[pipeline_name].error_msg = "Fail to save to datastore"
         return results
 
+    def _validate_files_in_processes(self, pending: list[tuple]) -> list | None:
+        """ Parse and validate configuration files in a pool of worker processes
+
+        Args:
+            pending (list[tuple]): list of (pipeline_name, file_path) to validate
+
+        Returns:
+            list | None: validation results in the order of pending,
+            None if the worker processes cannot be used.
+        """
+        workers = min(get_cpu_count(), len(pending))
+        chunksize = max(1, len(pending) // (workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return [result for _, result in executor.map(
+                    _validate_config_file,
+                    [str(pipeline_name) for pipeline_name, _ in pending],
+                    [file_path for _, file_path in pending],
+                    chunksize=chunksize)]
+        except (OSError, BrokenExecutor) as e:
+            self.logger.warning(f"Fail to validate in worker processes, fallback to serial. {e}")
+            return None
+
+    def _get_cached_validation(self, file_path: str) -> ValidationResult | None:
+        """ Get the validation result of an unchanged configuration file from the cache
+
+        Args:
+            file_path (str): path of the configuration file
+
+        Returns:
+            ValidationResult | None: successful validation result, or None if the file
+            was never validated successfully or changed since.
+        """
+        entry = self.config_cache.lookup(file_path)
+        if entry is None or entry[c.FIELD_PIPELINE_CONFIG] is None:
+            return None
+        try:
+            pipeline_config = PipelineConfig.model_validate(entry[c.FIELD_PIPELINE_CONFIG])
+        except ValidationError:
+            return None
+        self.logger.debug(f"Using cached validation result for {file_path}")
+        return ValidationResult(valid=True, error_msg="", pipeline_config=pipeline_config)
+
+    def _store_validation(self, file_path: str, pipeline_name: str,
+                          result: ValidationResult) -> None:
+        """ Store a successful validation result in the cache. Failed results are not
+        cached so their error messages are always produced from the file.
+
+        Args:
+            file_path (str): path of the configuration file
+            pipeline_name (str): pipeline_name declared in the file
+            result (ValidationResult): validation result of the file without overrides
+        """
+        if result.valid:
+            self.config_cache.store(file_path, pipeline_name,
+                                    result.pipeline_config.model_dump(by_alias=True))
+
     def validate_n_save_config(
         self, file_name: str = None,
         pipeline_name: str = None,
         override_configs: dict = None,
         session_data: SessionDetail = None,
+        repo_path: str = None,
     ) -> tuple[bool, str, PipelineInfo]:
         """ apply overrides if any, validate config, and save the config into datastore.
         The pipeline configuration can come from three sources: (1) file_name,
@@ -358,6 +552,8 @@ class Controller:
             file_name (str, optional): target file_name. Defaults to None.
             pipeline_name (str, optional): target pipeline_name. Defaults to None.
             override_configs (dict, optional): override if any. Defaults to None.
+            repo_path (str, optional): root of the checkout holding the configuration,
+                i.e. a worktree. Defaults to None for the current directory.
 
         Returns:
             tuple[bool, str, PipelineInfo]: First item is indicator for success or fail.
@@ -368,7 +564,7 @@ class Controller:
         error_msg = ""
 
         status, error_msg, pipeline_info = self.validate_config(
-            file_name, pipeline_name, override_configs
+            file_name, pipeline_name, override_configs, repo_path
         )
 
         if not status:
@@ -406,7 +602,8 @@ class Controller:
     def validate_config(self,
                         file_name: str = None,
                         pipeline_name: str = None,
-                        override_configs: dict = None
+                        override_configs: dict = None,
+                        repo_path: str = None
                         ) -> tuple[bool, str, PipelineInfo]:
         """ Apply override if any and Validate a single configuration file.
         The pipeline configuration can come from three sources: (1) file_name,
@@ -416,54 +613,56 @@ class Controller:
             file_name (str, optional): target file_name. Defaults to None.
             pipeline_name (str, optional): target pipeline_name. Defaults to None.
             override_configs (dict, optional): override if any. Defaults to None.
+            repo_path (str, optional): root of the checkout holding the configuration,
+                relative file_name and the config directory are resolved against it.
+                Defaults to None for the current directory.
 
         Returns:
             tuple[bool, str, PipelineInfo]: First item is indicator for success or fail.
             second item is the error message if any.
             third item is the PipelineInfo object.
         """
-        parser = YamlParser()
-        pipeline_config = None
-        pipeline_file_name = None
+        parser = YamlParser(cache=self.config_cache)
+        config_dir = c.DEFAULT_CONFIG_DIR
+        if repo_path is not None:
+            config_dir = os.path.join(repo_path, c.DEFAULT_CONFIG_DIR)
+            if file_name is not None and not os.path.isabs(file_name):
+                file_name = os.path.join(repo_path, file_name)
         # At this point will have either config_file or pipeline_name set by upstream but not both
         # check pipeline_name first
         if pipeline_name is not None:
             try:
-                pipeline_info = parser.parse_yaml_by_pipeline_name(
-                    pipeline_name, c.DEFAULT_CONFIG_DIR)
-                pipeline_file_name = pipeline_info.pipeline_file_name
-                pipeline_config = pipeline_info.pipeline_config
+                file_name = parser.get_pipeline_file(pipeline_name, config_dir)
             except (ValueError, FileNotFoundError) as fe:
                 # if 'pipeline' name could not be located, return False and error message
                 self.logger.error(
                     "error in extracting from pipeline_name, %s", fe)
                 return False, str(fe), None
-        else:
-            try:
-                pipeline_config = parser.parse_yaml_file(file_name)
-                # get the pipeline_name for ConfigChecker
-                pipeline_name = pipeline_config[c.KEY_GLOBAL][c.KEY_PIPE_NAME]
-                # Extract the filename without extension or path
-                pipeline_file_name = os.path.basename(file_name)
-            except (FileNotFoundError, YAMLError) as e:
-                # if cannot extract content, return False and error message
-                self.logger.error("error in extracting from file_name, %s", e)
-                return False, str(e), None
-
-        # Process Override if have.
-        if override_configs:
-            pipeline_config = ConfigOverride.apply_overrides(
-                pipeline_config,
-                override_configs)
+        # Extract the filename without extension or path
+        pipeline_file_name = os.path.basename(file_name)
+
+        # Unchanged file validated before, overrides always go through validation
+        if not override_configs:
+            result = self._get_cached_validation(file_name)
+            if result is not None:
+                return True, "", PipelineInfo(
+                    pipeline_name=result.pipeline_config.global_.pipeline_name,
+                    pipeline_file_name=pipeline_file_name,
+                    pipeline_config=result.pipeline_config
+                )
+
         click.echo(f"Validating file in {pipeline_file_name}")
-        # call ConfigChecker to validate the configuration
-        result = self.config_checker.validate_config(pipeline_name,
-                                                     pipeline_config,
-                                                     pipeline_file_name,
-                                                     error_lc=True)
+        # call ConfigChecker to validate the configuration, with override if have.
+        with self._validate_lock:
+            pipeline_name, result = _validate_config_file(
+                pipeline_name, file_name, parser, self.config_checker, override_configs)
         # Early return
         if not result.valid:
+            self.logger.error("error in validating %s, %s", file_name, result.error_msg)
             return result.valid, result.error_msg, None
+        if not override_configs:
+            self._store_validation(file_name, pipeline_name, result)
+            self.config_cache.flush()
 
         pipeline_info = PipelineInfo(
             pipeline_name=pipeline_name,
@@ -538,8 +737,8 @@ class Controller:
 
     def run_pipeline(self, config_file: str, pipeline_name: str, git_details: SessionDetail,
                      dry_run: bool = False, local: bool = False, yaml_output: bool = False,
-                     override_configs: dict = None
-                     ) -> tuple[bool, str]:
+                     override_configs: dict = None, repo_path: str = None,
+                     enqueue: bool = False, resume: int = None) -> tuple[bool, str]:
         """Executes the job by coordinating the repository, runner, artifact store, and logger.
 
         Args:
@@ -551,6 +750,12 @@ class Controller:
                 By default set to false.
             yaml_output (bool): set output format to yaml
             override_configs: to override required configs
+            repo_path (str, optional): root of the checkout to run, i.e. a worktree.
+                Defaults to None for the current directory.
+            enqueue (bool, optional): add the run to the job queue for a cid runner
+                instead of running it. Defaults to False.
+            resume (int, optional): run number of a failed or cancelled run to resume,
+                with the configuration it was started with. Defaults to None.
 
         Returns:
             tuple[bool, str]:
@@ -560,16 +765,26 @@ class Controller:
         status = True
         message = None
         config_dict = None
+        resume_job = None
+
+        if resume is not None:
+            # A resumed run uses the configuration recorded with it, the current
+            # configuration file is neither validated nor saved
+            status, error_msg, resume_job = self._get_resume_job(
+                config_file, pipeline_name, git_details, resume)
+            if not status:
+                return status, error_msg
+            config_dict = resume_job[c.FIELD_PIPELINE_CONFIG_USED]
+        else:
+            # Step 2 - 4 extract yaml content, apply override, validate and
+            # save handled by validate_n_save_config
+            status, error_msg, pipeline_info = self.validate_n_save_config(
+                config_file, pipeline_name, override_configs, git_details, repo_path)
 
-        # Step 2 - 4 extract yaml content, apply override, validate and
-        # save handled by validate_n_save_config
-        status, error_msg, pipeline_info = self.validate_n_save_config(
-            config_file, pipeline_name, override_configs, git_details)
-
-        # Early Return if override and validation fail
-        if not status:
-            return status, error_msg
-        config_dict = pipeline_info.pipeline_config.model_dump(by_alias=True)
+            # Early Return if override and validation fail
+            if not status:
+                return status, error_msg
+            config_dict = pipeline_info.pipeline_config.model_dump(by_alias=True)
 
         # Step 5: check if pipeline is running dry-run or not
         if dry_run:
@@ -583,217 +798,397 @@ class Controller:
 
         try:
             pipeline_config = PipelineConfig.model_validate(config_dict)
-            status, run_msg = self._actual_pipeline_run(
-                git_details, pipeline_config, local)
+            if enqueue:
+                status, run_msg = self.scheduler.enqueue(git_details, pipeline_config)
+            else:
+                status, run_msg = self.scheduler.run(
+                    git_details, pipeline_config, local, resume_job)
             message += run_msg
         except ValidationError as ve:
             status = False
             message = f"validation error occur, error is {str(ve)}\n"
             self.logger.warning(message)
-        except DockerException as de:
+        except docker.errors.DockerException as de:
+            status = False
+            message = f"Error with docker service. error is {str(de)}\n"
+            self.logger.warning(message)
+
+        return self._get_run_result(status, message, enqueue)
+
+    def _get_resume_job(self, config_file: str, pipeline_name: str,
+                        git_details: SessionDetail, run_number: int
+                        ) -> tuple[bool, str, dict | None]:
+        """ Retrieve the record of a run to resume. Without a pipeline name, the
+        pipeline is the one recorded for the configuration file, so the file itself
+        is not read.
+
+        Args:
+            config_file (str): file path of the configuration file.
+            pipeline_name (str): pipeline name, None to use the configuration file.
+            git_details (SessionDetail): details of the git repository where to use.
+            run_number (int): run number to resume
+
+        Returns:
+            tuple[bool, str, dict | None]: success flag, error message if any, and the
+                job record of the run
+        """
+        if pipeline_name is None:
+            pipeline_file_name = os.path.basename(config_file)
+            pipeline_name = self.mongo_ds.get_pipeline_name(
+                git_details.repo_name, git_details.repo_url, git_details.branch,
+                pipeline_file_name)
+            if pipeline_name is None:
+                return False, f"No pipeline recorded for {pipeline_file_name}", None
+        return self.scheduler.get_resume_job(git_details, pipeline_name, run_number)
+
+    async def _run_pipeline_async(self, config_file: str, pipeline_name: str,
+                                  git_details: SessionDetail, host_pool: DockerHostPool,
+                                  dry_run: bool = False, yaml_output: bool = False,
+                                  override_configs: dict = None, repo_path: str = None,
+                                  label: str = None) -> tuple[bool, str]:
+        """ Validate, save and run the pipeline on the running event loop, sharing the
+        docker hosts with the other runs of the loop. See run_pipeline.
+
+        Args:
+            config_file (str): file path of the configuration file.
+            pipeline_name (str): pipeline name to be executed.
+            git_details (SessionDetail): details of the git repository where to use.
+            host_pool (DockerHostPool): docker hosts to place the run on, None for a
+                dry run.
+            dry_run (bool, optional): simulate pipeline order of execution.
+                Defaults to False.
+            yaml_output (bool, optional): set dry run output format to yaml.
+                Defaults to False.
+            override_configs (dict, optional): to override required configs.
+                Defaults to None.
+            repo_path (str, optional): root of the checkout to run, i.e. a worktree.
+                Defaults to None for the current directory.
+            label (str, optional): prefix of the run messages. Defaults to None.
+
+        Returns:
+            tuple[bool, str]: same as run_pipeline
+        """
+        status, error_msg, pipeline_info = await asyncio.to_thread(
+            self.validate_n_save_config, config_file, pipeline_name, override_configs,
+            git_details, repo_path)
+        if not status:
+            return status, error_msg
+        if dry_run:
+            return self.dry_run(pipeline_info.pipeline_config.model_dump(by_alias=True),
+                                yaml_output)
+        message = ""
+        try:
+            status, message = await self.scheduler.run_async(
+                git_details, pipeline_info.pipeline_config, host_pool=host_pool, label=label)
+        except docker.errors.DockerException as de:
             status = False
             message = f"Error with docker service. error is {str(de)}\n"
             self.logger.warning(message)
+        return self._get_run_result(status, message)
 
+    @staticmethod
+    def _get_run_result(status: bool, message: str, enqueue: bool = False
+                        ) -> tuple[bool, str]:
+        """ Append the outcome of a pipeline run to its message
+
+        Args:
+            status (bool): True if the run pass, or is queued
+            message (str): message of the run
+            enqueue (bool, optional): True if the run is queued. Defaults to False.
+
+        Returns:
+            tuple[bool, str]: status and message of the run
+        """
         if not status:
             message += '\nPipeline runs fail'
+        elif enqueue:
+            message += "\nPipeline run queued for a cid runner. "
         else:
             message += "\nPipeline runs successfully. "
         return (status, message)
 
-    def _actual_pipeline_run(self,
-                             repo_data: SessionDetail,
-                             pipeline_config: PipelineConfig,
-                             local: bool = False) -> tuple[bool, str]:
-        """ method to actually run the pipeline
+    def run_pipelines(self, pipeline_names: list[str] | None, git_details: SessionDetail,
+                      dry_run: bool = False, local: bool = False, yaml_output: bool = False,
+                      override_configs: dict = None, max_containers: int = None,
+                      enqueue: bool = False) -> tuple[bool, str]:
+        """ Run several pipelines of the repository concurrently, on the same checkout
+        and commit. The pipelines share the clone, each run is placed on the least
+        loaded docker host, the jobs on a host share its limit of running containers,
+        and each pipeline keeps its own running flag and run record.
 
         Args:
-            repo_data (SessionDetail): information required to identify the repo record
-            pipeline_config (PipelineConfig): validated pipeline_configuration
-            local (bool, optional): flag indicate if run to be local(True) or remote(False).
+            pipeline_names (list[str] | None): pipeline names to run, None to run all the
+                pipelines in the configuration directory.
+            git_details (SessionDetail): details of the git repository where to use.
+            dry_run (bool, optional): simulate the pipelines order of execution.
                 Defaults to False.
+            local (bool, optional): run pipelines on the local docker engine, instead of
+                the docker hosts in CID_DOCKER_HOSTS. Defaults to False.
+            yaml_output (bool, optional): set dry run output format to yaml. Defaults to False.
+            override_configs (dict, optional): overrides applied to every pipeline.
+                Defaults to None.
+            max_containers (int, optional): maximum containers running at the same time
+                on each docker host. Defaults to None for CID_MAX_CONTAINERS or
+                DEFAULT_MAX_CONTAINERS.
+            enqueue (bool, optional): add the runs to the job queue for the cid runners
+                instead of running them. Defaults to False.
 
-        Raises:
-            ValueError: If target pipeline already running
+        Returns:
+            tuple[bool, str]: status, True if all the pipelines pass, and summary message
+        """
+        if pipeline_names is None:
+            parser = YamlParser(cache=self.config_cache)
+            try:
+                pipeline_names = sorted(parser.get_pipeline_files(c.DEFAULT_CONFIG_DIR))
+            except (ValueError, FileNotFoundError) as e:
+                return False, str(e)
+            if not pipeline_names:
+                return False, f"No pipeline found in {c.DEFAULT_CONFIG_DIR}"
+
+        # Step 2 - 4 validate and save every pipeline before any of them start
+        results = {}
+        pipeline_configs = {}
+        for pipeline_name in dict.fromkeys(pipeline_names):
+            status, error_msg, pipeline_info = self.validate_n_save_config(
+                pipeline_name=pipeline_name, override_configs=override_configs,
+                session_data=git_details)
+            if not status:
+                results[pipeline_name] = (False, error_msg)
+            elif dry_run:
+                results[pipeline_name] = self.dry_run(
+                    pipeline_info.pipeline_config.model_dump(by_alias=True), yaml_output)
+            elif enqueue:
+                results[pipeline_name] = self.scheduler.enqueue(
+                    git_details, pipeline_info.pipeline_config)
+            else:
+                pipeline_configs[pipeline_name] = pipeline_info.pipeline_config
+
+        # Step 6: Actual run of all the valid pipelines on a single event loop
+        if pipeline_configs:
+            results.update(asyncio.run(self.scheduler.run_all_async(
+                git_details, pipeline_configs, local, max_containers)))
+
+        lines = []
+        for pipeline_name in dict.fromkeys(pipeline_names):
+            status, message = results[pipeline_name]
+            if dry_run and status:
+                lines.append(f"{pipeline_name}:\n{message}")
+            else:
+                run_status = c.STATUS_FAILED
+                if status:
+                    run_status = c.STATUS_QUEUED if enqueue else c.STATUS_SUCCESS
+                lines.append(f"{pipeline_name} {run_status} {message.strip()}".strip())
+        passed = sum(status for status, _ in results.values())
+        message = f"{passed} of {len(results)} pipelines passed\n" + "\n".join(lines)
+        return passed == len(results), message
+
+    def resolve_commits(self, rev_range: str = None, revisions: list[str] = None
+                        ) -> tuple[bool, str, list[str]]:
+        """ Resolve the commits for a batch run in the current repository.
+
+        Args:
+            rev_range (str, optional): git revision range, i.e. "abc123..main".
+            revisions (list[str], optional): list of commit hashes.
 
         Returns:
-            tuple(bool, str): first flag indicate whether the overall run is
-                successful(True) or fail(False). Second str is the actual run number if success,
-                or error message if fail
+            tuple[bool, str, list[str]]: status, message and the full commit hashes,
+                oldest first for a range.
         """
-        # Step 0: Process local flag. Note feature to run pipeline on remote is not implemented
-        if local:
-            click.echo("Running pipeline on local")
+        return self.repo_manager.list_commits(rev_range=rev_range, revisions=revisions)
+
+    def run_pipeline_batch(self, commits: list[str], config_file: str, pipeline_name: str,
+                           branch: str = None, strategy: str = c.BATCH_BACKFILL,
+                           parallel: int = 1, max_containers: int = None,
+                           **run_options) -> tuple[bool, str]:
+        """ Run the pipeline once per commit. Each commit is checked out in its own
+        worktree of the current repository, so runs share the clone and the local
+        docker image cache, and up to `parallel` commits run at the same time on a
+        single event loop. The runs share the pool of docker hosts, so the jobs of all
+        the commits are held to the container limit of each host.
+
+        With the backfill strategy, every commit is run. With the bisect strategy,
+        commits are assumed to go from passing to failing, and as few commits as
+        possible are run to locate the first failing one.
+
+        Args:
+            commits (list[str]): full commit hashes, oldest first.
+            config_file (str): file path of the configuration file, relative to the repo root.
+            pipeline_name (str): pipeline name to be executed.
+            branch (str, optional): branch containing the commits. Defaults to current branch.
+            strategy (str, optional): backfill or bisect. Defaults to backfill.
+            parallel (int, optional): maximum concurrent runs. Defaults to 1.
+            max_containers (int, optional): maximum containers running at the same time
+                on each docker host. Defaults to None, see RunScheduler.get_host_pool.
+            **run_options: other keyword arguments of the runs, i.e. local, dry_run,
+                yaml_output and override_configs.
+
+        Returns:
+            tuple[bool, str]: status and summary message. For backfill status is True if all
+                runs pass. For bisect status is True if the search completes.
+        """
+        parallel = max(1, parallel)
+        results = {}
+        local = run_options.pop('local', False)
+        host_pool = None
+        if not run_options.get('dry_run'):
+            # All the commits share the docker hosts and their container limits
+            try:
+                host_pool = self.scheduler.get_host_pool(local, max_containers)
+            except docker.errors.DockerException as de:
+                message = f"Error with docker service. error is {str(de)}"
+                self.logger.warning(message)
+                return False, message
+
+        async def run_commit(commit: str, slots: asyncio.Semaphore) -> bool:
+            async with slots:
+                status, message, repo_data, worktree_path = await asyncio.to_thread(
+                    self.acquire_worktree, branch=branch, commit_hash=commit)
+                if not status:
+                    click.secho(f"Commit {commit[:8]}: {message}", fg='red')
+                    return False
+                try:
+                    status, message = await self._run_pipeline_async(
+                        config_file, pipeline_name, repo_data, host_pool,
+                        repo_path=worktree_path, label=commit[:8], **run_options)
+                finally:
+                    await asyncio.to_thread(self.release_worktree, worktree_path)
+            click.secho(f"Commit {commit[:8]}: {message.strip()}",
+                        fg='green' if status else 'red')
+            return status
+
+        async def run_round(targets: list[str]) -> list[bool]:
+            # Ctrl+C cancel the round, and the runs stop their containers
+            slots = asyncio.Semaphore(parallel)
+            return await asyncio.gather(*(run_commit(commit, slots) for commit in targets))
+
+        def run_many(targets: list[str]) -> None:
+            results.update(zip(targets, asyncio.run(run_round(targets))))
+
+        if strategy == c.BATCH_BISECT:
+            first_fail = self._bisect_commits(commits, run_many, results, parallel)
         else:
-            click.echo(
-                "Remote run feature is not implemented, still running pipeline on local")
+            run_many(commits)
+            first_fail = None
+
+        summary = [f"{commit[:8]} {c.STATUS_SUCCESS if results[commit] else c.STATUS_FAILED}"
+                   for commit in commits if commit in results]
+        message = f"Ran {len(results)} of {len(commits)} commits\n" + "\n".join(summary)
+        if strategy == c.BATCH_BISECT:
+            if first_fail is None:
+                message += "\nNo failing commit found"
+            else:
+                message += f"\nFirst failing commit: {first_fail}"
+            return True, message
+        return all(results.values()), message
 
-        # Step 1: Check if pipeline is already running
-        pipeline_history = self.mongo_ds.get_pipeline_history(
-            repo_data.repo_name,
-            repo_data.repo_url,
-            repo_data.branch,
-            pipeline_config.global_.pipeline_name
-        )
+    @staticmethod
+    def _bisect_commits(commits: list[str], run_many, results: dict,
+                        parallel: int = 1) -> str | None:
+        """ k-ary search for the first failing commit. Each round run up to `parallel`
+        evenly spaced commits between the last known passing and first known failing one.
+
+        Args:
+            commits (list[str]): commit hashes, oldest first.
+            run_many (Callable): function running a list of commits, storing the
+                pass(True) / fail(False) result into results.
+            results (dict): results of the commits already run.
+            parallel (int, optional): number of commits to run per round. Defaults to 1.
+
+        Returns:
+            str | None: first failing commit, None if the newest commit passes.
+        """
+        low, high = -1, len(commits) - 1
+        run_many([commits[high]])
+        if results[commits[high]]:
+            return None
+        while high - low > 1:
+            span = high - low
+            count = min(parallel, span - 1)
+            points = sorted({low + span * (i + 1) // (count + 1) for i in range(count)})
+            run_many([commits[point] for point in points])
+            for point in points:
+                if not results[commits[point]]:
+                    high = point
+                    break
+            low = max((point for point in points if point < high and results[commits[point]]),
+                      default=low)
+        return commits[high]
+
+    def run_runner(self, name: str = None, local: bool = False, concurrency: int = 1,
+                   max_containers: int = None, once: bool = False) -> tuple[bool, str]:
+        """ Run the pipeline runs queued with enqueue, until interrupted
+
+        Args:
+            name (str, optional): name of the runner. Defaults to None for
+                <hostname>-<pid>.
+            local (bool, optional): run on the local docker engine instead of the
+                docker hosts in CID_DOCKER_HOSTS. Defaults to False.
+            concurrency (int, optional): pipeline runs at the same time. Defaults to 1.
+            max_containers (int, optional): maximum containers running at the same time
+                on each docker host. Defaults to None, see RunScheduler.get_host_pool.
+            once (bool, optional): stop when the queue is empty. Defaults to False.
+
+        Returns:
+            tuple[bool, str]: status and summary message
+        """
         try:
-            his_obj = PipelineInfo.model_validate(pipeline_history)
-        except ValidationError as ve:
-            self.logger.warning(
-                "Validation error for pipeline_history: %s error is %s",
-                pipeline_history,
-                ve
-            )
-            return False, "Fail to retrieve pipeline history"
-
-        # Early return if pipeline already running
-        if his_obj.running:
-            error_msg = f"Pipeline {
-                pipeline_config.global_.pipeline_name} Already Running. "
-            error_msg += "Please Stop Before Proceed"
-            return False, error_msg
-
-        # Step 2: Insert new job record
-        job_id = self.mongo_ds.insert_job(
-            his_obj,
-            pipeline_config.model_dump(by_alias=True)
-        )
+            host_pool = self.scheduler.get_host_pool(local, max_containers)
+        except docker.errors.DockerException as de:
+            message = f"Error with docker service. error is {str(de)}"
+            self.logger.warning(message)
+            return False, message
+        runner = QueueRunner(self.mongo_ds, host_pool, name=name, concurrency=concurrency)
+        click.echo(f"Runner {runner.name} waiting for queued runs")
+        try:
+            runner.serve(once)
+        except KeyboardInterrupt:
+            click.echo(f"Runner {runner.name} stopped")
+        return True, f"Runner {runner.name} completed {runner.completed} runs"
+
+    def collect_garbage(self, local: bool = False, max_age: float = c.DEFAULT_GC_MAX_AGE,
+                        disk_budget: int = None, dry_run: bool = False) -> tuple[bool, str]:
+        """ Remove the stale containers, volumes and dangling images of the docker
+        hosts, see DockerGarbageCollector, then the worktrees left on this machine by
+        crashed runs, see WorktreeManager.prune. The volumes of the runs in flight are
+        kept.
 
-        his_obj.job_run_history.append(job_id)
-        run_number = len(his_obj.job_run_history)
-        updates = {
-            c.FIELD_JOB_RUN_HISTORY: his_obj.job_run_history,
-            c.FIELD_RUNNING: True,
-        }
-        update_success = self.mongo_ds.update_pipeline_info(
-            repo_data.repo_name,
-            repo_data.repo_url,
-            repo_data.branch,
-            pipeline_config.global_.pipeline_name,
-            updates
-        )
-        # if update unsuccessful, prompt user.
-        if not update_success:
-            click.confirm(
-                'Cannot update into db, do you want to continue?', abort=True)
+        Args:
+            local (bool, optional): collect the local docker engine instead of the
+                docker hosts in CID_DOCKER_HOSTS. Defaults to False.
+            max_age (float, optional): age in seconds of the run volumes and dangling
+                images to remove. Defaults to DEFAULT_GC_MAX_AGE.
+            disk_budget (int, optional): bytes each engine may use on disk.
+                Defaults to None for no budget.
+            dry_run (bool, optional): only report the resources to remove.
+                Defaults to False.
 
-        pipeline_status = c.STATUS_PENDING
+        Returns:
+            tuple[bool, str]: status and the resources removed on each host
+        """
+        verb = "would remove" if dry_run else "removed"
+        messages = []
         try:
-            # Initialize Docker Manager
-            docker_manager = DockerManager(
-                repo=repo_data.repo_name,
-                branch=repo_data.branch,
-                pipeline=pipeline_config.global_.pipeline_name,
-                run=str(len(his_obj.job_run_history))
-            )
-            # Step 3: Iterate through all stages, for each jobs
-            early_break = False
-            for stage_name, stage_config in pipeline_config.stages.items():
-                stage_status = c.STATUS_PENDING
-                stage_config = ValidatedStage.model_validate(stage_config)
-                job_logs = {}
-                stage_start_time = time.asctime()
-                try:
-                    # run the job, get the record, update job history
-                    for job_group in stage_config.job_groups:
-                        for job_name in job_group:
-                            job_config = pipeline_config.jobs[job_name]
-                            try:
-                                click.secho(
-                                    f"Stage:{stage_name} Job:{
-                                        job_name} - Streaming Job Logs",
-                                    fg='green')
-                                job_log = docker_manager.run_job(
-                                    job_name, job_config)
-                                click.echo(job_log.job_logs)
-                                job_logs[job_name] = job_log.model_dump()
-                                # single fail job will switch the stage status to fail
-                                if job_log.job_status == c.STATUS_FAILED:
-                                    stage_status = c.STATUS_FAILED
-                                    click.secho(
-                                        f"Job:{job_name} failed\n", fg="red")
-                                    # Early break
-                                    if job_config[c.JOB_SUBKEY_ALLOW] is False:
-                                        early_break = True
-                                        break
-                                else:
-                                    click.secho(
-                                        f"Job:{job_name} success\n", fg="green")
-                            except KeyboardInterrupt:
-                                # Only create a job_log if current job not yet saved
-                                if job_name not in job_logs:
-                                    job_log_info = copy.deepcopy(job_config)
-                                    job_log_info[c.REPORT_KEY_JOBNAME] = job_name
-                                    job_log_info[c.REPORT_KEY_START] = time.asctime(
-                                    )
-                                    job_log = JobLog.model_validate(
-                                        job_log_info)
-                                    job_log.job_status = c.STATUS_CANCELLED
-                                    job_log.completion_time = time.asctime()
-                                    job_logs[job_name] = job_log.model_dump()
-                                if stage_status != c.STATUS_FAILED:
-                                    stage_status = c.STATUS_CANCELLED
-                                raise
-                            # If early break, skip next job group execution
-                            if early_break:
-                                break
-                    # If we reach this step, if stage status still pending, update to success
-                    if stage_status == c.STATUS_PENDING:
-                        stage_status = c.STATUS_SUCCESS
-                finally:
-                    # Ensure job logs always updated regardless exception thrown
-                    self.mongo_ds.update_job_logs(
-                        job_id,
-                        stage_name,
-                        stage_status,
-                        job_logs,
-                        stage_time={
-                            c.FIELD_START_TIME: stage_start_time,
-                            c.FIELD_COMPLETION_TIME: time.asctime()
-                        }
-                    )
-                    # single fail stage will switch the pipeline status to fail
-                    if stage_status == c.STATUS_FAILED:
-                        pipeline_status = c.STATUS_FAILED
-                        click.secho(f"Stage:{stage_name} failed\n", fg="red")
-                    elif stage_status == c.STATUS_CANCELLED:
-                        # Fail status take precedence
-                        if pipeline_status != c.STATUS_FAILED:
-                            pipeline_status = c.STATUS_CANCELLED
-                        click.secho(
-                            f"Stage:{stage_name} cancelled\n", fg="yellow")
-                    else:
-                        click.secho(
-                            f"Stage:{stage_name} success\n", fg="green")
-                # If early break, skip next stages execution
-                if early_break:
-                    break
-            # if stage status still pending, update to success
-            if pipeline_status == c.STATUS_PENDING:
-                pipeline_status = c.STATUS_SUCCESS
-        finally:
-            # Ensure always Wrap up and return
-            run_update = {
-                c.FIELD_STATUS: pipeline_status,
-                c.FIELD_COMPLETION_TIME: time.asctime()
-            }
-            self.mongo_ds.update_job(job_id, run_update)
-            final_updates = {
-                c.FIELD_RUNNING: False
-            }
-            update_success = self.mongo_ds.update_pipeline_info(
-                repo_data.repo_name,
-                repo_data.repo_url,
-                repo_data.branch,
-                pipeline_config.global_.pipeline_name,
-                final_updates
-            )
-            if not update_success:
-                click.secho(
-                    "Failed to update pipeline status, please do manual update\n", fg="red")
-            docker_manager.remove_vol()
-        pipeline_pass = pipeline_status == c.STATUS_SUCCESS
-        run_msg = f"run_number:{run_number}" if pipeline_pass else ""
-        return pipeline_pass, run_msg
+            host_pool = None if local else DockerHostPool.from_env()
+            for host in (host_pool or DockerHostPool.local()).hosts:
+                collector = DockerGarbageCollector(host.client or docker.from_env(),
+                                                   max_age=max_age, disk_budget=disk_budget,
+                                                   dry_run=dry_run, log_tool=self.logger,
+                                                   is_active=self.scheduler.is_run_active)
+                report = collector.collect()
+                messages.append(
+                    f"{host.name}: {verb} {len(report.containers)} containers, "
+                    f"{len(report.volumes)} volumes and {len(report.images)} images, "
+                    f"{report.reclaimed / 1024 ** 2:.1f} MB reclaimed")
+                messages.extend(f"  {name}" for name in
+                                report.containers + report.volumes + report.images)
+        except docker.errors.DockerException as de:
+            message = f"Error with docker service. error is {str(de)}"
+            self.logger.warning(message)
+            return False, message
+        worktrees = self.repo_manager.worktree_manager.prune(dry_run)
+        messages.append(f"worktrees: {verb} {len(worktrees)} stale worktrees")
+        messages.extend(f"  {path}" for path in worktrees)
+        return True, "\n".join(messages)
 
     def dry_run(self, config_dict: dict, is_yaml_output: bool) -> tuple[bool, str]:
         """dry run methods responsible for the `--dry-run` method for pipelines.
@@ -0,0 +1,492 @@
+""" Asyncio execution engine of a pipeline run. Stages run one after the other,
+the job groups of a stage have no dependency between them and run concurrently,
+and the jobs within a group run in order.
+The Docker SDK and pymongo are blocking libraries, their calls are handed to worker
+threads with asyncio.to_thread, so a single event loop supervises every running job.
+"""
+import asyncio
+import contextlib
+import copy
+import time
+
+import click
+import util.constant as c
+from util.model import (JobAttempt, JobLog, PipelineConfig, ValidatedStage)
+from util.common_utils import (get_logger, LazyModule)
+from util.db_mongo import (MongoAdapter)
+from util.admission import (AdmissionController)
+
+docker = LazyModule('docker')
+
+logger = get_logger('controller.executor')
+
+
+def build_job_log(job_name: str, job_config: dict, status: str) -> JobLog:
+    """ Build the record of a job that did not run in a container,
+    i.e. skipped or cancelled.
+
+    Args:
+        job_name (str): name of the job
+        job_config (dict): validated job configuration
+        status (str): status of the job
+
+    Returns:
+        JobLog: the job record
+    """
+    job_log_info = copy.deepcopy(job_config)
+    job_log_info[c.REPORT_KEY_JOBNAME] = job_name
+    job_log_info[c.REPORT_KEY_START] = time.asctime()
+    job_log = JobLog.model_validate(job_log_info)
+    job_log.job_status = status
+    job_log.completion_time = time.asctime()
+    return job_log
+
+
+class PipelineExecutor:
+    """ Run the stages and jobs of one pipeline run, and record the job logs
+    of every stage in the datastore.
+    """
+
+    def __init__(self, docker_manager, mongo_ds: MongoAdapter, job_id: str,
+                 skipped_jobs: set = None, admission: AdmissionController = None,
+                 label: str = None, completed_jobs: dict = None):
+        """ Initialize the executor
+
+        Args:
+            docker_manager (DockerManager): docker manager of the run
+            mongo_ds (MongoAdapter): datastore to record the job logs
+            job_id (str): id of the job record of the run
+            skipped_jobs (set, optional): name of the jobs to skip. Defaults to None.
+            admission (AdmissionController, optional): admission control of the job
+                containers, shared by the pipelines running on the same event loop.
+                Defaults to None for no limit.
+            label (str, optional): prefix of the messages, to tell apart the output of
+                pipelines running together. Defaults to None.
+            completed_jobs (dict, optional): job name to job log of the jobs completed
+                by a previous attempt of a resumed run, kept instead of running them.
+                Defaults to None.
+        """
+        self.docker_manager = docker_manager
+        self.mongo_ds = mongo_ds
+        self.job_id = job_id
+        self.skipped_jobs = skipped_jobs or set()
+        self.completed_jobs = completed_jobs or {}
+        self.admission = admission
+        self.prefix = f"[{label}] " if label else ""
+        self.pipeline_status = c.STATUS_PENDING
+
+    def run(self, pipeline_config: PipelineConfig) -> str:
+        """ Run the pipeline on a new event loop, for callers outside of asyncio
+
+        Args:
+            pipeline_config (PipelineConfig): validated pipeline configuration
+
+        Raises:
+            KeyboardInterrupt: if the run is interrupted, the running jobs are stopped
+                and the pipeline_status is kept for the caller to record.
+
+        Returns:
+            str: status of the pipeline
+        """
+        return asyncio.run(self.run_async(pipeline_config))
+
+    async def run_async(self, pipeline_config: PipelineConfig) -> str:
+        """ Run the stages in order, stop after a stage with a failed job
+        not allowed to fail. A run exceeding the timeout of the pipeline is
+        cancelled and failed. The pipeline status is final on every exit, a run
+        interrupted before finishing a stage is cancelled and a run stopped by
+        an error is failed.
+
+        Args:
+            pipeline_config (PipelineConfig): validated pipeline configuration
+
+        Raises:
+            asyncio.CancelledError: if the run is cancelled
+            KeyboardInterrupt: if the run is interrupted
+
+        Returns:
+            str: status of the pipeline
+        """
+        timeout = pipeline_config.global_.timeout
+        try:
+            await asyncio.wait_for(self._run_stages(pipeline_config), timeout)
+        except asyncio.TimeoutError:
+            self.pipeline_status = c.STATUS_FAILED
+            self._echo(f"Pipeline timed out after {timeout:g}s\n", fg="red")
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            if self.pipeline_status == c.STATUS_PENDING:
+                self.pipeline_status = c.STATUS_CANCELLED
+            raise
+        finally:
+            if self.pipeline_status == c.STATUS_PENDING:
+                self.pipeline_status = c.STATUS_FAILED
+        return self.pipeline_status
+
+    async def _run_stages(self, pipeline_config: PipelineConfig) -> None:
+        """ Run the stages in order, stop after a stage with a failed job
+        not allowed to fail.
+
+        Args:
+            pipeline_config (PipelineConfig): validated pipeline configuration
+        """
+        for stage_name, stage_config in pipeline_config.stages.items():
+            stage_config = ValidatedStage.model_validate(stage_config)
+            if all(job_name in self.completed_jobs
+                   for job_group in stage_config.job_groups for job_name in job_group):
+                # the record of the stage is kept as completed by the previous attempt
+                self._echo(f"Stage:{stage_name} already completed\n", fg="yellow")
+                continue
+            early_break = await self._run_stage(stage_name, stage_config, pipeline_config.jobs,
+                                                pipeline_config.global_.fail_fast)
+            if early_break:
+                break
+        # if pipeline status still pending, update to success
+        if self.pipeline_status == c.STATUS_PENDING:
+            self.pipeline_status = c.STATUS_SUCCESS
+
+    async def _run_stage(self, stage_name: str, stage_config: ValidatedStage,
+                         jobs: dict, fail_fast: bool = False) -> bool:
+        """ Run the job groups of a stage concurrently and record the job logs,
+        regardless of exception thrown. With fail fast, the first failed job not
+        allowed to fail stops the running jobs of the other groups, and the jobs
+        not completed are recorded as cancelled.
+
+        Args:
+            stage_name (str): name of the stage
+            stage_config (ValidatedStage): validated stage with its job groups
+            jobs (dict): validated job configurations
+            fail_fast (bool, optional): cancel the stage on the first failed job not
+                allowed to fail. Defaults to False.
+
+        Returns:
+            bool: True if a job not allowed to fail failed, so the next stages are skipped
+        """
+        job_logs = {}
+        stage_start_time = time.asctime()
+        interrupted = False
+        groups = [asyncio.ensure_future(self._run_group(stage_name, job_group, jobs, job_logs))
+                  for job_group in stage_config.job_groups]
+        try:
+            pending = set(groups)
+            while pending:
+                done, pending = await asyncio.wait(pending,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for group in done:
+                    group.result()
+                if pending and fail_fast and self._has_fatal_failure(job_logs, jobs):
+                    self._echo(f"Stage:{stage_name} fail fast, cancelling the running jobs\n",
+                               fg="red")
+                    await self._cancel_groups(pending)
+                    pending = set()
+            if fail_fast and self._has_fatal_failure(job_logs, jobs):
+                self._cancel_pending_jobs(stage_config, jobs, job_logs)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            interrupted = True
+            raise
+        finally:
+            # stop the containers of the groups still running after an error
+            await self._cancel_groups([group for group in groups if not group.done()])
+            stage_status = self._get_stage_status(job_logs, interrupted)
+            await asyncio.to_thread(
+                self.mongo_ds.update_job_logs,
+                self.job_id,
+                stage_name,
+                stage_status,
+                job_logs,
+                stage_time={
+                    c.FIELD_START_TIME: stage_start_time,
+                    c.FIELD_COMPLETION_TIME: time.asctime()
+                }
+            )
+            self._update_pipeline_status(stage_name, stage_status)
+        return self._has_fatal_failure(job_logs, jobs)
+
+    @staticmethod
+    def _has_fatal_failure(job_logs: dict, jobs: dict) -> bool:
+        """ Check if a job not allowed to fail failed
+
+        Args:
+            job_logs (dict): job logs of the stage
+            jobs (dict): validated job configurations
+
+        Returns:
+            bool: True if a job not allowed to fail failed
+        """
+        return any(log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_FAILED
+                   and jobs[job_name][c.JOB_SUBKEY_ALLOW] is False
+                   for job_name, log in job_logs.items())
+
+    @staticmethod
+    async def _cancel_groups(groups) -> None:
+        """ Cancel the running job groups and wait for them to stop their containers
+        and record their running job as cancelled
+
+        Args:
+            groups (Iterable[asyncio.Future]): tasks of the job groups
+        """
+        for group in groups:
+            group.cancel()
+        await asyncio.gather(*groups, return_exceptions=True)
+
+    @staticmethod
+    def _cancel_pending_jobs(stage_config: ValidatedStage, jobs: dict,
+                             job_logs: dict) -> None:
+        """ Record the jobs of a stage that did not run as cancelled
+
+        Args:
+            stage_config (ValidatedStage): validated stage with its job groups
+            jobs (dict): validated job configurations
+            job_logs (dict): job logs of the stage, updated with the job records
+        """
+        for job_group in stage_config.job_groups:
+            for job_name in job_group:
+                if job_name not in job_logs:
+                    job_logs[job_name] = build_job_log(
+                        job_name, jobs[job_name], c.STATUS_CANCELLED).model_dump()
+
+    async def _run_group(self, stage_name: str, job_group: list, jobs: dict,
+                         job_logs: dict) -> None:
+        """ Run the jobs of a group in order, skip the rest of the group after
+        a failed job not allowed to fail.
+
+        Args:
+            stage_name (str): name of the stage
+            job_group (list): name of the jobs in running order
+            jobs (dict): validated job configurations
+            job_logs (dict): job logs of the stage, updated with the job records
+        """
+        for job_name in job_group:
+            job_config = jobs[job_name]
+            if job_name in self.completed_jobs:
+                job_logs[job_name] = self.completed_jobs[job_name]
+                self._echo(f"Job:{job_name} already completed\n", fg="yellow")
+                continue
+            if job_name in self.skipped_jobs:
+                job_logs[job_name] = build_job_log(
+                    job_name, job_config, c.STATUS_SKIPPED).model_dump()
+                self._echo(f"Job:{job_name} skipped, no matching changes\n", fg="yellow")
+                continue
+            try:
+                job_log = await self._run_job(stage_name, job_name, job_config)
+            except (asyncio.CancelledError, KeyboardInterrupt):
+                job_logs[job_name] = build_job_log(
+                    job_name, job_config, c.STATUS_CANCELLED).model_dump()
+                raise
+            self._echo(job_log.job_logs)
+            job_logs[job_name] = job_log.model_dump()
+            if job_log.job_status == c.STATUS_FAILED:
+                self._echo(f"Job:{job_name} failed{self._get_failure_detail(job_log)}\n",
+                           fg="red")
+                if job_config[c.JOB_SUBKEY_ALLOW] is False:
+                    break
+            else:
+                self._echo(f"Job:{job_name} success\n", fg="green")
+
+    async def _run_job(self, stage_name: str, job_name: str, job_config: dict) -> JobLog:
+        """ Run a job in its container, and run it again after the failures covered
+        by its retry policy, with an exponential backoff. Only the failed job is run
+        again, the earlier attempts are recorded in the job log.
+
+        Args:
+            stage_name (str): name of the stage
+            job_name (str): name of the job
+            job_config (dict): validated job configuration
+
+        Returns:
+            JobLog: record of the last attempt
+        """
+        attempts = []
+        while True:
+            async with self._admit(job_config):
+                self._echo(f"Stage:{stage_name} Job:{job_name} - Streaming Job Logs",
+                           fg='green')
+                job_log = await self._run_container(job_name, job_config)
+            # the run is still in flight, see DockerGarbageCollector
+            await asyncio.to_thread(self.mongo_ds.update_job, self.job_id,
+                                    {c.FIELD_HEARTBEAT: time.time()})
+            delay = self._get_retry_delay(job_log, job_config, len(attempts) + 1)
+            if delay is None:
+                job_log.attempts = attempts
+                return job_log
+            attempts.append(JobAttempt(attempt=len(attempts) + 1,
+                                       **job_log.model_dump(exclude={c.REPORT_KEY_ATTEMPTS})))
+            self._echo(job_log.job_logs)
+            reason = f"exit code {job_log.exit_code}" if job_log.failure == c.FAILURE_SCRIPT \
+                else f"{job_log.failure} error"
+            self._echo(f"Job:{job_name} attempt {len(attempts)} failed with {reason}, "
+                       f"retry in {delay:g}s\n", fg="yellow")
+            await asyncio.sleep(delay)
+            await self._remove_job(job_name)
+
+    async def _run_container(self, job_name: str, job_config: dict) -> JobLog:
+        """ Run the container of a job, and stop it once it runs longer than the
+        timeout of the job. The job is then failed with a timeout failure. The
+        container of a cancelled job is stopped before the cancellation goes on.
+
+        Args:
+            job_name (str): name of the job
+            job_config (dict): validated job configuration
+
+        Returns:
+            JobLog: record of the job
+        """
+        timeout = job_config.get(c.KEY_TIMEOUT)
+        run = asyncio.ensure_future(
+            asyncio.to_thread(self.docker_manager.run_job, job_name, job_config))
+        try:
+            return await asyncio.wait_for(asyncio.shield(run), timeout)
+        except asyncio.TimeoutError:
+            self._echo(f"Job:{job_name} timed out after {timeout:g}s, stopping it\n",
+                       fg="red")
+            await self._stop_until_done(job_name, run)
+        except asyncio.CancelledError:
+            # the worker thread keeps running the job until its container is stopped
+            await self._stop_until_done(job_name, run)
+            raise
+        finally:
+            if not run.done():
+                run.cancel()
+        job_log = run.result()
+        job_log.job_status = c.STATUS_FAILED
+        job_log.failure = c.FAILURE_TIMEOUT
+        job_log.job_logs += f"\nJob timed out after {timeout:g}s"
+        return job_log
+
+    @staticmethod
+    def _get_retry_delay(job_log: JobLog, job_config: dict, attempt: int) -> float | None:
+        """ Check if a job attempt is to be retried. Infra and timeout failures are
+        retried if the policy lists them, script failures if it lists their exit code.
+
+        Args:
+            job_log (JobLog): record of the attempt
+            job_config (dict): validated job configuration
+            attempt (int): number of the attempt, starting at 1
+
+        Returns:
+            float | None: seconds to wait before the next attempt, None if the attempt
+                is the last one
+        """
+        retry = job_config.get(c.JOB_SUBKEY_RETRY)
+        if not retry or job_log.job_status != c.STATUS_FAILED or \
+                attempt > retry[c.RETRY_SUBKEY_MAX]:
+            return None
+        if job_log.failure in (c.FAILURE_INFRA, c.FAILURE_TIMEOUT):
+            retryable = job_log.failure in retry[c.RETRY_SUBKEY_ON]
+        else:
+            retryable = job_log.exit_code in retry[c.RETRY_SUBKEY_ON]
+        if not retryable:
+            return None
+        return min(retry[c.RETRY_SUBKEY_BACKOFF] * 2 ** (attempt - 1), c.MAX_RETRY_DELAY)
+
+    @staticmethod
+    def _get_failure_detail(job_log: JobLog) -> str:
+        """ Describe the script a failed job failed on
+
+        Args:
+            job_log (JobLog): record of the failed job
+
+        Returns:
+            str: the failed script and its exit code, empty if unknown
+        """
+        failed = next((result for result in job_log.script_results or []
+                       if result.exit_code != 0), None)
+        if failed is None:
+            return ""
+        return f", script `{failed.script}` exit code {failed.exit_code}"
+
+    def _admit(self, job_config: dict):
+        """ Get the context holding the admission of a job for the time it runs
+
+        Args:
+            job_config (dict): validated job configuration
+
+        Returns:
+            AbstractAsyncContextManager: admission of the job
+        """
+        if self.admission is None:
+            return contextlib.nullcontext()
+        return self.admission.admit(job_config)
+
+    async def _stop_job(self, job_name: str) -> None:
+        """ Stop the container of a cancelled job
+
+        Args:
+            job_name (str): name of the job
+        """
+        try:
+            await asyncio.to_thread(self.docker_manager.stop_job, job_name)
+        except docker.errors.DockerException as de:
+            logger.warning("fail to stop job %s, error: %s", job_name, de)
+
+    async def _stop_until_done(self, job_name: str, run: asyncio.Future) -> None:
+        """ Stop the container of a job until its worker thread returns. The container
+        may not exist yet while its image is pulled, and is stopped once started.
+
+        Args:
+            job_name (str): name of the job
+            run (asyncio.Future): worker thread running the job
+        """
+        while not run.done():
+            await self._stop_job(job_name)
+            await asyncio.wait({run}, timeout=c.STOP_RETRY_INTERVAL)
+
+    async def _remove_job(self, job_name: str) -> None:
+        """ Remove the container left by a failed attempt, before the job run again
+
+        Args:
+            job_name (str): name of the job
+        """
+        try:
+            await asyncio.to_thread(self.docker_manager.remove_job, job_name)
+        except docker.errors.DockerException as de:
+            logger.warning("fail to remove job %s, error: %s", job_name, de)
+
+    @staticmethod
+    def _get_stage_status(job_logs: dict, interrupted: bool) -> str:
+        """ Derive the status of a stage from its job logs. A single failed job
+        fail the stage, fail status take precedence over cancelled.
+
+        Args:
+            job_logs (dict): job logs of the stage
+            interrupted (bool): True if the stage was interrupted
+
+        Returns:
+            str: status of the stage
+        """
+        statuses = [log[c.REPORT_KEY_JOBSTATUS] for log in job_logs.values()]
+        if c.STATUS_FAILED in statuses:
+            return c.STATUS_FAILED
+        if interrupted:
+            return c.STATUS_CANCELLED
+        if statuses and all(status == c.STATUS_SKIPPED for status in statuses):
+            return c.STATUS_SKIPPED
+        return c.STATUS_SUCCESS
+
+    def _update_pipeline_status(self, stage_name: str, stage_status: str) -> None:
+        """ Fold the status of a finished stage into the pipeline status
+
+        Args:
+            stage_name (str): name of the stage
+            stage_status (str): status of the stage
+        """
+        if stage_status == c.STATUS_FAILED:
+            self.pipeline_status = c.STATUS_FAILED
+            self._echo(f"Stage:{stage_name} failed\n", fg="red")
+        elif stage_status == c.STATUS_CANCELLED:
+            # Fail status take precedence
+            if self.pipeline_status != c.STATUS_FAILED:
+                self.pipeline_status = c.STATUS_CANCELLED
+            self._echo(f"Stage:{stage_name} cancelled\n", fg="yellow")
+        elif stage_status == c.STATUS_SKIPPED:
+            self._echo(f"Stage:{stage_name} skipped\n", fg="yellow")
+        else:
+            self._echo(f"Stage:{stage_name} success\n", fg="green")
+
+    def _echo(self, message: str, **styles) -> None:
+        """ Print a message of the run, prefixed with the label if any
+
+        Args:
+            message (str): message to print
+            **styles: click.secho styles, i.e. fg
+        """
+        click.secho(f"{self.prefix}{message}", **styles)
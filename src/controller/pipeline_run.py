@@ -0,0 +1,155 @@
+""" A run of a pipeline on a docker host, shared by the runs started by the controller
+and the queued runs of a cid runner. The run creates the docker manager of its volume,
+runs its stages with a PipelineExecutor, then records its final status and keeps or
+removes its volume.
+"""
+import asyncio
+import time
+from typing import Callable
+
+import click
+import util.constant as c
+from util.model import (PipelineConfig)
+from util.common_utils import (LazyModule)
+from util.db_mongo import (MongoAdapter, RunStateWriter)
+from util.docker_pool import (DockerHost)
+from controller.executor import (PipelineExecutor)
+
+container = LazyModule('util.container')
+
+
+class PipelineRun:
+    """ Lifecycle of a pipeline run on a docker host, from its docker manager to its
+    wrap up. The state changes of the run are buffered by a RunStateWriter and written
+    at the stage boundaries.
+    """
+
+    def __init__(self, mongo_ds: MongoAdapter, job_id: str, host: DockerHost = None,
+                 label: str = None):
+        """ Initialize the run
+
+        Args:
+            mongo_ds (MongoAdapter): datastore holding the run record
+            job_id (str): id of the job record of the run
+            host (DockerHost, optional): docker host the run is placed on.
+                Defaults to None for a run wrapped up without running.
+            label (str, optional): prefix of the run messages. Defaults to None.
+        """
+        self.job_id = job_id
+        self.host = host
+        self.label = label
+        self.state_writer = RunStateWriter(mongo_ds)
+        self.docker_manager = None
+        self.executor = None
+
+    async def start(self, repo_name: str, branch: str, pipeline_config: PipelineConfig,
+                    run_number: int, skipped_jobs: set, resume_job: dict = None
+                    ) -> PipelineExecutor:
+        """ Create the docker manager of the run on its host, remove the job containers
+        left on the host by crashed runs, and create the executor of the run.
+
+        Args:
+            repo_name (str): name of the repository
+            branch (str): branch of the run
+            pipeline_config (PipelineConfig): validated pipeline configuration
+            run_number (int): run number of the run
+            skipped_jobs (set): names of the jobs to skip
+            resume_job (dict, optional): record of the run to resume. Defaults to None.
+
+        Raises:
+            docker.errors.DockerException: If the docker host is not reachable
+
+        Returns:
+            PipelineExecutor: executor of the run
+        """
+        # a resumed run is back in flight under its record
+        self.state_writer.update_job(self.job_id, {c.FIELD_STATUS: None,
+                                                   c.FIELD_HEARTBEAT: time.time()})
+        self.docker_manager = await asyncio.to_thread(
+            container.DockerManager,
+            client=self.host.client,
+            repo=repo_name,
+            branch=branch,
+            pipeline=pipeline_config.global_.pipeline_name,
+            run=str(run_number),
+            run_id=str(self.job_id)
+        )
+        await asyncio.to_thread(self.docker_manager.reap_orphans)
+        completed_jobs = {}
+        if resume_job is not None:
+            completed_jobs = await asyncio.to_thread(
+                self.prepare_resume, resume_job, pipeline_config)
+        self.executor = PipelineExecutor(self.docker_manager, self.state_writer, self.job_id,
+                                         skipped_jobs, admission=self.host.admission,
+                                         label=self.label, completed_jobs=completed_jobs)
+        return self.executor
+
+    def prepare_resume(self, resume_job: dict, pipeline_config: PipelineConfig) -> dict:
+        """ Find the jobs completed by the previous attempt of a resumed run, and
+        remove the containers left by the other jobs. The completed jobs are only kept
+        if the volume holding their work is still there.
+
+        Args:
+            resume_job (dict): job record of the run
+            pipeline_config (PipelineConfig): pipeline configuration of the run
+
+        Returns:
+            dict: job name to job log of the completed jobs
+        """
+        completed_jobs = {}
+        if self.docker_manager.volume_exists():
+            for stage_log in resume_job.get(c.FIELD_LOGS) or []:
+                for job_name, job_log in (stage_log.get(c.FIELD_JOBS) or {}).items():
+                    if job_log.get(c.FIELD_JOB_STATUS) in (c.STATUS_SUCCESS, c.STATUS_SKIPPED):
+                        completed_jobs[job_name] = job_log
+        else:
+            click.echo(f"Volume {self.docker_manager.vol_name} not found, running all the jobs")
+        for job_name in pipeline_config.jobs:
+            if job_name not in completed_jobs:
+                self.docker_manager.remove_job(job_name)
+        click.echo(f"Resuming run {resume_job[c.FIELD_RUN_NUMBER]}, "
+                   f"{len(completed_jobs)} jobs already completed")
+        return completed_jobs
+
+    def get_status(self, default: str) -> str:
+        """ Get the final status of the run, never pending as the record of a finished
+        run must not look in flight
+
+        Args:
+            default (str): status of a run whose executor was not created or did not
+                finish a stage
+
+        Returns:
+            str: status of the pipeline
+        """
+        if self.executor is None or self.executor.pipeline_status == c.STATUS_PENDING:
+            return default
+        return self.executor.pipeline_status
+
+    def wrap_up(self, pipeline_status: str, release: Callable[[], bool]) -> bool:
+        """ Record the final status of the run, release the pipeline and remove the
+        shared volume of a successful run. The volume of a failed or cancelled run is
+        kept for the run to be resumed. The state of the run is written and journaled
+        before the pipeline is released and the volume removed.
+
+        Args:
+            pipeline_status (str): final status of the pipeline
+            release (Callable[[], bool]): release the pipeline of the run, i.e. clear
+                its running flag, returning False if the pipeline record is not updated
+
+        Returns:
+            bool: True if the run record and the pipeline record are updated
+        """
+        self.state_writer.update_job(self.job_id, {
+            c.FIELD_STATUS: pipeline_status,
+            c.FIELD_COMPLETION_TIME: time.asctime()
+        })
+        # the pipeline is released once the run record is complete
+        update_success = self.state_writer.close()
+        update_success = release() and update_success
+        if self.docker_manager is not None:
+            if pipeline_status == c.STATUS_SUCCESS:
+                self.docker_manager.remove_vol()
+            elif self.docker_manager.docker_vol is not None:
+                click.echo(f"Volume {self.docker_manager.vol_name} kept to resume the run")
+        return update_success
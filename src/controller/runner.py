@@ -0,0 +1,231 @@
+""" Runner of the queued pipeline runs. `cid pipeline run --enqueue` records the run in
+jobs_history and adds it to the job_queue collection, then any number of `cid runner`
+processes, on any machine reaching the same MongoDB, claim the queued runs with an
+atomic find and modify. A runner renews the lease of its runs while they run, so the
+run of a runner that crashed is claimed again by another runner once its lease expires.
+"""
+import asyncio
+import functools
+import os
+import socket
+
+import click
+import util.constant as c
+from util.model import (PipelineConfig)
+from util.common_utils import (get_logger, LazyModule)
+from util.db_mongo import (MongoAdapter)
+from util.docker_pool import (DockerHostPool)
+from controller.pipeline_run import (PipelineRun)
+
+docker = LazyModule('docker')
+
+logger = get_logger('controller.runner')
+
+
+def get_runner_name() -> str:
+    """ Get the default name of a runner, unique across the machines of the fleet
+
+    Returns:
+        str: <hostname>-<pid>
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class QueueRunner:
+    """ Claim the queued pipeline runs and run them on a pool of docker hosts
+    """
+
+    def __init__(self, mongo_ds: MongoAdapter, host_pool: DockerHostPool, name: str = None,
+                 concurrency: int = 1, lease_seconds: float = c.DEFAULT_LEASE_SECONDS,
+                 poll_interval: float = c.DEFAULT_POLL_INTERVAL,
+                 max_attempts: int = c.DEFAULT_MAX_ATTEMPTS):
+        """ Initialize the runner
+
+        Args:
+            mongo_ds (MongoAdapter): datastore holding the queue and the run records
+            host_pool (DockerHostPool): docker hosts to run the pipelines on
+            name (str, optional): name of the runner holding the leases.
+                Defaults to None for <hostname>-<pid>.
+            concurrency (int, optional): pipeline runs at the same time. Defaults to 1.
+            lease_seconds (float, optional): validity of a lease. Defaults to
+                DEFAULT_LEASE_SECONDS.
+            poll_interval (float, optional): seconds between two polls of an empty queue.
+                Defaults to DEFAULT_POLL_INTERVAL.
+            max_attempts (int, optional): claims of a run before it is failed, a run
+                claimed again is one whose runner crashed. Defaults to DEFAULT_MAX_ATTEMPTS.
+        """
+        self.mongo_ds = mongo_ds
+        self.host_pool = host_pool
+        self.name = name or get_runner_name()
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.completed = 0
+
+    def serve(self, once: bool = False) -> int:
+        """ Serve the queue on a new event loop, for callers outside of asyncio
+
+        Args:
+            once (bool, optional): return when the queue is empty instead of waiting
+                for new runs. Defaults to False.
+
+        Returns:
+            int: number of runs completed
+        """
+        return asyncio.run(self.serve_async(once))
+
+    async def serve_async(self, once: bool = False) -> int:
+        """ Claim and run the queued runs until interrupted
+
+        Args:
+            once (bool, optional): return when the queue is empty. Defaults to False.
+
+        Returns:
+            int: number of runs completed
+        """
+        await asyncio.gather(*(self._work(once) for _ in range(self.concurrency)))
+        return self.completed
+
+    async def _work(self, once: bool) -> None:
+        """ Run the queued runs one after the other
+
+        Args:
+            once (bool): return when the queue is empty
+        """
+        while True:
+            item = await asyncio.to_thread(
+                self.mongo_ds.claim_queued_run, self.name, self.lease_seconds)
+            if item is None:
+                if once:
+                    return
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.run_item(item)
+
+    async def run_item(self, item: dict) -> str | None:
+        """ Run a claimed pipeline run while renewing its lease, and record its status
+
+        Args:
+            item (dict): the claimed queue item
+
+        Returns:
+            str | None: status of the pipeline, None if the lease was lost and the run
+                was left to the runner that claimed it again
+        """
+        job = await asyncio.to_thread(self.mongo_ds.get_job, item[c.FIELD_JOB_ID])
+        if not job:
+            logger.warning("run record %s of queued run %s not found",
+                           item[c.FIELD_JOB_ID], item[c.FIELD_ID])
+            await asyncio.to_thread(self.mongo_ds.complete_queued_run,
+                                    item[c.FIELD_ID], self.name)
+            return None
+        pipeline_config = PipelineConfig.model_validate(job[c.FIELD_PIPELINE_CONFIG_USED])
+        label = f"{item[c.FIELD_PIPELINE_NAME]}:{job[c.FIELD_RUN_NUMBER]}"
+        if item[c.FIELD_ATTEMPTS] > self.max_attempts:
+            click.secho(f"[{label}] abandoned after {self.max_attempts} attempts", fg='red')
+            await asyncio.to_thread(self._wrap_up, item,
+                                    PipelineRun(self.mongo_ds, item[c.FIELD_JOB_ID]),
+                                    c.STATUS_FAILED)
+            return c.STATUS_FAILED
+
+        host = self.host_pool.acquire()
+        click.echo(f"[{label}] claimed by runner {self.name}, running on {host.name}")
+        run = PipelineRun(self.mongo_ds, item[c.FIELD_JOB_ID], host, label=label)
+        lease_kept = True
+        default_status = c.STATUS_FAILED
+        try:
+            run.state_writer.update_job(item[c.FIELD_JOB_ID], {c.FIELD_DOCKER_HOST: host.name})
+            executor = await run.start(item[c.FIELD_REPO_NAME], item[c.FIELD_BRANCH],
+                                       pipeline_config, job[c.FIELD_RUN_NUMBER],
+                                       set(item.get(c.FIELD_SKIPPED_JOBS) or []))
+            lease_kept = await self._run_with_lease(item[c.FIELD_ID],
+                                                    executor.run_async(pipeline_config))
+        except docker.errors.DockerException as de:
+            logger.warning("run %s fail with docker error: %s", label, de)
+            click.secho(f"[{label}] Error with docker service. error is {de}", fg='red')
+            if run.executor is not None:
+                run.executor.pipeline_status = c.STATUS_FAILED
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            # a run stopped before its executor finished a stage is cancelled
+            default_status = c.STATUS_CANCELLED
+            raise
+        finally:
+            self.host_pool.release(host)
+            pipeline_status = run.get_status(default_status)
+            if lease_kept:
+                await asyncio.to_thread(self._wrap_up, item, run, pipeline_status)
+            else:
+                # the stages recorded so far are kept for the runner claiming the run
+                await asyncio.to_thread(run.state_writer.close)
+                click.secho(f"[{label}] lease lost, run left to the runner claiming it",
+                            fg='yellow')
+        if not lease_kept:
+            return None
+        self.completed += 1
+        click.secho(f"[{label}] {pipeline_status}",
+                    fg='green' if pipeline_status == c.STATUS_SUCCESS else 'red')
+        return pipeline_status
+
+    async def _run_with_lease(self, item_id, run) -> bool:
+        """ Await the run while a heartbeat renews its lease. The run is cancelled
+        if the lease is lost, as another runner may have claimed it.
+
+        Args:
+            item_id (ObjectId): id of the queue item
+            run (Coroutine): the pipeline run
+
+        Returns:
+            bool: False if the lease was lost
+        """
+        run_task = asyncio.create_task(run)
+        heartbeat = asyncio.create_task(self._heartbeat(item_id))
+        lease_kept = True
+        try:
+            await asyncio.wait({run_task, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            lease_kept = run_task.done()
+        finally:
+            heartbeat.cancel()
+            run_task.cancel()
+            # let a cancelled run stop its containers and record its stage
+            await asyncio.gather(run_task, heartbeat, return_exceptions=True)
+        if lease_kept:
+            run_task.result()
+        return lease_kept
+
+    async def _heartbeat(self, item_id) -> None:
+        """ Renew the lease of a run several times per lease period, return when lost.
+        Renewals failing to reach the database are retried until the lease expires.
+
+        Args:
+            item_id (ObjectId): id of the queue item
+        """
+        while True:
+            await asyncio.sleep(self.lease_seconds / c.LEASE_RENEWALS)
+            renewed = await asyncio.to_thread(
+                self.mongo_ds.renew_lease, item_id, self.name, self.lease_seconds)
+            if renewed is False:
+                logger.warning("lease of queued run %s lost by runner %s", item_id, self.name)
+                return
+
+    def _wrap_up(self, item: dict, run: PipelineRun, pipeline_status: str) -> None:
+        """ Wrap up the run and clear the running flag of its pipeline, see
+        PipelineRun.wrap_up, then remove the run from the queue. The state of the run
+        is journaled before the run leaves the queue.
+
+        Args:
+            item (dict): the claimed queue item
+            run (PipelineRun): the run to wrap up
+            pipeline_status (str): final status of the pipeline
+        """
+        release = functools.partial(
+            self.mongo_ds.update_pipeline_info,
+            item[c.FIELD_REPO_NAME],
+            item[c.FIELD_REPO_URL],
+            item[c.FIELD_BRANCH],
+            item[c.FIELD_PIPELINE_NAME],
+            {c.FIELD_RUNNING: False}
+        )
+        if not run.wrap_up(pipeline_status, release):
+            logger.warning("fail to record the status of run %s", item[c.FIELD_JOB_ID])
+        self.mongo_ds.complete_queued_run(item[c.FIELD_ID], self.name)
@@ -0,0 +1,467 @@
+""" Scheduler of the pipeline runs started by the controller. A run is recorded in
+jobs_history and marks its pipeline as running, then it is placed on the least loaded
+docker host of a pool and its stages run there, see PipelineRun. A failed or cancelled
+run keeps its volume and can be resumed under the same record, and a run can be added
+to the job queue for a cid runner instead of running it here.
+"""
+import asyncio
+import functools
+import threading
+import time
+
+import click
+from pydantic import ValidationError
+import util.constant as c
+from util.model import (SessionDetail, PipelineConfig, PipelineInfo)
+from util.common_utils import (get_logger, get_env, ChangeSelector, LazyModule)
+from util.repo_manager import (RepoManager)
+from util.db_mongo import (MongoAdapter)
+from util.docker_pool import (DockerHostPool)
+from controller.pipeline_run import (PipelineRun)
+
+docker = LazyModule('docker')
+
+logger = get_logger('controller.scheduler')
+
+
+class RunScheduler:
+    """ Start, resume, queue and wrap up the pipeline runs of a controller. Runs started
+    by the same scheduler, i.e. a batch run across commits, can overlap and share the
+    running flag of their pipeline, while a run from other process is rejected.
+    """
+
+    def __init__(self, mongo_ds: MongoAdapter, repo_manager: RepoManager):
+        """ Initialize the scheduler
+
+        Args:
+            mongo_ds (MongoAdapter): datastore holding the pipeline and run records
+            repo_manager (RepoManager): repository the pipelines run from, to find the
+                files changed since the last successful run
+        """
+        self.mongo_ds = mongo_ds
+        self.repo_manager = repo_manager
+        # Guard the pipeline run history shared by concurrent runs
+        self._run_lock = threading.Lock()
+        self._active_runs = {}
+
+    def get_host_pool(self, local: bool, max_containers: int = None) -> DockerHostPool:
+        """ Get the docker hosts to run the pipelines on. Remote runs use the hosts
+        in the environment variable CID_DOCKER_HOSTS, and fall back to the local
+        docker engine if none is configured.
+
+        Args:
+            local (bool): True to run on the local docker engine
+            max_containers (int, optional): maximum containers running at the same time
+                on each host. Defaults to None, see _get_max_containers.
+
+        Raises:
+            docker.errors.DockerException: If none of the remote docker hosts is reachable
+
+        Returns:
+            DockerHostPool: pool of the docker hosts
+        """
+        max_containers = self._get_max_containers(max_containers)
+        if local:
+            click.echo("Running pipeline on local")
+            return DockerHostPool.local(max_containers)
+        host_pool = DockerHostPool.from_env(max_containers)
+        if host_pool is None:
+            click.echo(f"No remote docker host configured in {c.ENV_DOCKER_HOSTS}, "
+                       "running pipeline on local")
+            return DockerHostPool.local(max_containers)
+        click.echo("Running pipeline on remote docker hosts "
+                   f"{', '.join(host.name for host in host_pool.hosts)}")
+        return host_pool
+
+    @staticmethod
+    def _get_max_containers(max_containers: int = None) -> int:
+        """ Get the maximum number of containers running at the same time, from the
+        given value, or the environment variable CID_MAX_CONTAINERS.
+
+        Args:
+            max_containers (int, optional): limit given by the user. Defaults to None.
+
+        Returns:
+            int: the limit, at least 1
+        """
+        if max_containers is None:
+            env = get_env()
+            max_containers = c.DEFAULT_MAX_CONTAINERS
+            try:
+                if env.get(c.ENV_MAX_CONTAINERS):
+                    max_containers = int(env[c.ENV_MAX_CONTAINERS])
+            except ValueError:
+                logger.warning("Invalid %s value %s, using default",
+                               c.ENV_MAX_CONTAINERS, env[c.ENV_MAX_CONTAINERS])
+        return max(1, max_containers)
+
+    def run(self, repo_data: SessionDetail, pipeline_config: PipelineConfig,
+            local: bool = False, resume_job: dict = None) -> tuple[bool, str]:
+        """ Run the pipeline on a new event loop, for callers outside of asyncio.
+        A failed or cancelled run is resumed under its job record: the jobs completed
+        by the previous attempt are kept, the others run again on the volume of the run.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_config (PipelineConfig): validated pipeline_configuration
+            local (bool, optional): flag indicate if run to be local(True) or remote(False).
+                Defaults to False.
+            resume_job (dict, optional): record of a failed or cancelled run to resume
+                instead of starting a new run. Defaults to None.
+
+        Raises:
+            docker.errors.DockerException: If none of the remote docker hosts is reachable
+
+        Returns:
+            tuple(bool, str): first flag indicate whether the overall run is
+                successful(True) or fail(False). Second str is the actual run number if success,
+                or error message if fail
+        """
+        host_pool = self.get_host_pool(local)
+        return asyncio.run(self.run_async(repo_data, pipeline_config, host_pool=host_pool,
+                                          resume_job=resume_job))
+
+    async def run_async(self, repo_data: SessionDetail, pipeline_config: PipelineConfig,
+                        host_pool: DockerHostPool, label: str = None,
+                        resume_job: dict = None) -> tuple[bool, str]:
+        """ Run the pipeline on the running event loop, alongside other pipelines
+        sharing the same pool of docker hosts. All the jobs of the run are placed on
+        one host, as they share the volume of the run.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_config (PipelineConfig): validated pipeline_configuration
+            host_pool (DockerHostPool): docker hosts to place the run on,
+                see get_host_pool.
+            label (str, optional): prefix of the run messages. Defaults to None.
+            resume_job (dict, optional): record of the run to resume. Defaults to None.
+
+        Returns:
+            tuple(bool, str): same as run
+        """
+        pipeline_name = pipeline_config.global_.pipeline_name
+        # Step 1: Select the jobs to skip based on the changes since last successful run,
+        # a resumed run keeps the selection recorded by its previous attempt
+        skipped_jobs = set()
+        if resume_job is None:
+            skipped_jobs = await asyncio.to_thread(
+                self._get_skipped_jobs, repo_data, pipeline_config)
+
+        # Step 1 - 2: Check if pipeline is already running, insert new job record
+        status, error_msg, job_id, run_number = await asyncio.to_thread(
+            self._start_run, repo_data, pipeline_config,
+            None if resume_job is None else resume_job[c.FIELD_RUN_NUMBER])
+        if not status:
+            return False, error_msg
+
+        # Place the run on the least loaded docker host, a resumed run on the host
+        # holding its volume
+        host = host_pool.acquire(None if resume_job is None
+                                 else resume_job.get(c.FIELD_DOCKER_HOST))
+        run = PipelineRun(self.mongo_ds, job_id, host, label=label)
+        if host_pool.remote:
+            click.echo(f"Running pipeline {pipeline_name} on {host.name}")
+            run.state_writer.update_job(job_id, {c.FIELD_DOCKER_HOST: host.name})
+        default_status = c.STATUS_FAILED
+        try:
+            # Step 3: Run the stages, job groups of a stage run concurrently
+            executor = await run.start(repo_data.repo_name, repo_data.branch, pipeline_config,
+                                       run_number, skipped_jobs, resume_job)
+            await executor.run_async(pipeline_config)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            default_status = c.STATUS_CANCELLED
+            raise
+        finally:
+            # Ensure always Wrap up and return, a run stopped before its executor
+            # finished a stage is cancelled, or failed by an error
+            pipeline_status = run.get_status(default_status)
+            host_pool.release(host)
+            await asyncio.to_thread(self._wrap_up_run, repo_data, pipeline_name, run,
+                                    pipeline_status)
+        pipeline_pass = pipeline_status == c.STATUS_SUCCESS
+        run_msg = f"run_number:{run_number}" if pipeline_pass else ""
+        return pipeline_pass, run_msg
+
+    async def run_all_async(self, git_details: SessionDetail, pipeline_configs: dict,
+                            local: bool, max_containers: int = None) -> dict:
+        """ Run the pipelines concurrently on a shared pool of docker hosts
+
+        Args:
+            git_details (SessionDetail): details of the git repository where to use.
+            pipeline_configs (dict): pipeline name to validated PipelineConfig
+            local (bool): run pipelines on the local docker engine
+            max_containers (int, optional): maximum containers running at the same time
+                on each docker host. Defaults to None, see _get_max_containers.
+
+        Returns:
+            dict: pipeline name to (status, message) of the run
+        """
+        try:
+            host_pool = await asyncio.to_thread(self.get_host_pool, local, max_containers)
+        except docker.errors.DockerException as de:
+            message = f"Error with docker service. error is {str(de)}"
+            logger.warning(message)
+            return dict.fromkeys(pipeline_configs, (False, message))
+
+        async def run_one(pipeline_name: str, pipeline_config: PipelineConfig) -> tuple:
+            try:
+                return await self.run_async(git_details, pipeline_config,
+                                            host_pool=host_pool, label=pipeline_name)
+            except docker.errors.DockerException as de:
+                message = f"Error with docker service. error is {str(de)}"
+                logger.warning(message)
+                return False, message
+
+        runs = await asyncio.gather(*(run_one(pipeline_name, pipeline_config)
+                                      for pipeline_name, pipeline_config
+                                      in pipeline_configs.items()))
+        return dict(zip(pipeline_configs, runs))
+
+    def enqueue(self, repo_data: SessionDetail,
+                pipeline_config: PipelineConfig) -> tuple[bool, str]:
+        """ Record a new run of the pipeline and add it to the job queue, for a cid
+        runner to run it. The pipeline stays running until the runner finish the run.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_config (PipelineConfig): validated pipeline_configuration
+
+        Returns:
+            tuple(bool, str): True if the run is queued, and the run number or the
+                error message
+        """
+        # Skipped jobs are selected here, the runner has no checkout to compare
+        skipped_jobs = self._get_skipped_jobs(repo_data, pipeline_config)
+        status, error_msg, job_id, run_number = self._start_run(repo_data, pipeline_config)
+        if not status:
+            return False, error_msg
+        pipeline_name = pipeline_config.global_.pipeline_name
+        item_id = self.mongo_ds.enqueue_run({
+            c.FIELD_JOB_ID: job_id,
+            c.FIELD_REPO_NAME: repo_data.repo_name,
+            c.FIELD_REPO_URL: repo_data.repo_url,
+            c.FIELD_BRANCH: repo_data.branch,
+            c.FIELD_PIPELINE_NAME: pipeline_name,
+            c.FIELD_SKIPPED_JOBS: sorted(skipped_jobs)
+        })
+        if item_id is None:
+            # no runner will ever finish this run, release the pipeline now
+            self.mongo_ds.update_job(job_id, {c.FIELD_STATUS: c.STATUS_FAILED,
+                                              c.FIELD_COMPLETION_TIME: time.asctime()})
+            self._finish_run(repo_data, pipeline_name)
+            return False, "Fail to add the run to the job queue"
+        self._finish_run(repo_data, pipeline_name, clear_running=False)
+        return True, f"run_number:{run_number} queued"
+
+    def _wrap_up_run(self, repo_data: SessionDetail, pipeline_name: str, run: PipelineRun,
+                     pipeline_status: str) -> None:
+        """ Wrap up the run and release the pipeline started by _start_run,
+        see PipelineRun.wrap_up
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_name (str): name of the pipeline
+            run (PipelineRun): the run to wrap up
+            pipeline_status (str): final status of the pipeline
+        """
+        if not run.wrap_up(pipeline_status,
+                           functools.partial(self._finish_run, repo_data, pipeline_name)):
+            click.secho(
+                "Failed to update pipeline status, please do manual update\n", fg="red")
+
+    def _start_run(self, repo_data: SessionDetail, pipeline_config: PipelineConfig,
+                   resume_run: int = None) -> tuple[bool, str, str | None, int]:
+        """ Check the pipeline is not already running, insert the new job record, and
+        mark the pipeline as running.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_config (PipelineConfig): validated pipeline_configuration
+            resume_run (int, optional): run number of the run to resume under its
+                existing job record. Defaults to None for a new run.
+
+        Returns:
+            tuple[bool, str, str | None, int]: success flag, error message if any,
+                the inserted job id and the run number.
+        """
+        pipeline_name = pipeline_config.global_.pipeline_name
+        run_key = (repo_data.repo_name, repo_data.repo_url, repo_data.branch, pipeline_name)
+        # Read and update of the run history must not interleave between concurrent runs
+        with self._run_lock:
+            pipeline_history = self.mongo_ds.get_pipeline_history(
+                repo_data.repo_name,
+                repo_data.repo_url,
+                repo_data.branch,
+                pipeline_name
+            )
+            try:
+                his_obj = PipelineInfo.model_validate(pipeline_history)
+            except ValidationError as ve:
+                logger.warning(
+                    "Validation error for pipeline_history: %s error is %s",
+                    pipeline_history,
+                    ve
+                )
+                return False, "Fail to retrieve pipeline history", None, 0
+
+            # Early return if pipeline already running outside of this scheduler
+            if his_obj.running and not self._active_runs.get(run_key):
+                error_msg = f"Pipeline {pipeline_name} Already Running. "
+                error_msg += "Please Stop Before Proceed"
+                return False, error_msg, None, 0
+
+            if resume_run is None:
+                # Record the commit actually checked out, as concurrent runs of
+                # other commits may update the pipeline record
+                his_obj.last_commit_hash = repo_data.commit_hash
+                job_id = self.mongo_ds.insert_job(
+                    his_obj,
+                    pipeline_config.model_dump(by_alias=True)
+                )
+
+                his_obj.job_run_history.append(job_id)
+                run_number = len(his_obj.job_run_history)
+                updates = {
+                    c.FIELD_JOB_RUN_HISTORY: his_obj.job_run_history,
+                    c.FIELD_RUNNING: True,
+                }
+            else:
+                job_id = his_obj.job_run_history[resume_run - 1]
+                run_number = resume_run
+                updates = {c.FIELD_RUNNING: True}
+            update_success = self.mongo_ds.update_pipeline_info(
+                repo_data.repo_name,
+                repo_data.repo_url,
+                repo_data.branch,
+                pipeline_name,
+                updates
+            )
+            # if update unsuccessful, prompt user.
+            if not update_success:
+                click.confirm(
+                    'Cannot update into db, do you want to continue?', abort=True)
+            self._active_runs[run_key] = self._active_runs.get(run_key, 0) + 1
+        return True, "", job_id, run_number
+
+    def _finish_run(self, repo_data: SessionDetail, pipeline_name: str,
+                    clear_running: bool = True) -> bool:
+        """ Release the run started by _start_run, and clear the running flag
+        when no other run of the pipeline is active in this scheduler.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_name (str): name of the pipeline
+            clear_running (bool, optional): False to keep the running flag, for a run
+                handed over to a cid runner. Defaults to True.
+
+        Returns:
+            bool: True if the pipeline record is updated successfully
+        """
+        run_key = (repo_data.repo_name, repo_data.repo_url, repo_data.branch, pipeline_name)
+        with self._run_lock:
+            remaining = self._active_runs.get(run_key, 1) - 1
+            if remaining > 0:
+                self._active_runs[run_key] = remaining
+                return True
+            self._active_runs.pop(run_key, None)
+            if not clear_running:
+                return True
+            return self.mongo_ds.update_pipeline_info(
+                repo_data.repo_name,
+                repo_data.repo_url,
+                repo_data.branch,
+                pipeline_name,
+                {c.FIELD_RUNNING: False}
+            )
+
+    def get_resume_job(self, repo_data: SessionDetail, pipeline_name: str,
+                        run_number: int) -> tuple[bool, str, dict | None]:
+        """ Retrieve the record of a run to resume, only failed, cancelled or
+        interrupted runs can be resumed.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_name (str): name of the pipeline
+            run_number (int): run number to resume
+
+        Returns:
+            tuple[bool, str, dict | None]: success flag, error message if any, and the
+                job record of the run
+        """
+        pipeline_history = self.mongo_ds.get_pipeline_history(
+            repo_data.repo_name,
+            repo_data.repo_url,
+            repo_data.branch,
+            pipeline_name
+        ) or {}
+        run_history = pipeline_history.get(c.FIELD_JOB_RUN_HISTORY) or []
+        if not 1 <= run_number <= len(run_history):
+            return False, f"Run {run_number} of pipeline {pipeline_name} not found", None
+        job = self.mongo_ds.get_job(run_history[run_number - 1])
+        if not job:
+            return False, f"Record of run {run_number} of pipeline {pipeline_name} not found", \
+                None
+        if job.get(c.FIELD_STATUS) == c.STATUS_SUCCESS:
+            return False, f"Run {run_number} of pipeline {pipeline_name} already succeeded", \
+                None
+        return True, "", job
+
+    def is_run_active(self, run_id: str, max_age: float) -> bool:
+        """ Check if a run is still in flight, i.e. its record has no final status yet
+        and its heartbeat was renewed within max_age. The record of a crashed run keeps
+        its status, but its heartbeat gets stale. A run whose record cannot be read is
+        taken as in flight, and a run whose record is gone as finished.
+
+        Args:
+            run_id (str): id of the job record of the run
+            max_age (float): seconds since the last heartbeat of a run in flight
+
+        Returns:
+            bool: True if the run is in flight
+        """
+        job = self.mongo_ds.get_job(run_id)
+        if not job:
+            return job is not None
+        try:
+            heartbeat = float(job.get(c.FIELD_HEARTBEAT) or 0)
+        except (TypeError, ValueError):
+            heartbeat = 0
+        return job.get(c.FIELD_STATUS) in c.ACTIVE_RUN_STATUSES and \
+            time.time() <= heartbeat + max_age
+
+    def _get_skipped_jobs(self, repo_data: SessionDetail,
+                          pipeline_config: PipelineConfig) -> set[str]:
+        """ Find the jobs to skip for this run. Jobs declaring `changes` globs are
+        skipped, with the jobs that need them, when no file matching the globs changed
+        between the last successful run of the pipeline and the commit being run.
+        All jobs run if there is no previous successful run or the diff is unavailable.
+
+        Args:
+            repo_data (SessionDetail): information required to identify the repo record
+            pipeline_config (PipelineConfig): validated pipeline_configuration
+
+        Returns:
+            set[str]: names of the jobs to skip
+        """
+        if all(job.get(c.JOB_SUBKEY_CHANGES) is None for job in pipeline_config.jobs.values()):
+            return set()
+        pipeline_history = self.mongo_ds.get_pipeline_history(
+            repo_data.repo_name,
+            repo_data.repo_url,
+            repo_data.branch,
+            pipeline_config.global_.pipeline_name
+        ) or {}
+        base_commit = self.mongo_ds.get_last_successful_commit(
+            pipeline_history.get(c.FIELD_JOB_RUN_HISTORY) or [])
+        if not base_commit:
+            click.echo("No previous successful run, running all jobs")
+            return set()
+        changed_files = self.repo_manager.get_changed_files(base_commit, repo_data.commit_hash)
+        if changed_files is None:
+            click.echo(f"Cannot compare with last successful commit {base_commit}, "
+                       "running all jobs")
+            return set()
+        skipped_jobs = ChangeSelector.get_skipped_jobs(pipeline_config.jobs, changed_files)
+        click.echo(f"{len(changed_files)} files changed since last successful commit "
+                   f"{base_commit[:8]}")
+        return skipped_jobs
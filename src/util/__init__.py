@@ -2,6 +2,7 @@
 provide supporting functions used by the controller, which includes
 the common utility tools, constant, config_tools for pipeline configuration validation, 
 yaml_parser to extract yaml file, repo_manager to handle interaction
-with repository, db_mongo to handle interaction with mongo database and 
+with repository, repo_cache to cache the remote repositories locally,
+db_mongo to handle interaction with mongo database and 
 container to handle interaction with the Docker
 """
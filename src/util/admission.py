@@ -0,0 +1,159 @@
+""" Admission control of the job containers on a docker host. A job is admitted
+when the cpus and memory it declares fit in what is left of the host capacity and
+the number of running containers is below the limit. The other jobs wait in arrival
+order, so a large job is not starved by the smaller jobs queued behind it.
+Jobs without resources only count against the container limit.
+"""
+import asyncio
+import collections
+import contextlib
+import util.constant as c
+from util.common_utils import (get_logger, get_cpu_count, get_memory_size)
+
+logger = get_logger('util.admission')
+
+# tolerance for the float sum of cpus
+CPU_EPSILON = 1e-9
+
+
+class AdmissionController:
+    """ Track the resources reserved by the running jobs of a docker host.
+    An instance is used from a single event loop, and can be shared by all
+    the pipelines running on it.
+    """
+
+    def __init__(self, cpus: float = None, memory: int = None,
+                 max_containers: int = c.DEFAULT_MAX_CONTAINERS):
+        """ Initialize the controller
+
+        Args:
+            cpus (float, optional): cpus of the host. Defaults to None for no cpu accounting.
+            memory (int, optional): memory of the host in bytes.
+                Defaults to None for no memory accounting.
+            max_containers (int, optional): maximum running containers.
+                Defaults to DEFAULT_MAX_CONTAINERS.
+        """
+        self.cpus = cpus
+        self.memory = memory
+        self.max_containers = max(1, max_containers)
+        self.used_cpus = 0.0
+        self.used_memory = 0
+        self.running = 0
+        self._waiters = collections.deque()
+
+    @classmethod
+    def for_local_host(cls, max_containers: int = c.DEFAULT_MAX_CONTAINERS
+                       ) -> 'AdmissionController':
+        """ Build the controller for the docker engine of this machine
+
+        Args:
+            max_containers (int, optional): maximum running containers.
+                Defaults to DEFAULT_MAX_CONTAINERS.
+
+        Returns:
+            AdmissionController: controller sized to the cpus and memory of the machine
+        """
+        return cls(cpus=get_cpu_count(), memory=get_memory_size(),
+                   max_containers=max_containers)
+
+    def get_request(self, job_config: dict) -> tuple[float, int]:
+        """ Get the resources to reserve for a job. A job asking more than the host
+        has is reduced to the host capacity, so it runs alone instead of waiting forever.
+
+        Args:
+            job_config (dict): validated job configuration
+
+        Returns:
+            tuple[float, int]: cpus and memory in bytes
+        """
+        resources = job_config.get(c.JOB_SUBKEY_RESOURCES) or {}
+        cpus = resources.get(c.RESOURCE_SUBKEY_CPUS) or 0.0
+        memory = resources.get(c.RESOURCE_SUBKEY_MEMORY) or 0
+        if self.cpus is not None and cpus > self.cpus:
+            logger.warning("job ask %s cpus, more than the %s of the host", cpus, self.cpus)
+            cpus = self.cpus
+        if self.memory is not None and memory > self.memory:
+            logger.warning("job ask %s bytes, more than the %s of the host",
+                           memory, self.memory)
+            memory = self.memory
+        return cpus, memory
+
+    def fits(self, cpus: float, memory: int) -> bool:
+        """ Check if a job can start now
+
+        Args:
+            cpus (float): cpus requested
+            memory (int): memory requested in bytes
+
+        Returns:
+            bool: True if the job fits in the free capacity
+        """
+        if self.running >= self.max_containers:
+            return False
+        if self.cpus is not None and self.used_cpus + cpus > self.cpus + CPU_EPSILON:
+            return False
+        if self.memory is not None and self.used_memory + memory > self.memory:
+            return False
+        return True
+
+    @contextlib.asynccontextmanager
+    async def admit(self, job_config: dict):
+        """ Wait until the job is admitted, and release its resources on exit
+
+        Args:
+            job_config (dict): validated job configuration
+        """
+        cpus, memory = self.get_request(job_config)
+        await self._acquire(cpus, memory)
+        try:
+            yield
+        finally:
+            self._release(cpus, memory)
+
+    async def _acquire(self, cpus: float, memory: int) -> None:
+        """ Reserve the resources, queueing behind the jobs already waiting
+
+        Args:
+            cpus (float): cpus requested
+            memory (int): memory requested in bytes
+        """
+        if not self._waiters and self.fits(cpus, memory):
+            self._reserve(cpus, memory)
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, cpus, memory)
+        self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # admitted just before the cancellation, give the resources back
+                self._release(cpus, memory)
+            else:
+                self._waiters.remove(waiter)
+                self._wake_up()
+            raise
+
+    def _reserve(self, cpus: float, memory: int) -> None:
+        """ Account the resources of an admitted job """
+        self.used_cpus += cpus
+        self.used_memory += memory
+        self.running += 1
+
+    def _release(self, cpus: float, memory: int) -> None:
+        """ Give back the resources of a finished job """
+        self.used_cpus -= cpus
+        self.used_memory -= memory
+        self.running -= 1
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        """ Admit the waiting jobs in arrival order while they fit
+        """
+        while self._waiters:
+            future, cpus, memory = self._waiters[0]
+            if not self.fits(cpus, memory):
+                break
+            self._waiters.popleft()
+            self._reserve(cpus, memory)
+            future.set_result(None)
@@ -4,11 +4,61 @@ Provide the common utility functions used by all other modules
 import os
 import re
 import collections
+import contextlib
+import importlib
 import logging
-import yaml
-from dotenv import dotenv_values
+import types
 import util.constant as c
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non posix platform
+    fcntl = None
+
+
+class LazyModule:
+    """ Stand-in for a module that is only imported on first attribute access, so the
+    heavy backends (docker, boto3, pymongo, git) are only loaded by the commands using
+    them. Setting or deleting an attribute is applied to the real module, which keep
+    mock.patch working through the stand-in.
+    """
+
+    def __init__(self, module_name: str):
+        """ Initialize the stand-in without importing the module
+
+        Args:
+            module_name (str): full name of the module, i.e. 'botocore.exceptions'
+        """
+        object.__setattr__(self, '_module_name', module_name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self) -> types.ModuleType:
+        """ Import the module if not done yet. The import system lock make
+        concurrent first accesses safe.
+
+        Returns:
+            types.ModuleType: the real module
+        """
+        if self._module is None:
+            object.__setattr__(self, '_module', importlib.import_module(self._module_name))
+        return self._module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._load(), name)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._module_name}'>"
+
+
+yaml = LazyModule('yaml')
+dotenv = LazyModule('dotenv')
+
 
 def get_logger(logger_name='', log_level=logging.DEBUG, log_file='../debug.log') -> logging.Logger:
     """ common function to set the logger for the cicd system. This will add the stream logger 
@@ -58,7 +108,7 @@ def get_env() -> dict:
     Returns:
         dict: dictionary of env values in key=value pairs
     """
-    file_config = dotenv_values(".env")
+    file_config = dotenv.dotenv_values(".env")
     env_config = {key: os.getenv(key) for key in os.environ.keys()}
     # Merge dictionaries, .env file takes priority
     config = {**env_config, **file_config}
@@ -66,6 +116,113 @@ def get_env() -> dict:
     return config
 
 
+def get_cpu_count() -> int:
+    """ Number of CPUs this process may run on, which can be lower than
+    os.cpu_count() inside containers or with a restricted CPU affinity.
+
+    Returns:
+        int: number of usable CPUs, at least 1
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def get_memory_size() -> int | None:
+    """ Physical memory of the machine
+
+    Returns:
+        int | None: number of bytes, None if it cannot be determined
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def parse_duration(value: any) -> float | None:
+    """ Convert a duration to a number of seconds
+
+    Args:
+        value (any): number of seconds, or duration with unit s, m or h
+
+    Returns:
+        float | None: number of seconds, None if the value is not a valid duration
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    match = re.match(c.REGEX_DURATION, value, re.IGNORECASE)
+    if match is None:
+        return None
+    return float(match.group(1)) * c.DURATION_UNITS[match.group(2).lower()]
+
+
+def parse_size(value: any) -> int | None:
+    """ Convert a memory or disk size to a number of bytes
+
+    Args:
+        value (any): number of bytes, or size with unit b, k, m or g
+
+    Returns:
+        int | None: number of bytes, None if the value is not a valid size
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str):
+        return None
+    match = re.match(c.REGEX_MEMORY_SIZE, value, re.IGNORECASE)
+    if match is None:
+        return None
+    return int(float(match.group(1)) * c.MEMORY_UNITS[match.group(2).lower()])
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str):
+    """ Exclusive advisory lock backed by a lock file, used to coordinate
+    multiple cid processes on the same machine. No-op on platforms without fcntl.
+
+    Args:
+        lock_path (str): path of the lock file, created if absent
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'a', encoding='utf-8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_process_alive(pid: int) -> bool:
+    """ Check if a process of this machine is still running
+
+    Args:
+        pid (int): id of the process
+
+    Returns:
+        bool: True if the process exists, even when owned by other user
+    """
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
 class UnionFind:
     """ UnionFind Class to Find Separated Group of Related Nodes(jobs)
     """
@@ -439,6 +596,94 @@ class ConfigOverride:
         return config
 
 
+class ChangeSelector:
+    """ChangeSelector class to select the jobs to skip based on the changed files
+    and the `changes` globs declared by each job"""
+
+    @staticmethod
+    def glob_to_regex(pattern: str) -> re.Pattern:
+        """
+        Convert a path glob into a regex. `*` and `?` do not cross directory
+        separators, `**` match any number of directories, and a pattern ending
+        with `/` match everything below the directory.
+
+        Args:
+            pattern (str): glob pattern, relative to the repository root, i.e. services/api/**
+
+        Returns:
+            re.Pattern: compiled regex matching the whole path
+        """
+        pattern = pattern.strip()
+        if pattern.startswith('./'):
+            pattern = pattern[2:]
+        pattern = pattern.lstrip('/')
+        if pattern.endswith('/'):
+            pattern += '**'
+        regex = ''
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if pattern.startswith('**/', i):
+                regex += '(?:.*/)?'
+                i += 3
+                continue
+            if pattern.startswith('**', i):
+                regex += '.*'
+                i += 2
+                continue
+            if char == '*':
+                regex += '[^/]*'
+            elif char == '?':
+                regex += '[^/]'
+            else:
+                regex += re.escape(char)
+            i += 1
+        return re.compile(regex + r'\Z')
+
+    @staticmethod
+    def matches(changed_files: list[str], patterns: list[str]) -> bool:
+        """
+        Check if any changed file matches any of the glob patterns.
+
+        Args:
+            changed_files (list[str]): changed file paths relative to the repository root
+            patterns (list[str]): glob patterns
+
+        Returns:
+            bool: True if at least one file matches
+        """
+        regexes = [ChangeSelector.glob_to_regex(pattern) for pattern in patterns]
+        return any(regex.match(path) for path in changed_files for regex in regexes)
+
+    @staticmethod
+    def get_skipped_jobs(jobs: dict, changed_files: list[str]) -> set[str]:
+        """
+        Find the jobs to skip. A job declaring `changes` is skipped when none of
+        the changed files matches its globs, and every job that needs a skipped
+        job is skipped as well.
+
+        Args:
+            jobs (dict): validated jobs section, job name to job config
+            changed_files (list[str]): changed file paths relative to the repository root
+
+        Returns:
+            set[str]: names of the jobs to skip
+        """
+        skipped = {name for name, config in jobs.items()
+                   if config.get(c.JOB_SUBKEY_CHANGES) is not None
+                   and not ChangeSelector.matches(changed_files, config[c.JOB_SUBKEY_CHANGES])}
+        # Propagate to the dependents until no new job is skipped
+        changed = True
+        while changed:
+            changed = False
+            for name, config in jobs.items():
+                if name not in skipped and skipped.intersection(
+                        config.get(c.JOB_SUBKEY_NEEDS, [])):
+                    skipped.add(name)
+                    changed = True
+        return skipped
+
+
 class DryRun:
     """DryRun class to handle message output formatting for cid pipeline, to print plain text
     or YAML format."""
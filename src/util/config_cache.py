@@ -0,0 +1,213 @@
+""" On-disk cache of parsed and validated pipeline configurations.
+Each configuration directory has one index file, recording for every YAML file
+its size, modification time and content hash, the pipeline_name it declares and,
+once validated, the processed pipeline configuration. An entry is only reused while
+the file on disk still match it, so editing a file invalidate its entry automatically.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from importlib import metadata
+from pathlib import Path
+from util.common_utils import (get_env, get_logger, file_lock)
+import util.constant as c
+
+logger = get_logger('util.config_cache')
+
+
+def _get_cache_version() -> str:
+    """ Version tag stored in every index, so entries processed by another
+    release of the program are discarded instead of reused.
+
+    Returns:
+        str: cache format version and package version
+    """
+    try:
+        package_version = metadata.version(c.PACKAGE_NAME)
+    except metadata.PackageNotFoundError:
+        package_version = c.DEFAULT_STR
+    return f"{c.CONFIG_CACHE_VERSION}-{package_version}"
+
+
+class ConfigCache:
+    """ Cache the pipeline_name and the validated configuration of each pipeline
+    configuration file, keyed by the file path and validated against its size,
+    modification time and content hash.
+    """
+
+    def __init__(self, cache_dir: str = None, enabled: bool = True):
+        """ Initialize the config cache
+
+        Args:
+            cache_dir (str, optional): directory to hold the index files.
+                Defaults to ~/.cid/cache.
+            enabled (bool, optional): False turn every lookup into a miss and
+                every store into a no-op. Defaults to True.
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(c.DEFAULT_CID_HOME, c.DEFAULT_CONFIG_CACHE_DIR_NAME)
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.enabled = enabled
+        self.version = _get_cache_version()
+        # directory -> {file_path: entry}, loaded lazily from disk
+        self._indexes = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls) -> 'ConfigCache':
+        """ Build the config cache from the environment variable CID_CONFIG_CACHE_DIR.
+        Setting it to an empty value disable the cache.
+
+        Returns:
+            ConfigCache: configured config cache
+        """
+        env = get_env()
+        if c.ENV_CONFIG_CACHE_DIR in env and not env[c.ENV_CONFIG_CACHE_DIR]:
+            return cls(enabled=False)
+        return cls(cache_dir=env.get(c.ENV_CONFIG_CACHE_DIR))
+
+    @staticmethod
+    def get_file_hash(file_path: str) -> str:
+        """ Compute the content hash of a file
+
+        Args:
+            file_path (str): path of the file
+
+        Returns:
+            str: sha256 hex digest of the content
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_index_path(self, directory: str) -> Path:
+        """ Get the path of the index file for a configuration directory
+
+        Args:
+            directory (str): configuration directory
+
+        Returns:
+            Path: path of the index file, may not exist yet
+        """
+        directory = os.path.abspath(directory)
+        digest = hashlib.sha1(directory.encode('utf-8')).hexdigest()[:16]
+        return self.cache_dir / f"{os.path.basename(directory) or 'root'}-{digest}.json"
+
+    def lookup(self, file_path: str) -> dict | None:
+        """ Get the cache entry of a file if the file did not change since it was stored.
+        The content hash is only computed when the size matches but the modification
+        time does not, i.e. after a checkout rewrote the file with the same content.
+
+        Args:
+            file_path (str): path of the configuration file
+
+        Returns:
+            dict | None: entry with pipeline_name and pipeline_config, the later is
+            None if the file was never validated successfully. None for a cache miss.
+        """
+        if not self.enabled:
+            return None
+        file_path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            index = self._get_index(os.path.dirname(file_path))
+            entry = index.get(file_path)
+            if entry is None or entry[c.CACHE_FIELD_SIZE] != stat.st_size:
+                return None
+            if entry[c.CACHE_FIELD_MTIME] != stat.st_mtime_ns:
+                try:
+                    if self.get_file_hash(file_path) != entry[c.CACHE_FIELD_HASH]:
+                        return None
+                except OSError:
+                    return None
+                entry[c.CACHE_FIELD_MTIME] = stat.st_mtime_ns
+                self._dirty.add(os.path.dirname(file_path))
+            return entry
+
+    def store(self, file_path: str, pipeline_name: str | None,
+              pipeline_config: dict = None) -> None:
+        """ Record the pipeline_name declared by a file and optionally its validated
+        configuration. Only configurations that passed validation without overrides
+        should be stored. Call flush to persist the change.
+
+        Args:
+            file_path (str): path of the configuration file
+            pipeline_name (str | None): pipeline_name declared in the file,
+                None if the file cannot be parsed.
+            pipeline_config (dict, optional): processed pipeline configuration.
+                Defaults to None.
+        """
+        if not self.enabled:
+            return
+        file_path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(file_path)
+            file_hash = self.get_file_hash(file_path)
+        except OSError as e:
+            logger.debug("Skip caching %s. Error: %s", file_path, e)
+            return
+        directory = os.path.dirname(file_path)
+        with self._lock:
+            index = self._get_index(directory)
+            index[file_path] = {
+                c.CACHE_FIELD_SIZE: stat.st_size,
+                c.CACHE_FIELD_MTIME: stat.st_mtime_ns,
+                c.CACHE_FIELD_HASH: file_hash,
+                c.FIELD_PIPELINE_NAME: None if pipeline_name is None else str(pipeline_name),
+                c.FIELD_PIPELINE_CONFIG: pipeline_config,
+            }
+            self._dirty.add(directory)
+
+    def flush(self) -> None:
+        """ Persist the modified indexes to disk. Failure to write is logged and
+        ignored, as the cache only speed up later commands.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            for directory in dirty:
+                index_path = self.get_index_path(directory)
+                try:
+                    self.cache_dir.mkdir(parents=True, exist_ok=True)
+                    content = json.dumps({c.CACHE_FIELD_VERSION: self.version,
+                                          c.CACHE_FIELD_FILES: self._indexes[directory]})
+                    with file_lock(f"{index_path}.lock"):
+                        # Write to a temporary file first so readers never see a partial index
+                        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                            file.write(content)
+                        os.replace(tmp_path, index_path)
+                except (OSError, TypeError, ValueError) as e:
+                    logger.warning("Fail to write config cache %s. Error: %s", index_path, e)
+
+    def _get_index(self, directory: str) -> dict:
+        """ Get the in-memory index of a directory, loading it from disk on first use.
+        Index written by another version of the program is discarded.
+
+        Args:
+            directory (str): absolute path of the configuration directory
+
+        Returns:
+            dict: file_path to entry
+        """
+        if directory not in self._indexes:
+            index = {}
+            index_path = self.get_index_path(directory)
+            try:
+                with open(index_path, 'r', encoding='utf-8') as file:
+                    content = json.load(file)
+                if content.get(c.CACHE_FIELD_VERSION) == self.version:
+                    index = content.get(c.CACHE_FIELD_FILES, {})
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, AttributeError) as e:
+                logger.warning("Ignoring unreadable config cache %s. Error: %s", index_path, e)
+            self._indexes[directory] = index
+        return self._indexes[directory]
@@ -2,9 +2,13 @@
 validate and process the content of pipeline_configuration 
 """
 import collections
+import copy
+import hashlib
+import json
+import threading
 import util.constant as c
 from util.model import (ValidationResult)
-from util.common_utils import (get_logger, UnionFind, TopoSort)
+from util.common_utils import (get_logger, parse_duration, parse_size, UnionFind, TopoSort)
 
 logger = get_logger("util.config_tools")
 
@@ -14,6 +18,15 @@ logger = get_logger("util.config_tools")
 class ConfigChecker:
     """ ConfigChecker class performing validation and processing for 
     pipeline configurations.
+
+    The result of the two expensive checks are memoized by the fingerprint of
+    everything they depend on, so validating again after an override or a small
+    edit only recompute the affected parts:
+    - each job depends on its own config and the docker and artifact defaults
+      of the global section.
+    - the dependency check of each stage, including the job grouping and
+      topological sort, depends on the jobs of the stage and their needs.
+    The memo is only used when lines and columns information is not required.
     """
 
     def __init__(self, pipeline_name: str = c.DEFAULT_STR, file_name: str = c.DEFAULT_STR,
@@ -31,6 +44,9 @@ class ConfigChecker:
         self.logger = log_tool
         self.pipeline_name = pipeline_name
         self.file_name = file_name
+        self._use_memo = False
+        self._memo = collections.OrderedDict()
+        self._memo_lock = threading.Lock()
 
     def validate_config(self,
                         pipeline_name: str,
@@ -52,6 +68,8 @@ class ConfigChecker:
         """
         self.pipeline_name = pipeline_name
         self.file_name = file_name
+        # error messages with lines and columns depend on more than the content
+        self._use_memo = not error_lc
         result_flag = True
         result_error_msg = ""
         processed_pipeline_config = {}
@@ -83,6 +101,38 @@ class ConfigChecker:
             )
         return validation_res
 
+    def _memoize(self, key_parts: tuple, compute, *args) -> tuple:
+        """ Return the memoized result of compute(*args) for the fingerprint of the
+        key_parts, computing and storing it on a miss. The result is copied so the
+        caller can modify it in-place.
+
+        Args:
+            key_parts (tuple): everything the result depends on, must be JSON serializable
+            compute (callable): function to compute the result
+            *args: arguments of compute
+
+        Returns:
+            tuple: result of compute
+        """
+        if not self._use_memo:
+            return compute(*args)
+        try:
+            content = json.dumps([self.pipeline_name, self.file_name, *key_parts],
+                                 sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return compute(*args)
+        fingerprint = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        with self._memo_lock:
+            if fingerprint in self._memo:
+                self._memo.move_to_end(fingerprint)
+                return copy.deepcopy(self._memo[fingerprint])
+        result = compute(*args)
+        with self._memo_lock:
+            self._memo[fingerprint] = copy.deepcopy(result)
+            while len(self._memo) > c.VALIDATION_MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return result
+
     def _check_individual_config(self, sub_key: str,
                                  config_dict: dict,
                                  res_dict: dict,
@@ -211,6 +261,25 @@ class ConfigChecker:
                 result_flag = result_flag and flag
                 result_error_msg += error
 
+            # Check the fail fast flag
+            flag, error = self._check_individual_config(
+                    sub_key=c.KEY_FAIL_FAST,
+                    config_dict=global_config,
+                    res_dict=processed_section,
+                    default_if_absent=c.DEFAULT_FLAG_FAIL_FAST,
+                    expected_type=bool,
+                    error_prefix=error_prefix,
+                    error_lc=error_lc
+                )
+            result_flag = result_flag and flag
+            result_error_msg += error
+
+            # Check the timeout of the whole run
+            flag, error = self._check_timeout(global_config, processed_section,
+                                              error_prefix, error_lc)
+            result_flag = result_flag and flag
+            result_error_msg += error
+
             # Prepare to return
             processed_config[sec_key] = processed_section
             return (result_flag, result_error_msg)
@@ -279,8 +348,12 @@ class ConfigChecker:
 
             # Next check, for each stage, verify the dependencies are correct
             for stage, job_list in processed_stages.items():
-                flag, error, dependency_dict = self._check_jobs_dependencies(
-                    stage, job_list, jobs_section, error_lc)
+                job_needs = {str(job): jobs_section[job].get(c.JOB_SUBKEY_NEEDS)
+                             if isinstance(jobs_section.get(job), dict) else None
+                             for job in job_list if job in jobs_section}
+                flag, error, dependency_dict = self._memoize(
+                    (c.KEY_STAGES, stage, sorted(map(str, job_list)), job_needs),
+                    self._check_jobs_dependencies, stage, job_list, jobs_section, error_lc)
                 result_flag = result_flag and flag
                 result_error_msg += error
                 processed_stages[stage] = dependency_dict
@@ -516,110 +589,18 @@ class ConfigChecker:
             if sec_key not in pipeline_config:
                 return (False, f"No {sec_key} section defined for pipeline {self.pipeline_name}")
             job_configs = pipeline_config[sec_key]
-            error_prefix = f"{sec_key}:"
             # All global values should be available in processed config when called
             # as prepared by previous section
             global_docker_reg = processed_config[c.KEY_GLOBAL][c.KEY_DOCKER][c.KEY_DOCKER_REG]
             global_docker_img = processed_config[c.KEY_GLOBAL][c.KEY_DOCKER][c.KEY_DOCKER_IMG]
             global_upload_path = processed_config[c.KEY_GLOBAL][c.KEY_ARTIFACT_PATH]
+            global_defaults = (global_docker_reg, global_docker_img, global_upload_path)
             for job, config in job_configs.items():
-                job_error_prefix = error_prefix + f"{job} "
-                # if error_lc and hasattr(config, 'lc'):
-                #     job_error_prefix = f"{self.file_name}:{config.lc.line}:{config.lc.col} "
-                processed_job = {}
-                # top level key-values pair
-                sub_key_list = [
-                    c.JOB_SUBKEY_STAGE,
-                    c.JOB_SUBKEY_ALLOW,
-                    c.JOB_SUBKEY_NEEDS,
-                    c.KEY_ARTIFACT_PATH,
-                    c.JOB_SUBKEY_SCRIPTS,
-                ]
-                default_list = [
-                    None,
-                    c.DEFAULT_FLAG_JOB_ALLOW_FAIL,
-                    c.DEFAULT_LIST,
-                    global_upload_path,
-                    None
-                ]
-                expected_type = [
-                    str,
-                    bool,
-                    list,
-                    str,
-                    list,
-                ]
-                for sub_key, default, etype in zip(sub_key_list, default_list, expected_type):
-                    flag, error = self._check_individual_config(
-                        sub_key=sub_key,
-                        config_dict=config,
-                        res_dict=processed_job,
-                        default_if_absent=default,
-                        expected_type=etype,
-                        error_prefix=job_error_prefix,
-                        error_lc=error_lc
-                    )
-                    result_flag = result_flag and flag
-                    result_error_msg += error
-                # Check docker section
-                docker_config = {}
-                if c.KEY_DOCKER in config:
-                    docker_config = config[c.KEY_DOCKER]
-                processed_job[c.KEY_DOCKER] = {}
-                sub_key_list = [c.KEY_DOCKER_REG, c.KEY_DOCKER_IMG]
-                default_list = [
-                    global_docker_reg if global_docker_reg != "" else None,
-                    global_docker_img if global_docker_img != "" else None,
-                ]
-                # all expected_types are string
-                for sub_key, default in zip(sub_key_list, default_list):
-                    flag, error = self._check_individual_config(
-                                sub_key=sub_key,
-                                config_dict=docker_config,
-                                res_dict=processed_job[c.KEY_DOCKER],
-                                default_if_absent=default,
-                                error_prefix=job_error_prefix,
-                                error_lc=error_lc
-                            )
-                    result_flag = result_flag and flag
-                    result_error_msg += error
-
-                # Check artifacts
-                if c.JOB_SUBKEY_ARTIFACT in config:
-                    if processed_job[c.KEY_ARTIFACT_PATH] == c.DEFAULT_STR:
-                        result_flag = False
-                        element = config[c.JOB_SUBKEY_ARTIFACT]
-                        err = ""
-                        if error_lc and hasattr(element, 'lc'):
-                            err = f"{self.file_name}:{element.lc.line}:{element.lc.col} "
-                        err += job_error_prefix + "no artifact upload path defined\n"
-                        result_error_msg += err
-                    artifact_dict = config[c.JOB_SUBKEY_ARTIFACT]
-                    artifact_config = {}
-                    # Check flag upload on success
-                    flag, error = self._check_individual_config(
-                        sub_key=c.ARTIFACT_SUBKEY_ONSUCCESS,
-                        config_dict=artifact_dict,
-                        res_dict=artifact_config,
-                        default_if_absent=c.DEFAULT_FLAG_ARTIFACT_UPLOAD_ONSUCCESS,
-                        expected_type=bool,
-                        error_prefix=job_error_prefix,
-                        error_lc=error_lc
-                    )
-                    result_flag = result_flag and flag
-                    result_error_msg += error
-                    # Check flag required path
-                    flag, error = self._check_individual_config(
-                        sub_key=c.ARTIFACT_SUBKEY_PATH,
-                        config_dict=artifact_dict,
-                        res_dict=artifact_config,
-                        expected_type=list,
-                        error_prefix=job_error_prefix,
-                        error_lc=error_lc
-                    )
-                    result_flag = result_flag and flag
-                    result_error_msg += error
-                    processed_job[c.JOB_SUBKEY_ARTIFACT] = artifact_config
+                flag, error, processed_job = self._memoize(
+                    (sec_key, job, config, global_defaults),
+                    self._check_single_job, job, config, global_defaults, error_lc)
+                result_flag = result_flag and flag
+                result_error_msg += error
                 # Update processed job info
                 processed_section[job] = processed_job
             if result_flag:
@@ -631,3 +612,311 @@ class ConfigChecker:
             self.logger.warning(f"Error in parsing job sections, exception msg is {e}\n"
                                 )
             return (False, "Parsing jobs section, unexpected error occur")
+
+    def _check_single_job(self, job: str, config: dict, global_defaults: tuple,
+                          error_lc: bool = False) -> tuple[bool, str, dict]:
+        """ check a single job config, validate and filled the required field
+
+        Args:
+            job (str): job name
+            config (dict): given job config
+            global_defaults (tuple): docker registry, docker image and artifact upload path
+                from the processed global section, used as defaults
+            error_lc (bool, optional): boolean flag indicate if lines and columns
+                information available for error tracking, Defaults to False
+
+        Returns:
+            tuple[bool, str, dict]: first variable is a boolean indicator if the check passed,
+            second variable is the str of the error message combined,
+            third variable is the processed job config.
+        """
+        result_flag = True
+        result_error_msg = ""
+        global_docker_reg, global_docker_img, global_upload_path = global_defaults
+        job_error_prefix = f"{c.KEY_JOBS}:{job} "
+        # if error_lc and hasattr(config, 'lc'):
+        #     job_error_prefix = f"{self.file_name}:{config.lc.line}:{config.lc.col} "
+        processed_job = {}
+        # top level key-values pair
+        sub_key_list = [
+            c.JOB_SUBKEY_STAGE,
+            c.JOB_SUBKEY_ALLOW,
+            c.JOB_SUBKEY_NEEDS,
+            c.KEY_ARTIFACT_PATH,
+            c.JOB_SUBKEY_SCRIPTS,
+        ]
+        default_list = [
+            None,
+            c.DEFAULT_FLAG_JOB_ALLOW_FAIL,
+            c.DEFAULT_LIST,
+            global_upload_path,
+            None
+        ]
+        expected_type = [
+            str,
+            bool,
+            list,
+            str,
+            list,
+        ]
+        for sub_key, default, etype in zip(sub_key_list, default_list, expected_type):
+            flag, error = self._check_individual_config(
+                sub_key=sub_key,
+                config_dict=config,
+                res_dict=processed_job,
+                default_if_absent=default,
+                expected_type=etype,
+                error_prefix=job_error_prefix,
+                error_lc=error_lc
+            )
+            result_flag = result_flag and flag
+            result_error_msg += error
+        # Check docker section
+        docker_config = {}
+        if c.KEY_DOCKER in config:
+            docker_config = config[c.KEY_DOCKER]
+        processed_job[c.KEY_DOCKER] = {}
+        sub_key_list = [c.KEY_DOCKER_REG, c.KEY_DOCKER_IMG]
+        default_list = [
+            global_docker_reg if global_docker_reg != "" else None,
+            global_docker_img if global_docker_img != "" else None,
+        ]
+        # all expected_types are string
+        for sub_key, default in zip(sub_key_list, default_list):
+            flag, error = self._check_individual_config(
+                        sub_key=sub_key,
+                        config_dict=docker_config,
+                        res_dict=processed_job[c.KEY_DOCKER],
+                        default_if_absent=default,
+                        error_prefix=job_error_prefix,
+                        error_lc=error_lc
+                    )
+            result_flag = result_flag and flag
+            result_error_msg += error
+
+        # Check artifacts
+        if c.JOB_SUBKEY_ARTIFACT in config:
+            if processed_job[c.KEY_ARTIFACT_PATH] == c.DEFAULT_STR:
+                result_flag = False
+                element = config[c.JOB_SUBKEY_ARTIFACT]
+                err = ""
+                if error_lc and hasattr(element, 'lc'):
+                    err = f"{self.file_name}:{element.lc.line}:{element.lc.col} "
+                err += job_error_prefix + "no artifact upload path defined\n"
+                result_error_msg += err
+            artifact_dict = config[c.JOB_SUBKEY_ARTIFACT]
+            artifact_config = {}
+            # Check flag upload on success
+            flag, error = self._check_individual_config(
+                sub_key=c.ARTIFACT_SUBKEY_ONSUCCESS,
+                config_dict=artifact_dict,
+                res_dict=artifact_config,
+                default_if_absent=c.DEFAULT_FLAG_ARTIFACT_UPLOAD_ONSUCCESS,
+                expected_type=bool,
+                error_prefix=job_error_prefix,
+                error_lc=error_lc
+            )
+            result_flag = result_flag and flag
+            result_error_msg += error
+            # Check flag required path
+            flag, error = self._check_individual_config(
+                sub_key=c.ARTIFACT_SUBKEY_PATH,
+                config_dict=artifact_dict,
+                res_dict=artifact_config,
+                expected_type=list,
+                error_prefix=job_error_prefix,
+                error_lc=error_lc
+            )
+            result_flag = result_flag and flag
+            result_error_msg += error
+            processed_job[c.JOB_SUBKEY_ARTIFACT] = artifact_config
+        # Check the optional keys: changes globs (paths is accepted as an alias),
+        # resource limits, retry policy and timeout
+        for check in (self._check_job_changes, self._check_job_resources,
+                      self._check_job_retry, self._check_timeout):
+            flag, error = check(config, processed_job, job_error_prefix, error_lc)
+            result_flag = result_flag and flag
+            result_error_msg += error
+        return (result_flag, result_error_msg, processed_job)
+
+    def _check_job_changes(self, config: dict, processed_job: dict,
+                           error_prefix: str = c.DEFAULT_STR,
+                           error_lc: bool = False) -> tuple[bool, str]:
+        """ check the optional changes (or paths) globs of a job, which must be
+        a list of strings. The globs are stored under the changes key.
+
+        Args:
+            config (dict): given job config
+            processed_job (dict): processed job config. Will be modified in-place
+            error_prefix (str, optional): prefix for error message. Defaults to empty str
+            error_lc (bool, optional): boolean flag indicate if lines and columns
+                information available for error tracking, Defaults to False
+
+        Returns:
+            tuple[bool, str]: first variable is a boolean indicator if the check passed,
+            second variable is the str of the error message.
+        """
+        sub_key = None
+        for key in (c.JOB_SUBKEY_CHANGES, c.JOB_SUBKEY_PATHS):
+            if key in config:
+                if sub_key is not None:
+                    return (False, error_prefix +
+                            f"only one of {c.JOB_SUBKEY_CHANGES} or {c.JOB_SUBKEY_PATHS} allowed\n")
+                sub_key = key
+        if sub_key is None:
+            return (True, "")
+        element = config[sub_key]
+        if not isinstance(element, list) or not all(
+                isinstance(glob, str) and glob.strip() for glob in element):
+            err = ""
+            if error_lc and hasattr(element, 'lc'):
+                err = f"{self.file_name}:{element.lc.line}:{element.lc.col} "
+            elif error_lc and hasattr(config, 'lc'):
+                err = f"{self.file_name}:{config.lc.line}:{config.lc.col} "
+            err += error_prefix + f"{sub_key} must be a list of non empty path globs\n"
+            return (False, err)
+        processed_job[c.JOB_SUBKEY_CHANGES] = [str(glob) for glob in element]
+        return (True, "")
+
+    def _check_job_resources(self, config: dict, processed_job: dict,
+                             error_prefix: str = c.DEFAULT_STR,
+                             error_lc: bool = False) -> tuple[bool, str]:
+        """ check the optional resources of a job. cpus is a positive number of cpus,
+        memory is a number of bytes or a size with unit b, k, m or g, i.e. 512m.
+        The memory is stored as a number of bytes.
+
+        Args:
+            config (dict): given job config
+            processed_job (dict): processed job config. Will be modified in-place
+            error_prefix (str, optional): prefix for error message. Defaults to empty str
+            error_lc (bool, optional): boolean flag indicate if lines and columns
+                information available for error tracking, Defaults to False
+
+        Returns:
+            tuple[bool, str]: first variable is a boolean indicator if the check passed,
+            second variable is the str of the error message.
+        """
+        if c.JOB_SUBKEY_RESOURCES not in config:
+            return (True, "")
+        element = config[c.JOB_SUBKEY_RESOURCES]
+        err = ""
+        if error_lc and hasattr(element, 'lc'):
+            err = f"{self.file_name}:{element.lc.line}:{element.lc.col} "
+        elif error_lc and hasattr(config, 'lc'):
+            err = f"{self.file_name}:{config.lc.line}:{config.lc.col} "
+        err += error_prefix + c.JOB_SUBKEY_RESOURCES + " "
+        if not isinstance(element, dict):
+            return (False, err + f"must be a mapping of {c.RESOURCE_SUBKEY_CPUS} "
+                    f"and {c.RESOURCE_SUBKEY_MEMORY}\n")
+        error_msg = ""
+        resources = {}
+        for key in element:
+            if key not in (c.RESOURCE_SUBKEY_CPUS, c.RESOURCE_SUBKEY_MEMORY):
+                error_msg += err + f"unknown key:{key}\n"
+        if c.RESOURCE_SUBKEY_CPUS in element:
+            cpus = element[c.RESOURCE_SUBKEY_CPUS]
+            if isinstance(cpus, bool) or not isinstance(cpus, (int, float)) or cpus <= 0:
+                error_msg += err + f"{c.RESOURCE_SUBKEY_CPUS} must be a positive number\n"
+            else:
+                resources[c.RESOURCE_SUBKEY_CPUS] = float(cpus)
+        if c.RESOURCE_SUBKEY_MEMORY in element:
+            memory = parse_size(element[c.RESOURCE_SUBKEY_MEMORY])
+            if memory is None or memory < c.MIN_JOB_MEMORY:
+                error_msg += err + f"{c.RESOURCE_SUBKEY_MEMORY} must be a size of at least 6m, "
+                error_msg += "i.e. 512m or 2g\n"
+            else:
+                resources[c.RESOURCE_SUBKEY_MEMORY] = memory
+        if error_msg:
+            return (False, error_msg)
+        processed_job[c.JOB_SUBKEY_RESOURCES] = resources
+        return (True, "")
+
+    def _check_job_retry(self, config: dict, processed_job: dict,
+                         error_prefix: str = c.DEFAULT_STR,
+                         error_lc: bool = False) -> tuple[bool, str]:
+        """ check the optional retry policy of a job. max is the number of retries,
+        on lists the failures to retry, infra and/or exit codes of the scripts, and
+        backoff is the delay in seconds before the first retry, doubled at each retry.
+
+        Args:
+            config (dict): given job config
+            processed_job (dict): processed job config. Will be modified in-place
+            error_prefix (str, optional): prefix for error message. Defaults to empty str
+            error_lc (bool, optional): boolean flag indicate if lines and columns
+                information available for error tracking, Defaults to False
+
+        Returns:
+            tuple[bool, str]: first variable is a boolean indicator if the check passed,
+            second variable is the str of the error message.
+        """
+        if c.JOB_SUBKEY_RETRY not in config:
+            return (True, "")
+        element = config[c.JOB_SUBKEY_RETRY]
+        err = ""
+        if error_lc and hasattr(element, 'lc'):
+            err = f"{self.file_name}:{element.lc.line}:{element.lc.col} "
+        elif error_lc and hasattr(config, 'lc'):
+            err = f"{self.file_name}:{config.lc.line}:{config.lc.col} "
+        err += error_prefix + c.JOB_SUBKEY_RETRY + " "
+        if not isinstance(element, dict):
+            return (False, err + f"must be a mapping of {c.RETRY_SUBKEY_MAX}, "
+                    f"{c.RETRY_SUBKEY_ON} and {c.RETRY_SUBKEY_BACKOFF}\n")
+        error_msg = "".join(err + f"unknown key:{key}\n" for key in element if key not in (
+            c.RETRY_SUBKEY_MAX, c.RETRY_SUBKEY_ON, c.RETRY_SUBKEY_BACKOFF))
+        max_retries = element.get(c.RETRY_SUBKEY_MAX)
+        if isinstance(max_retries, bool) or not isinstance(max_retries, int) or \
+                not 1 <= max_retries <= c.MAX_JOB_RETRIES:
+            error_msg += err + f"{c.RETRY_SUBKEY_MAX} must be a number of retries "
+            error_msg += f"between 1 and {c.MAX_JOB_RETRIES}\n"
+        retry_on = element.get(c.RETRY_SUBKEY_ON, c.DEFAULT_RETRY_ON)
+        if not isinstance(retry_on, list) or not retry_on or not all(
+                failure in (c.FAILURE_INFRA, c.FAILURE_TIMEOUT) or (
+                    isinstance(failure, int) and not isinstance(failure, bool)
+                    and 1 <= failure <= c.MAX_EXIT_CODE)
+                for failure in retry_on):
+            error_msg += err + f"{c.RETRY_SUBKEY_ON} must be a list of {c.FAILURE_INFRA}, "
+            error_msg += f"{c.FAILURE_TIMEOUT} or exit codes between 1 and {c.MAX_EXIT_CODE}\n"
+        backoff = element.get(c.RETRY_SUBKEY_BACKOFF, c.DEFAULT_RETRY_BACKOFF)
+        if isinstance(backoff, bool) or not isinstance(backoff, (int, float)) or backoff < 0:
+            error_msg += err + f"{c.RETRY_SUBKEY_BACKOFF} must be a number of seconds\n"
+        if error_msg:
+            return (False, error_msg)
+        processed_job[c.JOB_SUBKEY_RETRY] = {
+            c.RETRY_SUBKEY_MAX: max_retries,
+            c.RETRY_SUBKEY_ON: list(dict.fromkeys(
+                str(failure) if isinstance(failure, str) else int(failure)
+                for failure in retry_on)),
+            c.RETRY_SUBKEY_BACKOFF: float(backoff)
+        }
+        return (True, "")
+
+    def _check_timeout(self, config: dict, processed: dict,
+                       error_prefix: str = c.DEFAULT_STR,
+                       error_lc: bool = False) -> tuple[bool, str]:
+        """ check the optional timeout of a job or of the whole pipeline run. It is a
+        number of seconds or a duration with unit s, m or h, i.e. 30m. The timeout is
+        stored as a number of seconds.
+
+        Args:
+            config (dict): given job or global config
+            processed (dict): processed config. Will be modified in-place
+            error_prefix (str, optional): prefix for error message. Defaults to empty str
+            error_lc (bool, optional): boolean flag indicate if lines and columns
+                information available for error tracking, Defaults to False
+
+        Returns:
+            tuple[bool, str]: first variable is a boolean indicator if the check passed,
+            second variable is the str of the error message.
+        """
+        if c.KEY_TIMEOUT not in config:
+            return (True, "")
+        timeout = parse_duration(config[c.KEY_TIMEOUT])
+        if timeout is None or timeout <= 0:
+            err = ""
+            if error_lc and hasattr(config, 'lc'):
+                err = f"{self.file_name}:{config.lc.line}:{config.lc.col} "
+            err += error_prefix + f"{c.KEY_TIMEOUT} must be a positive duration, "
+            err += "i.e. 90, 90s, 30m or 2h\n"
+            return (False, err)
+        processed[c.KEY_TIMEOUT] = timeout
+        return (True, "")
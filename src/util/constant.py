@@ -6,6 +6,7 @@ MONGO_DB_NAME = 'CICDControllerDB'
 MONGO_PIPELINES_TABLE = 'repo_configs'
 MONGO_JOBS_TABLE = 'jobs_history'
 MONGO_REPOS_TABLE = 'sessions'
+MONGO_QUEUE_TABLE = 'job_queue'
 
 # Common Field Names
 FIELD_ID = '_id'  # MongoDB ObjectId field
@@ -36,6 +37,8 @@ FIELD_PIPELINE_CONFIG_USED = 'pipeline_config_used'
 FIELD_STATUS = 'status'
 FIELD_START_TIME = 'start_time'
 FIELD_COMPLETION_TIME = 'completion_time'
+# epoch time renewed while the run is in flight, a crashed run stops renewing it
+FIELD_HEARTBEAT = 'heartbeat'
 FIELD_LOGS = 'logs'
 FIELD_STAGE_NAME = 'stage_name'
 FIELD_STAGE_STATUS = 'stage_status'
@@ -44,6 +47,15 @@ FIELD_JOB_NAME = 'job_name'
 FIELD_JOB_STATUS = 'job_status'
 FIELD_JOB_ALLOW_FAILURE = 'allow_failure'
 FIELD_JOB_LOGS = 'job_logs'
+FIELD_DOCKER_HOST = 'docker_host'
+
+# Fields for `job_queue` Table
+FIELD_JOB_ID = 'job_id'
+FIELD_SKIPPED_JOBS = 'skipped_jobs'
+FIELD_ENQUEUE_TIME = 'enqueue_time'
+FIELD_LEASE_OWNER = 'lease_owner'
+FIELD_LEASE_EXPIRY = 'lease_expiry'
+FIELD_ATTEMPTS = 'attempts'
 
 # Job and Stage Statuses
 STATUS_PENDING = 'pending'
@@ -51,6 +63,11 @@ STATUS_COMPLETE = 'complete'
 STATUS_SUCCESS = 'success'
 STATUS_FAILED = 'failed'
 STATUS_CANCELLED = 'cancelled'
+STATUS_SKIPPED = 'skipped'
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+# statuses of a run still in flight, a run record has no status until its wrap up
+ACTIVE_RUN_STATUSES = (None, STATUS_PENDING, STATUS_QUEUED, STATUS_RUNNING)
 
 # Pipeline Configurations
 DEFAULT_DOCKER_REGISTRY = 'dockerhub'
@@ -71,6 +88,17 @@ JOB_SUBKEY_ALLOW = 'allow_failure'
 JOB_SUBKEY_NEEDS = 'needs'
 JOB_SUBKEY_SCRIPTS = 'scripts'
 JOB_SUBKEY_ARTIFACT = 'artifacts'
+JOB_SUBKEY_CHANGES = 'changes'
+JOB_SUBKEY_PATHS = 'paths'
+JOB_SUBKEY_RESOURCES = 'resources'
+RESOURCE_SUBKEY_CPUS = 'cpus'
+RESOURCE_SUBKEY_MEMORY = 'memory'
+JOB_SUBKEY_RETRY = 'retry'
+RETRY_SUBKEY_MAX = 'max'
+RETRY_SUBKEY_ON = 'on'
+RETRY_SUBKEY_BACKOFF = 'backoff'
+KEY_TIMEOUT = 'timeout'
+KEY_FAIL_FAST = 'fail_fast'
 ARTIFACT_SUBKEY_ONSUCCESS = 'on_success_only'
 ARTIFACT_SUBKEY_PATH = 'paths'
 RETURN_KEY_VALID = 'valid'
@@ -80,6 +108,8 @@ REPORT_KEY_JOBSTATUS = 'job_status'
 REPORT_KEY_START = 'start_time'
 REPORT_KEY_END = 'completion_time'
 REPORT_KEY_JOBLOG = 'job_logs'
+REPORT_KEY_ATTEMPTS = 'attempts'
+REPORT_KEY_SCRIPT_RESULTS = 'script_results'
 
 # Other Constants
 DEFAULT_CONFIG_PL_FILE = "pipelines.yml"
@@ -91,8 +121,147 @@ DEFAULT_STAGES = ['build', 'test', 'doc', 'deploy']
 DEFAULT_DOCKER_REGISTRY = 'dockerhub'
 DEFAULT_FLAG_JOB_ALLOW_FAIL = False
 DEFAULT_FLAG_ARTIFACT_UPLOAD_ONSUCCESS = True
+DEFAULT_FLAG_FAIL_FAST = True
 DEFAULT_STR = ""
 DEFAULT_LIST = []
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 DEFAULT_DOCKER_DIR = '/app'
-REGEX_SHELL_ERR = r'(sh:\s?)(\d+)(:)'
+DEFAULT_CID_HOME = '~/.cid'
+
+# Repository Mirror Cache
+DEFAULT_MIRROR_DIR_NAME = 'mirrors'
+DEFAULT_MIRROR_MAX_SIZE = 2 * 1024 ** 3
+ENV_MIRROR_DIR = 'CID_MIRROR_DIR'
+ENV_MIRROR_MAX_SIZE = 'CID_MIRROR_MAX_SIZE'
+DEFAULT_REMOTE_REF_TTL = 60
+
+# Batch Run
+BATCH_BACKFILL = 'backfill'
+BATCH_BISECT = 'bisect'
+
+# Concurrent Run
+DEFAULT_MAX_CONTAINERS = 4
+ENV_MAX_CONTAINERS = 'CID_MAX_CONTAINERS'
+
+# Docker Hosts
+LOCAL_DOCKER_HOST = 'local'
+ENV_DOCKER_HOSTS = 'CID_DOCKER_HOSTS'
+DEFAULT_DOCKER_HOST_TIMEOUT = 60
+DOCKER_INFO_CPUS = 'NCPU'
+DOCKER_INFO_MEMORY = 'MemTotal'
+
+# Runner
+DEFAULT_LEASE_SECONDS = 60
+# the lease is renewed this many times before it expires
+LEASE_RENEWALS = 3
+DEFAULT_POLL_INTERVAL = 5
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Run State Writer
+# seconds a buffered run state change waits before it is written
+DEFAULT_STATE_FLUSH_INTERVAL = 5.0
+# buffered fields written at once whatever the timer
+MAX_PENDING_STATE_FIELDS = 64
+
+# Job Resources
+NANO_CPUS_PER_CPU = 10 ** 9
+# smallest memory limit accepted by docker
+MIN_JOB_MEMORY = 6 * 1024 ** 2
+REGEX_MEMORY_SIZE = r'^\s*(\d+(?:\.\d+)?)\s*([bkmg]?)b?\s*$'
+MEMORY_UNITS = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+# Job Retry
+# failures of the docker engine or the artifact store, i.e. an image pull timeout
+FAILURE_INFRA = 'infra'
+# non zero exit code of the job scripts
+FAILURE_SCRIPT = 'script'
+# job stopped after running longer than its timeout
+FAILURE_TIMEOUT = 'timeout'
+DOCKER_STATUS_CODE = 'StatusCode'
+# exit code of each script of a job, written by the job shell outside of the workspace
+SCRIPT_STATUS_FILE = '/tmp/.cid-script-status'
+DEFAULT_RETRY_ON = [FAILURE_INFRA]
+DEFAULT_RETRY_BACKOFF = 5
+MAX_JOB_RETRIES = 10
+MAX_EXIT_CODE = 255
+# ceiling of the delay between two attempts, in seconds
+MAX_RETRY_DELAY = 300
+
+# Timeouts and Orphan Containers
+REGEX_DURATION = r'^\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*$'
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600}
+# seconds given to a stopped container to exit before it is killed
+DEFAULT_STOP_TIMEOUT = 10
+# seconds between two stops of a job whose container is not created yet
+STOP_RETRY_INTERVAL = 1.0
+LABEL_MANAGED = 'cid.managed'
+LABEL_RUN = 'cid.run'
+# id of the job record of the run, to keep the volume of an in-flight run
+LABEL_RUN_ID = 'cid.run_id'
+LABEL_PIPELINE = 'cid.pipeline'
+LABEL_JOB = 'cid.job'
+LABEL_CREATED = 'cid.created'
+LABEL_DEADLINE = 'cid.deadline'
+LIVE_CONTAINER_STATES = ('running', 'paused', 'restarting')
+# a container is orphaned once it has stopped, or passed its deadline, for this long
+ORPHAN_GRACE_SECONDS = 900
+
+# Garbage Collection
+# run volumes, and dangling images, older than this are removed by cid admin gc
+DEFAULT_GC_MAX_AGE = 24 * 3600
+DOCKER_DF_LAYERS_SIZE = 'LayersSize'
+DOCKER_DF_CONTAINERS = 'Containers'
+DOCKER_DF_VOLUMES = 'Volumes'
+DOCKER_DF_SIZE_RW = 'SizeRw'
+DOCKER_DF_USAGE = 'UsageData'
+DOCKER_DF_SIZE = 'Size'
+DOCKER_DF_REF_COUNT = 'RefCount'
+# status code of the docker engine for a name already in use
+HTTP_CONFLICT = 409
+
+# Worktree
+DEFAULT_WORKTREE_DIR_NAME = 'worktrees'
+ENV_WORKTREE_DIR = 'CID_WORKTREE_DIR'
+
+# Config Cache
+PACKAGE_NAME = 't4-cicd'
+CONFIG_CACHE_VERSION = 4
+DEFAULT_CONFIG_CACHE_DIR_NAME = 'cache'
+ENV_CONFIG_CACHE_DIR = 'CID_CONFIG_CACHE_DIR'
+CACHE_FIELD_VERSION = 'version'
+CACHE_FIELD_FILES = 'files'
+CACHE_FIELD_SIZE = 'size'
+CACHE_FIELD_MTIME = 'mtime_ns'
+CACHE_FIELD_HASH = 'hash'
+# minimum number of files to validate before check-all use worker processes
+PARALLEL_CHECK_THRESHOLD = 16
+
+# Validation
+VALIDATION_MEMO_SIZE = 4096
+
+# Watch mode
+DEFAULT_WATCH_POLL_INTERVAL = 0.5
+DEFAULT_WATCH_DEBOUNCE = 0.05
+
+
+# Daemon
+DEFAULT_DAEMON_SOCKET_NAME = 'cid.sock'
+ENV_DAEMON_SOCKET = 'CID_DAEMON_SOCKET'
+DAEMON_BACKLOG = 64
+DAEMON_ACCEPT_TIMEOUT = 1.0
+DAEMON_BUFFER_SIZE = 64 * 1024
+DAEMON_MAX_MESSAGE_SIZE = 16 * 1024 ** 2
+DAEMON_PRELOAD_MODULES = ('cli.__main__', 'util.container', 'util.db_mongo', 'pymongo', 'bson',
+                          'boto3', 'botocore.exceptions', 'git', 'yaml', 'dotenv')
+DAEMON_ACTION_RUN = 'run'
+DAEMON_ACTION_STATUS = 'status'
+DAEMON_ACTION_STOP = 'stop'
+DAEMON_FIELD_ACTION = 'action'
+DAEMON_FIELD_ARGV = 'argv'
+DAEMON_FIELD_CWD = 'cwd'
+DAEMON_FIELD_ENV = 'env'
+DAEMON_FIELD_EXIT_CODE = 'exit_code'
+DAEMON_FIELD_PID = 'pid'
+DAEMON_FIELD_UPTIME = 'uptime'
+DAEMON_FIELD_SERVED = 'served'
+DAEMON_FIELD_RUNNING = 'running'
@@ -3,21 +3,22 @@ for execution of pipeline job
 """
 from pathlib import Path
 import copy
+import io
 import os
-import re
 import tarfile
 import time
 from abc import ABC, abstractmethod
 from shutil import make_archive
 import docker
 import docker.errors
-from botocore.exceptions import ClientError
 from docker.models.containers import Container
 import util.constant as c
-from util.common_utils import (get_logger)
+from util.common_utils import (get_logger, LazyModule)
 from util.db_artifact import S3Client
-from util.model import (JobConfig, JobLog)
+from util.docker_gc import (DockerGarbageCollector)
+from util.model import (JobConfig, JobLog, ScriptResult)
 
+botocore_exceptions = LazyModule('botocore.exceptions')
 logger = get_logger("util.docker")
 
 
@@ -58,7 +59,7 @@ class DockerManager(ContainerManager):
     def __init__(self, client:docker.DockerClient=None,
                  log_tool=logger, repo:str="Repo", 
                  branch:str='main',
-                 pipeline:str="pipeline", run:str="run"):
+                 pipeline:str="pipeline", run:str="run", run_id:str=None):
         """ Initialize the DockerManager
 
         Args:
@@ -72,6 +73,8 @@ class DockerManager(ContainerManager):
             pipeline (str, optional): pipeline name, use to uniquely identify the volume used. 
                 Defaults to "pipeline".
             run (str, optional): run, use to uniquely identify the volume used. Defaults to "run".
+            run_id (str, optional): id of the job record of the run, labeled on the volume
+                and containers for the garbage collector. Defaults to None.
         """
         if client is None:
             self.client = docker.from_env()
@@ -79,11 +82,16 @@ class DockerManager(ContainerManager):
             self.client = client
         self.logger = log_tool
         self.vol_name = repo + '-' + branch + '-' + pipeline + '-' + run
+        self.pipeline = pipeline
+        self.run_id = run_id
         self.docker_vol = None
 
     def run_job(self, job_name:str, job_config: dict) -> JobLog:
         """ run a single job and return its output. Docker exception 
-        will be caught and handled.
+        will be caught and handled. The job status is taken from the exit code of
+        the container. The failure of a failed job is classified as infra for the
+        errors of docker or the artifact store, or script for the scripts exiting
+        with a non zero exit code, with the exit code of each script run.
 
         Args:
             job_name (str): name of the job
@@ -98,7 +106,8 @@ class DockerManager(ContainerManager):
         JobConfig.model_validate(job_config)
         # create the vol for the first time
         if self.docker_vol is None:
-            self.docker_vol = self.client.volumes.create(self.vol_name)
+            self.docker_vol = self.client.volumes.create(self.vol_name,
+                                                         labels=self._get_labels())
 
         # Extract important values
         container_name = self.vol_name + '-' + job_name
@@ -116,11 +125,12 @@ class DockerManager(ContainerManager):
         job_log_info[c.REPORT_KEY_START] = time.asctime()
         job_log = JobLog.model_validate(job_log_info)
         output = ""
+        container = None
         try:
-            container = self.client.containers.run(
+            container = self._start_container(
+                    container_name,
                     image=docker_img,
-                    name=container_name,
-                    command=f"sh -c '{' && '.join(commands)}'",
+                    command=self._build_command(commands),
                     detach=True,
                     volumes={
                         self.vol_name:{
@@ -128,23 +138,23 @@ class DockerManager(ContainerManager):
                             'mode': 'rw'
                         }
                     },
-                    working_dir=c.DEFAULT_DOCKER_DIR
+                    working_dir=c.DEFAULT_DOCKER_DIR,
+                    labels=self._get_labels(job_name, job_config),
+                    **self._get_resource_limits(job_config)
                 )
 
             # Wait for the container to finish, required as we are running in detach mode
-            container.wait()
+            result = container.wait()
+            job_log.exit_code = result.get(c.DOCKER_STATUS_CODE)
 
             # Retrieve the output from logs, default options will contain both
-            # stdout and stderr, we want to also check the stderr
+            # stdout and stderr
             output = container.logs().decode('utf-8')
-            output_stderr = container.logs(stdout=False).decode('utf-8')
 
-            # Note docker container will store some status log in stderr, currently
-            # only way to check if error in execution is to look for the keyword
-            # using the custom _check_status_from_log function
-            job_success = False
-            if self._check_status_from_log(output_stderr):
-                job_success = True
+            job_success = job_log.exit_code == 0
+            if not job_success:
+                job_log.failure = c.FAILURE_SCRIPT
+                job_log.script_results = self._get_script_results(container, commands)
 
             if c.JOB_SUBKEY_ARTIFACT in job_config:
                 upload_config = job_config[c.JOB_SUBKEY_ARTIFACT]
@@ -153,37 +163,150 @@ class DockerManager(ContainerManager):
                                                         upload_path,
                                                         upload_config[c.ARTIFACT_SUBKEY_PATH]
                                                         )
-                    job_success = job_success and indicator
+                    if job_success and not indicator:
+                        job_success = False
+                        job_log.failure = c.FAILURE_INFRA
                     output += msg
             if job_success:
                 job_log.job_status = c.STATUS_SUCCESS
-            # Clean up container
-            container.remove()
         except docker.errors.DockerException as de:
             # If caught DockerException
             self.logger.warning(f"Job run fail for {job_name}, exception is {de}")
+            job_log.failure = c.FAILURE_INFRA
+            output += str(de)
+        finally:
+            # Clean up container, also when interrupted
+            if container is not None:
+                self._remove_container(container)
         # Add completion time and log to job_log
         job_log.completion_time = time.asctime()
         job_log.job_logs = output
 
         return job_log
 
-    def _check_status_from_log(self, stderr:str)->bool:
-        """ Check the stderr for job status
+    def _get_labels(self, job_name: str = None, job_config: dict = None) -> dict:
+        """ Get the labels identifying the volume of the run or the container of a
+        job, used to find the resources left by a crashed or failed run
 
         Args:
-            stderr (str): error log extracted from containers
+            job_name (str, optional): name of the job. Defaults to None for the volume.
+            job_config (dict, optional): a complete job configuration. Defaults to None.
 
         Returns:
-            bool: indicator if job success or failure
+            dict: labels of the resource, with the deadline of a job with a timeout
         """
-        # Look for sh exit status from the log
-        # any sh: <number>: with number != 0 is error
-        shell_results = re.finditer(c.REGEX_SHELL_ERR, stderr)
-        for match in shell_results:
-            if int(match.group(2)) != 0:
-                return False
-        return True
+        now = time.time()
+        labels = {
+            c.LABEL_MANAGED: 'true',
+            c.LABEL_RUN: self.vol_name,
+            c.LABEL_PIPELINE: self.pipeline,
+            c.LABEL_CREATED: str(int(now)),
+        }
+        if self.run_id is not None:
+            labels[c.LABEL_RUN_ID] = self.run_id
+        if job_name is not None:
+            labels[c.LABEL_JOB] = job_name
+        if job_config and job_config.get(c.KEY_TIMEOUT):
+            deadline = now + job_config[c.KEY_TIMEOUT] + c.DEFAULT_STOP_TIMEOUT
+            labels[c.LABEL_DEADLINE] = str(int(deadline))
+        return labels
+
+    def _start_container(self, container_name: str, **kwargs) -> Container:
+        """ Start the container of a job. A container left with the same name by a
+        crashed run is removed first, instead of failing the job on the name conflict.
+
+        Args:
+            container_name (str): name of the container
+            kwargs: other arguments of containers.run
+
+        Returns:
+            Container: the started container
+        """
+        try:
+            return self.client.containers.run(name=container_name, **kwargs)
+        except docker.errors.APIError as ae:
+            if ae.status_code != c.HTTP_CONFLICT:
+                raise
+            self.logger.warning(f"removing container {container_name} left by a crashed run")
+            self.client.containers.get(container_name).remove(force=True)
+            return self.client.containers.run(name=container_name, **kwargs)
+
+    def _remove_container(self, container: Container) -> None:
+        """ Remove the container of a finished job, stopping it if still running
+
+        Args:
+            container (Container): docker container of the job
+        """
+        try:
+            container.remove(force=True)
+        except docker.errors.DockerException as de:
+            self.logger.warning(f"fail to remove container {container.name}, exception is {de}")
+
+    @staticmethod
+    def _get_resource_limits(job_config: dict) -> dict:
+        """ Convert the resources of a job into docker container limits
+
+        Args:
+            job_config (dict): a complete job configuration
+
+        Returns:
+            dict: nano_cpus and mem_limit arguments of containers.run, for the
+                resources declared by the job only
+        """
+        resources = job_config.get(c.JOB_SUBKEY_RESOURCES) or {}
+        limits = {}
+        if resources.get(c.RESOURCE_SUBKEY_CPUS):
+            limits['nano_cpus'] = int(resources[c.RESOURCE_SUBKEY_CPUS] * c.NANO_CPUS_PER_CPU)
+        if resources.get(c.RESOURCE_SUBKEY_MEMORY):
+            limits['mem_limit'] = resources[c.RESOURCE_SUBKEY_MEMORY]
+        return limits
+
+    @staticmethod
+    def _build_command(commands: list[str]) -> list[str]:
+        """ Build the shell command running the scripts of a job in order, until one
+        fails. The exit code of each script is appended to the status file as a line
+        <index> <exit_code>, and the shell exits with the exit code of the failed script.
+
+        Args:
+            commands (list[str]): scripts of the job
+
+        Returns:
+            list[str]: command of the job container
+        """
+        lines = [f": > {c.SCRIPT_STATUS_FILE}"]
+        for index, command in enumerate(commands):
+            lines.append(command)
+            lines.append(f'status=$?; echo "{index} $status" >> {c.SCRIPT_STATUS_FILE}; '
+                         '[ "$status" -eq 0 ] || exit "$status"')
+        return ['sh', '-c', '\n'.join(lines)]
+
+    def _get_script_results(self, container: Container,
+                            commands: list[str]) -> list[ScriptResult]:
+        """ Read the exit code of each script run from the status file of a job
+
+        Args:
+            container (Container): docker container of the job
+            commands (list[str]): scripts of the job
+
+        Returns:
+            list[ScriptResult]: exit code of the scripts run, empty if the status
+                file cannot be read
+        """
+        try:
+            bits, _ = container.get_archive(c.SCRIPT_STATUS_FILE)
+            with tarfile.open(fileobj=io.BytesIO(b''.join(bits))) as tar:
+                member = tar.next()
+                status = tar.extractfile(member).read().decode('utf-8')
+            results = []
+            for line in status.splitlines():
+                index, exit_code = line.split()
+                results.append(ScriptResult(script=commands[int(index)],
+                                            exit_code=int(exit_code)))
+            return results
+        except (docker.errors.DockerException, tarfile.TarError,
+                AttributeError, TypeError, ValueError, IndexError) as e:
+            self.logger.warning(f"fail to read the script status, exception is {e}")
+            return []
 
     def _upload_artifact(self,
                          container:Container,
@@ -245,7 +368,7 @@ class DockerManager(ContainerManager):
             s3_client.upload_file(archive_name)
             os.remove(archive_name)
             return True, ""
-        except (ClientError, OSError) as e:
+        except (botocore_exceptions.ClientError, OSError) as e:
             self.logger.warning(str(e))
             error_msg += f"\nReason: {e}"
             return False, error_msg
@@ -261,11 +384,55 @@ class DockerManager(ContainerManager):
         # Reconstruct container name
         container_name = self.vol_name + '-' + job_name
         container = self.client.containers.get(container_name)
-        container.stop()
+        try:
+            # the engine kills the container if it does not exit within the timeout
+            container.stop(timeout=c.DEFAULT_STOP_TIMEOUT)
+        except docker.errors.APIError as ae:
+            self.logger.warning(f"fail to stop {container_name}, killing it. exception is {ae}")
+            container.kill()
         container.wait()
         output = container.logs().decode('utf-8')
         return output
 
+    def reap_orphans(self) -> int:
+        """ Remove the job containers orphaned by crashed runs on the docker engine,
+        see docker_gc.is_orphan
+
+        Returns:
+            int: number of containers removed
+        """
+        collector = DockerGarbageCollector(self.client, log_tool=self.logger)
+        return len(collector.remove_containers())
+
+    def volume_exists(self) -> bool:
+        """ Check if the volume of the run is still on the docker engine,
+        i.e. to resume the run with the content left by its completed jobs
+
+        Returns:
+            bool: True if the volume exists
+        """
+        try:
+            self.docker_vol = self.client.volumes.get(self.vol_name)
+            return True
+        except docker.errors.NotFound:
+            return False
+
+    def remove_job(self, job_name: str) -> bool:
+        """ Remove the container left by a job, so the job can run again
+
+        Args:
+            job_name (str): name of the job
+
+        Returns:
+            bool: True if a container was removed
+        """
+        container_name = self.vol_name + '-' + job_name
+        try:
+            self.client.containers.get(container_name).remove(force=True)
+            return True
+        except docker.errors.NotFound:
+            return False
+
     def remove_vol(self) -> bool:
         """ Remove the volume associated 
 
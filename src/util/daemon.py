@@ -0,0 +1,388 @@
+""" Resident daemon serving cid commands over a local Unix socket.
+The daemon imports the program and the heavy backends once, then fork a child for
+each request. The child inherit the warm interpreter, switch to the working directory
+and environment of the caller, and write straight to the terminal of the caller,
+whose stdin, stdout and stderr are passed over the socket.
+Only this module and util.constant are needed by the client, so a command served
+by the daemon does not pay the import cost of the program.
+
+The warm state kept by the daemon is the imported program, not live objects:
+- the MongoAdapter opens a client for each operation, so there is no connection
+  to keep, and a MongoClient or a docker client with open connections is not safe
+  to use across fork, so each command connects again from its child.
+- the config cache, the repository mirrors and the worktrees are on disk and
+  shared by the children through the filesystem. A copy of them in the daemon
+  would be stale, as the children cannot write it back.
+- building the Controller, ConfigChecker and ConfigCache of a command take less
+  than a millisecond, against most of the cold start spent importing the program.
+Measured on `cid --help` and `cid config --no-set`, a command takes about 400ms
+cold and 75ms served by the daemon, most of it the start of the client interpreter.
+"""
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from util.common_utils import get_logger
+import util.constant as c
+
+logger = get_logger('util.daemon')
+
+
+def _send_message(conn: socket.socket, message: dict, fds: list = None) -> None:
+    """ Send a newline terminated json message, optionally with file descriptors
+
+    Args:
+        conn (socket.socket): connected socket
+        message (dict): message to send
+        fds (list, optional): file descriptors to pass along. Defaults to None.
+    """
+    data = json.dumps(message).encode('utf-8') + b'\n'
+    if fds:
+        sent = socket.send_fds(conn, [data], fds)
+        data = data[sent:]
+    conn.sendall(data)
+
+
+def _recv_message(conn: socket.socket, max_fds: int = 0) -> tuple[dict | None, list]:
+    """ Receive a newline terminated json message and the file descriptors passed with it
+
+    Args:
+        conn (socket.socket): connected socket
+        max_fds (int, optional): maximum number of file descriptors to accept. Defaults to 0.
+
+    Returns:
+        tuple[dict | None, list]: the message, None if the peer closed the connection
+        before a full message, and the file descriptors received
+    """
+    fds = []
+    buffer = b''
+    while not buffer.endswith(b'\n'):
+        if max_fds and not fds:
+            chunk, fds, _, _ = socket.recv_fds(conn, c.DAEMON_BUFFER_SIZE, max_fds)
+        else:
+            chunk = conn.recv(c.DAEMON_BUFFER_SIZE)
+        if not chunk:
+            return None, fds
+        buffer += chunk
+        if len(buffer) > c.DAEMON_MAX_MESSAGE_SIZE:
+            raise ValueError("daemon message too large")
+    return json.loads(buffer), fds
+
+
+def get_socket_path() -> str | None:
+    """ Get the socket path of the daemon from the environment variable
+    CID_DAEMON_SOCKET, setting it to an empty value disable the daemon.
+    The .env file is not read here to keep the client light.
+
+    Returns:
+        str | None: socket path, None if disabled
+    """
+    socket_path = os.environ.get(c.ENV_DAEMON_SOCKET)
+    if socket_path is None:
+        socket_path = os.path.join(c.DEFAULT_CID_HOME, c.DEFAULT_DAEMON_SOCKET_NAME)
+    if not socket_path:
+        return None
+    return os.path.expanduser(socket_path)
+
+
+class DaemonClient:
+    """ Forward commands to a running daemon
+    """
+
+    def __init__(self, socket_path: str = None):
+        """ Initialize the client
+
+        Args:
+            socket_path (str, optional): socket of the daemon.
+                Defaults to None to use get_socket_path().
+        """
+        self.socket_path = socket_path if socket_path is not None else get_socket_path()
+
+    def _connect(self) -> socket.socket | None:
+        """ Connect to the daemon
+
+        Returns:
+            socket.socket | None: connected socket, None if no daemon is listening
+        """
+        if not self.socket_path:
+            return None
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+        except OSError:
+            conn.close()
+            return None
+        return conn
+
+    def run(self, argv: list, fds: tuple = (0, 1, 2)) -> int | None:
+        """ Run a cid command in the daemon, with the current working directory and
+        environment. The output is written by the daemon directly to the given file
+        descriptors. Interrupting the client interrupt the command.
+
+        Args:
+            argv (list): command line arguments, without the program name
+            fds (tuple, optional): stdin, stdout and stderr for the command.
+                Defaults to (0, 1, 2).
+
+        Returns:
+            int | None: exit code of the command, None if no daemon is running,
+            in which case the caller should run the command itself.
+        """
+        conn = self._connect()
+        if conn is None:
+            return None
+        with conn:
+            request = {c.DAEMON_FIELD_ACTION: c.DAEMON_ACTION_RUN,
+                       c.DAEMON_FIELD_ARGV: list(argv),
+                       c.DAEMON_FIELD_CWD: os.getcwd(),
+                       c.DAEMON_FIELD_ENV: dict(os.environ)}
+            try:
+                _send_message(conn, request, list(fds))
+                response, _ = _recv_message(conn)
+            except OSError:
+                # daemon went away before accepting the request, run it locally
+                return None
+        if response is None:
+            sys.stderr.write("cid daemon stopped before the command completed\n")
+            return 1
+        return response[c.DAEMON_FIELD_EXIT_CODE]
+
+    def request(self, action: str) -> dict | None:
+        """ Send a control request to the daemon
+
+        Args:
+            action (str): DAEMON_ACTION_STATUS or DAEMON_ACTION_STOP
+
+        Returns:
+            dict | None: response of the daemon, None if no daemon is running
+        """
+        conn = self._connect()
+        if conn is None:
+            return None
+        with conn:
+            try:
+                _send_message(conn, {c.DAEMON_FIELD_ACTION: action})
+                response, _ = _recv_message(conn)
+            except OSError:
+                return None
+        return response
+
+
+class DaemonServer:
+    """ Serve cid commands over a Unix socket, forking the warm process for each
+    command so commands run concurrently and never share the working directory,
+    environment or standard streams.
+    """
+
+    def __init__(self, handler, socket_path: str = None):
+        """ Initialize the server
+
+        Args:
+            handler (Callable[[list], int]): run a command in the child process given
+                its arguments and return the exit code. SystemExit is handled.
+            socket_path (str, optional): socket to listen on.
+                Defaults to None to use get_socket_path().
+        """
+        self.handler = handler
+        self.socket_path = socket_path if socket_path is not None else get_socket_path()
+        self.started_at = None
+        self.served = 0
+        self._children = set()
+        self._listener = None
+        self._stopping = threading.Event()
+
+    def bind(self) -> None:
+        """ Create the socket, readable by the current user only
+
+        Raises:
+            RuntimeError: if the daemon is disabled or another daemon is listening
+        """
+        if not self.socket_path:
+            raise RuntimeError(f"cid daemon is disabled, {c.ENV_DAEMON_SOCKET} is empty")
+        if DaemonClient(self.socket_path).request(c.DAEMON_ACTION_STATUS) is not None:
+            raise RuntimeError(f"cid daemon already running on {self.socket_path}")
+        os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+        if os.path.exists(self.socket_path):
+            # left behind by a daemon that did not shut down cleanly
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self._listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._listener.listen(c.DAEMON_BACKLOG)
+        self._listener.settimeout(c.DAEMON_ACCEPT_TIMEOUT)
+        self.started_at = time.time()
+
+    def serve_forever(self) -> None:
+        """ Accept requests until stop() is called or a stop request is received.
+        The socket is removed and the running commands are waited for on exit.
+        """
+        if self._listener is None:
+            self.bind()
+        try:
+            while not self._stopping.is_set():
+                self._reap_children()
+                try:
+                    conn, _ = self._listener.accept()
+                except TimeoutError:
+                    continue
+                except OSError as e:
+                    if self._stopping.is_set():
+                        break
+                    logger.warning("cid daemon fail to accept connection. Error: %s", e)
+                    continue
+                try:
+                    self._handle(conn)
+                except (OSError, ValueError) as e:
+                    logger.warning("cid daemon fail to handle request. Error: %s", e)
+                    conn.close()
+        finally:
+            self._listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            while self._children:
+                self._reap_children(block=True)
+
+    def stop(self) -> None:
+        """ Ask serve_forever to return
+        """
+        self._stopping.set()
+
+    def _handle(self, conn: socket.socket) -> None:
+        """ Answer a control request, or fork a child to run a command
+
+        Args:
+            conn (socket.socket): accepted connection
+        """
+        conn.settimeout(None)
+        request, fds = _recv_message(conn, max_fds=3)
+        action = None if request is None else request.get(c.DAEMON_FIELD_ACTION)
+        if action == c.DAEMON_ACTION_RUN and len(fds) == 3:
+            self.served += 1
+            self._fork_command(conn, request, fds)
+            return
+        for fd in fds:
+            os.close(fd)
+        with conn:
+            if action in (c.DAEMON_ACTION_STATUS, c.DAEMON_ACTION_STOP):
+                self._reap_children()
+                _send_message(conn, {c.DAEMON_FIELD_PID: os.getpid(),
+                                     c.DAEMON_FIELD_UPTIME: time.time() - self.started_at,
+                                     c.DAEMON_FIELD_SERVED: self.served,
+                                     c.DAEMON_FIELD_RUNNING: len(self._children)})
+            if action == c.DAEMON_ACTION_STOP:
+                self.stop()
+
+    def _fork_command(self, conn: socket.socket, request: dict, fds: list) -> None:
+        """ Fork a child to run the command, the child never return
+
+        Args:
+            conn (socket.socket): connection of the client
+            request (dict): run request
+            fds (list): stdin, stdout and stderr of the client
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            self._children.add(pid)
+            conn.close()
+            for fd in fds:
+                os.close(fd)
+            return
+        exit_code = 1
+        try:
+            self._listener.close()
+            exit_code = self._run_command(conn, request, fds)
+        except BaseException:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+        finally:
+            # the client closes the connection once it has the exit code
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                _send_message(conn, {c.DAEMON_FIELD_EXIT_CODE: exit_code})
+            except OSError:
+                pass
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0)
+
+    def _run_command(self, conn: socket.socket, request: dict, fds: list) -> int:
+        """ Run the command in the forked child, in the context of the client
+
+        Args:
+            conn (socket.socket): connection of the client
+            request (dict): run request
+            fds (list): stdin, stdout and stderr of the client
+
+        Returns:
+            int: exit code
+        """
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request[c.DAEMON_FIELD_CWD])
+        os.environ.clear()
+        os.environ.update(request[c.DAEMON_FIELD_ENV])
+        # interrupt the command if the client goes away, i.e. Ctrl+C
+        threading.Thread(target=self._watch_client, args=(conn,), daemon=True).start()
+        try:
+            exit_code = self.handler(request[c.DAEMON_FIELD_ARGV])
+        except SystemExit as e:
+            exit_code = e.code
+        if exit_code is None:
+            return 0
+        if not isinstance(exit_code, int):
+            sys.stderr.write(f"{exit_code}\n")
+            return 1
+        return exit_code
+
+    @staticmethod
+    def _watch_client(conn: socket.socket) -> None:
+        """ Interrupt the child when the client closes the connection
+
+        Args:
+            conn (socket.socket): connection of the client
+        """
+        try:
+            data = conn.recv(1)
+        except OSError:
+            data = b''
+        if not data:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    def _reap_children(self, block: bool = False) -> None:
+        """ Collect the exit status of finished children
+
+        Args:
+            block (bool, optional): wait for one child to finish. Defaults to False.
+        """
+        for pid in list(self._children):
+            try:
+                done, _ = os.waitpid(pid, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self._children.discard(pid)
+                if block:
+                    return
+
+
+def warm_up() -> None:
+    """ Import the backends loaded lazily by the commands, so every forked child
+    starts with them ready.
+    """
+    for module_name in c.DAEMON_PRELOAD_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning("cid daemon fail to preload %s. Error: %s", module_name, e)
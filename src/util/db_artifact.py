@@ -1,12 +1,11 @@
 """ Module to manage upload files to aws s3
 """
 import os
-import boto3
-from botocore.exceptions import ClientError
-from util.common_utils import (get_env, get_logger)
+from util.common_utils import (get_env, get_logger, LazyModule)
 import util.constant as c
 
-env = get_env()
+boto3 = LazyModule('boto3')
+botocore_exceptions = LazyModule('botocore.exceptions')
 logger = get_logger("util.db_artifact")
 # pylint: disable=logging-fstring-interpolation
 # pylint: disable=too-few-public-methods
@@ -26,6 +25,7 @@ class S3Client:
         try:
             self.bucket_name = bucket_name
             s3_region = c.DEFAULT_S3_LOC
+            env = get_env()
             if "AWS_S3_REGION" in env:
                 s3_region = env["AWS_S3_REGION"]
             self.s3_client = boto3.client('s3')
@@ -35,7 +35,7 @@ class S3Client:
                 },
                 Bucket=bucket_name,
             )
-        except ClientError as ce:
+        except botocore_exceptions.ClientError as ce:
             error_code = ce.response['Error']['Code']
             # raise if the error_code not related to 'BucketAlreadyOwnedByYou'
             if error_code != 'BucketAlreadyOwnedByYou':
@@ -55,7 +55,7 @@ class S3Client:
             object_name = os.path.basename(file_name)
             self.s3_client.upload_file(file_name, self.bucket_name, object_name)
             return True
-        except (TypeError, ClientError) as e:
+        except (TypeError, botocore_exceptions.ClientError) as e:
             error_msg = f"Error in uploading file for {file_name}\n"
             error_msg += f"Error message = {str(e)}"
             logger.warning(error_msg)
@@ -1,15 +1,15 @@
 """ Manage connection to MongoDB, and provides functions for relevent CRUD operation
 """
 import copy
+import threading
 import time
-import bson
 from pydantic import ValidationError
-from pymongo import (MongoClient, errors)
-from util.common_utils import (get_env, get_logger, MongoHelper)
+from util.common_utils import (get_env, get_logger, LazyModule, MongoHelper)
 from util.model import (PipelineInfo, RepoConfig)
 import util.constant as c
 
-env = get_env()
+pymongo = LazyModule('pymongo')
+bson = LazyModule('bson')
 logger = get_logger("util.db_mongo")
 # pylint: disable=logging-fstring-interpolation
 # pylint: disable=fixme
@@ -21,9 +21,20 @@ class MongoAdapter:
     def __init__(self):
         """ Default Constructor
         """
-        # store the mongoDB url in bash rc file. Using atlas for this.
-        # self.mongo_uri = os.getenv('MONGO_DB_URL')
-        self.mongo_uri = env['MONGO_DB_URL'] if 'MONGO_DB_URL' in env else ""
+        self._mongo_uri = None
+
+    @property
+    def mongo_uri(self) -> str:
+        """ MongoDB url, read from the environment on first use
+
+        Returns:
+            str: the MONGO_DB_URL, empty if not set
+        """
+        if self._mongo_uri is None:
+            # store the mongoDB url in bash rc file. Using atlas for this.
+            env = get_env()
+            self._mongo_uri = env['MONGO_DB_URL'] if 'MONGO_DB_URL' in env else ""
+        return self._mongo_uri
 
     def _insert(self, data: dict, db_name: str, collection_name: str) -> str:
         """ Generic Helper method to insert the data
@@ -36,7 +47,7 @@ class MongoAdapter:
         Returns:
             str: the inserted_id(converted to str) if successful
         """
-        mongo_client = MongoClient(self.mongo_uri)
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
         database = mongo_client[db_name]
         collection = database[collection_name]
         result = collection.insert_one(data)
@@ -55,7 +66,7 @@ class MongoAdapter:
         Returns:
             bool: boolean indicator if successful
         """
-        mongo_client = MongoClient(self.mongo_uri)
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
         database = mongo_client[db_name]
         collection = database[collection_name]
         updated_data = copy.deepcopy(data)
@@ -82,7 +93,7 @@ class MongoAdapter:
         Returns:
             bool: boolean indicator if successful
         """
-        mongo_client = MongoClient(self.mongo_uri)
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
         database = mongo_client[db_name]
         collection = database[collection_name]
         updated_data = copy.deepcopy(data)
@@ -110,7 +121,7 @@ class MongoAdapter:
         Returns:
             dict: target record in dict form
         """
-        mongo_client = MongoClient(self.mongo_uri)
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
         database = mongo_client[db_name]
         collection = database[collection_name]
         result = collection.find_one(
@@ -131,7 +142,7 @@ class MongoAdapter:
         Returns:
             dict: target record in dict form
         """
-        mongo_client = MongoClient(self.mongo_uri)
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
         database = mongo_client[db_name]
         collection = database[collection_name]
         result = collection.find_one(query)
@@ -149,7 +160,7 @@ class MongoAdapter:
         Returns:
             bool: boolean indicator if successful
         """
-        mongo_client = MongoClient(self.mongo_uri)
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
         database = mongo_client[db_name]
         collection = database[collection_name]
         result = collection.delete_one(
@@ -187,7 +198,7 @@ class MongoAdapter:
                 updates.pop(c.FIELD_ID)
             acknowledge = self._update_by_query(query_filter, updates, db_name, collection_name)
             return acknowledge
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning(
                 "Error inserting new pipeline, exception is %s", e)
             return False
@@ -232,10 +243,11 @@ class MongoAdapter:
                 c.FIELD_STATUS: None,
                 c.FIELD_START_TIME: time.asctime(),
                 c.FIELD_COMPLETION_TIME: "",
+                c.FIELD_HEARTBEAT: time.time(),
                 c.FIELD_LOGS: stage_logs
             }
             return self._insert(job_data, c.MONGO_DB_NAME, c.MONGO_JOBS_TABLE)
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error inserting new job: %s", e)
             return None
 
@@ -251,13 +263,10 @@ class MongoAdapter:
             bool: True if the update succeeded, False otherwise.
         """
         try:
-            job = self._retrieve(jobs_id, c.MONGO_DB_NAME, c.MONGO_JOBS_TABLE)
-            if not job:
-                logger.warning("Job with ID %s not found.", jobs_id)
-                return False
-            job.update(updates)
-            return self._update(job, c.MONGO_DB_NAME, c.MONGO_JOBS_TABLE)
-        except errors.PyMongoError as e:
+            # $set the given fields only, no need to read the job first
+            return self._update({**updates, c.FIELD_ID: jobs_id},
+                                c.MONGO_DB_NAME, c.MONGO_JOBS_TABLE)
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error updating job: %s", e)
             return False
 
@@ -291,7 +300,7 @@ class MongoAdapter:
                 stage_log[c.FIELD_START_TIME] = stage_time[c.FIELD_START_TIME]
                 stage_log[c.FIELD_COMPLETION_TIME] = stage_time[c.FIELD_COMPLETION_TIME]
             return self._update(jobs, c.MONGO_DB_NAME, c.MONGO_JOBS_TABLE)
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error updating job log for jobs_id %s: %s", jobs_id, e)
             return False
 
@@ -309,10 +318,147 @@ class MongoAdapter:
         """
         try:
             return self._retrieve(doc_id, db_name, collection_name)
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error retrieving the job, exception is %s", e)
             return {}
 
+    def get_last_successful_commit(self, job_ids: list[str]) -> str | None:
+        """ Retrieve the commit hash of the latest successful run among the given jobs
+
+        Args:
+            job_ids (list[str]): ids of the job records, i.e. the job_run_history of a pipeline
+
+        Returns:
+            str | None: commit hash, None if no successful run found
+        """
+        object_ids = [bson.objectid.ObjectId(job_id) for job_id in job_ids
+                      if bson.objectid.ObjectId.is_valid(str(job_id))]
+        if not object_ids:
+            return None
+        try:
+            mongo_client = pymongo.MongoClient(self.mongo_uri)
+            collection = mongo_client[c.MONGO_DB_NAME][c.MONGO_JOBS_TABLE]
+            result = collection.find_one(
+                {c.FIELD_ID: {'$in': object_ids}, c.FIELD_STATUS: c.STATUS_SUCCESS},
+                {c.FIELD_GIT_COMMIT_HASH: 1},
+                sort=[(c.FIELD_RUN_NUMBER, -1)]
+            )
+            mongo_client.close()
+            return result.get(c.FIELD_GIT_COMMIT_HASH) if result else None
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Error retrieving last successful run: %s", e)
+            return None
+
+    def enqueue_run(self, queue_item: dict) -> str | None:
+        """ Add a pipeline run to the job_queue collection, for a runner to claim
+
+        Args:
+            queue_item (dict): job_id of the run record in jobs_history, the repository
+                and pipeline of the run, and the skipped_jobs
+
+        Returns:
+            str | None: id of the queue item, None if the insert fail
+        """
+        item = copy.deepcopy(queue_item)
+        item.update({
+            c.FIELD_STATUS: c.STATUS_QUEUED,
+            c.FIELD_ENQUEUE_TIME: time.time(),
+            c.FIELD_LEASE_OWNER: None,
+            c.FIELD_LEASE_EXPIRY: 0,
+            c.FIELD_ATTEMPTS: 0
+        })
+        try:
+            return self._insert(item, c.MONGO_DB_NAME, c.MONGO_QUEUE_TABLE)
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Error queueing the run: %s", e)
+            return None
+
+    def claim_queued_run(self, owner: str,
+                         lease_seconds: float = c.DEFAULT_LEASE_SECONDS) -> dict | None:
+        """ Claim the oldest queued run with an atomic find and modify, so a run is
+        claimed by a single runner. A running item whose lease expired, because its
+        runner stopped renewing it, is claimed again.
+
+        Args:
+            owner (str): name of the runner
+            lease_seconds (float, optional): time the claim is valid before it must be
+                renewed. Defaults to DEFAULT_LEASE_SECONDS.
+
+        Returns:
+            dict | None: the claimed queue item, None if the queue is empty
+        """
+        now = time.time()
+        try:
+            mongo_client = pymongo.MongoClient(self.mongo_uri)
+            collection = mongo_client[c.MONGO_DB_NAME][c.MONGO_QUEUE_TABLE]
+            item = collection.find_one_and_update(
+                {'$or': [
+                    {c.FIELD_STATUS: c.STATUS_QUEUED},
+                    {c.FIELD_STATUS: c.STATUS_RUNNING, c.FIELD_LEASE_EXPIRY: {'$lt': now}}
+                ]},
+                {'$set': {
+                    c.FIELD_STATUS: c.STATUS_RUNNING,
+                    c.FIELD_LEASE_OWNER: owner,
+                    c.FIELD_LEASE_EXPIRY: now + lease_seconds
+                }, '$inc': {c.FIELD_ATTEMPTS: 1}},
+                sort=[(c.FIELD_ENQUEUE_TIME, 1)],
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+            mongo_client.close()
+            return item
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Error claiming a queued run: %s", e)
+            return None
+
+    def renew_lease(self, item_id: str, owner: str,
+                    lease_seconds: float = c.DEFAULT_LEASE_SECONDS) -> bool | None:
+        """ Extend the lease of a claimed run, the heartbeat of its runner
+
+        Args:
+            item_id (str): id of the queue item
+            owner (str): name of the runner holding the lease
+            lease_seconds (float, optional): new validity of the lease from now.
+                Defaults to DEFAULT_LEASE_SECONDS.
+
+        Returns:
+            bool | None: True if renewed, False if the lease was lost to another runner,
+                None if the database cannot be reached
+        """
+        try:
+            mongo_client = pymongo.MongoClient(self.mongo_uri)
+            collection = mongo_client[c.MONGO_DB_NAME][c.MONGO_QUEUE_TABLE]
+            result = collection.update_one(
+                {c.FIELD_ID: bson.objectid.ObjectId(item_id), c.FIELD_LEASE_OWNER: owner,
+                 c.FIELD_STATUS: c.STATUS_RUNNING},
+                {'$set': {c.FIELD_LEASE_EXPIRY: time.time() + lease_seconds}}
+            )
+            mongo_client.close()
+            return result.matched_count == 1
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Error renewing the lease of %s: %s", item_id, e)
+            return None
+
+    def complete_queued_run(self, item_id: str, owner: str) -> bool:
+        """ Remove a finished run from the queue, if the runner still hold its lease
+
+        Args:
+            item_id (str): id of the queue item
+            owner (str): name of the runner holding the lease
+
+        Returns:
+            bool: True if removed
+        """
+        try:
+            mongo_client = pymongo.MongoClient(self.mongo_uri)
+            collection = mongo_client[c.MONGO_DB_NAME][c.MONGO_QUEUE_TABLE]
+            result = collection.delete_one(
+                {c.FIELD_ID: bson.objectid.ObjectId(item_id), c.FIELD_LEASE_OWNER: owner})
+            mongo_client.close()
+            return result.deleted_count == 1
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Error removing the queued run %s: %s", item_id, e)
+            return False
+
     def get_session(
             self,
             user_id: str,
@@ -341,7 +487,7 @@ class MongoAdapter:
 
             return result if result else {}
 
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error retrieving last set repository for user %s: %s", user_id, e)
             return {}
 
@@ -385,7 +531,7 @@ class MongoAdapter:
             acknowledge = self._update_by_query(query_filter, updates, db_name, collection_name)
             return acknowledge
 
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error in update_session, exception is %s", e)
             return False
 
@@ -412,7 +558,7 @@ class MongoAdapter:
                 c.FIELD_ID: 1,
                 f"pipelines.{pipeline_name}": 1
             }
-            mongo_client = MongoClient(self.mongo_uri)
+            mongo_client = pymongo.MongoClient(self.mongo_uri)
             database = mongo_client[c.MONGO_DB_NAME]
             collection = database[c.MONGO_PIPELINES_TABLE]
             pipeline_document = collection.find_one(query_filter, projection)
@@ -426,7 +572,7 @@ class MongoAdapter:
                 pipeline_name, repo_name, repo_url, branch
             )
             return {}
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.warning("Error retrieving pipeline config: %s", str(e))
             return {}
         except AttributeError as attr:
@@ -434,6 +580,35 @@ class MongoAdapter:
             print(f"pipelines: {pipeline_document} is empty.\nError: {str(attr)}")
             return {}
 
+    def get_pipeline_name(self, repo_name: str, repo_url: str, branch: str,
+                          pipeline_file_name: str) -> str | None:
+        """Find the pipeline recorded for a configuration file.
+
+        Args:
+            repo_name (str): Repository name.
+            repo_url (str): Repository URL.
+            branch (str): Repository branch.
+            pipeline_file_name (str): File name of the pipeline configuration.
+
+        Returns:
+            str | None: Name of the pipeline, None if not found.
+        """
+        try:
+            query_filter = {
+                c.FIELD_REPO_NAME: repo_name,
+                c.FIELD_REPO_URL: repo_url,
+                c.FIELD_BRANCH: branch,
+            }
+            pipeline_document = self._retrieve_by_query(query_filter, c.MONGO_DB_NAME,
+                                                         c.MONGO_PIPELINES_TABLE) or {}
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Error retrieving pipeline of %s: %s", pipeline_file_name, str(e))
+            return None
+        for pipeline_name, pipeline in (pipeline_document.get(c.FIELD_PIPELINES) or {}).items():
+            if pipeline.get(c.FIELD_PIPELINE_FILE_NAME) == pipeline_file_name:
+                return pipeline_name
+        return None
+
     def update_pipeline_info(
             self,
             repo_name: str,
@@ -451,6 +626,27 @@ class MongoAdapter:
             pipeline_name (str): The name of the pipeline to update.
             updates (dict): key:value pair of new pipeline configuration to be updated
 
+        Returns:
+            bool: True if the update was successful, False otherwise.
+        """
+        return self.update_pipelines_info(repo_name, repo_url, branch, {pipeline_name: updates})
+
+    def update_pipelines_info(
+            self,
+            repo_name: str,
+            repo_url: str,
+            branch: str,
+            pipelines: dict) -> bool:
+        """ Update the fields of several pipelines of the same repository in the
+        repo_configs collection with a single write. Will catch PyMongoError
+
+        Args:
+            repo_name (str): The repository name.
+            repo_url (str): The URL of the repository.
+            branch (str): The branch of the repository.
+            pipelines (dict): pipeline_name as key, and key:value pair of new
+                pipeline configuration to be updated as value
+
         Returns:
             bool: True if the update was successful, False otherwise.
         """
@@ -460,21 +656,51 @@ class MongoAdapter:
                 c.FIELD_REPO_URL: repo_url,
                 c.FIELD_BRANCH: branch,
             }
-            # Check if the specific repository and pipeline exists
+            # A single write if all the pipelines exist, i.e. the running flag of a run
+            if self._update_existing_pipelines(query_filter, pipelines):
+                return True
+            # Check which pipelines already exist for the specific repository
             exist = self._retrieve_by_query(query_filter, c.MONGO_DB_NAME, c.MONGO_PIPELINES_TABLE)
-            if not exist or pipeline_name not in exist[c.FIELD_PIPELINES]:
-                pipeline_info = PipelineInfo.model_validate(updates)
-                # Convert it back for later usage
-                updates = pipeline_info.model_dump(by_alias=True)
-            update_dict = {f'pipelines.{pipeline_name}.{k}': v for k, v in updates.items()}
+            existing_pipelines = exist.get(c.FIELD_PIPELINES, {}) if exist else {}
+            update_dict = {}
+            for pipeline_name, updates in pipelines.items():
+                if pipeline_name not in existing_pipelines:
+                    pipeline_info = PipelineInfo.model_validate(updates)
+                    # Convert it back for later usage
+                    updates = pipeline_info.model_dump(by_alias=True)
+                update_dict.update(
+                    {f'pipelines.{pipeline_name}.{k}': v for k, v in updates.items()})
             status = self._update_by_query(
                 query_filter,update_dict,c.MONGO_DB_NAME,c.MONGO_PIPELINES_TABLE
                 )
             return status
-        except (errors.PyMongoError, ValidationError) as e:
+        except (pymongo.errors.PyMongoError, ValidationError) as e:
             logger.warning("Error updating pipeline config: %s", str(e))
             return False
 
+    def _update_existing_pipelines(self, query_filter: dict, pipelines: dict) -> bool:
+        """ Update the fields of pipelines of a repository, only if they all exist
+
+        Args:
+            query_filter (dict): field name and value of the repository primary keys
+            pipelines (dict): pipeline_name as key, and key:value pair of the fields
+                to be updated as value
+
+        Returns:
+            bool: True if the pipelines exist and are updated, False otherwise.
+        """
+        query = dict(query_filter)
+        update_dict = {}
+        for pipeline_name, updates in pipelines.items():
+            query[f'{c.FIELD_PIPELINES}.{pipeline_name}'] = {'$exists': True}
+            update_dict.update(
+                {f'{c.FIELD_PIPELINES}.{pipeline_name}.{k}': v for k, v in updates.items()})
+        mongo_client = pymongo.MongoClient(self.mongo_uri)
+        collection = mongo_client[c.MONGO_DB_NAME][c.MONGO_PIPELINES_TABLE]
+        result = collection.update_one(query, {'$set': update_dict})
+        mongo_client.close()
+        return result.matched_count > 0
+
     def get_pipeline_run_summary(
         self, repo_url: str, pipeline_name: str = None, stage_name: str = None,
         job_name: str = None, run_number: int = None) -> list:
@@ -503,15 +729,245 @@ class MongoAdapter:
         aggregation_pipeline.append({"$sort": {"job_details.run_number": -1}})
 
         try:
-            mongo_client = MongoClient(self.mongo_uri)
+            mongo_client = pymongo.MongoClient(self.mongo_uri)
             database = mongo_client[c.MONGO_DB_NAME]
             repo_collection = database[c.MONGO_PIPELINES_TABLE]
             result = list(repo_collection.aggregate(aggregation_pipeline))
             mongo_client.close()
             return result
 
-        except errors.PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             logger.error(
                 "Error retrieving pipeline runs with job details for repo %s: %s",
                 repo_url, e)
             return []
+
+
+class RunStateWriter:
+    """ Write-behind buffer of the state of a pipeline run. The job logs and run
+    status written during a run are kept in memory, and written at once
+    at the end of each stage, when the flush timer expires, when too many fields are
+    buffered, or when the writer is closed. A flush is a single update per document,
+    so the writes of a run do not grow with the number of jobs. The writer offers the
+    run state methods of MongoAdapter, and is shared by the threads of a run.
+    """
+
+    def __init__(self, mongo_ds: MongoAdapter,
+                 flush_interval: float = c.DEFAULT_STATE_FLUSH_INTERVAL,
+                 max_pending: int = c.MAX_PENDING_STATE_FIELDS):
+        """ Initialize the writer
+
+        Args:
+            mongo_ds (MongoAdapter): datastore of the run records
+            flush_interval (float, optional): seconds a buffered change waits before
+                it is written. Defaults to DEFAULT_STATE_FLUSH_INTERVAL.
+            max_pending (int, optional): buffered fields written at once.
+                Defaults to MAX_PENDING_STATE_FIELDS.
+        """
+        self.mongo_ds = mongo_ds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # (collection, document key) to (query filter, fields to $set)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._client = None
+        # job id to the position of each stage in its logs
+        self._stage_index = {}
+
+    def update_job(self, jobs_id: str, updates: dict) -> bool:
+        """ Buffer the update of fields of a job document, see MongoAdapter.update_job
+
+        Args:
+            jobs_id (str): ID of the job to update.
+            updates (dict): A dictionary of fields and their new values to update.
+
+        Returns:
+            bool: True, the update is written by a later flush
+        """
+        self._buffer(c.MONGO_JOBS_TABLE, jobs_id,
+                     {c.FIELD_ID: bson.objectid.ObjectId(jobs_id)}, updates)
+        return True
+
+    def update_job_logs(self, jobs_id: str, stage_name: str,
+                        stage_status: str, jobs_log: dict, stage_time: dict = None) -> bool:
+        """ Record the status and the jobs log of a completed stage, and flush the
+        buffered changes as the stage boundary. See MongoAdapter.update_job_logs
+
+        Args:
+            jobs_id (str): ID of the job to update.
+            stage_name (str): Name of the stage to update.
+            stage_status (str): New status of the stage.
+            jobs_log (dict): Log information for the stage.
+            stage_time (dict, optional): start_time and completion_time of the stage.
+                Defaults to None.
+
+        Returns:
+            bool: True if the update succeeded, False otherwise.
+        """
+        index = self._get_stage_index(jobs_id).get(stage_name)
+        if index is None:
+            logger.warning("Stage '%s' not initialized. Cannot update job log.", stage_name)
+            return False
+        prefix = f"{c.FIELD_LOGS}.{index}"
+        updates = {
+            f"{prefix}.{c.FIELD_STAGE_STATUS}": stage_status,
+            f"{prefix}.{c.FIELD_JOBS}": jobs_log
+        }
+        if stage_time:
+            updates[f"{prefix}.{c.FIELD_START_TIME}"] = stage_time[c.FIELD_START_TIME]
+            updates[f"{prefix}.{c.FIELD_COMPLETION_TIME}"] = \
+                stage_time[c.FIELD_COMPLETION_TIME]
+        self._buffer(c.MONGO_JOBS_TABLE, jobs_id,
+                     {c.FIELD_ID: bson.objectid.ObjectId(jobs_id)}, updates)
+        return self.flush()
+
+    def flush(self, durable: bool = False) -> bool:
+        """ Write the buffered changes, with one update per document and one request
+        per collection. Changes failing to be written are kept for the next flush.
+
+        Args:
+            durable (bool, optional): wait for the changes to be journaled, the fsync
+                of the run state. Defaults to False.
+
+        Returns:
+            bool: True if the buffered changes are written, False otherwise.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._cancel_timer()
+            if not batch:
+                return True
+            requests = {}
+            for (collection_name, _), (query_filter, updates) in batch.items():
+                requests.setdefault(collection_name, []).append((query_filter, updates))
+            try:
+                database = self._get_client()[c.MONGO_DB_NAME]
+                for collection_name, updates in requests.items():
+                    collection = database[collection_name]
+                    if durable:
+                        collection = collection.with_options(
+                            write_concern=pymongo.WriteConcern(w=1, j=True))
+                    self._write(collection, updates)
+                    # written collections are not written again by a retry
+                    for key in [key for key in batch if key[0] == collection_name]:
+                        batch.pop(key)
+                return True
+            except pymongo.errors.PyMongoError as e:
+                logger.warning("Error writing the run state, kept for the next flush: %s", e)
+                self._requeue(batch)
+                return False
+
+    def close(self) -> bool:
+        """ Stop the flush timer and write the buffered changes, waiting for them to be
+        journaled. The writer is not used after it is closed.
+
+        Returns:
+            bool: True if all the changes of the run are written, False otherwise.
+        """
+        success = self.flush(durable=True)
+        with self._lock:
+            self._cancel_timer()
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+        return success
+
+    @staticmethod
+    def _write(collection, updates: list[tuple[dict, dict]]) -> None:
+        """ Write the updates of the documents of a collection in a single request
+
+        Args:
+            collection (Collection): target collection
+            updates (list[tuple[dict, dict]]): query filter and fields to $set of
+                each document
+        """
+        if len(updates) == 1:
+            query_filter, fields = updates[0]
+            collection.update_one(query_filter, {'$set': fields})
+            return
+        collection.bulk_write([pymongo.UpdateOne(query_filter, {'$set': fields})
+                               for query_filter, fields in updates], ordered=True)
+
+    def _buffer(self, collection_name: str, key, query_filter: dict,
+                updates: dict) -> None:
+        """ Merge changes of a document into the buffer, the latest value of a field
+        wins. Too many buffered fields are flushed at once.
+
+        Args:
+            collection_name (str): collection of the document
+            key (Hashable): key of the document in the buffer
+            query_filter (dict): query filter of the document
+            updates (dict): fields and values to $set
+        """
+        with self._lock:
+            _, fields = self._pending.setdefault((collection_name, key), (query_filter, {}))
+            fields.update(updates)
+            pending = sum(len(buffered) for _, buffered in self._pending.values())
+            self._arm_timer()
+        if pending >= self.max_pending:
+            self.flush()
+
+    def _requeue(self, batch: dict) -> None:
+        """ Put back changes failed to be written, behind the changes buffered since
+
+        Args:
+            batch (dict): changes taken from the buffer by the failed flush
+        """
+        with self._lock:
+            for key, (query_filter, fields) in batch.items():
+                _, newer = self._pending.get(key, (query_filter, {}))
+                self._pending[key] = (query_filter, {**fields, **newer})
+            self._arm_timer()
+
+    def _arm_timer(self) -> None:
+        """ Start the flush timer of the buffered changes, the lock must be held """
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_timer(self) -> None:
+        """ Cancel the flush timer, the lock must be held """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _get_client(self):
+        """ Get the client of the writer, created on first use and kept until closed
+
+        Returns:
+            MongoClient: client of the run state database
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = pymongo.MongoClient(self.mongo_ds.mongo_uri)
+            return self._client
+
+    def _get_stage_index(self, jobs_id: str) -> dict:
+        """ Get the position of each stage in the logs of a job, read once per job as
+        the stages of a run are initialized with its job record
+
+        Args:
+            jobs_id (str): ID of the job
+
+        Returns:
+            dict: stage name to its position, empty if the job is not found
+        """
+        if jobs_id not in self._stage_index:
+            try:
+                job = self._get_client()[c.MONGO_DB_NAME][c.MONGO_JOBS_TABLE].find_one(
+                    {c.FIELD_ID: bson.objectid.ObjectId(jobs_id)},
+                    {f"{c.FIELD_LOGS}.{c.FIELD_STAGE_NAME}": 1})
+            except pymongo.errors.PyMongoError as e:
+                logger.warning("Error reading the stages of job %s: %s", jobs_id, e)
+                return {}
+            if not job:
+                logger.warning("Jobs with ID %s not found.", jobs_id)
+                return {}
+            self._stage_index[jobs_id] = {
+                stage[c.FIELD_STAGE_NAME]: index
+                for index, stage in enumerate(job.get(c.FIELD_LOGS) or [])}
+        return self._stage_index[jobs_id]
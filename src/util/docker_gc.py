@@ -0,0 +1,264 @@
+""" Garbage collector of the docker resources left on a docker engine. The job
+containers and run volumes created by cid carry cid.* labels with their run, pipeline
+and creation time, so the ones left by a crashed or failed run are found by label:
+- the job containers orphaned by their run, see is_orphan.
+- the run volumes older than the maximum age. The volume of a failed or cancelled
+  run is kept for `cid pipeline run --resume` until then.
+- the dangling images older than the maximum age.
+With a disk budget, the oldest unused run volumes are then removed until the disk
+used by the engine fits in the budget. The volume of a run still in flight is never
+removed, even when no container uses it between two jobs, see is_run_active. A run
+left in flight by a crash stops renewing its heartbeat, and its volume is collected
+once the heartbeat is older than the maximum age.
+"""
+import time
+from typing import Callable
+from datetime import (datetime, timezone)
+import util.constant as c
+from util.common_utils import (get_logger, LazyModule)
+from util.model import (GcReport)
+
+docker = LazyModule('docker')
+logger = get_logger('util.docker_gc')
+
+
+def parse_docker_time(value: str) -> float | None:
+    """ Convert a time reported by the docker engine to an epoch time
+
+    Args:
+        value (str): UTC time in RFC 3339 format, i.e. 2024-11-20T10:00:00.123456789Z
+
+    Returns:
+        float | None: epoch time, None if the value is not a valid time
+    """
+    try:
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(
+            tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_orphan(container, now: float, grace: float = c.ORPHAN_GRACE_SECONDS) -> bool:
+    """ Check if a job container was left behind by its run. A container is orphaned
+    once it has stopped for the grace period, as its run removes it when it stops, or
+    once it has run past its deadline for as long, as its run stops it at the deadline.
+    Running containers without a deadline are never orphaned.
+
+    Args:
+        container (Container): docker container of a job
+        now (float): current epoch time
+        grace (float, optional): seconds given to the run to clean up.
+            Defaults to ORPHAN_GRACE_SECONDS.
+
+    Returns:
+        bool: True if the container is orphaned
+    """
+    labels = container.labels
+    try:
+        created = float(labels.get(c.LABEL_CREATED, now))
+        if container.status in c.LIVE_CONTAINER_STATES:
+            deadline = labels.get(c.LABEL_DEADLINE)
+            return deadline is not None and now > float(deadline) + grace
+    except ValueError:
+        return False
+    finished = parse_docker_time((container.attrs.get('State') or {}).get('FinishedAt'))
+    # a container never started report a finish time before its creation
+    return now > max(finished or created, created) + grace
+
+
+class DockerGarbageCollector:
+    """ Remove the stale cid resources of a docker engine
+    """
+
+    def __init__(self, client, max_age: float = c.DEFAULT_GC_MAX_AGE,
+                 disk_budget: int = None, dry_run: bool = False, log_tool=logger,
+                 is_active: Callable[[str, float], bool] = None):
+        """ Initialize the collector
+
+        Args:
+            client (docker.DockerClient): client of the docker engine
+            max_age (float, optional): age in seconds of the run volumes and dangling
+                images to remove. Defaults to DEFAULT_GC_MAX_AGE.
+            disk_budget (int, optional): bytes the engine may use on disk.
+                Defaults to None for no budget.
+            dry_run (bool, optional): report the resources without removing them.
+                Defaults to False.
+            log_tool (Logger, optional): logging tool. Defaults to logger.
+            is_active (Callable[[str, float], bool], optional): check if the run of
+                a job record id is still in flight, i.e. renewed its heartbeat within
+                the given seconds. Defaults to None for no run in flight.
+        """
+        self.client = client
+        self.max_age = max_age
+        self.disk_budget = disk_budget
+        self.dry_run = dry_run
+        self.logger = log_tool
+        self.is_active = is_active
+
+    def collect(self) -> GcReport:
+        """ Remove the orphaned containers, then the stale volumes and images, then
+        the oldest volumes over the disk budget
+
+        Returns:
+            GcReport: resources removed, or to remove for a dry run
+        """
+        now = time.time()
+        report = GcReport()
+        # stopped containers are orphaned after the grace period whatever the max age
+        report.containers = self.remove_containers(now, min(self.max_age,
+                                                            c.ORPHAN_GRACE_SECONDS))
+        report.volumes = self.remove_volumes(now)
+        report.images, report.reclaimed = self.remove_images(now)
+        if self.disk_budget is not None:
+            volumes, reclaimed = self.fit_budget(set(report.volumes))
+            report.volumes += volumes
+            report.reclaimed += reclaimed
+        return report
+
+    def remove_containers(self, now: float = None,
+                          grace: float = c.ORPHAN_GRACE_SECONDS) -> list[str]:
+        """ Remove the job containers orphaned by their run
+
+        Args:
+            now (float, optional): current epoch time. Defaults to None for now.
+            grace (float, optional): seconds given to the run to clean up.
+                Defaults to ORPHAN_GRACE_SECONDS.
+
+        Returns:
+            list[str]: names of the containers removed
+        """
+        now = time.time() if now is None else now
+        removed = []
+        for container in self.client.containers.list(
+                all=True, filters={'label': c.LABEL_MANAGED}):
+            if is_orphan(container, now, grace) and self._remove(
+                    container.name, lambda container=container: container.remove(force=True)):
+                removed.append(container.name)
+        return removed
+
+    def remove_volumes(self, now: float) -> list[str]:
+        """ Remove the run volumes older than the maximum age. Volumes of the runs
+        in flight, or still used by a container, are left to a later collection.
+
+        Args:
+            now (float): current epoch time
+
+        Returns:
+            list[str]: names of the volumes removed
+        """
+        removed = []
+        for volume in self.client.volumes.list(filters={'label': c.LABEL_MANAGED}):
+            try:
+                created = float((volume.attrs.get('Labels') or {})[c.LABEL_CREATED])
+            except (KeyError, ValueError):
+                continue
+            if now > created + self.max_age and not self.is_run_active(
+                    volume.attrs.get('Labels')) and self._remove(volume.name, volume.remove):
+                removed.append(volume.name)
+        return removed
+
+    def remove_images(self, now: float) -> tuple[list[str], int]:
+        """ Remove the dangling images older than the maximum age, i.e. the images
+        left untagged by a newer pull of the job images
+
+        Args:
+            now (float): current epoch time
+
+        Returns:
+            tuple[list[str], int]: ids of the images removed and bytes reclaimed
+        """
+        removed = []
+        reclaimed = 0
+        for image in self.client.images.list(filters={'dangling': True}):
+            created = parse_docker_time(image.attrs.get('Created'))
+            if created is None or now <= created + self.max_age:
+                continue
+            if self._remove(image.id, lambda image=image: self.client.images.remove(image.id)):
+                removed.append(image.id)
+                reclaimed += image.attrs.get(c.DOCKER_DF_SIZE) or 0
+        return removed, reclaimed
+
+    def fit_budget(self, removed: set = frozenset()) -> tuple[list[str], int]:
+        """ Remove the oldest unused run volumes until the disk used by the images,
+        containers and volumes of the engine fits in the disk budget. The volumes of
+        the runs in flight are not removed.
+
+        Args:
+            removed (set, optional): names of the volumes already removed, still
+                reported in a dry run. Defaults to empty.
+
+        Returns:
+            tuple[list[str], int]: names of the volumes removed and bytes reclaimed
+        """
+        usage = self.client.df()
+        volumes = [volume for volume in usage.get(c.DOCKER_DF_VOLUMES) or []
+                   if volume['Name'] not in removed]
+        used = (usage.get(c.DOCKER_DF_LAYERS_SIZE) or 0) + sum(
+            container.get(c.DOCKER_DF_SIZE_RW) or 0
+            for container in usage.get(c.DOCKER_DF_CONTAINERS) or [])
+        used += sum(self._get_volume_size(volume) for volume in volumes)
+        candidates = []
+        for volume in volumes:
+            labels = volume.get('Labels') or {}
+            usage_data = volume.get(c.DOCKER_DF_USAGE) or {}
+            if c.LABEL_MANAGED in labels and usage_data.get(c.DOCKER_DF_REF_COUNT) == 0 \
+                    and not self.is_run_active(labels):
+                candidates.append((labels.get(c.LABEL_CREATED, ''), volume))
+        candidates.sort(key=lambda candidate: candidate[0])
+        evicted = []
+        reclaimed = 0
+        for _, volume in candidates:
+            if used <= self.disk_budget:
+                break
+            if self._remove(volume['Name'], lambda volume=volume:
+                            self.client.volumes.get(volume['Name']).remove()):
+                size = self._get_volume_size(volume)
+                evicted.append(volume['Name'])
+                reclaimed += size
+                used -= size
+        if used > self.disk_budget:
+            self.logger.warning("docker engine still use %s bytes, over the budget of %s",
+                                used, self.disk_budget)
+        return evicted, reclaimed
+
+    def is_run_active(self, labels: dict) -> bool:
+        """ Check if the run of a volume is still in flight, with a heartbeat renewed
+        within the maximum age. Its volume has no container between two jobs, during
+        the backoff of a retry or while waiting for a slot on the host, and must not be
+        removed then.
+
+        Args:
+            labels (dict): labels of the volume
+
+        Returns:
+            bool: True if the run is in flight, False for a volume without run id
+        """
+        run_id = (labels or {}).get(c.LABEL_RUN_ID)
+        return run_id is not None and self.is_active is not None and \
+            self.is_active(run_id, self.max_age)
+
+    @staticmethod
+    def _get_volume_size(volume: dict) -> int:
+        """ Get the disk size of a volume reported by df, 0 if it is unknown """
+        return max(0, (volume.get(c.DOCKER_DF_USAGE) or {}).get(c.DOCKER_DF_SIZE) or 0)
+
+    def _remove(self, name: str, remove) -> bool:
+        """ Remove a docker resource, unless in a dry run
+
+        Args:
+            name (str): name of the resource, for the logs
+            remove (Callable): function removing the resource
+
+        Returns:
+            bool: True if the resource is removed, or would be in a dry run
+        """
+        if self.dry_run:
+            return True
+        self.logger.info("removing %s", name)
+        try:
+            remove()
+            return True
+        except docker.errors.APIError as ae:
+            # i.e. a volume or an image still in use
+            self.logger.warning("fail to remove %s, exception is %s", name, ae)
+            return False
@@ -0,0 +1,162 @@
+""" Pool of the docker engines the pipelines run on. The remote engines are listed
+in the environment variable CID_DOCKER_HOSTS, i.e. tcp://10.0.0.5:2375,ssh://ci@runner2,
+and each one is sized from its own cpus and memory. A pipeline run is placed on the
+least loaded engine and all its jobs run there, as they share the run volume.
+Artifacts are read from the containers through the same engine, so they are
+uploaded from any engine.
+"""
+import util.constant as c
+from util.admission import (AdmissionController)
+from util.common_utils import (get_logger, get_env, LazyModule)
+
+docker = LazyModule('docker')
+logger = get_logger('util.docker_pool')
+
+
+class DockerHost:
+    """ A docker engine of the pool, with the admission control of its containers
+    """
+
+    def __init__(self, name: str, client, admission: AdmissionController):
+        """ Initialize the host
+
+        Args:
+            name (str): name of the engine shown to the user, i.e. its url
+            client (DockerClient | None): client of the engine, None for the engine
+                of the environment, created by DockerManager on first use
+            admission (AdmissionController): admission control of the engine
+        """
+        self.name = name
+        self.client = client
+        self.admission = admission
+        self.runs = 0
+
+    @property
+    def load(self) -> float:
+        """ Pipeline runs placed on the host, relative to its capacity
+
+        Returns:
+            float: runs per cpu, or per container slot if the cpus are unknown
+        """
+        capacity = self.admission.cpus or self.admission.max_containers
+        return self.runs / capacity
+
+
+class DockerHostPool:
+    """ Place the pipeline runs on the least loaded docker engine. A pool is used
+    from a single event loop, and can be shared by all the pipelines running on it.
+    """
+
+    def __init__(self, hosts: list[DockerHost], remote: bool = False):
+        """ Initialize the pool
+
+        Args:
+            hosts (list[DockerHost]): engines of the pool, at least one
+            remote (bool, optional): True if the engines are remote. Defaults to False.
+
+        Raises:
+            ValueError: if no host is given
+        """
+        if not hosts:
+            raise ValueError("docker host pool needs at least one host")
+        self.hosts = hosts
+        self.remote = remote
+
+    @classmethod
+    def local(cls, max_containers: int = c.DEFAULT_MAX_CONTAINERS) -> 'DockerHostPool':
+        """ Build the pool of the local docker engine
+
+        Args:
+            max_containers (int, optional): maximum running containers.
+                Defaults to DEFAULT_MAX_CONTAINERS.
+
+        Returns:
+            DockerHostPool: pool with the engine of the environment only
+        """
+        return cls([DockerHost(c.LOCAL_DOCKER_HOST, None,
+                               AdmissionController.for_local_host(max_containers))])
+
+    @classmethod
+    def from_clients(cls, clients: dict, max_containers: int = c.DEFAULT_MAX_CONTAINERS
+                     ) -> 'DockerHostPool':
+        """ Build a pool of remote engines from their clients. Engines that cannot
+        report their resources are left out.
+
+        Args:
+            clients (dict): name to DockerClient of each engine
+            max_containers (int, optional): maximum running containers per engine.
+                Defaults to DEFAULT_MAX_CONTAINERS.
+
+        Raises:
+            docker.errors.DockerException: if none of the engines is reachable
+
+        Returns:
+            DockerHostPool: pool of the reachable engines
+        """
+        hosts = []
+        for name, client in clients.items():
+            try:
+                info = client.info()
+            except docker.errors.DockerException as de:
+                logger.warning("docker host %s unreachable, left out. Error: %s", name, de)
+                continue
+            admission = AdmissionController(cpus=info.get(c.DOCKER_INFO_CPUS),
+                                            memory=info.get(c.DOCKER_INFO_MEMORY),
+                                            max_containers=max_containers)
+            hosts.append(DockerHost(name, client, admission))
+        if not hosts:
+            raise docker.errors.DockerException(
+                f"None of the docker hosts {', '.join(clients)} is reachable")
+        return cls(hosts, remote=True)
+
+    @classmethod
+    def from_env(cls, max_containers: int = c.DEFAULT_MAX_CONTAINERS
+                 ) -> 'DockerHostPool | None':
+        """ Build the pool of the remote engines listed in CID_DOCKER_HOSTS
+
+        Args:
+            max_containers (int, optional): maximum running containers per engine.
+                Defaults to DEFAULT_MAX_CONTAINERS.
+
+        Raises:
+            docker.errors.DockerException: if none of the engines is reachable
+
+        Returns:
+            DockerHostPool | None: pool of the remote engines, None if none is configured
+        """
+        urls = [url.strip() for url in get_env().get(c.ENV_DOCKER_HOSTS, "").split(',')
+                if url.strip()]
+        if not urls:
+            return None
+        clients = {}
+        for url in dict.fromkeys(urls):
+            try:
+                clients[url] = docker.DockerClient(base_url=url,
+                                                   timeout=c.DEFAULT_DOCKER_HOST_TIMEOUT)
+            except docker.errors.DockerException as de:
+                logger.warning("invalid docker host %s, left out. Error: %s", url, de)
+        return cls.from_clients(clients, max_containers)
+
+    def acquire(self, preferred: str = None) -> DockerHost:
+        """ Place a pipeline run on the least loaded host
+
+        Args:
+            preferred (str, optional): name of the host to use if it is in the pool,
+                i.e. the host holding the volume of a resumed run. Defaults to None.
+
+        Returns:
+            DockerHost: host to run all the jobs of the run on
+        """
+        host = next((host for host in self.hosts if host.name == preferred), None)
+        if host is None:
+            host = min(self.hosts, key=lambda host: host.load)
+        host.runs += 1
+        return host
+
+    def release(self, host: DockerHost) -> None:
+        """ Release the placement of a finished pipeline run
+
+        Args:
+            host (DockerHost): host returned by acquire
+        """
+        host.runs -= 1
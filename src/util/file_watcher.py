@@ -0,0 +1,255 @@
+""" Watch a directory tree for changes of configuration files. On Linux the
+kernel inotify interface is used through ctypes, so no extra dependency is needed.
+Other platforms, or when inotify cannot be initialized, fall back to polling the
+modification time of the files.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from util.common_utils import get_logger
+import util.constant as c
+
+logger = get_logger('util.file_watcher')
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class FileWatcher:
+    """ Report the files changed, created or deleted under a directory,
+    restricted to the given suffixes.
+    """
+
+    def __init__(self, directory: str, suffixes: tuple = ('.yml', '.yaml'),
+                 poll_interval: float = c.DEFAULT_WATCH_POLL_INTERVAL,
+                 use_inotify: bool = True):
+        """ Initialize the watcher and start watching
+
+        Args:
+            directory (str): directory to watch, including its sub directories
+            suffixes (tuple, optional): suffixes of the files to report.
+                Defaults to ('.yml', '.yaml').
+            poll_interval (float, optional): seconds between two scans when polling.
+                Defaults to DEFAULT_WATCH_POLL_INTERVAL.
+            use_inotify (bool, optional): try inotify before falling back to polling.
+                Defaults to True.
+
+        Raises:
+            FileNotFoundError: if the directory does not exist
+        """
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Given directory:{directory} is not a valid directory")
+        self.directory = os.path.abspath(directory)
+        self.suffixes = suffixes
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._watches = {}
+        self._snapshot = {}
+        if use_inotify:
+            self._init_inotify()
+        if self._fd is None:
+            self._snapshot = self._scan()
+
+    @property
+    def uses_inotify(self) -> bool:
+        """ Check if the watcher is backed by inotify
+
+        Returns:
+            bool: True for inotify, False for polling
+        """
+        return self._fd is not None
+
+    def __enter__(self) -> 'FileWatcher':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ Release the inotify file descriptor if any
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def get_files(self) -> list[str]:
+        """ List the files currently matching the suffixes under the directory
+
+        Returns:
+            list[str]: sorted absolute paths
+        """
+        return sorted(self._scan())
+
+    def wait(self, timeout: float = None) -> set[str]:
+        """ Block until at least one watched file changed, then return all the
+        files changed within a short debounce window, so an editor saving through
+        a temporary file is reported once.
+
+        Args:
+            timeout (float, optional): maximum seconds to wait. Defaults to None for no limit.
+
+        Returns:
+            set[str]: absolute paths of the changed files, empty if the timeout expired.
+            Deleted files are included, the caller can check their existence.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            changed = self._read_changes(remaining)
+        if changed:
+            time.sleep(c.DEFAULT_WATCH_DEBOUNCE)
+            changed |= self._read_changes(0)
+        return changed
+
+    def _read_changes(self, timeout: float | None) -> set[str]:
+        """ Read the pending changes, waiting up to timeout for the first one
+
+        Args:
+            timeout (float | None): seconds to wait, None for no limit
+
+        Returns:
+            set[str]: absolute paths of the changed files
+        """
+        if self._fd is None:
+            return self._poll(timeout)
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        return self._parse_events(data)
+
+    def _init_inotify(self) -> None:
+        """ Initialize inotify and watch every directory of the tree. Leave the
+        file descriptor unset if inotify is not available.
+        """
+        library = ctypes.util.find_library('c')
+        if library is None:
+            return
+        try:
+            self._libc = ctypes.CDLL(library, use_errno=True)
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            logger.info("inotify not available, fallback to polling. Error: %s", e)
+            return
+        if fd < 0:
+            logger.info("inotify_init1 failed with errno %d, fallback to polling",
+                        ctypes.get_errno())
+            return
+        self._fd = fd
+        for root, dirs, _ in os.walk(self.directory):
+            dirs.sort()
+            if not self._add_watch(root):
+                self.close()
+                return
+
+    def _add_watch(self, directory: str) -> bool:
+        """ Add an inotify watch on a directory
+
+        Args:
+            directory (str): directory to watch
+
+        Returns:
+            bool: True if the watch was added
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            logger.info("inotify_add_watch failed for %s with errno %d, fallback to polling",
+                        directory, ctypes.get_errno())
+            return False
+        self._watches[wd] = directory
+        return True
+
+    def _parse_events(self, data: bytes) -> set[str]:
+        """ Decode the inotify events read from the file descriptor
+
+        Args:
+            data (bytes): raw events
+
+        Returns:
+            set[str]: absolute paths of the changed files
+        """
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # new sub directory, watch it and report the files moved in with it
+                    for root, _, files in os.walk(path):
+                        self._add_watch(root)
+                        changed.update(os.path.join(root, file) for file in files
+                                       if file.endswith(self.suffixes))
+                continue
+            if path.endswith(self.suffixes) and not mask & IN_CREATE:
+                # creation is reported by the following close_write
+                changed.add(path)
+        return changed
+
+    def _scan(self) -> dict:
+        """ Snapshot the modification time and size of the watched files
+
+        Returns:
+            dict: absolute path to (mtime_ns, size)
+        """
+        snapshot = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs.sort()
+            for file in files:
+                if not file.endswith(self.suffixes):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _poll(self, timeout: float | None) -> set[str]:
+        """ Compare snapshots until a change is found or the timeout expire
+
+        Args:
+            timeout (float | None): seconds to wait, None for no limit
+
+        Returns:
+            set[str]: absolute paths of the changed files
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            sleep_time = self.poll_interval
+            if deadline is not None:
+                sleep_time = min(sleep_time, max(0, deadline - time.monotonic()))
+            time.sleep(sleep_time)
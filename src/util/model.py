@@ -26,6 +26,25 @@ class ArtifactConfig(BaseModel):
     on_success_only: bool
     paths: list[str]
 
+class ResourceConfig(BaseModel):
+    """ class to hold the resource limits of a job
+
+    Args:
+        BaseModel (BaseModel): Base Pydantic Class
+    """
+    cpus: Optional[float] = None
+    memory: Optional[int] = None
+
+class RetryConfig(BaseModel):
+    """ class to hold the retry policy of a job
+
+    Args:
+        BaseModel (BaseModel): Base Pydantic Class
+    """
+    max: int
+    on: list[Union[str, int]]
+    backoff: float
+
 class JobConfig(BaseModel):
     """ class to hold configuration for a job
 
@@ -39,6 +58,34 @@ class JobConfig(BaseModel):
     artifact_upload_path: Optional[str]
     scripts: list[str]
     artifacts: Optional[ArtifactConfig] = None
+    changes: Optional[list[str]] = None
+    resources: Optional[ResourceConfig] = None
+    retry: Optional[RetryConfig] = None
+    timeout: Optional[float] = None
+
+class ScriptResult(BaseModel):
+    """ class to hold the exit code of a script of a job
+
+    Args:
+        BaseModel (BaseModel): Base Pydantic Class
+    """
+    script: str
+    exit_code: int
+
+class JobAttempt(BaseModel):
+    """ class to hold the record of a failed attempt of a retried job
+
+    Args:
+        BaseModel (BaseModel): Base Pydantic Class
+    """
+    attempt: int
+    job_status: str
+    failure: Optional[str] = None
+    exit_code: Optional[int] = None
+    script_results: Optional[list[ScriptResult]] = []
+    start_time: str
+    completion_time: Optional[str] = None
+    job_logs: Optional[str] = ""
 
 class JobLog(BaseModel):
     """ class to hold information for a single job
@@ -52,6 +99,10 @@ class JobLog(BaseModel):
     start_time: str
     completion_time: Optional[str] = time.asctime()
     job_logs: Optional[str] = ""
+    exit_code: Optional[int] = None
+    failure: Optional[str] = None
+    script_results: Optional[list[ScriptResult]] = []
+    attempts: Optional[list[JobAttempt]] = []
 
 class SessionDetail(BaseModel):
     """ class to hold information to identify a repo for pipeline run
@@ -76,6 +127,8 @@ class GlobalConfig(BaseModel):
     pipeline_name: str
     docker: DockerConfig
     artifact_upload_path: str
+    timeout: Optional[float] = None
+    fail_fast: Optional[bool] = c.DEFAULT_FLAG_FAIL_FAST
 
 class ValidatedStage(BaseModel):
     """ class to hold information for a Validated Stage in Stages Section
@@ -174,3 +227,14 @@ class ValidationResult(BaseModel):
     valid: bool
     error_msg: str
     pipeline_config: Union[PipelineConfig, dict]
+
+class GcReport(BaseModel):
+    """ class to hold the docker resources removed by a garbage collection
+
+    Args:
+        BaseModel (BaseModel): Base Pydantic Class
+    """
+    containers: list[str] = []
+    volumes: list[str] = []
+    images: list[str] = []
+    reclaimed: int = 0
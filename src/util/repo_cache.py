@@ -0,0 +1,541 @@
+""" Local caches for repositories. The MirrorCache keep one bare mirror
+per normalized repository url, so repeated clone of the same remote only need to
+fetch the new objects into the mirror, followed by a cheap local clone.
+The WorktreeManager materialize detached git worktrees of a local repository,
+shared between concurrent runs of the same commit, and reclaim the worktrees left
+by crashed runs. The RemoteRefCache keep the
+branch heads of remote repositories for a short time, so a single command probe
+each remote only once.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+from util.common_utils import (get_env, get_logger, file_lock, is_process_alive, LazyModule)
+import util.constant as c
+
+git = LazyModule('git')
+
+logger = get_logger('util.repo_cache')
+
+
+class MirrorCache:
+    """ Manage a directory of bare mirrors, one per normalized repository url.
+    Mirrors are evicted in least recently used order when the total size of the
+    cache directory grow above the configured budget.
+    """
+
+    def __init__(self, cache_dir: str = None, max_size: int = c.DEFAULT_MIRROR_MAX_SIZE):
+        """ Initialize the mirror cache
+
+        Args:
+            cache_dir (str, optional): directory to hold the mirrors.
+                Defaults to ~/.cid/mirrors.
+            max_size (int, optional): size budget in bytes for all mirrors.
+                A value of 0 or less disable the cache. Defaults to DEFAULT_MIRROR_MAX_SIZE.
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(c.DEFAULT_CID_HOME, c.DEFAULT_MIRROR_DIR_NAME)
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_size = max_size
+
+    @classmethod
+    def from_env(cls) -> 'MirrorCache':
+        """ Build the mirror cache from the environment variables
+        CID_MIRROR_DIR and CID_MIRROR_MAX_SIZE.
+
+        Returns:
+            MirrorCache: configured mirror cache
+        """
+        env = get_env()
+        max_size = c.DEFAULT_MIRROR_MAX_SIZE
+        try:
+            if env.get(c.ENV_MIRROR_MAX_SIZE):
+                max_size = int(env[c.ENV_MIRROR_MAX_SIZE])
+        except ValueError:
+            logger.warning("Invalid %s value %s, using default",
+                           c.ENV_MIRROR_MAX_SIZE, env[c.ENV_MIRROR_MAX_SIZE])
+        return cls(cache_dir=env.get(c.ENV_MIRROR_DIR), max_size=max_size)
+
+    @property
+    def enabled(self) -> bool:
+        """ Check if the cache is enabled
+
+        Returns:
+            bool: True if mirrors should be used for remote clone
+        """
+        return self.max_size > 0
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """ Normalize the repository url so different spelling of the same
+        remote map to the same mirror. For example
+        git@github.com:org/repo.git, https://github.com/org/repo and
+        https://github.com/org/repo.git/ are all normalized to github.com/org/repo
+
+        Args:
+            url (str): repository url
+
+        Returns:
+            str: normalized url
+        """
+        url = url.strip()
+        # scp-like syntax, user@host:path
+        scp_match = re.match(r'^(?:[^@/]+@)?([^:/]+):(?!//)(.+)$', url)
+        if scp_match and '://' not in url:
+            host, path = scp_match.group(1), scp_match.group(2)
+        else:
+            parsed = urlparse(url)
+            host, path = parsed.hostname or '', parsed.path
+        path = path.strip('/')
+        if path.endswith('.git'):
+            path = path[:-4]
+        return f"{host.lower()}/{path}" if host else path
+
+    def get_mirror_path(self, url: str) -> Path:
+        """ Get the path of the mirror for the given url
+
+        Args:
+            url (str): repository url
+
+        Returns:
+            Path: path of the bare mirror, may not exist yet
+        """
+        normalized = self.normalize_url(url)
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:10]
+        readable = re.sub(r'[^A-Za-z0-9._-]+', '_', normalized).strip('_')[-60:]
+        return self.cache_dir / f"{readable}-{digest}.git"
+
+    def update_mirror(self, url: str) -> Path:
+        """ Create the mirror for the url if absent, otherwise fetch the
+        latest refs into it. Evict least recently used mirrors afterward.
+
+        Args:
+            url (str): repository url
+
+        Raises:
+            GitCommandError: if the mirror cannot be cloned or fetched. A mirror failing
+                to fetch is only removed if it is corrupt.
+
+        Returns:
+            Path: path of the up to date bare mirror
+        """
+        mirror_path = self.get_mirror_path(url)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock(mirror_path):
+            if mirror_path.is_dir():
+                try:
+                    logger.debug("Fetching %s into mirror %s", url, mirror_path)
+                    git.Repo(mirror_path).git.fetch('--prune', 'origin')
+                except (git.GitCommandError, git.InvalidGitRepositoryError) as e:
+                    if not self._is_corrupt(mirror_path):
+                        # i.e. a network or auth failure, the mirror is kept
+                        logger.warning("Fail to fetch mirror %s. Error: %s", mirror_path, e)
+                        raise
+                    # A corrupt mirror is discarded and cloned again below
+                    logger.warning("Mirror %s is corrupt, recloning. Error: %s",
+                                   mirror_path, e)
+                    shutil.rmtree(mirror_path, ignore_errors=True)
+            if not mirror_path.is_dir():
+                logger.debug("Cloning %s into mirror %s", url, mirror_path)
+                git.Repo.clone_from(url, mirror_path, mirror=True)
+            self._touch(mirror_path)
+        self.evict(keep=mirror_path)
+        return mirror_path
+
+    def evict(self, keep: Path = None) -> list[Path]:
+        """ Remove least recently used mirrors until the cache fit in the size budget.
+
+        Args:
+            keep (Path, optional): mirror that must not be evicted. Defaults to None.
+
+        Returns:
+            list[Path]: list of removed mirrors
+        """
+        removed = []
+        if not self.cache_dir.is_dir():
+            return removed
+        mirrors = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or not entry.name.endswith('.git'):
+                continue
+            size = self._dir_size(entry.path)
+            total_size += size
+            mirrors.append((entry.stat().st_mtime, Path(entry.path), size))
+        # Oldest used mirror first
+        for _, path, size in sorted(mirrors, key=lambda item: item[0]):
+            if total_size <= self.max_size:
+                break
+            if keep is not None and path == keep:
+                continue
+            with self._lock(path):
+                shutil.rmtree(path, ignore_errors=True)
+            logger.info("Evicted mirror %s of size %d bytes", path, size)
+            total_size -= size
+            removed.append(path)
+        return removed
+
+    @staticmethod
+    def _is_corrupt(mirror_path: Path) -> bool:
+        """ Check if a mirror is no longer a usable git repository
+
+        Args:
+            mirror_path (Path): path of the mirror
+
+        Returns:
+            bool: True if the mirror or its HEAD commit cannot be read
+        """
+        try:
+            git.Repo(mirror_path).git.rev_parse('--verify', 'HEAD^{commit}')
+            return False
+        except (git.GitCommandError, git.InvalidGitRepositoryError, git.NoSuchPathError):
+            return True
+
+    def _touch(self, mirror_path: Path) -> None:
+        """ Mark the mirror as recently used
+
+        Args:
+            mirror_path (Path): path of the mirror
+        """
+        if mirror_path.is_dir():
+            os.utime(mirror_path)
+
+    def _dir_size(self, path: str) -> int:
+        """ Compute the total size of all files within the directory
+
+        Args:
+            path (str): target directory
+
+        Returns:
+            int: size in bytes
+        """
+        total = 0
+        for root, _, files in os.walk(path):
+            for file in files:
+                try:
+                    total += os.lstat(os.path.join(root, file)).st_size
+                except OSError:
+                    continue
+        return total
+
+    @contextlib.contextmanager
+    def _lock(self, mirror_path: Path):
+        """ Exclusive lock for a single mirror, so concurrent runners on
+        the same machine do not fetch into the same mirror at the same time.
+
+        Args:
+            mirror_path (Path): path of the mirror
+        """
+        with file_lock(str(mirror_path.with_name(mirror_path.name + '.lock'))):
+            yield
+
+
+class WorktreeManager:
+    """ Manage detached worktrees of local repositories under a scratch directory.
+    Each worktree is keyed by the repository and the commit hash, and is reference
+    counted across processes, so concurrent runs on the same commit share one
+    checkout, and the worktree is removed when the last run release it. The
+    references are recorded per owner process, so the references of a crashed
+    process are dropped instead of keeping its worktree forever.
+    """
+
+    def __init__(self, root_dir: str = None):
+        """ Initialize the worktree manager
+
+        Args:
+            root_dir (str, optional): scratch directory for the worktrees.
+                Defaults to ~/.cid/worktrees.
+        """
+        if root_dir is None:
+            root_dir = os.path.join(c.DEFAULT_CID_HOME, c.DEFAULT_WORKTREE_DIR_NAME)
+        self.root_dir = Path(root_dir).expanduser()
+
+    @classmethod
+    def from_env(cls) -> 'WorktreeManager':
+        """ Build the worktree manager from the environment variable CID_WORKTREE_DIR
+
+        Returns:
+            WorktreeManager: configured worktree manager
+        """
+        return cls(root_dir=get_env().get(c.ENV_WORKTREE_DIR))
+
+    def get_worktree_path(self, repo: 'git.Repo', commit_hash: str) -> Path:
+        """ Get the path of the worktree for the given repository and commit
+
+        Args:
+            repo (Repo): main repository
+            commit_hash (str): full commit hash
+
+        Returns:
+            Path: path of the worktree, may not exist yet
+        """
+        common_dir = os.path.realpath(repo.common_dir)
+        digest = hashlib.sha1(common_dir.encode('utf-8')).hexdigest()[:10]
+        repo_name = os.path.basename(os.path.dirname(common_dir))
+        readable = re.sub(r'[^A-Za-z0-9._-]+', '_', repo_name).strip('_')[-40:]
+        return self.root_dir / f"{readable}-{digest}" / commit_hash
+
+    def acquire(self, repo: 'git.Repo', commit_hash: str) -> Path:
+        """ Get a worktree checked out at the commit, creating it if absent,
+        and increase its reference count.
+
+        Args:
+            repo (Repo): main repository, which must contain the commit
+            commit_hash (str): full commit hash
+
+        Raises:
+            GitCommandError: if the worktree cannot be created
+
+        Returns:
+            Path: path of the worktree
+        """
+        worktree_path = self.get_worktree_path(repo, commit_hash)
+        worktree_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock(worktree_path):
+            owners = self._get_live_owners(self._read_refs(worktree_path))
+            if not owners or not (worktree_path / '.git').exists():
+                # Fresh entry, or stale one whose owners are gone, i.e. crashed processes
+                self._remove(repo, worktree_path)
+                logger.debug("Adding worktree %s at %s", worktree_path, commit_hash)
+                repo.git.worktree('add', '--detach', str(worktree_path), commit_hash)
+                owners = {}
+            pid = str(os.getpid())
+            owners[pid] = owners.get(pid, 0) + 1
+            self._write_refs(worktree_path, {'owners': owners, 'repo': repo.common_dir})
+        return worktree_path
+
+    def release(self, worktree_path: str) -> bool:
+        """ Decrease the reference count of the worktree, and remove it when
+        no run use it anymore.
+
+        Args:
+            worktree_path (str): path returned by acquire
+
+        Returns:
+            bool: True if the worktree was removed
+        """
+        worktree_path = Path(worktree_path)
+        with self._lock(worktree_path):
+            refs = self._read_refs(worktree_path)
+            owners = self._get_live_owners(refs)
+            pid = str(os.getpid())
+            owners[pid] = owners.get(pid, 0) - 1
+            if owners[pid] <= 0:
+                del owners[pid]
+            if owners:
+                self._write_refs(worktree_path, {**refs, 'owners': owners})
+                return False
+            self._remove(self._open_repo(refs), worktree_path)
+            self._refs_path(worktree_path).unlink(missing_ok=True)
+        return True
+
+    def prune(self, dry_run: bool = False) -> list[Path]:
+        """ Remove the worktrees whose owner processes are all gone, i.e. left by runs
+        that crashed between acquire and release, and never acquired again
+
+        Args:
+            dry_run (bool, optional): report the worktrees without removing them.
+                Defaults to False.
+
+        Returns:
+            list[Path]: paths of the worktrees removed, or to remove for a dry run
+        """
+        removed = []
+        if not self.root_dir.is_dir():
+            return removed
+        for refs_path in sorted(self.root_dir.glob('*/*.refs')):
+            worktree_path = refs_path.with_name(refs_path.name[:-len('.refs')])
+            with self._lock(worktree_path):
+                refs = self._read_refs(worktree_path)
+                if self._get_live_owners(refs):
+                    continue
+                if not dry_run:
+                    logger.info("Removing stale worktree %s", worktree_path)
+                    self._remove(self._open_repo(refs), worktree_path)
+                    refs_path.unlink(missing_ok=True)
+            removed.append(worktree_path)
+        return removed
+
+    @staticmethod
+    def _get_live_owners(refs: dict) -> dict:
+        """ Get the references of the owner processes still running
+
+        Args:
+            refs (dict): reference record of the worktree
+
+        Returns:
+            dict: process id to its reference count
+        """
+        owners = {}
+        for pid, count in (refs.get('owners') or {}).items():
+            try:
+                if count > 0 and is_process_alive(int(pid)):
+                    owners[pid] = count
+            except (TypeError, ValueError):
+                continue
+        return owners
+
+    @staticmethod
+    def _open_repo(refs: dict) -> 'git.Repo':
+        """ Open the main repository of a worktree, None if it no longer exists """
+        if refs.get('repo') and os.path.isdir(refs['repo']):
+            return git.Repo(refs['repo'])
+        return None
+
+    def _remove(self, repo: 'git.Repo', worktree_path: Path) -> None:
+        """ Remove the worktree directory and its registration in the main repository
+
+        Args:
+            repo (Repo): main repository, None if it no longer exists
+            worktree_path (Path): path of the worktree
+        """
+        if repo is not None and worktree_path.exists():
+            try:
+                repo.git.worktree('remove', '--force', str(worktree_path))
+            except git.GitCommandError as e:
+                logger.warning("Fail to remove worktree %s, error: %s", worktree_path, e)
+        shutil.rmtree(worktree_path, ignore_errors=True)
+        if repo is not None:
+            try:
+                repo.git.worktree('prune')
+            except git.GitCommandError as e:
+                logger.warning("Fail to prune worktrees, error: %s", e)
+
+    def _refs_path(self, worktree_path: Path) -> Path:
+        return worktree_path.with_name(worktree_path.name + '.refs')
+
+    def _read_refs(self, worktree_path: Path) -> dict:
+        """ Read the reference record of the worktree
+
+        Args:
+            worktree_path (Path): path of the worktree
+
+        Returns:
+            dict: record with the reference count of each owner process, and the
+                main repository
+        """
+        try:
+            with open(self._refs_path(worktree_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_refs(self, worktree_path: Path, refs: dict) -> None:
+        with open(self._refs_path(worktree_path), 'w', encoding='utf-8') as f:
+            json.dump(refs, f)
+
+    @contextlib.contextmanager
+    def _lock(self, worktree_path: Path):
+        """ Exclusive lock for a single worktree across processes
+
+        Args:
+            worktree_path (Path): path of the worktree
+        """
+        with file_lock(str(worktree_path.with_name(worktree_path.name + '.lock'))):
+            yield
+
+
+class RemoteRefCache:
+    """ Cache of the branch heads advertised by remote repositories, keyed by url.
+    A single `git ls-remote` call restricted to HEAD and branch heads is made per
+    remote within the time to live, and shared by repository validation, branch
+    existence check and commit resolution. Tags are never listed.
+    """
+
+    def __init__(self, ttl: float = c.DEFAULT_REMOTE_REF_TTL):
+        """ Initialize the cache
+
+        Args:
+            ttl (float, optional): time to live of the cached refs in seconds.
+                Defaults to DEFAULT_REMOTE_REF_TTL.
+        """
+        self.ttl = ttl
+        self._refs = {}
+
+    def get_refs(self, url: str) -> dict[str, str]:
+        """ Get the refs of the remote, probing the remote if not cached or expired.
+
+        Args:
+            url (str): repository url
+
+        Raises:
+            subprocess.CalledProcessError: if the remote is unreachable or invalid
+            FileNotFoundError: if git is not installed
+
+        Returns:
+            dict[str, str]: mapping of ref name, i.e. refs/heads/main, to commit hash.
+                The symbolic HEAD target is stored under the key "ref: HEAD".
+        """
+        cached = self.get_cached_refs(url)
+        if cached is not None:
+            return cached
+        logger.debug("Probing remote refs for %s", url)
+        result = subprocess.run(
+            ["git", "ls-remote", "--symref", url, "HEAD", "refs/heads/*"],
+            capture_output=True, check=True, text=True)
+        refs = {}
+        for line in (result.stdout or "").splitlines():
+            value, _, ref = line.partition('\t')
+            if value.startswith('ref: '):
+                refs[f"ref: {ref}"] = value[len('ref: '):]
+            elif ref:
+                refs[ref] = value
+        self._refs[url] = (time.monotonic(), refs)
+        return refs
+
+    def get_cached_refs(self, url: str) -> dict[str, str] | None:
+        """ Get the refs of the remote only if already cached and not expired,
+        without probing the remote.
+
+        Args:
+            url (str): repository url
+
+        Returns:
+            dict[str, str] | None: cached refs, None if absent or expired
+        """
+        cached = self._refs.get(url)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+
+    def branch_exists(self, url: str, branch: str) -> bool:
+        """ Check if the branch exists on the remote
+
+        Args:
+            url (str): repository url
+            branch (str): branch name
+
+        Returns:
+            bool: True if the remote has the branch
+        """
+        return f"refs/heads/{branch}" in self.get_refs(url)
+
+    def resolve_branch(self, url: str, branch: str) -> str | None:
+        """ Get the head commit of the branch on the remote
+
+        Args:
+            url (str): repository url
+            branch (str): branch name
+
+        Returns:
+            str | None: commit hash of the branch head, None if the branch is absent
+        """
+        return self.get_refs(url).get(f"refs/heads/{branch}")
+
+    def invalidate(self, url: str = None) -> None:
+        """ Drop the cached refs of the url, or of all remotes
+
+        Args:
+            url (str, optional): repository url. Defaults to None for all remotes.
+        """
+        if url is None:
+            self._refs.clear()
+        else:
+            self._refs.pop(url, None)
@@ -8,11 +8,12 @@ import os
 from urllib.parse import urlparse
 import subprocess
 import shutil
-from git import Repo, GitCommandError, InvalidGitRepositoryError
-from gitdb.exc import BadObject
-from util.common_utils import get_logger
+from util.common_utils import (get_logger, LazyModule)
+from util.repo_cache import MirrorCache, WorktreeManager, RemoteRefCache
 import util.constant as c
 
+git = LazyModule('git')
+
 logger = get_logger(logger_name='util.repo_manager')
 
 
@@ -31,6 +32,48 @@ class RepoManager:
         - Handling remote branches and commits during repository setup or updates.
     """
 
+    def __init__(self, mirror_cache: MirrorCache = None,
+                 worktree_manager: WorktreeManager = None,
+                 remote_refs: RemoteRefCache = None):
+        """
+        Initialize the RepoManager.
+
+        Args:
+            mirror_cache (MirrorCache, optional): cache of bare mirrors used to speed up
+                remote clones. Defaults to the cache configured from the environment.
+            worktree_manager (WorktreeManager, optional): manager of the detached worktrees.
+                Defaults to the manager configured from the environment.
+            remote_refs (RemoteRefCache, optional): cache of the remote branch heads,
+                shared by all remote probes of this manager. Defaults to a new cache.
+        """
+        self._mirror_cache = mirror_cache
+        self._worktree_manager = worktree_manager
+        self.remote_refs = remote_refs if remote_refs is not None else RemoteRefCache()
+
+    @property
+    def mirror_cache(self) -> MirrorCache:
+        """
+        Mirror cache used for remote clones, configured from the environment on first use.
+
+        Returns:
+            MirrorCache: the mirror cache
+        """
+        if self._mirror_cache is None:
+            self._mirror_cache = MirrorCache.from_env()
+        return self._mirror_cache
+
+    @property
+    def worktree_manager(self) -> WorktreeManager:
+        """
+        Worktree manager used for isolated checkouts, configured from the environment on first use.
+
+        Returns:
+            WorktreeManager: the worktree manager
+        """
+        if self._worktree_manager is None:
+            self._worktree_manager = WorktreeManager.from_env()
+        return self._worktree_manager
+
     def set_repo(
             self,
             repo_source: str,
@@ -116,16 +159,29 @@ class RepoManager:
         repo_name = self._extract_repo_name_from_url(
             repo_source) if not is_local else Path(repo_source).name
 
+        # Fail fast on missing branch if the remote was already probed during validation
+        remote_refs = self.remote_refs.get_cached_refs(repo_source) if not is_local else None
+        if remote_refs is not None and f"refs/heads/{branch}" not in remote_refs:
+            return False, f"Branch '{branch}' does not exist remotely.", {}
+
         # Logic for cloning repository
         try:
             clone_source = repo_source if not is_local else str(
                 Path(repo_source).resolve())
-            repo = Repo.clone_from(
+            # Remote repository is fetched into the local mirror first,
+            # then cloned locally from the mirror
+            use_mirror = not is_local and self.mirror_cache.enabled
+            if use_mirror:
+                clone_source = str(self.mirror_cache.update_mirror(repo_source))
+            repo = git.Repo.clone_from(
                 clone_source,
                 current_directory,
                 branch=branch,
                 single_branch=True
             )
+            if use_mirror:
+                # Point origin back to the actual remote instead of the mirror
+                repo.remote().set_url(repo_source)
             logger.debug("Successfully cloned branch '%s'.", branch)
 
             # Checkout the commit if valid, latest commit if commit not given
@@ -149,7 +205,7 @@ class RepoManager:
 
         # Exceptions when cloning, not due to invalid branch or commit
         # Likely due to GitPython library error, or network error
-        except GitCommandError as e:
+        except git.GitCommandError as e:
             logger.warning("An error occurred during cloning: %s", e)
             return False, "Failed to clone or validate repository. Invalid branch or commit.", {}
 
@@ -158,7 +214,7 @@ class RepoManager:
             return False, f"Unexpected error: {e}", {}
 
     def _checkout_commit_after_clone(
-            self, repo: Repo, branch: str, commit_hash: str) -> tuple[bool, str]:
+            self, repo: 'git.Repo', branch: str, commit_hash: str) -> tuple[bool, str]:
         """
         Helper method to handles checkout of a specific commit after cloning.
 
@@ -174,9 +230,7 @@ class RepoManager:
         # Ensure the branch exists first, then check for valid commit
         try:
             if branch not in repo.branches:
-                ls_remote_output = repo.git.ls_remote(
-                    "--heads", "origin", branch)
-                if not ls_remote_output.strip():
+                if not self._remote_branch_exists(repo, branch):
                     return False, f"Branch '{branch}' does not exist remotely."
 
                 repo.git.fetch(
@@ -188,7 +242,7 @@ class RepoManager:
             # Validate the commit hash exists on the branch
             try:
                 repo.commit(commit_hash)
-            except (BadObject, IndexError, ValueError):
+            except (git.exc.BadObject, IndexError, ValueError):
                 err = f"Commit '{commit_hash}' does not exist on branch '{branch}'."
                 return False, err
 
@@ -197,7 +251,7 @@ class RepoManager:
             repo.git.execute(["git", "reset", "--hard", commit_hash])
             return True, f"Checked out to commit '{commit_hash}' on branch '{branch}'."
 
-        except GitCommandError as e:
+        except git.GitCommandError as e:
             return False, f"Error during checkout: {e}"
 
     def is_valid_git_repo(self, repo_source: str) -> tuple[bool, bool, str]:
@@ -224,8 +278,8 @@ class RepoManager:
             logger.debug(e)
 
         try:
-            subprocess.run(["git", "ls-remote", repo_source],
-                           capture_output=True, check=True, text=True)
+            # The refs are cached and reused later for branch and commit checks
+            self.remote_refs.get_refs(repo_source)
             return True, True, "Remote repository is valid."
         except subprocess.CalledProcessError:
             return False, False, f"Repository {repo_source} is invalid."
@@ -283,11 +337,11 @@ class RepoManager:
                 - bool: True if in the root directory of the Git repo, otherwise False.
         """
         try:
-            repo = Repo(os.getcwd(), search_parent_directories=True)
+            repo = git.Repo(os.getcwd(), search_parent_directories=True)
             repo_name = os.path.basename(repo.working_tree_dir)
             is_in_root = os.getcwd() == repo.working_tree_dir
             return True, is_in_root, repo_name
-        except InvalidGitRepositoryError:
+        except git.InvalidGitRepositoryError:
             return False, False, None
 
     def _safe_cleanup(self, path: Path) -> None:
@@ -322,7 +376,7 @@ class RepoManager:
             dict: Repository details, or an empty dictionary if not a Git repository.
         """
         try:
-            repo = Repo(
+            repo = git.Repo(
                 repo_path or os.getcwd(),
                 search_parent_directories=True)
             origin_url = next(
@@ -340,7 +394,7 @@ class RepoManager:
                 "branch": branch,
                 "commit_hash": commit_hash,
             }
-        except InvalidGitRepositoryError:
+        except git.InvalidGitRepositoryError:
             logger.error(
                 "Invalid Git repository at %s",
                 repo_path or os.getcwd())
@@ -363,7 +417,7 @@ class RepoManager:
                 - bool: True if successful, False otherwise.
                 - str: Message indicating the outcome.
         """
-        repo = Repo(os.getcwd())
+        repo = git.Repo(os.getcwd())
 
         branch = branch or repo.active_branch.name
 
@@ -392,7 +446,7 @@ class RepoManager:
                       f"commit '{commit_hash or repo.head.commit.hexsha}'.")
 
     def _handle_branch_checkout(
-            self, repo: Repo, branch: str) -> tuple[bool, str]:
+            self, repo: 'git.Repo', branch: str) -> tuple[bool, str]:
         """
         Validates and checks out the specified branch in the given repository.
 
@@ -412,8 +466,7 @@ class RepoManager:
                 return True, f"Checked out branch '{branch}' locally."
 
             # Check if the branch exists remotely
-            remote_refs = repo.git.ls_remote("--heads", "origin", branch)
-            if not remote_refs.strip():
+            if not self._remote_branch_exists(repo, branch):
                 return False, f"Branch '{branch}' does not exist remotely."
 
             # Extract the ref path and fetch the branch explicitly
@@ -426,11 +479,35 @@ class RepoManager:
             repo.git.checkout("-b", branch, f"origin/{branch}")
             return True, f"Fetched and checked out branch '{branch}' from remote."
 
-        except GitCommandError as e:
+        except git.GitCommandError as e:
             return False, f"Error while checking out branch '{branch}': {e}"
 
+    def _remote_branch_exists(self, repo: 'git.Repo', branch: str) -> bool:
+        """
+        Checks if the branch exists on the origin remote of the repository, using
+        the cached remote refs.
+
+        Args:
+            repo (Repo): The Git repository object.
+            branch (str): The branch name.
+
+        Raises:
+            GitCommandError: if the remote cannot be probed.
+
+        Returns:
+            bool: True if the branch exists on origin, False if absent or no origin remote.
+        """
+        try:
+            url = repo.remote("origin").url
+        except ValueError:
+            return False
+        try:
+            return self.remote_refs.branch_exists(url, branch)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            raise git.GitCommandError(["git", "ls-remote", url], 1, str(e)) from e
+
     def _handle_commit_checkout(
-            self, repo: Repo, branch: str, commit_hash: str) -> tuple[bool, str]:
+            self, repo: 'git.Repo', branch: str, commit_hash: str) -> tuple[bool, str]:
         """
         Validates and checks out the specified commit on the given branch.
         Defaults to the latest commit if `commit_hash` is None.
@@ -454,10 +531,147 @@ class RepoManager:
                 # Ensure the commit exists on the branch
                 try:
                     repo.commit(commit_hash)
-                except (BadObject, IndexError, ValueError):
+                except (git.exc.BadObject, IndexError, ValueError):
                     err = f"Commit '{commit_hash}' does not exist on local branch '{branch}'."
                     return False, err
                 repo.git.checkout(commit_hash)
             return True, f"Checked out to commit '{commit_hash}' on branch '{branch}'."
-        except GitCommandError as e:
+        except git.GitCommandError as e:
             return False, f"Error during checkout: {e}"
+
+    def acquire_worktree(
+            self,
+            branch: str = None,
+            commit_hash: str = None,
+            repo_path: str = None) -> tuple[bool, str, dict]:
+        """
+        Materializes the branch and commit into a detached worktree under the cid
+        scratch directory, without touching the working directory of the repository.
+        Concurrent callers asking for the same commit share one worktree.
+        Every successful call must be paired with release_worktree.
+
+        Args:
+            branch (str, optional): The branch to check out. Defaults to the current branch.
+            commit_hash (str, optional): The commit to check out.
+                Defaults to the latest commit of the branch.
+            repo_path (str, optional): Path to the repository.
+                Defaults to the current working directory.
+
+        Returns:
+            tuple[bool, str, dict]: Success status, message, and repository details
+                with an additional "worktree_path" key.
+        """
+        try:
+            repo = git.Repo(repo_path or os.getcwd(), search_parent_directories=True)
+        except git.InvalidGitRepositoryError:
+            return False, f"Invalid Git repository at {repo_path or os.getcwd()}", {}
+        details = self.get_current_repo_details(repo.working_tree_dir)
+        if not details:
+            return False, "Fail to retrieve repository details.", {}
+        branch = branch or details["branch"]
+
+        try:
+            ref = branch
+            if branch not in repo.branches:
+                if not self._remote_branch_exists(repo, branch):
+                    return False, f"Branch '{branch}' does not exist.", {}
+                repo.git.fetch(
+                    "origin",
+                    f"refs/heads/{branch}:refs/remotes/origin/{branch}")
+                ref = f"origin/{branch}"
+            target = repo.commit(commit_hash or ref)
+            if commit_hash and not repo.is_ancestor(target, repo.commit(ref)):
+                return False, f"Commit '{commit_hash}' does not exist on branch '{branch}'.", {}
+            worktree_path = self.worktree_manager.acquire(repo, target.hexsha)
+        except (git.exc.BadObject, git.exc.BadName, IndexError, ValueError):
+            return False, f"Commit '{commit_hash}' does not exist on branch '{branch}'.", {}
+        except git.GitCommandError as e:
+            return False, f"Error while creating worktree for branch '{branch}': {e}", {}
+
+        details.update({
+            "branch": branch,
+            "commit_hash": target.hexsha,
+            "worktree_path": str(worktree_path),
+        })
+        logger.info("Acquired worktree %s for branch %s commit %s",
+                    worktree_path, branch, target.hexsha)
+        return True, f"Worktree ready at {worktree_path}", details
+
+    def release_worktree(self, worktree_path: str) -> bool:
+        """
+        Releases a worktree obtained from acquire_worktree. The worktree is removed
+        once no other run is using it.
+
+        Args:
+            worktree_path (str): path of the worktree
+
+        Returns:
+            bool: True if the worktree was removed
+        """
+        removed = self.worktree_manager.release(worktree_path)
+        logger.info("Released worktree %s, removed: %s", worktree_path, removed)
+        return removed
+
+    def list_commits(
+            self,
+            rev_range: str = None,
+            revisions: list[str] = None,
+            repo_path: str = None) -> tuple[bool, str, list[str]]:
+        """
+        Resolves a commit range, i.e. A..B, or a list of revisions into full commit hashes.
+        Commits of a range are listed from oldest to newest, a list keeps its order.
+
+        Args:
+            rev_range (str, optional): git revision range, i.e. "abc123..main".
+            revisions (list[str], optional): list of commit hashes or other revisions.
+            repo_path (str, optional): Path to the repository.
+                Defaults to the current working directory.
+
+        Returns:
+            tuple[bool, str, list[str]]: Success status, message, and the commit hashes.
+        """
+        try:
+            repo = git.Repo(repo_path or os.getcwd(), search_parent_directories=True)
+        except git.InvalidGitRepositoryError:
+            return False, f"Invalid Git repository at {repo_path or os.getcwd()}", []
+        try:
+            if rev_range:
+                commits = repo.git.rev_list("--reverse", rev_range).split()
+            else:
+                commits = []
+                for revision in revisions or []:
+                    commit = repo.commit(revision).hexsha
+                    if commit not in commits:
+                        commits.append(commit)
+        except (git.exc.BadObject, git.exc.BadName, IndexError, ValueError,
+                git.GitCommandError) as e:
+            return False, f"Invalid commit range or revision: {e}", []
+        if not commits:
+            return False, "No commit to run in the given range.", []
+        return True, f"Resolved {len(commits)} commits.", commits
+
+    def get_changed_files(
+            self,
+            base_commit: str,
+            head_commit: str,
+            repo_path: str = None) -> list[str] | None:
+        """
+        Lists the files changed between two commits.
+
+        Args:
+            base_commit (str): The commit to compare from, i.e. last successful run.
+            head_commit (str): The commit to compare to, i.e. the commit being run.
+            repo_path (str, optional): Path to the repository.
+                Defaults to the current working directory.
+
+        Returns:
+            list[str] | None: changed file paths relative to the repository root,
+                None if the diff cannot be computed, i.e. commit absent from a shallow clone.
+        """
+        try:
+            repo = git.Repo(repo_path or os.getcwd(), search_parent_directories=True)
+            output = repo.git.diff("--name-only", "--no-renames", base_commit, head_commit)
+        except (git.InvalidGitRepositoryError, git.GitCommandError) as e:
+            logger.warning("Fail to diff %s..%s: %s", base_commit, head_commit, e)
+            return None
+        return [line for line in output.splitlines() if line.strip()]
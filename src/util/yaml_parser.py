@@ -7,6 +7,7 @@ import os
 import ruamel.yaml
 import util.constant as c
 from util.common_utils import get_logger
+from util.config_cache import ConfigCache
 from util.model import (RawPipelineInfo)
 
 logger = get_logger(logger_name='util.yaml_parser')
@@ -99,12 +100,24 @@ class YamlParser:
     """ Basic YamlParser to extract content from the yaml files
     """
 
-    def __init__(self):
+    def __init__(self, cache: ConfigCache = None):
         """ Initialize the yaml parser
+
+        Args:
+            cache (ConfigCache, optional): cache of the pipeline_name declared by each
+                file, so unchanged files are not parsed again to locate a pipeline.
+                Defaults to None for no caching.
         """
         self.yaml = ruamel.yaml.YAML(typ='rt')
         self.yaml.Constructor = MyConstructor
         self.yaml.preserve_quotes = True
+        # safe loader without line information, backed by the C parser if available.
+        # Used for the pipeline_name pre-scan and the fast path of parse_yaml_file
+        self.safe_yaml = ruamel.yaml.YAML(typ='safe')
+        self.cache = cache
+        # content parsed while building the pipeline index, consumed by parse_yaml_file.
+        # path to the (mtime_ns, size) of the file when parsed and its content
+        self._parsed = {}
 
     def _get_yaml_filepaths(self, directory:str) -> list[str]:
         """ Helper method to search for all the YAML files in the 
@@ -125,12 +138,184 @@ class YamlParser:
             raise FileNotFoundError(error_msg)
 
         yaml_filepaths = []
-        for root, _, files in os.walk(directory):
-            for file in files:
+        # sorted walk so the index and duplicate detection do not depend on the file system
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for file in sorted(files):
                 if file.endswith(('.yml', '.yaml')):
                     yaml_filepaths.append(os.path.join(root, file))
         return yaml_filepaths
 
+    def get_pipeline_files(self, directory:str, prescan: bool = True) -> dict:
+        """ Map each pipeline_name in the given directory to the file declaring it.
+        Files with a fresh cache entry are not read. Other files are pre-scanned for
+        global.pipeline_name only, or fully parsed if prescan is False. Files that
+        cannot be parsed or have no pipeline_name are skipped.
+
+        Args:
+            directory (str): directory to search for
+            prescan (bool, optional): read only the pipeline_name with the event parser
+                instead of parsing the whole file. Defaults to True.
+
+        Raises:
+            FileNotFoundError: if the directory does not exist
+            ValueError: for duplicate pipeline_name
+
+        Returns:
+            dict: pipeline_name as key and the path of the YAML file as value
+        """
+        pipeline_files = {}
+        # content kept by an earlier index may be stale
+        self._parsed.clear()
+        for yaml_file in self._get_yaml_filepaths(directory):
+            entry = self.cache.lookup(yaml_file) if self.cache else None
+            if entry is not None:
+                pl_name = entry[c.FIELD_PIPELINE_NAME]
+            else:
+                pl_name = self._scan_pipeline_name(yaml_file) if prescan else None
+                if pl_name is None:
+                    pl_name = self._read_pipeline_name(yaml_file)
+                if self.cache:
+                    self.cache.store(yaml_file, pl_name)
+            if pl_name is None:
+                continue
+            if pl_name in pipeline_files:
+                # Only a full parse tell if both files are valid and give the line information
+                existing_name = self._read_pipeline_name(pipeline_files[pl_name])
+                if existing_name is None:
+                    del pipeline_files[pl_name]
+                pl_name = self._read_pipeline_name(yaml_file)
+                if pl_name is None:
+                    continue
+                if existing_name is not None:
+                    pipeline_file_name = os.path.basename(yaml_file)
+                    err_msg = f"{pipeline_file_name}:{pl_name.lc.line}:{pl_name.lc.col} "
+                    err_msg += f"Duplicate key error for pipeline_name:{pl_name}"
+                    logger.error(err_msg)
+                    raise ValueError(err_msg)
+            pipeline_files[pl_name] = yaml_file
+        if self.cache:
+            self.cache.flush()
+        return pipeline_files
+
+    def _scan_pipeline_name(self, yaml_file:str) -> Str | None:
+        """ Extract global.pipeline_name from the parser events of a YAML file,
+        without constructing the document. Stop as soon as the global section ends.
+        The rest of the file is not checked, errors there surface on the full parse.
+
+        Args:
+            yaml_file (str): path of the YAML file
+
+        Returns:
+            Str | None: pipeline_name with line information, None if it cannot be
+            determined from the events, i.e. alias, duplicated key or parser error.
+            The caller should fall back to a full parse.
+        """
+        # stack of [is_mapping, expect_key, current_key, path] for each open collection
+        stack = []
+        pl_name = None
+        try:
+            with open(yaml_file, 'r', encoding='utf-8') as file:
+                for event in self.safe_yaml.parse(file):
+                    if isinstance(event, (ruamel.yaml.events.MappingStartEvent,
+                                          ruamel.yaml.events.SequenceStartEvent)):
+                        path = ()
+                        if stack:
+                            if stack[-1][0] and stack[-1][1]:
+                                # complex mapping key
+                                return None
+                            path = stack[-1][3] + (stack[-1][2],)
+                        is_mapping = isinstance(event, ruamel.yaml.events.MappingStartEvent)
+                        stack.append([is_mapping, True, None, path])
+                    elif isinstance(event, (ruamel.yaml.events.MappingEndEvent,
+                                            ruamel.yaml.events.SequenceEndEvent)):
+                        frame = stack.pop()
+                        if frame[3] == (c.KEY_GLOBAL,) or not stack:
+                            return pl_name
+                        stack[-1][1] = True
+                    elif isinstance(event, (ruamel.yaml.events.ScalarEvent,
+                                            ruamel.yaml.events.AliasEvent)) and stack:
+                        frame = stack[-1]
+                        if not frame[0]:
+                            continue
+                        if frame[1]:
+                            if frame[3] == (c.KEY_GLOBAL,) and event.value == c.KEY_PIPE_NAME \
+                                    and pl_name is not None:
+                                # duplicate key, let the full parse report it
+                                return None
+                            frame[1], frame[2] = False, event.value
+                            continue
+                        frame[1] = True
+                        if frame[3] == (c.KEY_GLOBAL,) and frame[2] == c.KEY_PIPE_NAME:
+                            pl_name = self._event_to_str(event)
+                            if pl_name is None:
+                                return None
+        except (OSError, ruamel.yaml.YAMLError) as e:
+            logger.debug("Fail to pre-scan %s, fallback to full parse. Error: %s",
+                         yaml_file, e)
+        return None
+
+    @staticmethod
+    def _event_to_str(event: ruamel.yaml.events.Event) -> Str | None:
+        """ Build the scalar value of a parser event with its line information
+
+        Args:
+            event (ruamel.yaml.events.Event): scalar or alias event
+
+        Returns:
+            Str | None: the value, None for an alias which require the full parse
+        """
+        if not isinstance(event, ruamel.yaml.events.ScalarEvent):
+            return None
+        value = Str(event.value)
+        value.lc = ruamel.yaml.comments.LineCol()
+        value.lc.line = event.start_mark.line
+        value.lc.col = event.start_mark.column
+        return value
+
+    def _read_pipeline_name(self, yaml_file:str) -> Str | None:
+        """ Parse a YAML file, keep the content for parse_yaml_file and
+        extract the pipeline_name
+
+        Args:
+            yaml_file (str): path of the YAML file
+
+        Returns:
+            Str | None: pipeline_name with line information, None if the file
+            cannot be parsed or has no pipeline_name
+        """
+        try:
+            stamp = self._get_file_stamp(yaml_file)
+            with open(yaml_file, 'r', encoding='utf-8') as file:
+                yaml_content = self.yaml.load(file)
+            pl_name = yaml_content[c.KEY_GLOBAL][c.KEY_PIPE_NAME]
+        except (FileNotFoundError, ruamel.yaml.YAMLError, TypeError) as e:
+            # We want to continue process rest of the file, so catch the error here.
+            logger.warning("Failed to parse YAML file at %s. Error: %s", yaml_file, e)
+            return None
+        except KeyError as k:
+            logger.warning("Failed to parse YAML file at %s. No key found for %s",
+                           yaml_file, k)
+            return None
+        self._parsed[os.path.abspath(yaml_file)] = (stamp, yaml_content)
+        return pl_name
+
+    @staticmethod
+    def _get_file_stamp(yaml_file: str) -> tuple[int, int]:
+        """ Get the modification time and size of a file, to tell if it changed
+
+        Args:
+            yaml_file (str): path of the YAML file
+
+        Raises:
+            FileNotFoundError: if the file does not exist
+
+        Returns:
+            tuple[int, int]: modification time in nanoseconds and size in bytes
+        """
+        stat = os.stat(yaml_file)
+        return stat.st_mtime_ns, stat.st_size
+
     def parse_yaml_directory(self, directory:str) -> dict:
         """
         Parse all YAML files in the given directory. Check for duplicate 
@@ -147,38 +332,30 @@ class YamlParser:
             dict: A nested dictionary with pipeline_name as main key, 
             and RawPipelineInfo object as value
         """
-        yaml_files = self._get_yaml_filepaths(directory)
         yaml_dict = {}
-        for yaml_file in yaml_files:
+        # Every file is parsed anyway, so skip the pre-scan
+        for pl_name, yaml_file in self.get_pipeline_files(directory, prescan=False).items():
             try:
-                with open(yaml_file, 'r', encoding='utf-8') as file:
-                    yaml_content = self.yaml.load(file)
-                    # Extract the filename without extension or path
-                    pipeline_file_name = os.path.basename(yaml_file)
-                    pl_name = yaml_content[c.KEY_GLOBAL][c.KEY_PIPE_NAME]
-                    if pl_name in yaml_dict:
-                        err_msg = f"{pipeline_file_name}:{pl_name.lc.line}:{pl_name.lc.col} "
-                        err_msg += f"Duplicate key error for pipeline_name:{pl_name}"
-                        logger.error(err_msg)
-                        raise ValueError(err_msg)
-                    yaml_dict[pl_name] = RawPipelineInfo(pipeline_name=pl_name,
-                                                      pipeline_file_name=pipeline_file_name,
-                                                      pipeline_config=yaml_content)
-            except (FileNotFoundError, ruamel.yaml.YAMLError, TypeError) as e:
-                # We want to continue process rest of the file, so catch the error here.
+                pipeline_config = self.parse_yaml_file(yaml_file)
+            except (FileNotFoundError, ruamel.yaml.YAMLError) as e:
+                # name came from the cache, the file itself cannot be parsed
                 logger.warning("Failed to parse YAML file at %s. Error: %s", yaml_file, e)
-            except KeyError as k:
-                logger.warning("Failed to parse YAML file at %s. No key found for %s",
-                               yaml_file, k)
+                continue
+            yaml_dict[pl_name] = RawPipelineInfo(pipeline_name=pl_name,
+                                                 pipeline_file_name=os.path.basename(yaml_file),
+                                                 pipeline_config=pipeline_config)
         logger.info("Successfully parsed YAML files: %s", list(yaml_dict.keys()))
         return yaml_dict
 
-    def parse_yaml_file(self, file_path: str) -> dict:
+    def parse_yaml_file(self, file_path: str, track_lc: bool = True) -> dict:
         """ Parse a single YAML file and return the content as a dictionary.
         Ignore potential duplicate pipeline name with other file. 
 
         Args:
             file_path (str): the absolute path of the yaml file
+            track_lc (bool, optional): keep the lines and columns information.
+                False use the much faster safe loader, returning plain python objects.
+                Defaults to True.
 
         Raises:
             FileNotFoundError: if file_path not valid or unable to parse
@@ -186,20 +363,48 @@ class YamlParser:
 
         Returns:
             dict: the key-value pairs from the YAML file. 
-            contain the lines and columns information of the key
+            contain the lines and columns information of the key if track_lc is True
         """
         if not os.path.isfile(file_path):
             error_msg = f"Given file_path:{file_path} is not a valid yaml file"
             logger.error(error_msg)
             raise FileNotFoundError(error_msg)
+        parsed = self._parsed.pop(os.path.abspath(file_path), None)
+        # the content parsed by the index is used only if the file did not change since
+        if track_lc and parsed is not None and parsed[0] == self._get_file_stamp(file_path):
+            return parsed[1]
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
                 logger.info("Parsing YAML file at %s", file_path)
+                if not track_lc:
+                    return self.safe_yaml.load(file)
                 return self.yaml.load(file)
         except ruamel.yaml.YAMLError as e:
             logger.error("Failed to parse YAML file at %s. Error: %s", file_path, e)
             raise
 
+    def get_pipeline_file(self, pipeline_name:str, directory:str) -> str:
+        """ Locate the YAML file declaring the pipeline_name in the given directory.
+        Check for duplicate pipeline name
+
+        Args:
+            pipeline_name (str): target pipeline_name
+            directory (str): directory to search for
+
+        Raises:
+            FileNotFoundError: if the pipeline name dont exist
+            ValueError: for duplicate pipeline_name
+
+        Returns:
+            str: path of the YAML file
+        """
+        pipeline_files = self.get_pipeline_files(directory)
+        if pipeline_name not in pipeline_files:
+            err_msg = f"Target pipeline {pipeline_name} do not exist "
+            err_msg += f"in given directory {directory}"
+            raise FileNotFoundError(err_msg)
+        return pipeline_files[pipeline_name]
+
     def parse_yaml_by_pipeline_name(self, pipeline_name:str, directory:str) -> RawPipelineInfo:
         """ Parse a single YAML file from a given directory with the pipeline_name
         as specified. Check for duplicate pipeline name
@@ -216,9 +421,7 @@ class YamlParser:
             PipelineInfo: the Pydantic model contains key-value pairs of pipeline 
             information
         """
-        all_yaml_dict = self.parse_yaml_directory(directory)
-        if pipeline_name not in all_yaml_dict:
-            err_msg = f"Target pipeline {pipeline_name} do not exist "
-            err_msg += f"in given directory {directory}"
-            raise FileNotFoundError(err_msg)
-        return all_yaml_dict[pipeline_name]
+        yaml_file = self.get_pipeline_file(pipeline_name, directory)
+        return RawPipelineInfo(pipeline_name=pipeline_name,
+                               pipeline_file_name=os.path.basename(yaml_file),
+                               pipeline_config=self.parse_yaml_file(yaml_file))
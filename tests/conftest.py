@@ -0,0 +1,13 @@
+""" This conftest.py provide fixtures shared by all the test modules.
+Reference: https://docs.pytest.org/en/stable/reference/fixtures.html
+"""
+import pytest
+import util.constant as c
+
+
+@pytest.fixture(autouse=True)
+def isolated_config_cache(tmp_path, monkeypatch):
+    """ Keep the config cache of each test in its own temporary directory, so
+    results cached by one test or by a previous run are never reused.
+    """
+    monkeypatch.setenv(c.ENV_CONFIG_CACHE_DIR, str(tmp_path / 'config-cache'))
@@ -0,0 +1,35 @@
+""" Test the cid entry point forwarding commands to the daemon
+"""
+from unittest.mock import patch
+import pytest
+from cli import client
+
+
+@patch("cli.client.DaemonClient.run", return_value=3)
+def test_forward_to_daemon(mock_run):
+    """ command served by the daemon exit with its exit code """
+    with patch("sys.argv", ["cid", "config", "--check"]), \
+            patch("cli.__main__.cid") as mock_cid, \
+            pytest.raises(SystemExit) as exit_info:
+        client.main()
+    assert exit_info.value.code == 3
+    mock_run.assert_called_once_with(["config", "--check"])
+    mock_cid.assert_not_called()
+
+
+@patch("cli.client.DaemonClient.run", return_value=None)
+def test_run_locally_without_daemon(mock_run):
+    """ command run in this process when no daemon is running """
+    with patch("sys.argv", ["cid", "config", "--check"]), patch("cli.__main__.cid") as mock_cid:
+        client.main()
+    mock_run.assert_called_once()
+    mock_cid.assert_called_once()
+
+
+@patch("cli.client.DaemonClient.run")
+def test_daemon_commands_run_locally(mock_run):
+    """ cid daemon commands are never forwarded """
+    with patch("sys.argv", ["cid", "daemon", "status"]), patch("cli.__main__.cid") as mock_cid:
+        client.main()
+    mock_run.assert_not_called()
+    mock_cid.assert_called_once()
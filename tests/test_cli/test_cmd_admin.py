@@ -0,0 +1,34 @@
+""" Test cid admin commands
+"""
+from unittest.mock import patch
+from click.testing import CliRunner
+from cli import cmd_admin
+
+
+@patch("controller.controller.Controller.collect_garbage")
+def test_gc(mock_collect_garbage):
+    """ Test the gc options are converted and passed to the controller, and its exit code
+
+    Args:
+        mock_collect_garbage (MagicMock): mock the Controller.collect_garbage function
+    """
+    runner = CliRunner()
+    mock_collect_garbage.return_value = (True, "local: removed 1 containers")
+    result = runner.invoke(cmd_admin.gc, ['--max-age', '12h', '--disk-budget', '20g',
+                                          '--dry-run', '--local'])
+    assert result.exit_code == 0
+    assert "removed 1 containers" in result.output
+    assert mock_collect_garbage.call_args.kwargs == {
+        'local': True, 'max_age': 12 * 3600.0, 'disk_budget': 20 * 1024 ** 3, 'dry_run': True}
+
+    result = runner.invoke(cmd_admin.gc, [])
+    assert mock_collect_garbage.call_args.kwargs['max_age'] == 24 * 3600.0
+    assert mock_collect_garbage.call_args.kwargs['disk_budget'] is None
+
+    mock_collect_garbage.return_value = (False, "Error with docker service")
+    result = runner.invoke(cmd_admin.gc, [])
+    assert result.exit_code == 1
+
+    result = runner.invoke(cmd_admin.gc, ['--max-age', 'soon'])
+    assert result.exit_code == 2
+    assert "positive duration" in result.output
@@ -234,6 +234,39 @@ class TestConfig(unittest.TestCase):
         assert result.exit_code == 1
         assert "error" in result.output
 
+    @patch("cli.cmd_config.FileWatcher")
+    @patch("cli.cmd_config.Controller.validate_config")
+    @patch("cli.cmd_config.os.path.isfile", side_effect=lambda path: path != "/dir/gone.yml")
+    @patch("cli.cmd_config.os.path.isdir", return_value=True)
+    @patch("cli.cmd_config.Controller.handle_repo")
+    def test_config_watch(self, mock_handle, mock_isdir, mock_isfile, mock_validate,
+                          mock_watcher_cls):
+        """ Test config command with --watch, all files checked once then only
+        the changed files, without setting the repo
+
+        Args:
+            mock_handle (MagicMock): mock the handle_repo function
+            mock_isdir (MagicMock): mock the os.path.isdir method
+            mock_isfile (MagicMock): mock the os.path.isfile method
+            mock_validate (MagicMock): mock the validate_config method
+            mock_watcher_cls (MagicMock): mock the FileWatcher class
+        """
+        watcher = mock_watcher_cls.return_value.__enter__.return_value
+        watcher.uses_inotify = True
+        watcher.get_files.return_value = ["/dir/a.yml", "/dir/b.yml"]
+        watcher.wait.side_effect = [{"/dir/a.yml", "/dir/gone.yml"}, KeyboardInterrupt]
+        mock_validate.side_effect = [self.controller_validate_res,
+                                     (False, "invalid stages", None),
+                                     self.controller_validate_res]
+        result = self.runner.invoke(cmd_config.config, ['--watch', '--dir', '/dir'])
+        assert result.exit_code == 0
+        mock_handle.assert_not_called()
+        assert [call.args[0] for call in mock_validate.call_args_list] == [
+            "/dir/a.yml", "/dir/b.yml", "/dir/a.yml"]
+        assert "invalid stages" in result.output
+        assert "/dir/gone.yml removed" in result.output
+        assert "stopped watching" in result.output
+
 class TestConfigOverride(unittest.TestCase):
     """ Test the logic handling of cid config override
 
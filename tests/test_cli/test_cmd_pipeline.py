@@ -231,7 +231,7 @@ class TestPipelineRun(TestCase):
                                     'run', '--dry-run', '--yaml'])
         assert result.exit_code == 0
 
-    @patch("controller.controller.Controller._actual_pipeline_run")
+    @patch("controller.scheduler.RunScheduler.run")
     @patch("controller.controller.os.getlogin", return_value='user')
     @patch("controller.controller.MongoAdapter.update_pipeline_info")
     @patch("controller.controller.ConfigChecker.validate_config")
@@ -259,7 +259,7 @@ class TestPipelineRun(TestCase):
         result = self.runner.invoke(cmd_pipeline.pipeline, ['run'])
         assert result.exit_code == 0
 
-    @patch("controller.controller.Controller._actual_pipeline_run")
+    @patch("controller.scheduler.RunScheduler.run")
     @patch("controller.controller.os.getlogin", return_value='user')
     @patch("controller.controller.MongoAdapter.update_pipeline_info")
     @patch("controller.controller.ConfigChecker.validate_config")
@@ -297,7 +297,7 @@ class TestPipelineRun(TestCase):
         assert result.exit_code == 1
 
     # Integration test
-    @patch("controller.controller.Controller._actual_pipeline_run")
+    @patch("controller.scheduler.RunScheduler.run")
     @patch("controller.controller.os.getlogin", return_value='user')
     @patch("controller.controller.MongoAdapter.update_pipeline_info")
     @patch("controller.controller.ConfigChecker.validate_config")
@@ -327,6 +327,140 @@ class TestPipelineRun(TestCase):
         assert result.exit_code == 0
 
 
+    def test_worktree_with_repo(self):
+        """ --worktree only work on the current repository
+        """
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--worktree', '--repo', 'https://github.com/a/b'])
+        assert result.exit_code == 2
+        assert "--worktree can't be used with --repo" in result.output
+
+    @patch("controller.controller.Controller.release_worktree")
+    @patch("controller.controller.Controller.run_pipeline")
+    @patch("controller.controller.Controller.acquire_worktree")
+    @patch("controller.controller.Controller.handle_repo")
+    def test_run_in_worktree(self, mock_handle, mock_acquire, mock_run, mock_release):
+        """ Test the run use the worktree path and release it afterward
+
+        Args:
+            mock_handle (MagicMock): mock the Controller.handle_repo function
+            mock_acquire (MagicMock): mock the Controller.acquire_worktree function
+            mock_run (MagicMock): mock the Controller.run_pipeline function
+            mock_release (MagicMock): mock the Controller.release_worktree function
+        """
+        mock_acquire.return_value = (True, "", self.session_data, "/tmp/worktree")
+        mock_run.return_value = (False, "fail")
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--worktree', '--branch', 'feature'])
+        assert result.exit_code == 1
+        mock_handle.assert_not_called()
+        mock_acquire.assert_called_once_with(branch='feature', commit_hash=None)
+        assert mock_run.call_args.kwargs['repo_path'] == "/tmp/worktree"
+        mock_release.assert_called_once_with("/tmp/worktree")
+
+
+    def test_batch_with_single_commit(self):
+        """ --commits can't be used with --commit
+        """
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--commits', 'a..b', '--commit', 'abc'])
+        assert result.exit_code == 2
+        assert "only pass one of --commit, --commits or --commit-list" in result.output
+
+    @patch("controller.controller.Controller.run_pipeline_batch")
+    @patch("controller.controller.Controller.resolve_commits")
+    def test_batch_bisect(self, mock_resolve, mock_batch):
+        """ Test the batch run resolve the commits and pass on the strategy
+
+        Args:
+            mock_resolve (MagicMock): mock the Controller.resolve_commits function
+            mock_batch (MagicMock): mock the Controller.run_pipeline_batch function
+        """
+        mock_resolve.return_value = (True, "", ["a", "b"])
+        mock_batch.return_value = (True, "First failing commit: b")
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--commits', 'a..b', '--strategy', 'bisect',
+                                     '--parallel', '2'])
+        assert result.exit_code == 0
+        mock_resolve.assert_called_once_with(rev_range='a..b', revisions=None)
+        assert mock_batch.call_args.args[0] == ["a", "b"]
+        assert mock_batch.call_args.kwargs['strategy'] == c.BATCH_BISECT
+        assert mock_batch.call_args.kwargs['parallel'] == 2
+
+    def test_multi_run_invalid_flags(self):
+        """ --all and --pipelines are exclusive, and can't select a single pipeline
+        """
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--all', '--pipelines', 'a,b'])
+        assert result.exit_code == 2
+        assert "only pass --all or --pipelines" in result.output
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--all', '--pipeline', 'a'])
+        assert result.exit_code == 2
+        assert "--all and --pipelines can't be used with --file" in result.output
+
+    @patch("controller.controller.Controller.run_pipelines")
+    @patch("controller.controller.Controller.handle_repo")
+    def test_multi_run(self, mock_handle, mock_run_pipelines):
+        """ Test --pipelines run the listed pipelines once the repo is set up
+
+        Args:
+            mock_handle (MagicMock): mock the Controller.handle_repo function
+            mock_run_pipelines (MagicMock): mock the Controller.run_pipelines function
+        """
+        mock_handle.return_value = (True, "", self.session_data)
+        mock_run_pipelines.return_value = (True, "2 of 2 pipelines passed")
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--pipelines', 'a, b', '--max-containers', '3'])
+        assert result.exit_code == 0
+        assert mock_run_pipelines.call_args.args == (['a', 'b'], self.session_data)
+        assert mock_run_pipelines.call_args.kwargs['max_containers'] == 3
+        result = self.runner.invoke(cmd_pipeline.pipeline, ['run', '--all'])
+        assert result.exit_code == 0
+        assert mock_run_pipelines.call_args.args[0] is None
+
+
+    @patch("controller.controller.Controller.run_pipeline")
+    @patch("controller.controller.Controller.handle_repo")
+    def test_enqueue(self, mock_handle, mock_run):
+        """ Test --enqueue queue the run, and is refused for a batch run
+
+        Args:
+            mock_handle (MagicMock): mock the Controller.handle_repo function
+            mock_run (MagicMock): mock the Controller.run_pipeline function
+        """
+        mock_handle.return_value = (True, "", self.session_data)
+        mock_run.return_value = (True, "run_number:2 queued")
+        result = self.runner.invoke(cmd_pipeline.pipeline, ['run', '--enqueue'])
+        assert result.exit_code == 0
+        assert mock_run.call_args.kwargs['enqueue'] is True
+        result = self.runner.invoke(cmd_pipeline.pipeline,
+                                    ['run', '--enqueue', '--commits', 'a..b'])
+        assert result.exit_code == 2
+        assert "--enqueue can't be used with --commits" in result.output
+
+    @patch("controller.controller.Controller.run_pipeline")
+    @patch("controller.controller.Controller.handle_repo")
+    def test_resume(self, mock_handle, mock_run):
+        """ Test --resume pass the run number, and is refused with the other run modes
+
+        Args:
+            mock_handle (MagicMock): mock the Controller.handle_repo function
+            mock_run (MagicMock): mock the Controller.run_pipeline function
+        """
+        mock_handle.return_value = (True, "", self.session_data)
+        mock_run.return_value = (True, "run_number:2")
+        result = self.runner.invoke(cmd_pipeline.pipeline, ['run', '--resume', '2'])
+        assert result.exit_code == 0
+        assert mock_run.call_args.kwargs['resume'] == 2
+        for flags in (['--enqueue'], ['--all'], ['--override', 'global.docker.image=a']):
+            result = self.runner.invoke(cmd_pipeline.pipeline, ['run', '--resume', '2'] + flags)
+            assert result.exit_code == 2
+            assert "--resume can't be used with" in result.output
+        result = self.runner.invoke(cmd_pipeline.pipeline, ['run', '--resume', '0'])
+        assert result.exit_code == 2
+
+
 class TestPipelineHistory(TestCase):
     """Test class to handle `cid pipeline history` command that
     validates the cli and controller class for report history
@@ -0,0 +1,24 @@
+""" Test cid runner command
+"""
+from unittest.mock import patch
+from click.testing import CliRunner
+from cli import cmd_runner
+
+
+@patch("controller.controller.Controller.run_runner")
+def test_runner(mock_run_runner):
+    """ Test the runner options are passed to the controller, and its exit code
+
+    Args:
+        mock_run_runner (MagicMock): mock the Controller.run_runner function
+    """
+    runner = CliRunner()
+    mock_run_runner.return_value = (True, "Runner r1 completed 2 runs")
+    result = runner.invoke(cmd_runner.runner, ['--name', 'r1', '--concurrency', '2', '--once'])
+    assert result.exit_code == 0
+    assert "completed 2 runs" in result.output
+    assert mock_run_runner.call_args.kwargs == {'name': 'r1', 'local': False, 'concurrency': 2,
+                                                'max_containers': None, 'once': True}
+    mock_run_runner.return_value = (False, "Error with docker service")
+    result = runner.invoke(cmd_runner.runner, ['--local'])
+    assert result.exit_code == 1
@@ -0,0 +1,61 @@
+""" Startup benchmark of the cid command. Each case runs in a fresh interpreter,
+record the time from the first import to the end of the command and check the
+heavy backends were not imported by commands that never use them.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from util.common_utils import get_logger
+
+logger = get_logger("tests.test_cli.test_startup")
+
+SRC_DIR = Path(__file__).resolve().parents[2] / 'src'
+VALID_CONFIG = (Path(__file__).resolve().parents[1] / 'test_util' / 'test_data' /
+                'valid_directory' / 'valid_config.yml')
+HEAVY_MODULES = ('docker', 'boto3', 'botocore', 'pymongo', 'git')
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from cli.__main__ import cid
+try:
+    cid(sys.argv[1:], standalone_mode=False)
+except SystemExit:
+    pass
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed,
+                  "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def run_cid(args: list, cwd: Path) -> dict:
+    """ Run the cid command in a new interpreter
+
+    Args:
+        args (list): command line arguments
+        cwd (Path): working directory
+
+    Returns:
+        dict: elapsed seconds and the heavy modules loaded
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get('PYTHONPATH')]))
+    result = subprocess.run([sys.executable, '-c', PROBE, *args], cwd=cwd, env=env,
+                            capture_output=True, text=True, timeout=120, check=True)
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    logger.info("cid %s startup: %.0f ms", ' '.join(args), stats['elapsed'] * 1000)
+    return stats
+
+
+def test_startup_help(tmp_path):
+    """ cid --help load none of the backends """
+    stats = run_cid(['--help'], tmp_path)
+    assert stats['loaded'] == []
+
+
+def test_startup_validate_no_set(tmp_path):
+    """ validating a file without repo and datastore load none of the backends """
+    stats = run_cid(['config', '--check', '--no-set', '--config-file', str(VALID_CONFIG)],
+                    tmp_path)
+    assert stats['loaded'] == []
@@ -1,10 +1,19 @@
 """Test controller integration
 """
+import asyncio
+import threading
+import time
 import unittest
 from datetime import datetime
 from pathlib import Path
-from unittest.mock import patch
-from controller.controller import (Controller)
+from unittest.mock import patch, MagicMock
+import docker
+from controller.controller import (Controller, _validate_config_file)
+from controller.executor import build_job_log
+from util.docker_pool import DockerHostPool
+from util.model import (GcReport, PipelineInfo)
+from util.config_tools import ConfigChecker
+from util.yaml_parser import YamlParser
 from util.common_utils import (get_logger)
 import util.constant as c
 
@@ -424,3 +433,330 @@ class TestControllerRepoFunctions(unittest.TestCase):
         self.assertFalse(status)
         self.assertEqual(message, "Failed to retrieve repository details.")
         self.assertIsNone(repo_data)
+
+
+class TestControllerBatchRun(unittest.TestCase):
+    """Test cases for the Controller batch run across commits."""
+
+    def setUp(self):
+        self.commits = [f"{i:040d}" for i in range(10)]
+        self.first_fail = 6
+
+    def _fake_run_many(self, results: dict, ran: list):
+        """ build a run_many function where commits fail from index first_fail onward """
+        def run_many(targets):
+            for commit in targets:
+                ran.append(commit)
+                results[commit] = self.commits.index(commit) < self.first_fail
+        return run_many
+
+    def test_bisect_commits(self):
+        """ bisect locate the first failing commit with few runs """
+        for parallel in (1, 3):
+            results, ran = {}, []
+            first = Controller._bisect_commits(
+                self.commits, self._fake_run_many(results, ran), results, parallel)
+            self.assertEqual(first, self.commits[self.first_fail])
+            self.assertLess(len(ran), len(self.commits))
+            self.assertEqual(len(ran), len(set(ran)))
+
+    def test_bisect_commits_no_failure(self):
+        """ bisect stop after the newest commit passes """
+        self.first_fail = len(self.commits)
+        results, ran = {}, []
+        first = Controller._bisect_commits(
+            self.commits, self._fake_run_many(results, ran), results, 2)
+        self.assertIsNone(first)
+        self.assertEqual(ran, [self.commits[-1]])
+
+    @patch("controller.scheduler.RunScheduler.get_host_pool")
+    @patch("controller.controller.Controller.release_worktree")
+    @patch("controller.controller.Controller._run_pipeline_async")
+    @patch("controller.controller.Controller.acquire_worktree")
+    def test_run_pipeline_batch_backfill(self, mock_acquire, mock_run, mock_release,
+                                         mock_pool):
+        """ backfill run every commit in its own worktree """
+        mock_acquire.side_effect = lambda branch, commit_hash: (
+            True, "", None, f"/tmp/{commit_hash}")
+        mock_run.side_effect = lambda *args, **kwargs: (
+            not kwargs['repo_path'].endswith(self.commits[2]), "done")
+
+        controller = Controller()
+        status, message = controller.run_pipeline_batch(
+            self.commits[:4], config_file="pipelines.yml", pipeline_name=None,
+            parallel=2, dry_run=True)
+
+        self.assertFalse(status)
+        self.assertIn("Ran 4 of 4 commits", message)
+        self.assertIn(f"{self.commits[2][:8]} {c.STATUS_FAILED}", message)
+        self.assertEqual(mock_run.call_count, 4)
+        self.assertEqual(mock_release.call_count, 4)
+        self.assertTrue(all(call.kwargs['dry_run'] for call in mock_run.call_args_list))
+        mock_pool.assert_not_called()
+
+    @patch("controller.scheduler.RunScheduler.get_host_pool")
+    @patch("controller.controller.Controller.release_worktree")
+    @patch("controller.scheduler.RunScheduler.run_async")
+    @patch("controller.controller.Controller.validate_n_save_config")
+    @patch("controller.controller.Controller.acquire_worktree")
+    def test_run_pipeline_batch_share_host_pool(self, mock_acquire, mock_validate, mock_run,
+                                                mock_release, mock_pool):
+        """ the commits run on one event loop, sharing a single pool of docker hosts """
+        mock_acquire.side_effect = lambda branch, commit_hash: (
+            True, "", None, f"/tmp/{commit_hash}")
+        mock_validate.return_value = (True, "", MagicMock())
+        running = []
+        max_running = []
+
+        async def run(*args, **kwargs):
+            running.append(kwargs['label'])
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(kwargs['label'])
+            return True, ""
+        mock_run.side_effect = run
+
+        status, message = Controller().run_pipeline_batch(
+            self.commits[:5], config_file="pipelines.yml", pipeline_name=None,
+            parallel=2, local=True, max_containers=3)
+
+        self.assertTrue(status)
+        self.assertIn("Ran 5 of 5 commits", message)
+        mock_pool.assert_called_once_with(True, 3)
+        self.assertTrue(all(call.kwargs['host_pool'] is mock_pool.return_value
+                            for call in mock_run.call_args_list))
+        self.assertEqual(max(max_running), 2)
+        self.assertEqual(mock_release.call_count, 5)
+
+class TestControllerMultiRun(unittest.TestCase):
+    """Test cases for running several pipelines concurrently."""
+
+    def setUp(self):
+        pipeline_file = Path(__file__).parents[1] / 'test_util' / 'test_data' / 'test_run' / \
+            'pipelines.yml'
+        extracted = YamlParser().parse_yaml_file(str(pipeline_file))
+        self.pipeline_config = ConfigChecker().validate_config(
+            "cicd_pipeline", extracted, "pipelines.yml", error_lc=True).pipeline_config
+        self.running = 0
+        self.max_running = 0
+        self.ran = []
+        self.lock = threading.Lock()
+
+    def _run_job(self, job_name: str, job_config: dict):
+        """ fake DockerManager.run_job tracking the containers running at the same time """
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+            self.ran.append(job_name)
+        return build_job_log(job_name, job_config, c.STATUS_SUCCESS)
+
+    @patch("controller.scheduler.RunScheduler._wrap_up_run")
+    @patch("controller.scheduler.RunScheduler._start_run", return_value=(True, "", "id", 1))
+    @patch("controller.scheduler.RunScheduler._get_skipped_jobs", return_value=set())
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch("util.container.DockerManager")
+    @patch("controller.controller.Controller.validate_n_save_config")
+    def test_run_pipelines_share_container_limit(self, mock_validate, mock_docker, mock_writer,
+                                                 mock_skipped, mock_start, mock_wrap_up):
+        """ pipelines run together, and never exceed the shared container limit """
+        mock_validate.side_effect = lambda pipeline_name, **kwargs: (
+            True, "", PipelineInfo(pipeline_name=pipeline_name,
+                                   pipeline_file_name=f"{pipeline_name}.yml",
+                                   pipeline_config=self.pipeline_config))
+        mock_docker.return_value.run_job.side_effect = self._run_job
+
+        status, message = Controller().run_pipelines(
+            ["a", "b", "c"], MagicMock(), local=True, max_containers=2)
+
+        self.assertTrue(status)
+        self.assertIn("3 of 3 pipelines passed", message)
+        self.assertEqual(len(self.ran), 12)
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(mock_start.call_count, 3)
+        self.assertEqual(mock_wrap_up.call_count, 3)
+
+    @patch("controller.controller.DockerHostPool.from_env")
+    @patch("controller.scheduler.RunScheduler._wrap_up_run")
+    @patch("controller.scheduler.RunScheduler._start_run", return_value=(True, "", "id", 1))
+    @patch("controller.scheduler.RunScheduler._get_skipped_jobs", return_value=set())
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch("util.container.DockerManager")
+    @patch("controller.controller.Controller.validate_n_save_config")
+    def test_run_pipelines_remote_hosts(self, mock_validate, mock_docker, mock_writer,
+                                        mock_skipped, mock_start, mock_wrap_up, mock_pool):
+        """ remote runs are spread over the docker hosts, each run on a single host """
+        mock_validate.side_effect = lambda pipeline_name, **kwargs: (
+            True, "", PipelineInfo(pipeline_name=pipeline_name,
+                                   pipeline_file_name=f"{pipeline_name}.yml",
+                                   pipeline_config=self.pipeline_config))
+        mock_docker.return_value.run_job.side_effect = self._run_job
+        clients = {}
+        for name in ("host1", "host2"):
+            clients[name] = MagicMock()
+            clients[name].info.return_value = {c.DOCKER_INFO_CPUS: 2,
+                                               c.DOCKER_INFO_MEMORY: 1024**3}
+        mock_pool.return_value = DockerHostPool.from_clients(clients)
+
+        status, message = Controller().run_pipelines(["a", "b", "c", "d"], MagicMock())
+
+        self.assertTrue(status)
+        self.assertIn("4 of 4 pipelines passed", message)
+        used = [call.kwargs['client'] for call in mock_docker.call_args_list]
+        self.assertEqual(used.count(clients["host1"]), 2)
+        self.assertEqual(used.count(clients["host2"]), 2)
+        self.assertTrue(all(host.runs == 0 for host in mock_pool.return_value.hosts))
+
+    @patch("controller.controller.Controller.validate_n_save_config")
+    def test_run_pipelines_invalid(self, mock_validate):
+        """ invalid pipelines are reported without running """
+        mock_validate.return_value = (False, "invalid config", None)
+        status, message = Controller().run_pipelines(["a"], MagicMock())
+        self.assertFalse(status)
+        self.assertIn(f"a {c.STATUS_FAILED} invalid config", message)
+
+
+class TestControllerResume(unittest.TestCase):
+    """Test cases for resuming a run from the command line."""
+
+    @patch("controller.scheduler.RunScheduler.run", return_value=(True, "run_number:2"))
+    @patch("controller.scheduler.RunScheduler.get_resume_job")
+    @patch("controller.controller.MongoAdapter.get_pipeline_name", return_value="pipe")
+    @patch("controller.controller.Controller.validate_n_save_config")
+    def test_run_pipeline_resume(self, mock_validate, mock_name, mock_resume_job, mock_run):
+        """ a resumed run uses its recorded configuration, the current file is neither
+        validated nor saved """
+        pipeline_file = Path(__file__).parents[1] / 'test_util' / 'test_data' / 'test_run' / \
+            'pipelines.yml'
+        extracted = YamlParser().parse_yaml_file(str(pipeline_file))
+        pipeline_config = ConfigChecker().validate_config(
+            "cicd_pipeline", extracted, "pipelines.yml", error_lc=True).pipeline_config
+        job = {c.FIELD_RUN_NUMBER: 2,
+               c.FIELD_PIPELINE_CONFIG_USED: pipeline_config.model_dump(by_alias=True)}
+        mock_resume_job.return_value = (True, "", job)
+        git_details = MagicMock(repo_name="repo", repo_url="url", branch="main")
+
+        status, message = Controller().run_pipeline(
+            ".cicd-pipelines/pipelines.yml", None, git_details, local=True, resume=2)
+
+        self.assertTrue(status)
+        self.assertIn("run_number:2", message)
+        mock_validate.assert_not_called()
+        mock_name.assert_called_once_with("repo", "url", "main", "pipelines.yml")
+        mock_resume_job.assert_called_once_with(git_details, "pipe", 2)
+        self.assertEqual(mock_run.call_args.args, (git_details, pipeline_config, True, job))
+
+        # without a recorded pipeline for the file, nothing runs
+        mock_name.return_value = None
+        status, message = Controller().run_pipeline(
+            ".cicd-pipelines/pipelines.yml", None, git_details, resume=2)
+        self.assertFalse(status)
+        self.assertEqual(message, "No pipeline recorded for pipelines.yml")
+        mock_validate.assert_not_called()
+
+class TestControllerGc(unittest.TestCase):
+    """Test cases for the garbage collection of the docker hosts."""
+
+    @patch("util.repo_manager.WorktreeManager.from_env")
+    @patch("controller.controller.DockerGarbageCollector")
+    @patch("controller.controller.DockerHostPool.from_env")
+    def test_collect_garbage(self, mock_from_env, mock_collector, mock_worktrees):
+        """ each host is collected with the given settings and reported """
+        clients = {'tcp://host1': MagicMock(), 'tcp://host2': MagicMock()}
+        for client in clients.values():
+            client.info.return_value = {}
+        mock_from_env.return_value = DockerHostPool.from_clients(clients)
+        mock_worktrees.return_value.prune.return_value = []
+        mock_collector.return_value.collect.return_value = GcReport(
+            containers=["c1"], volumes=["v1", "v2"], reclaimed=3 * 1024 ** 2)
+        status, message = Controller().collect_garbage(max_age=60, disk_budget=100,
+                                                       dry_run=True)
+        self.assertTrue(status)
+        self.assertEqual(message.splitlines()[0], "tcp://host1: would remove 1 containers, "
+                         "2 volumes and 0 images, 3.0 MB reclaimed")
+        self.assertIn("  v2", message.splitlines())
+        self.assertEqual([call.args[0] for call in mock_collector.call_args_list],
+                         list(clients.values()))
+        self.assertEqual(mock_collector.call_args.kwargs['max_age'], 60)
+        self.assertEqual(mock_collector.call_args.kwargs['disk_budget'], 100)
+        self.assertIsNotNone(mock_collector.call_args.kwargs['is_active'])
+        self.assertEqual(message.splitlines()[-1], "worktrees: would remove 0 stale worktrees")
+        mock_worktrees.return_value.prune.assert_called_once_with(True)
+
+        mock_collector.return_value.collect.side_effect = docker.errors.DockerException("down")
+        status, message = Controller().collect_garbage()
+        self.assertFalse(status)
+        self.assertIn("down", message)
+
+
+class TestControllerConfigCache(unittest.TestCase):
+    """Test cases for reusing cached validation results."""
+
+    def setUp(self):
+        self.config_file = str(Path(__file__).parents[1] / 'test_util' / 'test_data' /
+                               'valid_directory' / 'valid_config.yml')
+
+    def test_validate_config_cached(self):
+        """Unchanged file is validated once, overrides always validate."""
+        controller = Controller()
+        status, _, first = controller.validate_config(file_name=self.config_file)
+        self.assertTrue(status)
+
+        controller = Controller()
+        with patch.object(controller.config_checker, 'validate_config',
+                          wraps=controller.config_checker.validate_config) as mock_validate:
+            status, _, second = controller.validate_config(file_name=self.config_file)
+            self.assertTrue(status)
+            self.assertEqual(second, first)
+            mock_validate.assert_not_called()
+
+            overrides = {c.KEY_GLOBAL: {c.KEY_ARTIFACT_PATH: 'other_bucket'}}
+            status, _, _ = controller.validate_config(file_name=self.config_file,
+                                                      override_configs=overrides)
+            self.assertTrue(status)
+            mock_validate.assert_called_once()
+
+    @patch("controller.controller.MongoAdapter.update_pipelines_info", return_value=True)
+    @patch("controller.controller.get_cpu_count", return_value=2)
+    def test_validate_n_save_configs_parallel(self, mock_cpu, mock_update):
+        """Directory validated in worker processes match the serial results,
+        and the valid pipelines are saved in one write."""
+        directory = str(Path(self.config_file).parent)
+        session = MagicMock(repo_name='repo', repo_url='url', branch='main', commit_hash='abc')
+        with patch.object(c, 'PARALLEL_CHECK_THRESHOLD', 1000):
+            serial = Controller().validate_n_save_configs(directory, saving=False)
+        with patch.dict('os.environ', {c.ENV_CONFIG_CACHE_DIR: ''}), \
+                patch.object(c, 'PARALLEL_CHECK_THRESHOLD', 1):
+            parallel = Controller().validate_n_save_configs(directory, session_data=session)
+        self.assertEqual(list(parallel), list(serial))
+        for pipeline_name, result in serial.items():
+            self.assertEqual(parallel[pipeline_name].valid, result.valid)
+            self.assertEqual(parallel[pipeline_name].error_msg, result.error_msg)
+        mock_update.assert_called_once()
+        saved = mock_update.call_args.kwargs['pipelines']
+        self.assertEqual(set(saved), {name for name, res in serial.items() if res.valid})
+
+    def test_validate_config_file_fast_path(self):
+        """Valid file is only loaded without line information, invalid file is
+        parsed again so the error point to the line and column."""
+        parser = YamlParser()
+        checker = ConfigChecker()
+        with patch.object(parser, 'parse_yaml_file', wraps=parser.parse_yaml_file) as mock_parse:
+            name, result = _validate_config_file(None, self.config_file, parser)
+        self.assertEqual(name, 'valid_pipeline')
+        self.assertTrue(result.valid)
+        mock_parse.assert_called_once_with(self.config_file, track_lc=False)
+        expected = checker.validate_config(name, parser.parse_yaml_file(self.config_file),
+                                           'valid_config.yml', error_lc=True)
+        self.assertEqual(result.model_dump(), expected.model_dump())
+
+        invalid_file = str(Path(self.config_file).parent / 'invalid_config.yml')
+        with patch.object(parser, 'parse_yaml_file', wraps=parser.parse_yaml_file) as mock_parse:
+            name, result = _validate_config_file(None, invalid_file, parser)
+        self.assertFalse(result.valid)
+        self.assertEqual(mock_parse.call_count, 2)
+        expected = checker.validate_config(name, parser.parse_yaml_file(invalid_file),
+                                           'invalid_config.yml', error_lc=True)
+        self.assertEqual(result.error_msg, expected.error_msg)
@@ -0,0 +1,313 @@
+""" Test the asyncio PipelineExecutor with a fake docker manager
+"""
+import asyncio
+import os
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+import util.constant as c
+from controller.executor import (PipelineExecutor, build_job_log)
+from util.config_tools import ConfigChecker
+from util.model import PipelineConfig
+from util.yaml_parser import YamlParser
+from util.common_utils import (get_logger)
+
+logger = get_logger("tests.test_controller.test_executor")
+
+PIPELINE_FILE = os.path.join(os.path.dirname(__file__), '..', 'test_util', 'test_data',
+                             'test_run', 'pipelines.yml')
+
+
+def load_pipeline() -> PipelineConfig:
+    """ Load the test_run pipeline: stage build run checkout then compile,
+    stage test run pytest and pylint as two independent job groups """
+    extracted = YamlParser().parse_yaml_file(PIPELINE_FILE)
+    result = ConfigChecker().validate_config("cicd_pipeline", extracted, "pipelines.yml",
+                                             error_lc=True)
+    return PipelineConfig.model_validate(result.pipeline_config)
+
+
+class FakeDockerManager:
+    """ Record the jobs run, fail the jobs listed in failed, and fail the first
+    attempts of the flaky jobs with the listed failure and exit code """
+
+    def __init__(self, failed: tuple = (), barrier: threading.Barrier = None,
+                 flaky: dict = None):
+        self.failed = failed
+        self.barrier = barrier
+        self.flaky = flaky or {}
+        self.ran = []
+        self.stopped = []
+        self.removed = []
+        self.release = threading.Event()
+
+    def run_job(self, job_name: str, job_config: dict):
+        self.ran.append(job_name)
+        if self.barrier is not None and job_name in ('pytest', 'pylint'):
+            # only pass if both jobs of the test stage are running at the same time
+            self.barrier.wait(timeout=5)
+        if job_name == 'blocked':
+            self.release.wait(timeout=5)
+        if self.flaky.get(job_name):
+            failure, exit_code = self.flaky[job_name].pop(0)
+            job_log = build_job_log(job_name, job_config, c.STATUS_FAILED)
+            job_log.failure = failure
+            job_log.exit_code = exit_code
+            return job_log
+        status = c.STATUS_FAILED if job_name in self.failed else c.STATUS_SUCCESS
+        return build_job_log(job_name, job_config, status)
+
+    def remove_job(self, job_name: str):
+        self.removed.append(job_name)
+
+    def stop_job(self, job_name: str):
+        self.stopped.append(job_name)
+        self.release.set()
+
+
+class PullingDockerManager(FakeDockerManager):
+    """ Pull the image of the jobs first, their containers cannot be stopped
+    before they are created """
+
+    def __init__(self):
+        super().__init__()
+        self.created = threading.Event()
+        self.pull = threading.Event()
+
+    def run_job(self, job_name: str, job_config: dict):
+        self.ran.append(job_name)
+        self.pull.wait(timeout=5)
+        self.created.set()
+        self.release.wait(timeout=5)
+        return build_job_log(job_name, job_config, c.STATUS_SUCCESS)
+
+    def stop_job(self, job_name: str):
+        self.stopped.append(job_name)
+        # the image is pulled after the first stop attempt
+        self.pull.set()
+        if self.created.is_set():
+            self.release.set()
+
+
+class TestPipelineExecutor(unittest.TestCase):
+    """ Test the stage and job scheduling of the executor """
+
+    def setUp(self):
+        self.pipeline_config = load_pipeline()
+        self.mongo_ds = MagicMock()
+
+    def _stage_statuses(self) -> dict:
+        return {call.args[1]: call.args[2]
+                for call in self.mongo_ds.update_job_logs.call_args_list}
+
+    def test_job_groups_run_concurrently(self):
+        """ independent job groups of a stage run at the same time """
+        docker_manager = FakeDockerManager(barrier=threading.Barrier(2))
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_SUCCESS
+        assert docker_manager.ran[:2] == ['checkout', 'compile']
+        assert sorted(docker_manager.ran[2:]) == ['pylint', 'pytest']
+        assert self._stage_statuses() == {'build': c.STATUS_SUCCESS, 'test': c.STATUS_SUCCESS}
+        # the heartbeat of the run is renewed after each job
+        heartbeats = [call.args[1] for call in self.mongo_ds.update_job.call_args_list]
+        assert len(heartbeats) == 4
+        assert all(c.FIELD_HEARTBEAT in updates for updates in heartbeats)
+
+    def test_failed_job_skip_group_and_next_stages(self):
+        """ a failed job not allowed to fail skip the rest of its group and the next stages """
+        docker_manager = FakeDockerManager(failed=('checkout',))
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert docker_manager.ran == ['checkout']
+        assert self._stage_statuses() == {'build': c.STATUS_FAILED}
+
+    def test_skipped_jobs(self):
+        """ skipped jobs are recorded without running, a stage fully skipped is skipped """
+        docker_manager = FakeDockerManager()
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id',
+                                    skipped_jobs={'pytest', 'pylint'})
+        assert executor.run(self.pipeline_config) == c.STATUS_SUCCESS
+        assert docker_manager.ran == ['checkout', 'compile']
+        assert self._stage_statuses() == {'build': c.STATUS_SUCCESS, 'test': c.STATUS_SKIPPED}
+
+    def test_cancel_stop_running_job(self):
+        """ cancelling the run stop the running container and record the cancelled job """
+        self.pipeline_config.stages['build']['job_groups'] = [['blocked']]
+        self.pipeline_config.jobs['blocked'] = self.pipeline_config.jobs['checkout']
+        docker_manager = FakeDockerManager()
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+
+        async def cancel_run():
+            task = asyncio.create_task(executor.run_async(self.pipeline_config))
+            while not docker_manager.ran:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_run())
+        assert docker_manager.stopped == ['blocked']
+        assert executor.pipeline_status == c.STATUS_CANCELLED
+        job_logs = self.mongo_ds.update_job_logs.call_args.args[3]
+        assert job_logs['blocked'][c.REPORT_KEY_JOBSTATUS] == c.STATUS_CANCELLED
+
+    def test_cancel_before_any_job(self):
+        """ a run cancelled before scheduling a job is cancelled, not left pending """
+        executor = PipelineExecutor(FakeDockerManager(), self.mongo_ds, 'job_id')
+
+        async def blocked_stage(*args):
+            await asyncio.sleep(5)
+
+        async def cancel_run():
+            task = asyncio.create_task(executor.run_async(self.pipeline_config))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with patch.object(PipelineExecutor, '_run_stage', new=blocked_stage):
+            asyncio.run(cancel_run())
+        assert executor.pipeline_status == c.STATUS_CANCELLED
+
+    def test_error_before_any_job(self):
+        """ a run stopped by an error is failed, not left pending """
+        executor = PipelineExecutor(FakeDockerManager(), self.mongo_ds, 'job_id')
+        with patch.object(PipelineExecutor, '_run_stage', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                executor.run(self.pipeline_config)
+        assert executor.pipeline_status == c.STATUS_FAILED
+
+    def test_cancel_job_pulling_image(self):
+        """ a job cancelled before its container exists is stopped once it is created,
+        instead of running unattended """
+        self.pipeline_config.stages['build']['job_groups'] = [['blocked']]
+        self.pipeline_config.jobs['blocked'] = self.pipeline_config.jobs['checkout']
+        docker_manager = PullingDockerManager()
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+
+        async def cancel_run():
+            task = asyncio.create_task(executor.run_async(self.pipeline_config))
+            while not docker_manager.ran:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with patch.object(c, "STOP_RETRY_INTERVAL", 0.01):
+            asyncio.run(cancel_run())
+        assert docker_manager.created.is_set() and docker_manager.release.is_set()
+        assert len(docker_manager.stopped) >= 2
+
+    def test_completed_jobs_of_resumed_run(self):
+        """ jobs completed by a previous attempt are kept, a completed stage is not run """
+        completed = {name: build_job_log(name, self.pipeline_config.jobs[name],
+                                         c.STATUS_SUCCESS).model_dump()
+                     for name in ('checkout', 'compile', 'pylint')}
+        docker_manager = FakeDockerManager()
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id',
+                                    completed_jobs=completed)
+        assert executor.run(self.pipeline_config) == c.STATUS_SUCCESS
+        assert docker_manager.ran == ['pytest']
+        assert self._stage_statuses() == {'test': c.STATUS_SUCCESS}
+        job_logs = self.mongo_ds.update_job_logs.call_args.args[3]
+        assert job_logs['pylint'] is completed['pylint']
+
+    def test_retry_transient_failures(self):
+        """ failures covered by the retry policy run the job again, after a backoff """
+        self.pipeline_config.jobs['checkout'][c.JOB_SUBKEY_RETRY] = {
+            c.RETRY_SUBKEY_MAX: 2, c.RETRY_SUBKEY_ON: [c.FAILURE_INFRA, 75],
+            c.RETRY_SUBKEY_BACKOFF: 0}
+        docker_manager = FakeDockerManager(flaky={
+            'checkout': [(c.FAILURE_INFRA, None), (c.FAILURE_SCRIPT, 75)]})
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_SUCCESS
+        assert docker_manager.ran[:4] == ['checkout', 'checkout', 'checkout', 'compile']
+        assert docker_manager.removed == ['checkout', 'checkout']
+        job_log = self.mongo_ds.update_job_logs.call_args_list[0].args[3]['checkout']
+        assert job_log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_SUCCESS
+        assert [(attempt['attempt'], attempt['failure'], attempt['exit_code'])
+                for attempt in job_log[c.REPORT_KEY_ATTEMPTS]] == [
+            (1, c.FAILURE_INFRA, None), (2, c.FAILURE_SCRIPT, 75)]
+
+    def test_no_retry_of_other_failures(self):
+        """ exit codes not listed by the policy, and the last attempt, are not retried """
+        self.pipeline_config.jobs['checkout'][c.JOB_SUBKEY_RETRY] = {
+            c.RETRY_SUBKEY_MAX: 1, c.RETRY_SUBKEY_ON: [c.FAILURE_INFRA],
+            c.RETRY_SUBKEY_BACKOFF: 0}
+        docker_manager = FakeDockerManager(flaky={'checkout': [(c.FAILURE_SCRIPT, 1)]})
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert docker_manager.ran == ['checkout']
+
+        docker_manager = FakeDockerManager(flaky={
+            'checkout': [(c.FAILURE_INFRA, None), (c.FAILURE_INFRA, None)]})
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert docker_manager.ran == ['checkout', 'checkout']
+
+    def test_get_retry_delay(self):
+        """ the backoff double at each attempt, up to its ceiling """
+        job_config = {c.JOB_SUBKEY_RETRY: {c.RETRY_SUBKEY_MAX: 10,
+                                           c.RETRY_SUBKEY_ON: [c.FAILURE_INFRA],
+                                           c.RETRY_SUBKEY_BACKOFF: 5}}
+        job_log = build_job_log('checkout', self.pipeline_config.jobs['checkout'],
+                                c.STATUS_FAILED)
+        job_log.failure = c.FAILURE_INFRA
+        delays = [PipelineExecutor._get_retry_delay(job_log, job_config, attempt)
+                  for attempt in (1, 2, 3, 10, 11)]
+        assert delays == [5, 10, 20, c.MAX_RETRY_DELAY, None]
+        job_log.job_status = c.STATUS_SUCCESS
+        assert PipelineExecutor._get_retry_delay(job_log, job_config, 1) is None
+
+    def test_job_timeout(self):
+        """ a job running past its timeout is stopped and failed """
+        self.pipeline_config.stages['build']['job_groups'] = [['blocked']]
+        self.pipeline_config.jobs['blocked'] = dict(self.pipeline_config.jobs['checkout'])
+        self.pipeline_config.jobs['blocked'][c.KEY_TIMEOUT] = 0.05
+        docker_manager = FakeDockerManager()
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert docker_manager.stopped == ['blocked']
+        job_log = self.mongo_ds.update_job_logs.call_args.args[3]['blocked']
+        assert job_log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_FAILED
+        assert job_log['failure'] == c.FAILURE_TIMEOUT
+
+    def test_pipeline_timeout(self):
+        """ a run past the timeout of the pipeline is cancelled and failed """
+        self.pipeline_config.stages['build']['job_groups'] = [['blocked']]
+        self.pipeline_config.jobs['blocked'] = self.pipeline_config.jobs['checkout']
+        self.pipeline_config.global_.timeout = 0.05
+        docker_manager = FakeDockerManager()
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert docker_manager.stopped == ['blocked']
+        assert self._stage_statuses() == {'build': c.STATUS_CANCELLED}
+
+    def test_fail_fast_stop_sibling_jobs(self):
+        """ a failed job not allowed to fail stop the running jobs of the other groups,
+        the jobs not completed are cancelled """
+        self.pipeline_config.stages['build']['job_groups'] = [['blocked'], ['checkout', 'compile']]
+        self.pipeline_config.jobs['blocked'] = self.pipeline_config.jobs['pytest']
+        docker_manager = FakeDockerManager(failed=('checkout',))
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert docker_manager.stopped == ['blocked']
+        assert 'compile' not in docker_manager.ran
+        job_logs = self.mongo_ds.update_job_logs.call_args.args[3]
+        assert {job_name: log[c.REPORT_KEY_JOBSTATUS] for job_name, log in job_logs.items()} == {
+            'checkout': c.STATUS_FAILED, 'blocked': c.STATUS_CANCELLED,
+            'compile': c.STATUS_CANCELLED}
+        assert self._stage_statuses() == {'build': c.STATUS_FAILED}
+
+    def test_fail_fast_disabled(self):
+        """ without fail fast, the other groups complete after a failed job """
+        self.pipeline_config.stages['build']['job_groups'] = [['pytest'], ['checkout', 'compile']]
+        self.pipeline_config.global_.fail_fast = False
+        docker_manager = FakeDockerManager(failed=('checkout',))
+        executor = PipelineExecutor(docker_manager, self.mongo_ds, 'job_id')
+        assert executor.run(self.pipeline_config) == c.STATUS_FAILED
+        assert not docker_manager.stopped
+        job_logs = self.mongo_ds.update_job_logs.call_args.args[3]
+        assert {job_name: log[c.REPORT_KEY_JOBSTATUS] for job_name, log in job_logs.items()} == {
+            'checkout': c.STATUS_FAILED, 'pytest': c.STATUS_SUCCESS}
+
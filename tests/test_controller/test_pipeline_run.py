@@ -0,0 +1,74 @@
+""" Test the PipelineRun resume preparation and wrap up
+"""
+import asyncio
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from controller.executor import build_job_log
+from controller.pipeline_run import PipelineRun
+from util.config_tools import ConfigChecker
+from util.yaml_parser import YamlParser
+import util.constant as c
+
+
+class TestPipelineRun(unittest.TestCase):
+    """Test cases for the lifecycle of a pipeline run."""
+
+    def setUp(self):
+        pipeline_file = Path(__file__).parents[1] / 'test_util' / 'test_data' / 'test_run' / \
+            'pipelines.yml'
+        extracted = YamlParser().parse_yaml_file(str(pipeline_file))
+        self.pipeline_config = ConfigChecker().validate_config(
+            "cicd_pipeline", extracted, "pipelines.yml", error_lc=True).pipeline_config
+        patcher = patch("controller.pipeline_run.RunStateWriter")
+        self.mock_writer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_writer.return_value.close.return_value = True
+        self.run = PipelineRun(MagicMock(), "job_id")
+        self.run.docker_manager = MagicMock(vol_name="repo-main-pipe-2")
+
+    def test_prepare_resume_without_volume(self):
+        """ all the jobs run again when the volume of the run is gone """
+        self.run.docker_manager.volume_exists.return_value = False
+        job = {
+            c.FIELD_RUN_NUMBER: 2,
+            c.FIELD_LOGS: [{c.FIELD_STAGE_NAME: "build", c.FIELD_JOBS: {
+                "checkout": build_job_log("checkout", self.pipeline_config.jobs["checkout"],
+                                          c.STATUS_SUCCESS).model_dump()}}]
+        }
+        completed = self.run.prepare_resume(job, self.pipeline_config)
+        self.assertEqual(completed, {})
+        self.assertEqual(self.run.docker_manager.remove_job.call_count, 4)
+
+    def test_get_status(self):
+        """ a run without executor, or without a finished stage, get the default status """
+        self.assertEqual(self.run.get_status(c.STATUS_FAILED), c.STATUS_FAILED)
+        self.run.executor = MagicMock(pipeline_status=c.STATUS_PENDING)
+        self.assertEqual(self.run.get_status(c.STATUS_FAILED), c.STATUS_FAILED)
+        self.run.executor.pipeline_status = c.STATUS_CANCELLED
+        self.assertEqual(self.run.get_status(c.STATUS_FAILED), c.STATUS_CANCELLED)
+
+    def test_wrap_up_success(self):
+        """ a successful run is recorded, releases its pipeline and removes its volume """
+        release = MagicMock(return_value=True)
+        self.assertTrue(self.run.wrap_up(c.STATUS_SUCCESS, release))
+        update = self.mock_writer.return_value.update_job.call_args.args
+        self.assertEqual(update[0], "job_id")
+        self.assertEqual(update[1][c.FIELD_STATUS], c.STATUS_SUCCESS)
+        release.assert_called_once_with()
+        self.run.docker_manager.remove_vol.assert_called_once_with()
+
+    def test_wrap_up_failed(self):
+        """ a failed run keeps its volume, and a failed release is reported """
+        self.assertFalse(self.run.wrap_up(c.STATUS_FAILED, lambda: False))
+        self.run.docker_manager.remove_vol.assert_not_called()
+
+    @patch("util.container.DockerManager")
+    def test_start_renew_heartbeat(self, mock_docker):
+        """ a started run, resumed or not, is back in flight with a fresh heartbeat """
+        run = PipelineRun(MagicMock(), "job_id", MagicMock(), label="pipe")
+        asyncio.run(run.start("repo", "main", self.pipeline_config, 2, set()))
+        updates = self.mock_writer.return_value.update_job.call_args.args[1]
+        self.assertIsNone(updates[c.FIELD_STATUS])
+        self.assertGreater(updates[c.FIELD_HEARTBEAT], 0)
+        self.assertEqual(mock_docker.call_args.kwargs['run_id'], "job_id")
@@ -0,0 +1,129 @@
+""" Test the QueueRunner against a mongomock job queue and a fake docker manager
+"""
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+import mongomock
+import util.constant as c
+from controller.executor import build_job_log
+from controller.runner import (QueueRunner)
+from util.db_mongo import MongoAdapter
+from util.docker_pool import DockerHostPool
+from util.common_utils import (get_logger)
+from tests.test_controller.test_executor import load_pipeline
+
+logger = get_logger("tests.test_controller.test_runner")
+
+
+class FakeDockerManager:
+    """ Record the jobs run by all the managers, block the job named blocked """
+    ran = []
+    stopped = []
+    removed = []
+    release = threading.Event()
+
+    def __init__(self, client=None, repo="Repo", branch="main", pipeline="pipeline", run="run",
+                 run_id=None):
+        self.vol_name = f"{repo}-{branch}-{pipeline}-{run}"
+
+    def run_job(self, job_name: str, job_config: dict):
+        FakeDockerManager.ran.append(job_name)
+        if job_name == 'blocked':
+            FakeDockerManager.release.wait(timeout=5)
+        return build_job_log(job_name, job_config, c.STATUS_SUCCESS)
+
+    def stop_job(self, job_name: str):
+        FakeDockerManager.stopped.append(job_name)
+        FakeDockerManager.release.set()
+
+    def remove_vol(self):
+        FakeDockerManager.removed.append(self.vol_name)
+
+    def reap_orphans(self):
+        return 0
+
+
+class TestQueueRunner(unittest.TestCase):
+    """ Test claiming, running and recording the queued runs """
+
+    def setUp(self):
+        FakeDockerManager.ran = []
+        FakeDockerManager.stopped = []
+        FakeDockerManager.removed = []
+        FakeDockerManager.release = threading.Event()
+        self.mongo_client = mongomock.MongoClient()
+        patcher = patch("util.db_mongo.pymongo.MongoClient", return_value=self.mongo_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("util.container.DockerManager", FakeDockerManager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mongo_ds = MongoAdapter()
+        self.pipeline_config = load_pipeline()
+        self.host_pool = DockerHostPool.local(max_containers=2)
+        self.database = self.mongo_client[c.MONGO_DB_NAME]
+        self.database[c.MONGO_PIPELINES_TABLE].insert_one({
+            c.FIELD_REPO_NAME: "repo", c.FIELD_REPO_URL: "url", c.FIELD_BRANCH: "main",
+            c.FIELD_PIPELINES: {"test_run": {c.FIELD_RUNNING: True}}
+        })
+
+    def _enqueue(self, skipped_jobs: list = None) -> str:
+        """ Insert a run record and queue it, as cid pipeline run --enqueue """
+        job_id = self.database[c.MONGO_JOBS_TABLE].insert_one({
+            c.FIELD_PIPELINE_NAME: "test_run",
+            c.FIELD_RUN_NUMBER: 1,
+            c.FIELD_PIPELINE_CONFIG_USED: self.pipeline_config.model_dump(by_alias=True),
+            c.FIELD_STATUS: None,
+            c.FIELD_LOGS: [{c.FIELD_STAGE_NAME: stage, c.FIELD_JOBS: []}
+                           for stage in self.pipeline_config.stages]
+        }).inserted_id
+        self.mongo_ds.enqueue_run({
+            c.FIELD_JOB_ID: str(job_id), c.FIELD_REPO_NAME: "repo", c.FIELD_REPO_URL: "url",
+            c.FIELD_BRANCH: "main", c.FIELD_PIPELINE_NAME: "test_run",
+            c.FIELD_SKIPPED_JOBS: skipped_jobs or []
+        })
+        return str(job_id)
+
+    def _running(self) -> bool:
+        record = self.database[c.MONGO_PIPELINES_TABLE].find_one({c.FIELD_REPO_NAME: "repo"})
+        return record[c.FIELD_PIPELINES]["test_run"][c.FIELD_RUNNING]
+
+    def test_run_queued_runs(self):
+        """ the runner run the queued runs, record them and empty the queue """
+        first = self._enqueue()
+        second = self._enqueue(skipped_jobs=['pytest', 'pylint'])
+        runner = QueueRunner(self.mongo_ds, self.host_pool, name="runner1")
+        assert runner.serve(once=True) == 2
+        assert sorted(FakeDockerManager.ran) == ['checkout', 'checkout', 'compile', 'compile',
+                                                 'pylint', 'pytest']
+        for job_id in (first, second):
+            assert self.mongo_ds.get_job(job_id)[c.FIELD_STATUS] == c.STATUS_SUCCESS
+        assert not self._running()
+        assert len(FakeDockerManager.removed) == 2
+        assert self.database[c.MONGO_QUEUE_TABLE].count_documents({}) == 0
+
+    def test_lease_lost(self):
+        """ a run whose lease is lost is cancelled and left to the runner claiming it """
+        self.pipeline_config.stages['build']['job_groups'] = [['blocked']]
+        self.pipeline_config.jobs['blocked'] = self.pipeline_config.jobs['checkout']
+        job_id = self._enqueue()
+        runner = QueueRunner(self.mongo_ds, self.host_pool, name="runner1", lease_seconds=0.03)
+        item = self.mongo_ds.claim_queued_run("runner1")
+        with patch.object(MongoAdapter, "renew_lease", return_value=False):
+            assert asyncio.run(runner.run_item(item)) is None
+        assert FakeDockerManager.stopped == ['blocked']
+        assert self.mongo_ds.get_job(job_id)[c.FIELD_STATUS] is None
+        assert self._running()
+        assert self.database[c.MONGO_QUEUE_TABLE].count_documents({}) == 1
+
+    def test_abandon_after_max_attempts(self):
+        """ a run claimed again too many times is failed without running """
+        job_id = self._enqueue()
+        runner = QueueRunner(self.mongo_ds, self.host_pool, name="runner1", max_attempts=1)
+        self.mongo_ds.claim_queued_run("crashed", lease_seconds=-1)
+        assert runner.serve(once=True) == 0
+        assert not FakeDockerManager.ran
+        assert self.mongo_ds.get_job(job_id)[c.FIELD_STATUS] == c.STATUS_FAILED
+        assert not self._running()
+        assert self.database[c.MONGO_QUEUE_TABLE].count_documents({}) == 0
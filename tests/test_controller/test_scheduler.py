@@ -0,0 +1,249 @@
+""" Test the RunScheduler starting, resuming and queueing the pipeline runs
+"""
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from docker.errors import DockerException
+from controller.executor import build_job_log
+from controller.scheduler import RunScheduler
+from util.db_mongo import MongoAdapter
+from util.docker_gc import DockerGarbageCollector
+from util.config_tools import ConfigChecker
+from util.yaml_parser import YamlParser
+import util.constant as c
+
+
+def new_scheduler() -> RunScheduler:
+    """ Scheduler of a new controller, i.e. of other process """
+    return RunScheduler(MongoAdapter(), MagicMock())
+
+
+class TestSchedulerRuns(unittest.TestCase):
+    """Test cases for starting the pipeline runs."""
+
+    @patch("controller.scheduler.PipelineInfo.model_validate")
+    @patch("controller.scheduler.MongoAdapter.update_pipeline_info", return_value=True)
+    @patch("controller.scheduler.MongoAdapter.insert_job")
+    @patch("controller.scheduler.MongoAdapter.get_pipeline_history")
+    def test_overlapping_runs_share_running_flag(self, mock_get, mock_insert, mock_update,
+                                                 mock_validate):
+        """ runs started by the same scheduler can overlap, and the running flag
+        is cleared only when the last one finish """
+        history = {c.FIELD_RUNNING: False}
+        mock_get.side_effect = lambda *args: dict(history)
+        mock_validate.side_effect = lambda hist: MagicMock(
+            running=hist[c.FIELD_RUNNING], job_run_history=[])
+        mock_insert.side_effect = ["job1", "job2"]
+        repo_data = MagicMock(repo_name="repo", repo_url="url", branch="main",
+                              commit_hash="abc")
+        pipeline_config = MagicMock()
+        pipeline_config.global_.pipeline_name = "sample_pipeline"
+        pipeline_config.model_dump.return_value = {}
+
+        scheduler = new_scheduler()
+        status, _, job_id, _ = scheduler._start_run(repo_data, pipeline_config)
+        self.assertTrue(status)
+        self.assertEqual(job_id, "job1")
+        history[c.FIELD_RUNNING] = True
+        status, _, job_id, _ = scheduler._start_run(repo_data, pipeline_config)
+        self.assertTrue(status)
+        self.assertEqual(job_id, "job2")
+        # Other scheduler, i.e. other process, is rejected
+        status, message, _, _ = new_scheduler()._start_run(repo_data, pipeline_config)
+        self.assertFalse(status)
+        self.assertIn("Already Running", message)
+
+        mock_update.reset_mock()
+        scheduler._finish_run(repo_data, "sample_pipeline")
+        mock_update.assert_not_called()
+        scheduler._finish_run(repo_data, "sample_pipeline")
+        mock_update.assert_called_once_with(
+            "repo", "url", "main", "sample_pipeline", {c.FIELD_RUNNING: False})
+
+    @patch("controller.scheduler.RunScheduler._wrap_up_run")
+    @patch("controller.scheduler.RunScheduler._start_run", return_value=(True, "", "id1", 1))
+    @patch("controller.scheduler.RunScheduler._get_skipped_jobs", return_value=set())
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch("util.container.DockerManager", side_effect=DockerException("engine down"))
+    def test_run_setup_failure(self, mock_docker, mock_writer, mock_skipped, mock_start,
+                               mock_wrap_up):
+        """ a run failing before its executor is created is recorded as failed """
+        repo_data = MagicMock(repo_name="repo", repo_url="url", branch="main")
+        pipeline_config = MagicMock()
+        pipeline_config.global_.pipeline_name = "sample_pipeline"
+        with self.assertRaises(DockerException):
+            new_scheduler().run(repo_data, pipeline_config, local=True)
+        mock_docker.assert_called_once()
+        self.assertEqual(mock_wrap_up.call_args.args[3], c.STATUS_FAILED)
+
+    @patch("controller.scheduler.RunScheduler._wrap_up_run")
+    @patch("controller.scheduler.RunScheduler._start_run", return_value=(True, "", "id1", 1))
+    @patch("controller.scheduler.RunScheduler._get_skipped_jobs", return_value=set())
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch("controller.pipeline_run.PipelineRun.start", side_effect=KeyboardInterrupt)
+    def test_run_interrupted_before_start(self, mock_run_start, mock_writer, mock_skipped,
+                                          mock_start, mock_wrap_up):
+        """ a run interrupted before its executor is created is recorded as cancelled """
+        repo_data = MagicMock(repo_name="repo", repo_url="url", branch="main")
+        pipeline_config = MagicMock()
+        pipeline_config.global_.pipeline_name = "sample_pipeline"
+        with self.assertRaises(KeyboardInterrupt):
+            new_scheduler().run(repo_data, pipeline_config, local=True)
+        mock_run_start.assert_called_once()
+        self.assertEqual(mock_wrap_up.call_args.args[3], c.STATUS_CANCELLED)
+
+    @patch("controller.scheduler.DockerHostPool.from_env", return_value=None)
+    def test_get_host_pool(self, mock_pool):
+        """ remote run fall back to the local engine without configured hosts """
+        host_pool = new_scheduler().get_host_pool(local=False, max_containers=3)
+        self.assertFalse(host_pool.remote)
+        self.assertEqual(host_pool.hosts[0].admission.max_containers, 3)
+        mock_pool.assert_called_once_with(3)
+        mock_pool.reset_mock()
+        self.assertFalse(new_scheduler().get_host_pool(local=True).remote)
+        mock_pool.assert_not_called()
+
+
+class TestSchedulerEnqueue(unittest.TestCase):
+    """Test cases for queueing runs for the cid runners."""
+
+    @patch("controller.scheduler.MongoAdapter.update_pipeline_info")
+    @patch("controller.scheduler.MongoAdapter.enqueue_run", return_value="item_id")
+    @patch("controller.scheduler.RunScheduler._start_run", return_value=(True, "", "job_id", 3))
+    @patch("controller.scheduler.RunScheduler._get_skipped_jobs", return_value={"b", "a"})
+    def test_enqueue(self, mock_skipped, mock_start, mock_enqueue, mock_update):
+        """ the run is queued with its skipped jobs, the pipeline stays running """
+        repo_data = MagicMock(repo_name="repo", repo_url="url", branch="main")
+        pipeline_config = MagicMock()
+        pipeline_config.global_.pipeline_name = "pipe"
+        scheduler = new_scheduler()
+        status, message = scheduler.enqueue(repo_data, pipeline_config)
+        self.assertTrue(status)
+        self.assertEqual(message, "run_number:3 queued")
+        self.assertEqual(mock_enqueue.call_args.args[0], {
+            c.FIELD_JOB_ID: "job_id", c.FIELD_REPO_NAME: "repo", c.FIELD_REPO_URL: "url",
+            c.FIELD_BRANCH: "main", c.FIELD_PIPELINE_NAME: "pipe",
+            c.FIELD_SKIPPED_JOBS: ["a", "b"]})
+        mock_update.assert_not_called()
+
+        # the running flag is cleared when the run cannot be queued
+        mock_enqueue.return_value = None
+        with patch("controller.scheduler.MongoAdapter.update_job"):
+            status, _ = scheduler.enqueue(repo_data, pipeline_config)
+        self.assertFalse(status)
+        mock_update.assert_called_once_with("repo", "url", "main", "pipe",
+                                            {c.FIELD_RUNNING: False})
+
+
+class TestSchedulerResume(unittest.TestCase):
+    """Test cases for resuming a failed or cancelled run."""
+
+    def setUp(self):
+        pipeline_file = Path(__file__).parents[1] / 'test_util' / 'test_data' / 'test_run' / \
+            'pipelines.yml'
+        extracted = YamlParser().parse_yaml_file(str(pipeline_file))
+        self.pipeline_config = ConfigChecker().validate_config(
+            "cicd_pipeline", extracted, "pipelines.yml", error_lc=True).pipeline_config
+        self.repo_data = MagicMock(repo_name="repo", repo_url="url", branch="main")
+        jobs = self.pipeline_config.jobs
+        self.job = {
+            c.FIELD_RUN_NUMBER: 2,
+            c.FIELD_STATUS: c.STATUS_FAILED,
+            c.FIELD_DOCKER_HOST: c.LOCAL_DOCKER_HOST,
+            c.FIELD_PIPELINE_CONFIG_USED: self.pipeline_config.model_dump(by_alias=True),
+            c.FIELD_LOGS: [
+                {c.FIELD_STAGE_NAME: "build", c.FIELD_JOBS: {
+                    name: build_job_log(name, jobs[name], c.STATUS_SUCCESS).model_dump()
+                    for name in ("checkout", "compile")}},
+                {c.FIELD_STAGE_NAME: "test", c.FIELD_JOBS: {
+                    "pytest": build_job_log("pytest", jobs["pytest"],
+                                            c.STATUS_FAILED).model_dump(),
+                    "pylint": build_job_log("pylint", jobs["pylint"],
+                                            c.STATUS_SUCCESS).model_dump()}}
+            ]
+        }
+
+    @patch("controller.scheduler.MongoAdapter.get_job")
+    @patch("controller.scheduler.MongoAdapter.get_pipeline_history")
+    def test_get_resume_job(self, mock_history, mock_get_job):
+        """ only an existing run that did not succeed can be resumed """
+        mock_history.return_value = {c.FIELD_JOB_RUN_HISTORY: ["id1", "id2"]}
+        mock_get_job.return_value = self.job
+        scheduler = new_scheduler()
+        status, _, job = scheduler.get_resume_job(self.repo_data, "pipe", 2)
+        self.assertTrue(status)
+        self.assertIs(job, self.job)
+        mock_get_job.assert_called_once_with("id2")
+
+        status, message, _ = scheduler.get_resume_job(self.repo_data, "pipe", 3)
+        self.assertFalse(status)
+        self.assertEqual(message, "Run 3 of pipeline pipe not found")
+        mock_get_job.return_value = None
+        status, message, _ = scheduler.get_resume_job(self.repo_data, "pipe", 1)
+        self.assertEqual(message, "Record of run 1 of pipeline pipe not found")
+        mock_get_job.return_value = {c.FIELD_STATUS: c.STATUS_SUCCESS}
+        status, message, _ = scheduler.get_resume_job(self.repo_data, "pipe", 1)
+        self.assertEqual(message, "Run 1 of pipeline pipe already succeeded")
+
+    @patch("controller.scheduler.MongoAdapter.get_job")
+    def test_is_run_active(self, mock_get_job):
+        """ a run is in flight until its record has a final status, or its heartbeat
+        is stale after a crash """
+        scheduler = new_scheduler()
+        now = time.time()
+        for job, active in (({c.FIELD_STATUS: None, c.FIELD_HEARTBEAT: now}, True),
+                            ({c.FIELD_STATUS: None, c.FIELD_HEARTBEAT: now - 7200}, False),
+                            ({c.FIELD_STATUS: None}, False),
+                            ({c.FIELD_STATUS: c.STATUS_FAILED, c.FIELD_HEARTBEAT: now}, False),
+                            ({}, True), (None, False)):
+            mock_get_job.return_value = job
+            self.assertEqual(scheduler.is_run_active("id1", 3600), active)
+
+    @patch("controller.scheduler.MongoAdapter.get_job")
+    def test_collect_crashed_run(self, mock_get_job):
+        """ the volume of a crashed run, left without final status, is collected once its
+        heartbeat is older than the maximum age, while the run in flight is kept """
+        now = time.time()
+        jobs = {"crashed": {c.FIELD_STATUS: None, c.FIELD_HEARTBEAT: now - 2 * 3600},
+                "running": {c.FIELD_STATUS: None, c.FIELD_HEARTBEAT: now - 60}}
+        mock_get_job.side_effect = jobs.get
+        client = MagicMock()
+        client.containers.list.return_value = []
+        client.images.list.return_value = []
+        volumes = {}
+        for run_id in jobs:
+            volumes[run_id] = MagicMock(attrs={'Labels': {
+                c.LABEL_MANAGED: 'true', c.LABEL_CREATED: str(int(now - 2 * 3600)),
+                c.LABEL_RUN_ID: run_id}})
+            volumes[run_id].name = f"repo-main-pipe-{run_id}"
+        client.volumes.list.return_value = list(volumes.values())
+        report = DockerGarbageCollector(client, max_age=3600,
+                                        is_active=new_scheduler().is_run_active).collect()
+        self.assertEqual(report.volumes, ["repo-main-pipe-crashed"])
+        volumes["running"].remove.assert_not_called()
+
+    @patch("controller.scheduler.RunScheduler._wrap_up_run")
+    @patch("controller.scheduler.RunScheduler._start_run", return_value=(True, "", "id2", 2))
+    @patch("controller.scheduler.RunScheduler._get_skipped_jobs")
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch("util.container.DockerManager")
+    def test_resume(self, mock_docker, mock_writer, mock_skipped, mock_start, mock_wrap_up):
+        """ only the failed job run again, under the record of the resumed run """
+        mock_docker.return_value.volume_exists.return_value = True
+        mock_docker.return_value.run_job.side_effect = lambda job_name, job_config: \
+            build_job_log(job_name, job_config, c.STATUS_SUCCESS)
+
+        status, message = new_scheduler().run(self.repo_data, self.pipeline_config,
+                                              local=True, resume_job=self.job)
+
+        self.assertTrue(status)
+        self.assertEqual(message, "run_number:2")
+        ran = [call.args[0] for call in mock_docker.return_value.run_job.call_args_list]
+        self.assertEqual(ran, ["pytest"])
+        mock_docker.return_value.remove_job.assert_called_once_with("pytest")
+        self.assertEqual(mock_start.call_args.args[2], 2)
+        mock_skipped.assert_not_called()
+        self.assertEqual([call.args[1] for call in
+                          mock_writer.return_value.update_job_logs.call_args_list], ["test"])
+        self.assertEqual(mock_wrap_up.call_args.args[3], c.STATUS_SUCCESS)
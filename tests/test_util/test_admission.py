@@ -0,0 +1,105 @@
+""" Test the AdmissionController of the job containers
+"""
+import asyncio
+import unittest
+from util.admission import AdmissionController
+from util.common_utils import get_logger
+import util.constant as c
+
+logger = get_logger("tests.test_util.test_admission")
+
+GB = 1024 ** 3
+
+
+def job(cpus: float = None, memory: int = None) -> dict:
+    """ Build a job configuration with the given resources """
+    resources = {}
+    if cpus is not None:
+        resources[c.RESOURCE_SUBKEY_CPUS] = cpus
+    if memory is not None:
+        resources[c.RESOURCE_SUBKEY_MEMORY] = memory
+    return {c.JOB_SUBKEY_RESOURCES: resources} if resources else {}
+
+
+class TestAdmissionController(unittest.TestCase):
+    """ Test the jobs are admitted within the capacity, in arrival order """
+
+    def _run(self, admission: AdmissionController, jobs: dict) -> list:
+        """ Run the jobs concurrently, each holding its admission for a short time,
+        and record the order they start and the peak usage """
+        started = []
+        peak = {'cpus': 0.0, 'memory': 0, 'running': 0}
+
+        async def run_job(name: str, job_config: dict):
+            async with admission.admit(job_config):
+                started.append(name)
+                peak['cpus'] = max(peak['cpus'], admission.used_cpus)
+                peak['memory'] = max(peak['memory'], admission.used_memory)
+                peak['running'] = max(peak['running'], admission.running)
+                await asyncio.sleep(0.01)
+
+        async def run_all():
+            await asyncio.gather(*(run_job(name, job_config)
+                                   for name, job_config in jobs.items()))
+
+        asyncio.run(run_all())
+        self.peak = peak
+        return started
+
+    def test_capacity_respected(self):
+        """ the reserved cpus and memory never exceed the host """
+        admission = AdmissionController(cpus=4, memory=8 * GB, max_containers=10)
+        jobs = {f"job{i}": job(cpus=1.5, memory=3 * GB) for i in range(6)}
+        started = self._run(admission, jobs)
+        assert len(started) == 6
+        assert self.peak['cpus'] <= 4
+        assert self.peak['memory'] <= 8 * GB
+        assert self.peak['running'] == 2
+        assert admission.running == 0 and admission.used_memory == 0
+
+    def test_max_containers(self):
+        """ jobs without resources are only limited by the container count """
+        admission = AdmissionController(cpus=1, memory=GB, max_containers=3)
+        self._run(admission, {f"job{i}": job() for i in range(7)})
+        assert self.peak['running'] == 3
+
+    def test_arrival_order(self):
+        """ a large job is not overtaken by the small jobs queued behind it """
+        admission = AdmissionController(cpus=4, memory=None, max_containers=10)
+        started = self._run(admission, {'small1': job(cpus=2), 'large': job(cpus=4),
+                                        'small2': job(cpus=1)})
+        assert started == ['small1', 'large', 'small2']
+
+    def test_oversized_job(self):
+        """ a job larger than the host runs alone instead of waiting forever """
+        admission = AdmissionController(cpus=2, memory=GB)
+        assert admission.get_request(job(cpus=8, memory=4 * GB)) == (2, GB)
+        started = self._run(admission, {'huge': job(cpus=8, memory=4 * GB), 'other': job(1)})
+        assert started == ['huge', 'other']
+
+    def test_cancel_waiting_job(self):
+        """ cancelling a queued job let the next ones in """
+        admission = AdmissionController(cpus=2, max_containers=10)
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def hold(job_config: dict):
+                async with admission.admit(job_config):
+                    await release.wait()
+
+            running = asyncio.create_task(hold(job(cpus=1)))
+            queued_large = asyncio.create_task(hold(job(cpus=2)))
+            queued_small = asyncio.create_task(hold(job(cpus=1)))
+            await asyncio.sleep(0.01)
+            assert admission.running == 1
+            queued_large.cancel()
+            await asyncio.sleep(0.01)
+            assert admission.running == 2
+            release.set()
+            await asyncio.gather(running, queued_small)
+            with self.assertRaises(asyncio.CancelledError):
+                await queued_large
+
+        asyncio.run(scenario())
+        assert admission.running == 0 and admission.used_cpus == 0
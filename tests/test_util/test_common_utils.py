@@ -1,7 +1,8 @@
 """ Test for all common utilities function
 """
 import logging
-from util.common_utils import get_logger
+from util.common_utils import get_logger, parse_duration, parse_size, ChangeSelector
+import util.constant as c
 
 
 def test_get_logger():
@@ -9,3 +10,46 @@ def test_get_logger():
     """
     logger = get_logger(logger_name='tests.test_util.test_common_utils')
     assert isinstance(logger, logging.Logger)
+
+
+def test_change_selector_glob():
+    """ test the glob matching of ChangeSelector
+    """
+    assert ChangeSelector.matches(['services/api/app.py'], ['services/api/**'])
+    assert ChangeSelector.matches(['services/api/app.py'], ['services/api/'])
+    assert ChangeSelector.matches(['services/api/v1/app.py'], ['services/**/*.py'])
+    assert ChangeSelector.matches(['app.py'], ['**/*.py'])
+    assert ChangeSelector.matches(['README.md'], ['./README.md'])
+    assert not ChangeSelector.matches(['services/api/v1/app.py'], ['services/*/app.py'])
+    assert not ChangeSelector.matches(['services/web/app.py'], ['services/api/**'])
+    assert not ChangeSelector.matches(['docs/a.md'], ['*.md'])
+
+
+def test_change_selector_skipped_jobs():
+    """ test jobs without matching changes are skipped with their dependents
+    """
+    jobs = {
+        'api_build': {c.JOB_SUBKEY_NEEDS: [], c.JOB_SUBKEY_CHANGES: ['services/api/**']},
+        'api_test': {c.JOB_SUBKEY_NEEDS: ['api_build']},
+        'api_report': {c.JOB_SUBKEY_NEEDS: ['api_test']},
+        'web_build': {c.JOB_SUBKEY_NEEDS: [], c.JOB_SUBKEY_CHANGES: ['services/web/**']},
+        'lint': {c.JOB_SUBKEY_NEEDS: []},
+    }
+    skipped = ChangeSelector.get_skipped_jobs(jobs, ['services/web/index.js'])
+    assert skipped == {'api_build', 'api_test', 'api_report'}
+    assert ChangeSelector.get_skipped_jobs(jobs, ['services/api/app.py']) == {'web_build'}
+
+
+def test_parse_duration_and_size():
+    """ test the durations and sizes of the configuration and the command line
+    """
+    assert parse_duration(90) == 90.0
+    assert parse_duration('30m') == 1800.0
+    assert parse_duration('2H') == 7200.0
+    assert parse_duration('1d') is None
+    assert parse_duration(True) is None
+    assert parse_size(512) == 512
+    assert parse_size('1.5k') == 1536
+    assert parse_size('20g') == 20 * 1024 ** 3
+    assert parse_size('20t') is None
+    assert parse_size(None) is None
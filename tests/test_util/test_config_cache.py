@@ -0,0 +1,79 @@
+""" Test for the ConfigCache
+"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import util.constant as c
+from util.config_cache import ConfigCache
+from util.common_utils import get_logger
+
+logger = get_logger("tests.test_util.test_config_cache")
+
+
+class TestConfigCache(unittest.TestCase):
+    """ Test the ConfigCache with files in a temporary directory """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.file_path = os.path.join(self.tmp.name, 'pipelines.yml')
+        self._write('global:\n  pipeline_name: test\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, content: str):
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_store_and_lookup_across_instances(self):
+        """ stored entry is returned while the file is unchanged, also after reload """
+        cache = ConfigCache(cache_dir=self.cache_dir)
+        assert cache.lookup(self.file_path) is None
+        cache.store(self.file_path, 'test', {'global': {}})
+        cache.flush()
+
+        entry = ConfigCache(cache_dir=self.cache_dir).lookup(self.file_path)
+        assert entry[c.FIELD_PIPELINE_NAME] == 'test'
+        assert entry[c.FIELD_PIPELINE_CONFIG] == {'global': {}}
+
+    def test_modified_file_invalidated(self):
+        """ content change invalidate the entry, a rewrite with same content does not """
+        cache = ConfigCache(cache_dir=self.cache_dir)
+        cache.store(self.file_path, 'test')
+        stat = os.stat(self.file_path)
+        self._write('global:\n  pipeline_name: test\n')
+        os.utime(self.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert cache.lookup(self.file_path)[c.FIELD_PIPELINE_NAME] == 'test'
+
+        self._write('global:\n  pipeline_name: tset\n')
+        os.utime(self.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+        assert cache.lookup(self.file_path) is None
+
+    def test_other_version_discarded(self):
+        """ index written by another version of the program is ignored """
+        cache = ConfigCache(cache_dir=self.cache_dir)
+        cache.store(self.file_path, 'test')
+        cache.flush()
+        other = ConfigCache(cache_dir=self.cache_dir)
+        other.version = 'other'
+        assert other.lookup(self.file_path) is None
+
+    def test_disabled_and_unserializable(self):
+        """ disabled cache never hit, unserializable entry is not persisted """
+        disabled = ConfigCache(cache_dir=self.cache_dir, enabled=False)
+        disabled.store(self.file_path, 'test')
+        assert disabled.lookup(self.file_path) is None
+
+        cache = ConfigCache(cache_dir=self.cache_dir)
+        cache.store(self.file_path, 'test', {'config': object()})
+        cache.flush()
+        assert ConfigCache(cache_dir=self.cache_dir).lookup(self.file_path) is None
+
+    def test_from_env(self):
+        """ empty CID_CONFIG_CACHE_DIR disable the cache """
+        with patch.dict(os.environ, {c.ENV_CONFIG_CACHE_DIR: ''}):
+            assert not ConfigCache.from_env().enabled
+        with patch.dict(os.environ, {c.ENV_CONFIG_CACHE_DIR: self.cache_dir}):
+            assert str(ConfigCache.from_env().cache_dir) == self.cache_dir
@@ -1,7 +1,9 @@
 """ All testing method for config tool
 """
 from collections import OrderedDict
+import copy
 import unittest
+from unittest.mock import patch
 import util.config_tools as config
 import util.constant as c
 from util.common_utils import get_logger
@@ -19,7 +21,8 @@ class TestConfigChecker(unittest.TestCase):
                     c.KEY_DOCKER_REG: c.DEFAULT_DOCKER_REGISTRY,
                     c.KEY_DOCKER_IMG:'ubuntu:latest'
                 },
-                c.KEY_ARTIFACT_PATH: 'Github.com'
+                c.KEY_ARTIFACT_PATH: 'Github.com',
+                c.KEY_FAIL_FAST: c.DEFAULT_FLAG_FAIL_FAST
             }
         }
         self.expected_error_msg = ""
@@ -83,7 +86,8 @@ class TestConfigChecker(unittest.TestCase):
                     c.KEY_DOCKER_REG:c.DEFAULT_DOCKER_REGISTRY,
                     c.KEY_DOCKER_IMG:'ubuntu:latest'
                 },
-                c.KEY_ARTIFACT_PATH: 'Github.com'
+                c.KEY_ARTIFACT_PATH: 'Github.com',
+                c.KEY_FAIL_FAST: c.DEFAULT_FLAG_FAIL_FAST
             }
         }
         expected_error_msg = "Pipeline: from file:. Error in section:global key not found error for subkey:pipeline_name\n"
@@ -94,6 +98,24 @@ class TestConfigChecker(unittest.TestCase):
         assert error_msg == expected_error_msg
         assert actual_dict == expected_dict
 
+    def test_check_global_section_fail_fast(self):
+        """ test the _check_global_section() with the fail_fast flag turned off
+        """
+        input_dict = {
+            c.KEY_GLOBAL: {
+                c.KEY_PIPE_NAME: 'test_pipeline',
+                c.KEY_DOCKER:{
+                    c.KEY_DOCKER_IMG:'ubuntu:latest'
+                },
+                c.KEY_ARTIFACT_PATH: 'Github.com',
+                c.KEY_FAIL_FAST: False
+            }
+        }
+        passed, _ = self.checker._check_global_section(
+            pipeline_config=input_dict, processed_config=self.actual_dict)
+        self.assertTrue(passed)
+        self.assertFalse(self.actual_dict[c.KEY_GLOBAL][c.KEY_FAIL_FAST])
+
 
 def test_check_stages_section():
     """ test the _check_stages_section() for only the fill in default
@@ -371,3 +393,166 @@ def test_check_jobs_section():
     assert passed
     assert error_msg == expected_error_msg
     assert actual_dict == expected_dict
+
+def test_check_job_changes():
+    """ test the _check_job_changes function, with paths alias and invalid values
+    """
+    checker = config.ConfigChecker()
+    processed = {}
+    passed, error_msg = checker._check_job_changes(
+        {c.JOB_SUBKEY_PATHS: ['services/api/**']}, processed)
+    assert passed and error_msg == ""
+    assert processed == {c.JOB_SUBKEY_CHANGES: ['services/api/**']}
+
+    processed = {}
+    passed, error_msg = checker._check_job_changes({}, processed)
+    assert passed and processed == {}
+
+    passed, error_msg = checker._check_job_changes(
+        {c.JOB_SUBKEY_CHANGES: 'services/**'}, {}, 'jobs:test ')
+    assert not passed
+    assert "jobs:test changes must be a list of non empty path globs" in error_msg
+
+    passed, error_msg = checker._check_job_changes(
+        {c.JOB_SUBKEY_CHANGES: ['a'], c.JOB_SUBKEY_PATHS: ['b']}, {})
+    assert not passed
+
+def test_check_job_resources():
+    """ test the _check_job_resources function, with memory units and invalid values
+    """
+    checker = config.ConfigChecker()
+    processed = {}
+    passed, error_msg = checker._check_job_resources(
+        {c.JOB_SUBKEY_RESOURCES: {c.RESOURCE_SUBKEY_CPUS: 2,
+                                  c.RESOURCE_SUBKEY_MEMORY: '512m'}}, processed)
+    assert passed and error_msg == ""
+    assert processed == {c.JOB_SUBKEY_RESOURCES: {c.RESOURCE_SUBKEY_CPUS: 2.0,
+                                                  c.RESOURCE_SUBKEY_MEMORY: 512 * 1024 ** 2}}
+
+    processed = {}
+    passed, _ = checker._check_job_resources(
+        {c.JOB_SUBKEY_RESOURCES: {c.RESOURCE_SUBKEY_MEMORY: '1.5GB'}}, processed)
+    assert passed
+    assert processed[c.JOB_SUBKEY_RESOURCES] == {c.RESOURCE_SUBKEY_MEMORY: 3 * 512 * 1024 ** 2}
+
+    processed = {}
+    passed, error_msg = checker._check_job_resources({}, processed)
+    assert passed and processed == {}
+
+    passed, error_msg = checker._check_job_resources(
+        {c.JOB_SUBKEY_RESOURCES: {c.RESOURCE_SUBKEY_CPUS: 0, c.RESOURCE_SUBKEY_MEMORY: '1k',
+                                  'gpus': 1}}, {}, 'jobs:test ')
+    assert not passed
+    assert "jobs:test resources cpus must be a positive number" in error_msg
+    assert "jobs:test resources memory must be a size of at least 6m" in error_msg
+    assert "jobs:test resources unknown key:gpus" in error_msg
+
+    passed, error_msg = checker._check_job_resources(
+        {c.JOB_SUBKEY_RESOURCES: '2 cpus'}, {}, 'jobs:test ')
+    assert not passed
+    assert "jobs:test resources must be a mapping" in error_msg
+
+def test_check_job_retry():
+    """ test the _check_job_retry function, with its defaults and invalid values
+    """
+    checker = config.ConfigChecker()
+    processed = {}
+    passed, error_msg = checker._check_job_retry(
+        {c.JOB_SUBKEY_RETRY: {c.RETRY_SUBKEY_MAX: 2,
+                              c.RETRY_SUBKEY_ON: [c.FAILURE_INFRA, 75, 75],
+                              c.RETRY_SUBKEY_BACKOFF: 1}}, processed)
+    assert passed and error_msg == ""
+    assert processed == {c.JOB_SUBKEY_RETRY: {c.RETRY_SUBKEY_MAX: 2,
+                                              c.RETRY_SUBKEY_ON: [c.FAILURE_INFRA, 75],
+                                              c.RETRY_SUBKEY_BACKOFF: 1.0}}
+
+    processed = {}
+    passed, _ = checker._check_job_retry({c.JOB_SUBKEY_RETRY: {c.RETRY_SUBKEY_MAX: 3}},
+                                         processed)
+    assert passed
+    assert processed[c.JOB_SUBKEY_RETRY] == {
+        c.RETRY_SUBKEY_MAX: 3, c.RETRY_SUBKEY_ON: c.DEFAULT_RETRY_ON,
+        c.RETRY_SUBKEY_BACKOFF: float(c.DEFAULT_RETRY_BACKOFF)}
+
+    passed, error_msg = checker._check_job_retry(
+        {c.JOB_SUBKEY_RETRY: {c.RETRY_SUBKEY_MAX: 0, c.RETRY_SUBKEY_ON: ['timeout', 0],
+                              c.RETRY_SUBKEY_BACKOFF: -1, 'delay': 1}}, {}, 'jobs:test ')
+    assert not passed
+    assert "jobs:test retry max must be a number of retries between 1 and 10" in error_msg
+    assert "jobs:test retry on must be a list of infra, timeout or exit codes" in error_msg
+    assert "jobs:test retry backoff must be a number of seconds" in error_msg
+    assert "jobs:test retry unknown key:delay" in error_msg
+
+    passed, error_msg = checker._check_job_retry({c.JOB_SUBKEY_RETRY: 3}, {}, 'jobs:test ')
+    assert not passed
+    assert "jobs:test retry must be a mapping" in error_msg
+
+def test_check_timeout():
+    """ test the _check_timeout function, with duration units and invalid values
+    """
+    checker = config.ConfigChecker()
+    for value, seconds in ((90, 90.0), ('90s', 90.0), ('1.5m', 90.0), ('2h', 7200.0)):
+        processed = {}
+        passed, error_msg = checker._check_timeout({c.KEY_TIMEOUT: value}, processed)
+        assert passed and error_msg == ""
+        assert processed == {c.KEY_TIMEOUT: seconds}
+
+    processed = {}
+    passed, _ = checker._check_timeout({}, processed)
+    assert passed and processed == {}
+
+    for value in (0, -5, '10d', True, [10]):
+        passed, error_msg = checker._check_timeout({c.KEY_TIMEOUT: value}, {}, 'jobs:test ')
+        assert not passed
+        assert "jobs:test timeout must be a positive duration" in error_msg
+
+def test_validate_config_incremental():
+    """ test only the jobs and stages affected by a change are checked again
+    """
+    checker = config.ConfigChecker()
+    pipeline_config = {
+        c.KEY_GLOBAL: {
+            c.KEY_PIPE_NAME: 'test_pipeline',
+            c.KEY_DOCKER: {c.KEY_DOCKER_IMG: 'ubuntu:latest'},
+        },
+        c.KEY_STAGES: ['build', 'test'],
+        c.KEY_JOBS: {
+            'checkout': {c.JOB_SUBKEY_STAGE: 'build', c.JOB_SUBKEY_SCRIPTS: ['ls']},
+            'compile': {c.JOB_SUBKEY_STAGE: 'build', c.JOB_SUBKEY_NEEDS: ['checkout'],
+                        c.JOB_SUBKEY_SCRIPTS: ['make']},
+            'unit': {c.JOB_SUBKEY_STAGE: 'test', c.JOB_SUBKEY_SCRIPTS: ['pytest']},
+        }
+    }
+    with patch.object(checker, '_check_single_job', wraps=checker._check_single_job) as job_check, \
+            patch.object(checker, '_check_jobs_dependencies',
+                         wraps=checker._check_jobs_dependencies) as stage_check:
+        first = checker.validate_config('test_pipeline', pipeline_config)
+        assert first.valid
+        assert (job_check.call_count, stage_check.call_count) == (3, 2)
+
+        # identical config, nothing is checked again, result can be modified safely
+        second = checker.validate_config('test_pipeline', copy.deepcopy(pipeline_config))
+        assert second.model_dump() == first.model_dump()
+        assert (job_check.call_count, stage_check.call_count) == (3, 2)
+        second.pipeline_config.jobs['unit'][c.JOB_SUBKEY_SCRIPTS].append('changed')
+
+        # one script changed, only this job checked again
+        pipeline_config[c.KEY_JOBS]['unit'][c.JOB_SUBKEY_SCRIPTS] = ['pytest -x']
+        third = checker.validate_config('test_pipeline', pipeline_config)
+        assert third.pipeline_config.jobs['unit'][c.JOB_SUBKEY_SCRIPTS] == ['pytest -x']
+        assert third.pipeline_config.jobs['compile'] == first.pipeline_config.jobs['compile']
+        assert (job_check.call_count, stage_check.call_count) == (4, 2)
+
+        # needs changed, the build stage is grouped and sorted again
+        del pipeline_config[c.KEY_JOBS]['compile'][c.JOB_SUBKEY_NEEDS]
+        checker.validate_config('test_pipeline', pipeline_config)
+        assert (job_check.call_count, stage_check.call_count) == (5, 3)
+
+        # global docker image is a default of every job
+        pipeline_config[c.KEY_GLOBAL][c.KEY_DOCKER][c.KEY_DOCKER_IMG] = 'alpine'
+        checker.validate_config('test_pipeline', pipeline_config)
+        assert (job_check.call_count, stage_check.call_count) == (8, 3)
+
+        # lines and columns error messages are never memoized
+        checker.validate_config('test_pipeline', pipeline_config, error_lc=True)
+        assert (job_check.call_count, stage_check.call_count) == (11, 5)
@@ -1,10 +1,16 @@
 """ test the ContainerManager and all subclass
 """
 import copy
+import io
+import os
+import subprocess
+import tarfile
+import tempfile
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from botocore.exceptions import ClientError
-from docker.errors import DockerException
+from docker.errors import APIError, DockerException, NotFound
 import util.constant as c
 from util.container import (DockerManager)
 from util.common_utils import (get_logger)
@@ -21,9 +27,13 @@ class MockContainer:
         self.args = args
         self.kwargs = kwargs
 
-    def wait(self) -> None:
+    def wait(self) -> dict:
         """ Mock the container.wait() method
+
+        Returns:
+            dict: exit status of the container
         """
+        return {c.DOCKER_STATUS_CODE: 0}
 
     def logs(self, *args, **kwargs) -> bytes:
         """ Mock the container.wait() method
@@ -34,14 +44,14 @@ class MockContainer:
         """
         return bytes(TEST_LOG, encoding='utf-8')
 
-    def remove(self) -> None:
+    def remove(self, **kwargs) -> None:
         """ Mock the container.remove method
 
         Returns:
             _type_: _description_
         """
 
-    def stop(self) -> None:
+    def stop(self, **kwargs) -> None:
         """ Mock the container.stop method
 
         Returns:
@@ -60,6 +70,14 @@ class MockContainer:
         return "", ""
 
 class MockFailContainer(MockContainer):
+    def wait(self) -> dict:
+        """ Mock the container.wait() method of a failed script
+
+        Returns:
+            dict: exit status of the container
+        """
+        return {c.DOCKER_STATUS_CODE: 127}
+
     def logs(self, *args, **kwargs) -> bytes:
         """ Mock the container.wait() method
         return a fake logs message
@@ -99,6 +117,9 @@ class MockContainersApi:
     def get(self, *args, **kwargs):
         return self.container(*args, **kwargs)
 
+    def list(self, *args, **kwargs):
+        return []
+
 class MockVolume:
     """ Fake Docker Volume"""
     def __init__(self, *args, **kwargs):
@@ -160,6 +181,8 @@ class TestDockerManager(unittest.TestCase):
         assert job_log[c.REPORT_KEY_JOBNAME] == test_job_name
         assert job_log[c.REPORT_KEY_JOBLOG] == TEST_LOG
         assert job_log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_SUCCESS
+        assert job_log['exit_code'] == 0
+        assert job_log['failure'] is None
 
     def test_docker_manager_run_job_failwithincontainer(self):
         """ test run_job method of docker manager using for case where 
@@ -172,6 +195,8 @@ class TestDockerManager(unittest.TestCase):
         assert job_log[c.REPORT_KEY_JOBNAME] == test_job_name
         assert job_log[c.REPORT_KEY_JOBLOG] == TEST_LOG_ERROR
         assert job_log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_FAILED
+        assert job_log['exit_code'] == 127
+        assert job_log['failure'] == c.FAILURE_SCRIPT
 
     def test_docker_manager_run_job_failwithdockerAPI(self):
         docker_manager = DockerManager(client=MockDockerApi(throw=True))
@@ -180,6 +205,7 @@ class TestDockerManager(unittest.TestCase):
         job_log = job_log.model_dump()
         assert job_log[c.REPORT_KEY_JOBNAME] == test_job_name
         assert job_log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_FAILED
+        assert job_log['failure'] == c.FAILURE_INFRA
 
     @patch("util.container.DockerManager._upload_artifact", return_value=(False, "error"))
     def test_docker_manager_run_job_withfail_artifact(self, mock_upload):
@@ -193,17 +219,57 @@ class TestDockerManager(unittest.TestCase):
         job_log = docker_manager.run_job(test_job_name, job_config_with_upload)
         job_log = job_log.model_dump()
         assert job_log[c.REPORT_KEY_JOBSTATUS] == c.STATUS_FAILED
+        assert job_log['failure'] == c.FAILURE_INFRA
 
-    def test_check_status_from_log(self):
-        """ test the check_status from log
+    def test_docker_manager_run_job_resources(self):
+        """ test the job resources are passed as docker container limits"""
+        docker_manager = DockerManager(client=MockDockerApi())
+        job_config = copy.deepcopy(self.sample_job_config)
+        job_config[c.JOB_SUBKEY_RESOURCES] = {
+            c.RESOURCE_SUBKEY_CPUS: 1.5,
+            c.RESOURCE_SUBKEY_MEMORY: 512 * 1024 ** 2
+        }
+        with patch.object(MockContainersApi, 'run', autospec=True,
+                          side_effect=lambda api, **kwargs: MockContainer(**kwargs)) as mock_run:
+            docker_manager.run_job("sample_job", job_config)
+            assert mock_run.call_args.kwargs['nano_cpus'] == 1_500_000_000
+            assert mock_run.call_args.kwargs['mem_limit'] == 512 * 1024 ** 2
+            docker_manager.run_job("sample_job", self.sample_job_config)
+            assert 'nano_cpus' not in mock_run.call_args.kwargs
+            assert 'mem_limit' not in mock_run.call_args.kwargs
+
+    def test_build_command(self):
+        """ test the job shell stop at the first failed script, exit with its exit code
+        and record the exit code of each script run
         """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            status_file = os.path.join(tmp_dir, 'status')
+            with patch.object(c, 'SCRIPT_STATUS_FILE', status_file):
+                command = DockerManager._build_command(
+                    ["echo 'it''s'", "cd / && exit 3", "echo never"])
+            assert command[:2] == ['sh', '-c']
+            result = subprocess.run(command, capture_output=True, text=True, check=False)
+            assert result.returncode == 3
+            assert result.stdout == "its\n"
+            with open(status_file, encoding='utf-8') as f:
+                assert f.read() == "0 0\n"
+
+    def test_get_script_results(self):
+        """ test the exit codes of the scripts are read from the status file """
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            content = b"0 0\n1 2\n"
+            info = tarfile.TarInfo(name='.cid-script-status')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        container = MagicMock()
+        container.get_archive.return_value = ([archive.getvalue()], {})
         docker_manager = DockerManager(client=MockDockerApi())
-        stderr = "sh: 1: poetry: not found"
-        assert docker_manager._check_status_from_log(stderr) == False
-        stderr = "sh: 0:"
-        assert docker_manager._check_status_from_log(stderr) == True
-        stderr = "sh: 0: \n sh: 1:"
-        assert docker_manager._check_status_from_log(stderr) == False
+        results = docker_manager._get_script_results(container, ['ls', 'make', 'echo'])
+        assert [(result.script, result.exit_code) for result in results] == [
+            ('ls', 0), ('make', 2)]
+        container.get_archive.side_effect = DockerException()
+        assert docker_manager._get_script_results(container, ['ls']) == []
 
     def test_upload_artifact_fail(self):
         """ test exception catching of _upload_artifact method
@@ -269,3 +335,112 @@ class TestDockerManager(unittest.TestCase):
         docker_manager = DockerManager(client=MockDockerApi())
         docker_manager.stop_job("sample_job")
         assert True
+
+    def test_volume_exists(self):
+        """ the volume of a resumed run is reused if still on the engine """
+        client = MagicMock()
+        docker_manager = DockerManager(client=client, repo="repo", branch="main",
+                                       pipeline="pipe", run="2")
+        assert docker_manager.volume_exists()
+        client.volumes.get.assert_called_once_with("repo-main-pipe-2")
+        assert docker_manager.docker_vol is client.volumes.get.return_value
+        client.volumes.get.side_effect = NotFound("no volume")
+        assert not docker_manager.volume_exists()
+
+    def test_remove_job(self):
+        """ the container left by a job is removed before the job run again """
+        client = MagicMock()
+        docker_manager = DockerManager(client=client, repo="repo", branch="main",
+                                       pipeline="pipe", run="2")
+        assert docker_manager.remove_job("build")
+        client.containers.get.assert_called_once_with("repo-main-pipe-2-build")
+        client.containers.get.return_value.remove.assert_called_once_with(force=True)
+        client.containers.get.side_effect = NotFound("no container")
+        assert not docker_manager.remove_job("build")
+
+    def test_run_job_labels_and_removal(self):
+        """ job containers are labeled, and removed even when docker fail """
+        client = MagicMock()
+        container = client.containers.run.return_value
+        container.wait.side_effect = DockerException("connection reset")
+        docker_manager = DockerManager(client=client, repo="repo", branch="main",
+                                       pipeline="pipe", run="2", run_id="id2")
+        job_config = copy.deepcopy(self.sample_job_config)
+        job_config[c.KEY_TIMEOUT] = 60.0
+        job_log = docker_manager.run_job("build", job_config)
+        assert job_log.failure == c.FAILURE_INFRA
+        container.remove.assert_called_once_with(force=True)
+        labels = client.containers.run.call_args.kwargs['labels']
+        assert labels[c.LABEL_MANAGED] == 'true'
+        assert labels[c.LABEL_RUN] == "repo-main-pipe-2"
+        assert labels[c.LABEL_JOB] == "build"
+        assert client.volumes.create.call_args.kwargs['labels'][c.LABEL_RUN_ID] == "id2"
+        assert int(labels[c.LABEL_DEADLINE]) - int(labels[c.LABEL_CREATED]) in (70, 71)
+
+    def test_stop_job_kill(self):
+        """ a container the engine fail to stop is killed """
+        client = MagicMock()
+        container = client.containers.get.return_value
+        container.stop.side_effect = APIError("stop failed")
+        container.logs.return_value = b"log"
+        docker_manager = DockerManager(client=client)
+        assert docker_manager.stop_job("build") == "log"
+        container.stop.assert_called_once_with(timeout=c.DEFAULT_STOP_TIMEOUT)
+        container.kill.assert_called_once()
+
+    def test_reap_orphans(self):
+        """ stopped containers and containers past their deadline are removed """
+        now = time.time()
+        old = now - c.ORPHAN_GRACE_SECONDS - 60
+
+        def fake_container(status: str, labels: dict, finished_at: str = ""):
+            container = MagicMock(status=status, labels=labels,
+                                  attrs={'State': {'FinishedAt': finished_at}})
+            container.name = f"{status}-{len(labels)}"
+            return container
+
+        finished_old = time.strftime("%Y-%m-%dT%H:%M:%S.123456789Z", time.gmtime(old))
+        finished_now = time.strftime("%Y-%m-%dT%H:%M:%S.123456789Z", time.gmtime(now))
+        orphans = [
+            fake_container('exited', {c.LABEL_CREATED: str(old)}, finished_old),
+            fake_container('running', {c.LABEL_CREATED: str(old), c.LABEL_DEADLINE: str(old)}),
+            fake_container('created', {c.LABEL_CREATED: str(old)}, "0001-01-01T00:00:00Z"),
+        ]
+        alive = [
+            fake_container('exited', {c.LABEL_CREATED: str(old)}, finished_now),
+            fake_container('running', {c.LABEL_CREATED: str(old)}),
+            fake_container('running', {c.LABEL_CREATED: str(old), c.LABEL_DEADLINE: str(now)}),
+            fake_container('created', {c.LABEL_CREATED: str(now)}, "0001-01-01T00:00:00Z"),
+        ]
+        client = MagicMock()
+        client.containers.list.return_value = orphans + alive
+        docker_manager = DockerManager(client=client)
+        assert docker_manager.reap_orphans() == 3
+        client.containers.list.assert_called_once_with(
+            all=True, filters={'label': c.LABEL_MANAGED})
+        for container in orphans:
+            container.remove.assert_called_once_with(force=True)
+        for container in alive:
+            container.remove.assert_not_called()
+
+    def test_run_job_name_conflict(self):
+        """ a container left with the job name by a crashed run is replaced """
+        client = MagicMock()
+        container = MagicMock()
+        container.wait.return_value = {c.DOCKER_STATUS_CODE: 0}
+        container.logs.return_value = b"done"
+        conflict = APIError("Conflict", response=MagicMock(status_code=c.HTTP_CONFLICT))
+        client.containers.run.side_effect = [conflict, container]
+        docker_manager = DockerManager(client=client, repo="repo", branch="main",
+                                       pipeline="pipe", run="2")
+        job_log = docker_manager.run_job("build", copy.deepcopy(self.sample_job_config))
+        assert job_log.job_status == c.STATUS_SUCCESS
+        client.containers.get.assert_called_once_with("repo-main-pipe-2-build")
+        client.containers.get.return_value.remove.assert_called_once_with(force=True)
+        assert client.containers.run.call_count == 2
+        # the run volume is labeled as the job containers
+        labels = client.volumes.create.call_args.kwargs['labels']
+        assert labels[c.LABEL_RUN] == "repo-main-pipe-2"
+        assert labels[c.LABEL_PIPELINE] == "pipe"
+        assert c.LABEL_JOB not in labels
+
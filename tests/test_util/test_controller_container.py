@@ -46,7 +46,7 @@ def load_pipeline() -> ValidationResult:
 #         }
 #     repo_data = SessionDetail.model_validate(sample_session)
 #     pipeline_config = PipelineConfig.model_validate(load_pipeline()[c.KEY_PIPE_CONFIG])
-#     controller._actual_pipeline_run(repo_data, pipeline_config)
+#     controller.scheduler.run(repo_data, pipeline_config)
 
 # Preparing data for mock return
 pipeline_config = load_pipeline().pipeline_config
@@ -58,9 +58,13 @@ class MockContainer:
         self.args = args
         self.kwargs = kwargs
 
-    def wait(self) -> None:
+    def wait(self) -> dict:
         """ Mock the container.wait() method
+
+        Returns:
+            dict: exit status of the container
         """
+        return {c.DOCKER_STATUS_CODE: 0}
 
     def logs(self, *args, **kwargs) -> bytes:
         """ Mock the container.wait() method
@@ -71,14 +75,14 @@ class MockContainer:
         """
         return bytes(TEST_LOG, encoding='utf-8')
 
-    def remove(self) -> None:
+    def remove(self, **kwargs) -> None:
         """ Mock the container.remove method
 
         Returns:
             _type_: _description_
         """
 
-    def stop(self) -> None:
+    def stop(self, **kwargs) -> None:
         """ Mock the container.stop method
 
         Returns:
@@ -96,6 +100,14 @@ class MockContainer:
         """
 
 class MockFailContainer(MockContainer):
+    def wait(self) -> dict:
+        """ Mock the container.wait() method of a failed script
+
+        Returns:
+            dict: exit status of the container
+        """
+        return {c.DOCKER_STATUS_CODE: 127}
+
     def logs(self, *args, **kwargs) -> bytes:
         """ Mock the container.wait() method
         return a fake logs message
@@ -135,6 +147,9 @@ class MockContainersApi:
     def get(self, *args, **kwargs):
         return self.container(*args, **kwargs)
 
+    def list(self, *args, **kwargs):
+        return []
+
 class MockVolume:
     """ Fake Docker Volume"""
     def __init__(self, *args, **kwargs):
@@ -201,7 +216,7 @@ class TestRunJob(unittest.TestCase):
         controller = Controller()
         repo_data = SessionDetail.model_validate(self.sample_session)
         pipeline_config = PipelineConfig.model_validate(self.pipeline_config)
-        status, _ = controller._actual_pipeline_run(repo_data, pipeline_config, True)
+        status, _ = controller.scheduler.run(repo_data, pipeline_config, True)
         assert status == False
 
     @patch("controller.controller.MongoAdapter.get_pipeline_history")
@@ -215,13 +230,13 @@ class TestRunJob(unittest.TestCase):
         controller = Controller()
         repo_data = SessionDetail.model_validate(self.sample_session)
         pipeline_config = PipelineConfig.model_validate(self.pipeline_config)
-        status, _ = controller._actual_pipeline_run(repo_data, pipeline_config)
+        status, _ = controller.scheduler.run(repo_data, pipeline_config)
         assert status == False
 
     @patch("controller.controller.MongoAdapter.update_job")
-    @patch("controller.controller.MongoAdapter.update_job_logs")
-    @patch("controller.controller.DockerManager._upload_artifact")
-    @patch("controller.controller.DockerManager", return_value=DockerManager(client=MockDockerApi(success=False)))
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch("util.container.DockerManager._upload_artifact")
+    @patch("util.container.DockerManager", return_value=DockerManager(client=MockDockerApi(success=False)))
     @patch("controller.controller.MongoAdapter.update_pipeline_info", return_value=True)
     @patch("controller.controller.MongoAdapter.insert_job", return_value=123)
     @patch("controller.controller.MongoAdapter.get_pipeline_history")
@@ -232,7 +247,7 @@ class TestRunJob(unittest.TestCase):
             mock_update_pl_info,
             mock_docker_manager,
             mock_upload_artifact,
-            mock_update_job_logs,
+            mock_writer,
             mock_update_job,
         ):
         """ Test the case where running job but failed due to upload_artifact
@@ -243,7 +258,7 @@ class TestRunJob(unittest.TestCase):
             mock_update_pl_info (MagicMock): mock update_pipeline_info
             mock_docker_manager (MagicMock): mock DockerManager constructor
             mock_upload_artifact (MagicMock): mock _upload_artifact method
-            mock_update_job_logs (MagicMock): mock update_job_logs method
+            mock_writer (MagicMock): mock RunStateWriter constructor
             mock_update_job (MagicMock): mock_update_job method
         """
         mock_history = copy.deepcopy(self.mock_running_pipeline_history)
@@ -253,13 +268,13 @@ class TestRunJob(unittest.TestCase):
         controller = Controller()
         repo_data = SessionDetail.model_validate(self.sample_session)
         pipeline_config = PipelineConfig.model_validate(self.pipeline_config)
-        pipeline_status, _ = controller._actual_pipeline_run(repo_data, pipeline_config)
+        pipeline_status, _ = controller.scheduler.run(repo_data, pipeline_config)
         assert pipeline_status == False
 
     @patch("controller.controller.MongoAdapter.update_job")
-    @patch("controller.controller.MongoAdapter.update_job_logs")
-    @patch("util.container.DockerManager.run_job", side_effect=KeyboardInterrupt)
-    @patch("controller.controller.DockerManager", return_value=DockerManager(client=MockDockerApi()))
+    @patch("controller.pipeline_run.RunStateWriter")
+    @patch.object(DockerManager, "run_job", side_effect=KeyboardInterrupt)
+    @patch("util.container.DockerManager", return_value=DockerManager(client=MockDockerApi()))
     @patch("controller.controller.MongoAdapter.update_pipeline_info", return_value=True)
     @patch("controller.controller.MongoAdapter.insert_job", return_value=123)
     @patch("controller.controller.MongoAdapter.get_pipeline_history")
@@ -270,7 +285,7 @@ class TestRunJob(unittest.TestCase):
             mock_update_pl_info,
             mock_docker_manager,
             mock_run,
-            mock_update_job_logs,
+            mock_writer,
             mock_update_job,
         ):
         """ Test the case where running job but interrupted when running job
@@ -281,7 +296,7 @@ class TestRunJob(unittest.TestCase):
             mock_update_pl_info (MagicMock): mock update_pipeline_info
             mock_docker_manager (MagicMock): mock DockerManager constructor
             mock_run (MagicMock): mock DockerManager.run_job, will throw KeyboardInterrupt
-            mock_update_job_logs (MagicMock): mock update_job_logs method
+            mock_writer (MagicMock): mock RunStateWriter constructor
             mock_update_job (MagicMock): mock_update_job method
         """
         try:
@@ -292,7 +307,7 @@ class TestRunJob(unittest.TestCase):
             controller = Controller()
             repo_data = SessionDetail.model_validate(self.sample_session)
             pipeline_config = PipelineConfig.model_validate(self.pipeline_config)
-            pipeline_status, _ = controller._actual_pipeline_run(repo_data, pipeline_config)
+            pipeline_status, _ = controller.scheduler.run(repo_data, pipeline_config)
             assert False
         except KeyboardInterrupt:
             assert True
\ No newline at end of file
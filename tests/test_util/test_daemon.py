@@ -0,0 +1,85 @@
+""" Test for the DaemonServer and DaemonClient
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from util.daemon import (DaemonClient, DaemonServer)
+from util.common_utils import get_logger
+import util.constant as c
+
+logger = get_logger("tests.test_util.test_daemon")
+
+
+def echo_handler(argv: list) -> int:
+    """ Command handler writing its context to stdout, exit with 3 for 'fail' """
+    os.write(1, json.dumps({'argv': argv, 'cwd': os.getcwd(),
+                            'env': os.environ.get('CID_TEST_VALUE')}).encode('utf-8'))
+    if argv == ['fail']:
+        sys.exit(3)
+    return 0
+
+
+class TestDaemon(unittest.TestCase):
+    """ Test the daemon serving commands in forked children """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, 'cid.sock')
+        self.server = DaemonServer(echo_handler, socket_path=self.socket_path)
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = DaemonClient(self.socket_path)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(timeout=5)
+        self.tmp.cleanup()
+
+    def _run(self, argv: list) -> tuple[int, dict]:
+        with tempfile.TemporaryFile() as out:
+            exit_code = self.client.run(argv, fds=(0, out.fileno(), out.fileno()))
+            out.seek(0)
+            return exit_code, json.loads(out.read())
+
+    def test_run_in_client_context(self):
+        """ command run with the arguments, directory and environment of the client """
+        with patch.dict(os.environ, {'CID_TEST_VALUE': 'from-client'}):
+            exit_code, output = self._run(['config', '--check'])
+        assert exit_code == 0
+        assert output == {'argv': ['config', '--check'], 'cwd': os.getcwd(),
+                          'env': 'from-client'}
+
+    def test_run_exit_code(self):
+        """ exit code of the command is returned to the client """
+        exit_code, _ = self._run(['fail'])
+        assert exit_code == 3
+
+    def test_status_and_stop(self):
+        """ status report the served commands, stop remove the socket """
+        self._run([])
+        status = self.client.request(c.DAEMON_ACTION_STATUS)
+        assert status[c.DAEMON_FIELD_PID] == os.getpid()
+        assert status[c.DAEMON_FIELD_SERVED] == 1
+        assert self.client.request(c.DAEMON_ACTION_STOP) is not None
+        self.thread.join(timeout=5)
+        assert not self.thread.is_alive()
+        assert not os.path.exists(self.socket_path)
+        assert self.client.run([]) is None
+
+    def test_already_running(self):
+        """ second daemon on the same socket is refused """
+        with self.assertRaises(RuntimeError):
+            DaemonServer(echo_handler, socket_path=self.socket_path).bind()
+
+
+def test_client_without_daemon(tmp_path):
+    """ no daemon or disabled daemon let the caller run the command itself """
+    assert DaemonClient(str(tmp_path / 'missing.sock')).run(['--help']) is None
+    assert DaemonClient('').request(c.DAEMON_ACTION_STATUS) is None
+    with patch.dict(os.environ, {c.ENV_DAEMON_SOCKET: ''}):
+        assert DaemonClient().socket_path is None
@@ -7,7 +7,7 @@ from pymongo import (errors)
 import unittest
 from unittest.mock import patch
 import util.constant as c
-from util.db_mongo import MongoAdapter
+from util.db_mongo import (MongoAdapter, RunStateWriter)
 from util.common_utils import get_logger
 from util.model import (PipelineInfo, RepoConfig, SessionDetail)
 logger = get_logger("tests.test_util.test_db_mongo")
@@ -75,7 +75,7 @@ class TestMongoDB(unittest.TestCase):
             c.FIELD_PIPELINE_CONFIG:self.pipeline_config
         }
     
-    @patch("util.db_mongo.MongoClient", return_value=_mock_mongo)
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
     def test_pipeline_crud(self, mock_client):
         """ test crud operation with pipeline
 
@@ -88,7 +88,7 @@ class TestMongoDB(unittest.TestCase):
             self.repo_config_data)
         assert status == True
 
-    @patch("util.db_mongo.MongoClient", return_value=_mock_mongo)
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
     def test_job_crud(self, mock_client):
         """ Test CRUD operation with job
         Args:
@@ -113,6 +113,8 @@ class TestMongoDB(unittest.TestCase):
             his_object, self.pipeline_config)
         search_result = mongo_adapter.get_job(result_id)
         assert search_result[c.FIELD_PIPELINE_CONFIG_USED] == self.pipeline_config
+        assert search_result[c.FIELD_STATUS] is None
+        assert search_result[c.FIELD_HEARTBEAT] > 0
 
         # Test update
         updated_history = copy.deepcopy(search_result)
@@ -125,7 +127,7 @@ class TestMongoDB(unittest.TestCase):
     @patch("util.db_mongo.MongoAdapter._update", side_effect=errors.PyMongoError())
     @patch("util.db_mongo.MongoAdapter._retrieve", side_effect=errors.PyMongoError())
     @patch("util.db_mongo.MongoAdapter._insert", side_effect=errors.PyMongoError())
-    @patch("util.db_mongo.MongoClient", return_value=_mock_mongo)
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
     def test_job_crud_exception(self, mock_client, insert, get, update, delete):
         """ Test exception catching of crud operation with job
 
@@ -158,7 +160,7 @@ class TestMongoDB(unittest.TestCase):
         assert update_result == False
         pass
 
-    @patch("util.db_mongo.MongoClient", return_value=_mock_mongo)
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
     def test_update_with_query(self, mock_client):
         """ Test update and retrieve by query method
 
@@ -191,7 +193,7 @@ class TestMongoDB(unittest.TestCase):
         retrieved_data.pop(c.FIELD_ID)
         assert retrieved_data == updated_data
 
-    @patch("util.db_mongo.MongoClient", return_value=_mock_mongo)
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
     def test_update_pipeline_config(self, mock_client):
         """Test updating pipeline config with success, failure, and exception cases."""
         mongo_adapter = MongoAdapter()
@@ -239,3 +241,209 @@ class TestMongoDB(unittest.TestCase):
             updates={c.FIELD_PIPELINE_CONFIG:pipeline_config}
         )
         assert result is False
+
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
+    def test_get_last_successful_commit(self, mock_client):
+        """ Test retrieving the commit of the latest successful run
+
+        Args:
+            mock_client (mongomock.MongoClient): mock mongo_db
+        """
+        mongo_adapter = MongoAdapter()
+        job_ids = []
+        for run_number, status in [(1, c.STATUS_SUCCESS), (2, c.STATUS_SUCCESS),
+                                   (3, c.STATUS_FAILED)]:
+            job_ids.append(mongo_adapter._insert(
+                {c.FIELD_RUN_NUMBER: run_number, c.FIELD_STATUS: status,
+                 c.FIELD_GIT_COMMIT_HASH: f"commit{run_number}"},
+                c.MONGO_DB_NAME, c.MONGO_JOBS_TABLE))
+        assert mongo_adapter.get_last_successful_commit(job_ids) == "commit2"
+        assert mongo_adapter.get_last_successful_commit(job_ids[2:]) is None
+        assert mongo_adapter.get_last_successful_commit([]) is None
+
+        mock_client.side_effect = errors.PyMongoError("Database error")
+        assert mongo_adapter.get_last_successful_commit(job_ids) is None
+
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
+    def test_update_pipelines_info(self, mock_client):
+        """ Test saving several pipelines of a repository in a single write
+
+        Args:
+            mock_client (mongomock.MongoClient): mock mongo_db
+        """
+        mongo_adapter = MongoAdapter()
+        second_info = copy.deepcopy(self.pipeline_info)
+        second_info[c.FIELD_PIPELINE_NAME] = "second_pipeline"
+        with patch.object(mongo_adapter, "_update_by_query",
+                          wraps=mongo_adapter._update_by_query) as mock_update:
+            result = mongo_adapter.update_pipelines_info(
+                repo_name="bulk_repo",
+                repo_url="https://github.com/test/bulk_repo",
+                branch=c.DEFAULT_BRANCH,
+                pipelines={"test_pipeline": self.pipeline_info,
+                           "second_pipeline": second_info}
+            )
+        assert result is True
+        mock_update.assert_called_once()
+        stored_data = mongo_adapter._retrieve_by_query(
+            {c.FIELD_REPO_NAME: "bulk_repo"}, c.MONGO_DB_NAME, c.MONGO_PIPELINES_TABLE)
+        assert set(stored_data[c.FIELD_PIPELINES]) == {"test_pipeline", "second_pipeline"}
+        assert stored_data[c.FIELD_PIPELINES]["second_pipeline"][c.FIELD_PIPELINE_NAME] \
+            == "second_pipeline"
+
+        # a new pipeline must carry a complete pipeline info
+        result = mongo_adapter.update_pipelines_info(
+            repo_name="bulk_repo",
+            repo_url="https://github.com/test/bulk_repo",
+            branch=c.DEFAULT_BRANCH,
+            pipelines={"test_pipeline": {c.FIELD_PIPELINE_FILE_NAME: "renamed.yml"},
+                       "third_pipeline": {c.FIELD_PIPELINE_FILE_NAME: "third.yml"}}
+        )
+        assert result is False
+
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=mongomock.MongoClient())
+    def test_job_queue_leases(self, mock_client):
+        """ test queued runs are claimed once in order, and an expired lease is claimed again
+        """
+        mongo_adapter = MongoAdapter()
+        first_id = mongo_adapter.enqueue_run({c.FIELD_JOB_ID: "job1"})
+        second_id = mongo_adapter.enqueue_run({c.FIELD_JOB_ID: "job2"})
+        assert first_id and second_id
+
+        first = mongo_adapter.claim_queued_run("runner1", lease_seconds=60)
+        second = mongo_adapter.claim_queued_run("runner2", lease_seconds=-1)
+        assert (first[c.FIELD_JOB_ID], first[c.FIELD_LEASE_OWNER]) == ("job1", "runner1")
+        assert (second[c.FIELD_JOB_ID], second[c.FIELD_ATTEMPTS]) == ("job2", 1)
+        assert mongo_adapter.renew_lease(first[c.FIELD_ID], "runner1") is True
+        assert mongo_adapter.renew_lease(first[c.FIELD_ID], "runner2") is False
+
+        # runner2 stopped renewing, its expired run is claimed again
+        reclaimed = mongo_adapter.claim_queued_run("runner3")
+        assert (reclaimed[c.FIELD_JOB_ID], reclaimed[c.FIELD_ATTEMPTS]) == ("job2", 2)
+        assert mongo_adapter.claim_queued_run("runner3") is None
+        assert mongo_adapter.complete_queued_run(second[c.FIELD_ID], "runner2") is False
+        assert mongo_adapter.complete_queued_run(second[c.FIELD_ID], "runner3") is True
+        assert mongo_adapter.complete_queued_run(first[c.FIELD_ID], "runner1") is True
+        assert mongo_adapter.claim_queued_run("runner1") is None
+
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=_mock_mongo)
+    def test_update_existing_pipelines(self, mock_client):
+        """ Test the fields of existing pipelines are updated without reading the record
+
+        Args:
+            mock_client (mongomock.MongoClient): mock mongo_db
+        """
+        mongo_adapter = MongoAdapter()
+        assert mongo_adapter.update_pipeline_info(
+            "flag_repo", "flag_url", c.DEFAULT_BRANCH, "test_pipeline", self.pipeline_info)
+        with patch.object(mongo_adapter, "_retrieve_by_query") as mock_retrieve:
+            assert mongo_adapter.update_pipeline_info(
+                "flag_repo", "flag_url", c.DEFAULT_BRANCH, "test_pipeline",
+                {c.FIELD_RUNNING: True})
+        mock_retrieve.assert_not_called()
+        stored_data = mongo_adapter._retrieve_by_query(
+            {c.FIELD_REPO_NAME: "flag_repo"}, c.MONGO_DB_NAME, c.MONGO_PIPELINES_TABLE)
+        assert stored_data[c.FIELD_PIPELINES]["test_pipeline"][c.FIELD_RUNNING] is True
+
+
+    @patch("util.db_mongo.pymongo.MongoClient", return_value=mongomock.MongoClient())
+    def test_get_pipeline_name(self, mock_client):
+        """ Test the pipeline recorded for a configuration file is found
+
+        Args:
+            mock_client (mongomock.MongoClient): mock mongo_db
+        """
+        mongo_adapter = MongoAdapter()
+        assert mongo_adapter.update_pipeline_info(
+            "name_repo", "name_url", c.DEFAULT_BRANCH, "test_pipeline", self.pipeline_info)
+        assert mongo_adapter.get_pipeline_name(
+            "name_repo", "name_url", c.DEFAULT_BRANCH, "test_pipeline.yml") == "test_pipeline"
+        assert mongo_adapter.get_pipeline_name(
+            "name_repo", "name_url", c.DEFAULT_BRANCH, "other.yml") is None
+        assert mongo_adapter.get_pipeline_name(
+            "other_repo", "name_url", c.DEFAULT_BRANCH, "test_pipeline.yml") is None
+
+class TestRunStateWriter(unittest.TestCase):
+    """ Test the write-behind buffer of the run state """
+
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        patcher = patch("util.db_mongo.pymongo.MongoClient", return_value=self.mongo_client)
+        self.mock_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.jobs = self.mongo_client[c.MONGO_DB_NAME][c.MONGO_JOBS_TABLE]
+        self.job_id = str(self.jobs.insert_one({
+            c.FIELD_STATUS: None,
+            c.FIELD_LOGS: [{c.FIELD_STAGE_NAME: stage, c.FIELD_STAGE_STATUS: c.STATUS_PENDING,
+                            c.FIELD_JOBS: []} for stage in ("build", "test")]
+        }).inserted_id)
+        self.writer = RunStateWriter(MongoAdapter(), flush_interval=60)
+        self.addCleanup(self.writer.close)
+
+    def _get_job(self) -> dict:
+        return self.jobs.find_one()
+
+    def test_write_at_stage_boundary(self):
+        """ changes are buffered until a stage completes, then written at once """
+        assert self.writer.update_job(self.job_id, {c.FIELD_DOCKER_HOST: "host1"})
+        assert c.FIELD_DOCKER_HOST not in self._get_job()
+        stage_time = {c.FIELD_START_TIME: "start", c.FIELD_COMPLETION_TIME: "end"}
+        with patch.object(mongomock.collection.Collection, "update_one",
+                          autospec=True, side_effect=mongomock.collection.Collection.update_one
+                          ) as mock_update:
+            assert self.writer.update_job_logs(self.job_id, "test", c.STATUS_SUCCESS,
+                                               {"pytest": {}}, stage_time)
+            assert self.writer.update_job_logs(self.job_id, "build", c.STATUS_SUCCESS,
+                                               {"compile": {}})
+        assert mock_update.call_count == 2
+        job = self._get_job()
+        assert job[c.FIELD_DOCKER_HOST] == "host1"
+        assert job[c.FIELD_LOGS][1][c.FIELD_JOBS] == {"pytest": {}}
+        assert job[c.FIELD_LOGS][1][c.FIELD_COMPLETION_TIME] == "end"
+        assert job[c.FIELD_LOGS][0][c.FIELD_STAGE_STATUS] == c.STATUS_SUCCESS
+        # a stage not initialized with the job is not recorded
+        assert not self.writer.update_job_logs(self.job_id, "deploy", c.STATUS_SUCCESS, {})
+
+    def test_close_flush_durable(self):
+        """ closing the writer write the buffered changes and wait for the journal """
+        self.writer.update_job(self.job_id, {c.FIELD_STATUS: c.STATUS_RUNNING})
+        self.writer.update_job(self.job_id, {c.FIELD_STATUS: c.STATUS_SUCCESS})
+        with patch.object(mongomock.collection.Collection, "with_options", autospec=True,
+                          side_effect=mongomock.collection.Collection.with_options
+                          ) as mock_options:
+            assert self.writer.close()
+        assert mock_options.call_args.kwargs["write_concern"].document == {"w": 1, "j": True}
+        assert self._get_job()[c.FIELD_STATUS] == c.STATUS_SUCCESS
+
+    def test_flush_when_full(self):
+        """ too many buffered fields are written without waiting for the timer """
+        writer = RunStateWriter(MongoAdapter(), flush_interval=60, max_pending=2)
+        self.addCleanup(writer.close)
+        writer.update_job(self.job_id, {c.FIELD_STATUS: c.STATUS_RUNNING})
+        assert self._get_job()[c.FIELD_STATUS] is None
+        writer.update_job(self.job_id, {c.FIELD_DOCKER_HOST: "host1"})
+        assert self._get_job()[c.FIELD_STATUS] == c.STATUS_RUNNING
+
+    def test_bulk_write_several_documents(self):
+        """ the changes of several documents of a collection are a single request """
+        other_id = str(self.jobs.insert_one({c.FIELD_STATUS: None}).inserted_id)
+        self.writer.update_job(self.job_id, {c.FIELD_STATUS: c.STATUS_SUCCESS})
+        self.writer.update_job(other_id, {c.FIELD_STATUS: c.STATUS_FAILED})
+        with patch.object(mongomock.collection.Collection, "bulk_write") as mock_bulk:
+            assert self.writer.flush()
+        requests = mock_bulk.call_args.args[0]
+        assert len(requests) == 2
+        assert requests[1]._doc == {"$set": {c.FIELD_STATUS: c.STATUS_FAILED}}
+
+    def test_failed_flush_kept(self):
+        """ changes failing to be written are kept, behind the newer changes """
+        self.writer.update_job(self.job_id, {c.FIELD_STATUS: c.STATUS_RUNNING,
+                                             c.FIELD_DOCKER_HOST: "host1"})
+        with patch.object(mongomock.collection.Collection, "update_one",
+                          side_effect=errors.AutoReconnect("down")):
+            assert not self.writer.flush()
+        self.writer.update_job(self.job_id, {c.FIELD_STATUS: c.STATUS_SUCCESS})
+        assert self.writer.close()
+        job = self._get_job()
+        assert job[c.FIELD_STATUS] == c.STATUS_SUCCESS
+        assert job[c.FIELD_DOCKER_HOST] == "host1"
@@ -0,0 +1,137 @@
+""" Test the DockerGarbageCollector with fake docker clients
+"""
+import time
+import unittest
+from unittest.mock import MagicMock
+from docker.errors import APIError
+from util.docker_gc import (DockerGarbageCollector, parse_docker_time)
+from util.common_utils import get_logger
+import util.constant as c
+
+logger = get_logger("tests.test_util.test_docker_gc")
+
+DAY = 24 * 3600
+
+
+def docker_time(epoch: float) -> str:
+    """ Format an epoch time as the docker engine does """
+    return time.strftime("%Y-%m-%dT%H:%M:%S.123456789Z", time.gmtime(epoch))
+
+
+def fake_volume(name: str, created: float = None, run_id: str = None) -> MagicMock:
+    """ Fake run volume, labeled with its creation time and run id if given """
+    labels = {c.LABEL_MANAGED: 'true'}
+    if created is not None:
+        labels[c.LABEL_CREATED] = str(int(created))
+    if run_id is not None:
+        labels[c.LABEL_RUN_ID] = run_id
+    volume = MagicMock(attrs={'Labels': labels})
+    volume.name = name
+    return volume
+
+
+def df_volume(name: str, created: float, size: int, ref_count: int = 0,
+              run_id: str = None) -> dict:
+    """ Volume as reported by the disk usage of the engine """
+    labels = {c.LABEL_MANAGED: 'true', c.LABEL_CREATED: str(int(created))}
+    if run_id is not None:
+        labels[c.LABEL_RUN_ID] = run_id
+    return {'Name': name, 'Labels': labels,
+            c.DOCKER_DF_USAGE: {c.DOCKER_DF_SIZE: size, c.DOCKER_DF_REF_COUNT: ref_count}}
+
+
+class TestDockerGarbageCollector(unittest.TestCase):
+    """ Test the removal of the stale containers, volumes and images """
+
+    def setUp(self):
+        self.now = time.time()
+        self.client = MagicMock()
+        self.client.containers.list.return_value = []
+        self.client.volumes.list.return_value = []
+        self.client.images.list.return_value = []
+
+    def test_parse_docker_time(self):
+        """ the times of the engine are read as UTC """
+        assert parse_docker_time("1970-01-02T00:00:00.123456789Z") == DAY
+        assert parse_docker_time("") is None
+        assert parse_docker_time(None) is None
+
+    def test_collect_by_age(self):
+        """ volumes and dangling images older than the maximum age are removed """
+        old_volume = fake_volume("repo-main-pipe-1", self.now - 2 * DAY)
+        used_volume = fake_volume("repo-main-pipe-2", self.now - 2 * DAY)
+        used_volume.remove.side_effect = APIError("volume is in use")
+        recent_volume = fake_volume("repo-main-pipe-3", self.now - 60)
+        unlabeled_volume = fake_volume("repo-main-pipe-0")
+        self.client.volumes.list.return_value = [old_volume, used_volume,
+                                                 recent_volume, unlabeled_volume]
+        old_image = MagicMock(id="sha256:old", attrs={
+            'Created': docker_time(self.now - 2 * DAY), c.DOCKER_DF_SIZE: 1000})
+        recent_image = MagicMock(id="sha256:recent", attrs={
+            'Created': docker_time(self.now - 60), c.DOCKER_DF_SIZE: 2000})
+        self.client.images.list.return_value = [old_image, recent_image]
+
+        report = DockerGarbageCollector(self.client, max_age=DAY).collect()
+        assert report.volumes == ["repo-main-pipe-1"]
+        assert report.images == ["sha256:old"]
+        assert report.reclaimed == 1000
+        old_volume.remove.assert_called_once()
+        recent_volume.remove.assert_not_called()
+        unlabeled_volume.remove.assert_not_called()
+        self.client.images.remove.assert_called_once_with("sha256:old")
+        self.client.volumes.list.assert_called_once_with(filters={'label': c.LABEL_MANAGED})
+        self.client.images.list.assert_called_once_with(filters={'dangling': True})
+        self.client.df.assert_not_called()
+
+    def test_collect_disk_budget(self):
+        """ the oldest unused volumes are removed until the engine fits in the budget """
+        self.client.df.return_value = {
+            c.DOCKER_DF_LAYERS_SIZE: 400,
+            c.DOCKER_DF_CONTAINERS: [{c.DOCKER_DF_SIZE_RW: 100}],
+            c.DOCKER_DF_VOLUMES: [
+                df_volume("newest", self.now - 60, 300),
+                df_volume("oldest", self.now - 300, 300),
+                df_volume("in-use", self.now - 600, 300, ref_count=1),
+                df_volume("middle", self.now - 120, 300),
+                {'Name': "foreign", 'Labels': None,
+                 c.DOCKER_DF_USAGE: {c.DOCKER_DF_SIZE: 300, c.DOCKER_DF_REF_COUNT: 0}},
+            ]
+        }
+        report = DockerGarbageCollector(self.client, disk_budget=1500).collect()
+        # 2000 used, the two oldest unused cid volumes fit the engine in 1500
+        assert report.volumes == ["oldest", "middle"]
+        assert report.reclaimed == 600
+        assert [call.args[0] for call in self.client.volumes.get.call_args_list] == [
+            "oldest", "middle"]
+
+    def test_collect_keeps_runs_in_flight(self):
+        """ the volume of a run in flight is kept, over the budget and the max age,
+        while no container uses it between two jobs """
+        in_flight = fake_volume("repo-main-pipe-1", self.now - 2 * DAY, run_id="job1")
+        finished = fake_volume("repo-main-pipe-2", self.now - 2 * DAY, run_id="job2")
+        self.client.volumes.list.return_value = [in_flight, finished]
+        self.client.df.return_value = {c.DOCKER_DF_VOLUMES: [
+            df_volume("repo-main-pipe-1", self.now - 2 * DAY, 300, run_id="job1"),
+            df_volume("repo-main-pipe-3", self.now - 60, 300, run_id="job3"),
+            df_volume("repo-main-pipe-4", self.now - 30, 300, run_id="job4")]}
+        active = {"job1", "job3"}
+        report = DockerGarbageCollector(self.client, max_age=DAY, disk_budget=0,
+                                        is_active=lambda run_id, max_age: run_id in active
+                                        ).collect()
+        assert report.volumes == ["repo-main-pipe-2", "repo-main-pipe-4"]
+        in_flight.remove.assert_not_called()
+        finished.remove.assert_called_once()
+        assert [call.args[0] for call in self.client.volumes.get.call_args_list] == [
+            "repo-main-pipe-4"]
+
+    def test_dry_run(self):
+        """ a dry run report the stale resources without removing them """
+        old_volume = fake_volume("repo-main-pipe-1", self.now - 2 * DAY)
+        self.client.volumes.list.return_value = [old_volume]
+        self.client.df.return_value = {c.DOCKER_DF_VOLUMES: [
+            df_volume("repo-main-pipe-1", self.now - 2 * DAY, 300),
+            df_volume("repo-main-pipe-2", self.now - 60, 300)]}
+        report = DockerGarbageCollector(self.client, disk_budget=0, dry_run=True).collect()
+        assert report.volumes == ["repo-main-pipe-1", "repo-main-pipe-2"]
+        old_volume.remove.assert_not_called()
+        self.client.volumes.get.assert_not_called()
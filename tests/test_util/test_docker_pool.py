@@ -0,0 +1,77 @@
+""" Test the DockerHostPool with fake docker clients
+"""
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+import docker
+from util.docker_pool import (DockerHostPool)
+from util.common_utils import get_logger
+import util.constant as c
+
+logger = get_logger("tests.test_util.test_docker_pool")
+
+
+def fake_client(cpus: int = 2, memory: int = 2 * 1024**3) -> MagicMock:
+    """ Fake DockerClient reporting its cpus and memory """
+    client = MagicMock()
+    client.info.return_value = {c.DOCKER_INFO_CPUS: cpus, c.DOCKER_INFO_MEMORY: memory}
+    return client
+
+
+class TestDockerHostPool(unittest.TestCase):
+    """ Test the sizing of the hosts and the placement of the runs """
+
+    def test_from_clients_size_hosts(self):
+        """ each host is sized from the resources its engine report """
+        pool = DockerHostPool.from_clients({'host1': fake_client(2, 1024**3),
+                                            'host2': fake_client(8, 4 * 1024**3)},
+                                           max_containers=3)
+        assert pool.remote
+        assert [(host.name, host.admission.cpus, host.admission.memory,
+                 host.admission.max_containers) for host in pool.hosts] == [
+            ('host1', 2, 1024**3, 3), ('host2', 8, 4 * 1024**3, 3)]
+
+    def test_from_clients_skip_unreachable(self):
+        """ unreachable hosts are left out, the pool fail if none is left """
+        down = MagicMock()
+        down.info.side_effect = docker.errors.DockerException("connection refused")
+        pool = DockerHostPool.from_clients({'down': down, 'up': fake_client()})
+        assert [host.name for host in pool.hosts] == ['up']
+        with self.assertRaises(docker.errors.DockerException):
+            DockerHostPool.from_clients({'down': down})
+
+    def test_acquire_least_loaded(self):
+        """ runs go to the host with the least runs per cpu """
+        pool = DockerHostPool.from_clients({'small': fake_client(cpus=1),
+                                            'large': fake_client(cpus=3)})
+        placed = [pool.acquire().name for _ in range(4)]
+        assert placed == ['small', 'large', 'large', 'large']
+        pool.release(pool.hosts[1])
+        pool.release(pool.hosts[1])
+        assert pool.acquire().name == 'large'
+
+    def test_acquire_preferred(self):
+        """ a resumed run go back to the host holding its volume, if still in the pool """
+        pool = DockerHostPool.from_clients({'small': fake_client(cpus=1),
+                                            'large': fake_client(cpus=3)})
+        assert pool.acquire('small').name == 'small'
+        assert pool.acquire('small').name == 'small'
+        assert pool.acquire('gone').name == 'large'
+
+    @patch("util.docker_pool.docker.DockerClient")
+    def test_from_env(self, mock_client):
+        """ hosts are read from CID_DOCKER_HOSTS, none configured give no pool """
+        mock_client.side_effect = lambda base_url, timeout: fake_client()
+        hosts = "tcp://10.0.0.5:2375, ssh://ci@runner2,tcp://10.0.0.5:2375"
+        with patch.dict(os.environ, {c.ENV_DOCKER_HOSTS: hosts}):
+            pool = DockerHostPool.from_env()
+        assert [host.name for host in pool.hosts] == ['tcp://10.0.0.5:2375', 'ssh://ci@runner2']
+        with patch.dict(os.environ, {c.ENV_DOCKER_HOSTS: ""}):
+            assert DockerHostPool.from_env() is None
+
+    def test_local(self):
+        """ local pool hold the engine of the environment only """
+        pool = DockerHostPool.local(max_containers=2)
+        assert not pool.remote
+        assert [(host.name, host.client) for host in pool.hosts] == [(c.LOCAL_DOCKER_HOST, None)]
+        assert pool.hosts[0].admission.max_containers == 2
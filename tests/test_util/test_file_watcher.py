@@ -0,0 +1,62 @@
+""" Test for the FileWatcher
+"""
+import os
+import tempfile
+import unittest
+from util.file_watcher import FileWatcher
+from util.common_utils import get_logger
+
+logger = get_logger("tests.test_util.test_file_watcher")
+
+
+class TestFileWatcher(unittest.TestCase):
+    """ Test the FileWatcher with inotify and with polling """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp.name, 'pipeline.yml')
+        self._write(self.file_path, 'global: {}')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _write(path: str, content: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def _check_changes(self, watcher: FileWatcher):
+        """ modified, created in new sub directory and deleted files are reported,
+        other suffixes are ignored
+        """
+        assert watcher.get_files() == [self.file_path]
+        assert watcher.wait(timeout=0.1) == set()
+
+        self._write(self.file_path, 'global: {pipeline_name: test}')
+        self._write(os.path.join(self.tmp.name, 'notes.txt'), 'ignored')
+        os.makedirs(os.path.join(self.tmp.name, 'sub'))
+        new_path = os.path.join(self.tmp.name, 'sub', 'other.yaml')
+        self._write(new_path, 'global: {}')
+        assert watcher.wait(timeout=5) == {self.file_path, new_path}
+
+        os.remove(self.file_path)
+        assert watcher.wait(timeout=5) == {self.file_path}
+        assert watcher.get_files() == [new_path]
+
+    def test_inotify(self):
+        """ changes are reported through inotify """
+        with FileWatcher(self.tmp.name) as watcher:
+            if not watcher.uses_inotify:
+                self.skipTest("inotify not available")
+            self._check_changes(watcher)
+
+    def test_polling(self):
+        """ changes are reported by polling when inotify is not used """
+        with FileWatcher(self.tmp.name, poll_interval=0.05, use_inotify=False) as watcher:
+            assert not watcher.uses_inotify
+            self._check_changes(watcher)
+
+    def test_invalid_directory(self):
+        """ missing directory is rejected """
+        with self.assertRaises(FileNotFoundError):
+            FileWatcher(os.path.join(self.tmp.name, 'missing'))
@@ -0,0 +1,231 @@
+""" Test for the MirrorCache, WorktreeManager and RemoteRefCache
+"""
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from git import (GitCommandError, Repo)
+from util.repo_cache import MirrorCache, WorktreeManager, RemoteRefCache
+from util.common_utils import get_logger
+
+logger = get_logger("tests.test_util.test_repo_cache")
+
+
+def make_source_repo(path: str) -> Repo:
+    """ Create a git repository with a single commit on main branch
+
+    Args:
+        path (str): directory to create the repo
+
+    Returns:
+        Repo: the created repository
+    """
+    repo = Repo.init(path, initial_branch='main')
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'tester')
+        writer.set_value('user', 'email', 'tester@example.com')
+    commit_file(repo, 'README.md', 'first')
+    return repo
+
+
+def commit_file(repo: Repo, file_name: str, content: str) -> str:
+    """ Write a file and commit it
+
+    Returns:
+        str: commit hash
+    """
+    with open(os.path.join(repo.working_tree_dir, file_name), 'w', encoding='utf-8') as f:
+        f.write(content)
+    repo.index.add([file_name])
+    return repo.index.commit(f"update {file_name}").hexsha
+
+
+class TestMirrorCache(unittest.TestCase):
+    """ Test the MirrorCache with local repositories as remote """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = make_source_repo(os.path.join(self.tmp.name, 'source'))
+        self.cache = MirrorCache(cache_dir=os.path.join(self.tmp.name, 'mirrors'),
+                                 max_size=10 * 1024 ** 2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalize_url(self):
+        """ different spelling of the same remote share one mirror """
+        urls = [
+            "git@github.com:Org/repo.git",
+            "https://github.com/Org/repo",
+            "https://GitHub.com/Org/repo.git/",
+            "ssh://git@github.com/Org/repo.git",
+        ]
+        normalized = {MirrorCache.normalize_url(url) for url in urls}
+        assert normalized == {"github.com/Org/repo"}
+        paths = {self.cache.get_mirror_path(url) for url in urls}
+        assert len(paths) == 1
+
+    def test_update_mirror_clone_then_fetch(self):
+        """ first call create the mirror, second call fetch new commits """
+        url = Path(self.source.working_tree_dir).as_uri()
+        mirror_path = self.cache.update_mirror(url)
+        assert mirror_path.is_dir()
+        mirror = Repo(mirror_path)
+        assert mirror.bare
+        first = mirror.commit('main').hexsha
+
+        new_commit = commit_file(self.source, 'README.md', 'second')
+        assert self.cache.update_mirror(url) == mirror_path
+        assert Repo(mirror_path).commit('main').hexsha == new_commit != first
+
+    def test_update_mirror_fetch_error(self):
+        """ a failed fetch keep a healthy mirror, only a corrupt mirror is cloned again """
+        url = Path(self.source.working_tree_dir).as_uri()
+        mirror_path = self.cache.update_mirror(url)
+        os.rename(self.source.working_tree_dir, os.path.join(self.tmp.name, 'moved'))
+        with self.assertRaises(GitCommandError):
+            self.cache.update_mirror(url)
+        assert Repo(mirror_path).commit('main')
+
+        os.rename(os.path.join(self.tmp.name, 'moved'), self.source.working_tree_dir)
+        os.remove(mirror_path / 'HEAD')
+        assert self.cache.update_mirror(url) == mirror_path
+        assert Repo(mirror_path).commit('main').hexsha == self.source.head.commit.hexsha
+
+    def test_evict_least_recently_used(self):
+        """ oldest mirror evicted first when over the size budget """
+        other = make_source_repo(os.path.join(self.tmp.name, 'other'))
+        first_path = self.cache.update_mirror(Path(self.source.working_tree_dir).as_uri())
+        os.utime(first_path, (0, 0))
+        self.cache.max_size = 1
+        second_path = self.cache.update_mirror(Path(other.working_tree_dir).as_uri())
+        assert not first_path.exists()
+        assert second_path.is_dir()
+
+    def test_disabled_cache(self):
+        """ zero size budget disable the cache """
+        assert not MirrorCache(cache_dir=self.tmp.name, max_size=0).enabled
+
+
+class TestWorktreeManager(unittest.TestCase):
+    """ Test the WorktreeManager with a local repository """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = make_source_repo(os.path.join(self.tmp.name, 'source'))
+        self.manager = WorktreeManager(root_dir=os.path.join(self.tmp.name, 'worktrees'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_acquire_shared_and_released(self):
+        """ same commit share one worktree, removed after the last release """
+        commit = self.repo.head.commit.hexsha
+        first = self.manager.acquire(self.repo, commit)
+        second = self.manager.acquire(self.repo, commit)
+        assert first == second
+        assert Repo(first).head.commit.hexsha == commit
+        assert not self.manager.release(first)
+        assert first.is_dir()
+        assert self.manager.release(first)
+        assert not first.exists()
+        assert len(self.repo.git.worktree('list').splitlines()) == 1
+
+    def test_acquire_different_commits(self):
+        """ different commits are checked out side by side without touching the main tree """
+        old_commit = self.repo.head.commit.hexsha
+        new_commit = commit_file(self.repo, 'README.md', 'second')
+        old_path = self.manager.acquire(self.repo, old_commit)
+        new_path = self.manager.acquire(self.repo, new_commit)
+        assert old_path != new_path
+        assert (old_path / 'README.md').read_text(encoding='utf-8') == 'first'
+        assert (new_path / 'README.md').read_text(encoding='utf-8') == 'second'
+        assert self.repo.head.commit.hexsha == new_commit
+        self.manager.release(old_path)
+        self.manager.release(new_path)
+
+    def test_acquire_stale_worktree(self):
+        """ worktree left behind without reference record is recreated """
+        commit = self.repo.head.commit.hexsha
+        path = self.manager.acquire(self.repo, commit)
+        self.manager._refs_path(path).unlink()
+        assert self.manager.acquire(self.repo, commit) == path
+        assert self.manager.release(path)
+
+    @staticmethod
+    def _dead_pid() -> int:
+        """ Id of a process that has exited """
+        process = subprocess.Popen(['true'])
+        process.wait()
+        return process.pid
+
+    def test_leaked_reference(self):
+        """ the references of a crashed process are dropped by the next acquire """
+        commit = self.repo.head.commit.hexsha
+        path = self.manager.acquire(self.repo, commit)
+        # the run crashed between acquire and release
+        refs = self.manager._read_refs(path)
+        refs['owners'] = {str(self._dead_pid()): 1}
+        self.manager._write_refs(path, refs)
+        (path / 'leftover').write_text('crashed run', encoding='utf-8')
+        assert self.manager.acquire(self.repo, commit) == path
+        assert not (path / 'leftover').exists()
+        assert self.manager.release(path)
+        assert not path.exists()
+
+    def test_prune(self):
+        """ worktrees of crashed processes are pruned, the ones in use are kept """
+        old_commit = self.repo.head.commit.hexsha
+        new_commit = commit_file(self.repo, 'README.md', 'second')
+        leaked = self.manager.acquire(self.repo, old_commit)
+        used = self.manager.acquire(self.repo, new_commit)
+        refs = self.manager._read_refs(leaked)
+        refs['owners'] = {str(self._dead_pid()): 2}
+        self.manager._write_refs(leaked, refs)
+        assert self.manager.prune(dry_run=True) == [leaked]
+        assert leaked.is_dir()
+        assert self.manager.prune() == [leaked]
+        assert not leaked.exists()
+        assert not self.manager._refs_path(leaked).exists()
+        assert used.is_dir()
+        assert len(self.repo.git.worktree('list').splitlines()) == 2
+        assert self.manager.release(used)
+
+
+class TestRemoteRefCache(unittest.TestCase):
+    """ Test the RemoteRefCache """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = make_source_repo(os.path.join(self.tmp.name, 'source'))
+        self.url = Path(self.source.working_tree_dir).as_uri()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_refs_heads_only(self):
+        """ branch heads and HEAD are listed, tags are skipped """
+        self.source.create_tag('v1')
+        head = self.source.head.commit.hexsha
+        refs = RemoteRefCache().get_refs(self.url)
+        assert refs == {"ref: HEAD": "refs/heads/main", "HEAD": head,
+                        "refs/heads/main": head}
+
+    def test_probe_once_within_ttl(self):
+        """ remote is probed once and reused until expired or invalidated """
+        cache = RemoteRefCache(ttl=60)
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value.stdout = "abc\trefs/heads/main\n"
+            assert cache.branch_exists(self.url, 'main')
+            assert not cache.branch_exists(self.url, 'dev')
+            assert cache.resolve_branch(self.url, 'main') == 'abc'
+            assert mock_run.call_count == 1
+            cache.invalidate(self.url)
+            assert cache.get_cached_refs(self.url) is None
+            cache.get_refs(self.url)
+            assert mock_run.call_count == 2
+            cache.ttl = 0
+            cache.get_refs(self.url)
+            assert mock_run.call_count == 3
@@ -4,8 +4,9 @@ import unittest
 from unittest.mock import patch, MagicMock
 from pathlib import Path
 from util.repo_manager import RepoManager
+from util.repo_cache import WorktreeManager
 from util.common_utils import get_logger
-from git import GitCommandError, InvalidGitRepositoryError
+from git import Repo, GitCommandError, InvalidGitRepositoryError
 import util.constant as c
 
 logger = get_logger("tests.test_util.test_repo_manager")
@@ -15,7 +16,7 @@ class TestRepoManager(unittest.TestCase):
     from unittest.mock import patch
 
     @patch("util.repo_manager.Path.iterdir", return_value=[])
-    @patch("util.repo_manager.Repo.clone_from")
+    @patch("util.repo_manager.git.Repo.clone_from")
     def test_validate_and_clone_repo_empty_dir(
             self, mock_clone_from, mock_iterdir):
         """Test validate_and_clone_repo with an empty directory and valid cloning."""
@@ -36,7 +37,45 @@ class TestRepoManager(unittest.TestCase):
             repo_details[c.FIELD_COMMIT_HASH], "sample_commit_hash")
 
     @patch("util.repo_manager.Path.iterdir", return_value=[])
-    @patch("util.repo_manager.Repo.clone_from",
+    @patch("util.repo_manager.git.Repo.clone_from")
+    def test_validate_and_clone_repo_from_mirror(
+            self, mock_clone_from, mock_iterdir):
+        """Test validate_and_clone_repo clone remote repo from the mirror cache."""
+        mock_cache = MagicMock()
+        mock_cache.enabled = True
+        mock_cache.update_mirror.return_value = Path("/mock/mirrors/repo.git")
+        repo_manager = RepoManager(mirror_cache=mock_cache)
+        mock_repo = MagicMock()
+        mock_clone_from.return_value = mock_repo
+        mock_repo.head.commit.hexsha = "sample_commit_hash"
+
+        success, _, _ = repo_manager.validate_and_clone_repo(
+            "https://github.com/sample/repo", branch=c.DEFAULT_BRANCH
+        )
+
+        self.assertTrue(success)
+        mock_cache.update_mirror.assert_called_once_with("https://github.com/sample/repo")
+        self.assertEqual(mock_clone_from.call_args.args[0], "/mock/mirrors/repo.git")
+        mock_repo.remote.return_value.set_url.assert_called_once_with(
+            "https://github.com/sample/repo")
+
+    @patch("util.repo_manager.git.Repo.clone_from")
+    def test_validate_and_clone_repo_missing_branch_from_probe(self, mock_clone_from):
+        """Test validate_and_clone_repo fail before cloning when the probed refs lack the branch."""
+        remote_refs = MagicMock()
+        remote_refs.get_cached_refs.return_value = {"refs/heads/main": "abc"}
+        repo_manager = RepoManager(mirror_cache=MagicMock(), remote_refs=remote_refs)
+
+        success, message, details = repo_manager.validate_and_clone_repo(
+            "https://github.com/sample/repo", branch="dev")
+
+        self.assertFalse(success)
+        self.assertIn("Branch 'dev' does not exist remotely", message)
+        self.assertEqual(details, {})
+        mock_clone_from.assert_not_called()
+
+    @patch("util.repo_manager.Path.iterdir", return_value=[])
+    @patch("util.repo_manager.git.Repo.clone_from",
            side_effect=GitCommandError("clone", "error"))
     def test_validate_and_clone_repo_clone_failure(
             self, mock_clone_from, mock_iterdir):
@@ -90,7 +129,7 @@ class TestRepoManager(unittest.TestCase):
         self.assertEqual(
             result, (False, False, "Repository https://invalid-url/repo is invalid."))
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_is_current_dir_repo_in_git_repo(self, mock_repo):
         """Test is_current_dir_repo when the current directory is a Git repository."""
         repo_manager = RepoManager()
@@ -104,7 +143,7 @@ class TestRepoManager(unittest.TestCase):
             self.assertEqual(repo_name, "repo")
             self.assertTrue(is_in_root)
 
-    @patch("util.repo_manager.Repo", side_effect=InvalidGitRepositoryError)
+    @patch("util.repo_manager.git.Repo", side_effect=InvalidGitRepositoryError)
     def test_is_current_dir_repo_not_in_git_repo(self, mock_repo):
         """Test is_current_dir_repo when the current directory is not a Git repository."""
         repo_manager = RepoManager()
@@ -139,7 +178,7 @@ class TestRepoManager(unittest.TestCase):
             mock_unlink.assert_called_once_with()
             mock_rmtree.assert_called_once_with(mock_dir)
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_get_current_repo_details_success(self, mock_repo):
         """Test get_current_repo_details when in a Git repository."""
         repo_manager = RepoManager()
@@ -160,7 +199,7 @@ class TestRepoManager(unittest.TestCase):
             self.assertEqual(result[c.FIELD_BRANCH], c.DEFAULT_BRANCH)
             self.assertEqual(result[c.FIELD_COMMIT_HASH], "123abc")
 
-    @patch("util.repo_manager.Repo", side_effect=InvalidGitRepositoryError)
+    @patch("util.repo_manager.git.Repo", side_effect=InvalidGitRepositoryError)
     def test_get_current_repo_details_not_in_git_repo(self, mock_repo):
         """Test get_current_repo_details when not in a Git repository."""
         repo_manager = RepoManager()
@@ -227,16 +266,17 @@ class TestRepoManager(unittest.TestCase):
             message.lower())
         self.assertEqual(repo_details, {})
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_checkout_branch_and_commit_remote_branch_exists(self, mock_repo):
         """Test checkout_branch_and_commit when the branch exists remotely."""
-        repo_manager = RepoManager()
+        remote_refs = MagicMock()
+        remote_refs.branch_exists.return_value = True
+        repo_manager = RepoManager(remote_refs=remote_refs)
         mock_instance = mock_repo.return_value
 
         # Mock clean repository and remote branch
         mock_instance.is_dirty.return_value = False
         mock_instance.branches = []
-        mock_instance.git.ls_remote.return_value = "refs/heads/feature-branch"
         mock_instance.iter_commits.return_value = [MagicMock(hexsha="123abc")]
 
         # Mock the latest commit as "123abc"
@@ -258,15 +298,17 @@ class TestRepoManager(unittest.TestCase):
             "-b", "feature-branch", "origin/feature-branch"
         )
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_checkout_branch_and_commit_invalid_remote_branch(self, mock_repo):
         """Test checkout_branch_and_commit when the remote branch does not exist."""
-        repo_manager = RepoManager()
+        remote_refs = MagicMock()
+        remote_refs.branch_exists.return_value = False
+        repo_manager = RepoManager(remote_refs=remote_refs)
         mock_instance = mock_repo.return_value
 
         # Mock clean repository and no remote branch
         mock_instance.is_dirty.return_value = False
-        mock_instance.git.ls_remote.return_value = ""
+        mock_instance.remote.return_value.url = "https://github.com/sample/repo"
 
         # Call the method
         success, message = repo_manager.checkout_branch_and_commit(
@@ -274,10 +316,10 @@ class TestRepoManager(unittest.TestCase):
 
         self.assertFalse(success)
         self.assertIn("does not exist remotely", message)
-        mock_instance.git.ls_remote.assert_called_once_with(
-            "--heads", "origin", "nonexistent-branch")
+        remote_refs.branch_exists.assert_called_once_with(
+            "https://github.com/sample/repo", "nonexistent-branch")
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_checkout_branch_and_commit_valid_commit_hash(self, mock_repo):
         """Test checkout_branch_and_commit with a valid commit hash."""
         repo_manager = RepoManager()
@@ -298,7 +340,7 @@ class TestRepoManager(unittest.TestCase):
         # mock_instance.git.execute.assert_called_once_with(
         #    ["git", "reset", "--hard", "123abc"])
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_checkout_branch_and_commit_invalid_commit_hash(self, mock_repo):
         """Test checkout_branch_and_commit with an invalid commit hash."""
         repo_manager = RepoManager()
@@ -322,7 +364,7 @@ class TestRepoManager(unittest.TestCase):
             "Commit 'invalid' does not exist on local branch 'main'.", message)
         # mock_instance.git.checkout.assert_called_once_with(c.DEFAULT_BRANCH)
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_checkout_branch_and_commit_with_unstaged_changes(self, mock_repo):
         """Test checkout_branch_and_commit when there are unstaged changes."""
         repo_manager = RepoManager()
@@ -339,7 +381,7 @@ class TestRepoManager(unittest.TestCase):
         self.assertIn("Unstaged changes detected", message)
         mock_instance.git.checkout.assert_not_called()
 
-    @patch("util.repo_manager.Repo")
+    @patch("util.repo_manager.git.Repo")
     def test_checkout_commit_after_clone_branch_exists_locally(self, mock_repo):
         """Test _checkout_commit_after_clone when the branch exists locally."""
         repo_manager = RepoManager()
@@ -364,15 +406,16 @@ class TestRepoManager(unittest.TestCase):
         mock_instance.git.execute.assert_called_once_with(
             ["git", "reset", "--hard", "123abc"])
 
-    @patch("util.repo_manager.Repo")
+    @patch("util.repo_manager.git.Repo")
     def test_checkout_commit_after_clone_branch_does_not_exist_locally(self, mock_repo):
         """Test _checkout_commit_after_clone when the branch exists remotely but not locally."""
-        repo_manager = RepoManager()
+        remote_refs = MagicMock()
+        remote_refs.branch_exists.return_value = True
+        repo_manager = RepoManager(remote_refs=remote_refs)
         mock_instance = mock_repo.return_value
 
         # Simulate branch absence locally and presence remotely
         mock_instance.branches = []
-        mock_instance.git.ls_remote.return_value = "refs/heads/main"
         mock_instance.iter_commits.return_value = [
             MagicMock(hexsha="123abc"), MagicMock(hexsha="456def")
         ]
@@ -394,7 +437,7 @@ class TestRepoManager(unittest.TestCase):
         mock_instance.git.execute.assert_called_once_with(
             ["git", "reset", "--hard", "123abc"])
 
-    @patch("util.repo_manager.Repo")
+    @patch("util.repo_manager.git.Repo")
     def test_checkout_commit_after_clone_invalid_commit(self, mock_repo):
         """Test _checkout_commit_after_clone when the commit hash is invalid."""
         repo_manager = RepoManager()
@@ -419,15 +462,17 @@ class TestRepoManager(unittest.TestCase):
         mock_instance.git.checkout.assert_called_once_with(c.DEFAULT_BRANCH)
         mock_instance.git.execute.assert_not_called()
 
-    @patch("util.repo_manager.Repo")
+    @patch("util.repo_manager.git.Repo")
     def test_checkout_commit_after_clone_branch_does_not_exist_remotely(self, mock_repo):
         """Test _checkout_commit_after_clone when the branch does not exist remotely."""
-        repo_manager = RepoManager()
+        remote_refs = MagicMock()
+        remote_refs.branch_exists.return_value = False
+        repo_manager = RepoManager(remote_refs=remote_refs)
         mock_instance = mock_repo.return_value
 
         # Simulate branch absence locally and remotely
         mock_instance.branches = []
-        mock_instance.git.ls_remote.return_value = ""
+        mock_instance.remote.return_value.url = "https://github.com/sample/repo"
 
         # Call the method
         success, message = repo_manager._checkout_commit_after_clone(
@@ -438,15 +483,15 @@ class TestRepoManager(unittest.TestCase):
         self.assertFalse(success)
         self.assertIn(
             "Branch 'nonexistent-branch' does not exist remotely.", message)
-        mock_instance.git.ls_remote.assert_called_once_with("--heads",
-                                                            "origin", "nonexistent-branch")
+        remote_refs.branch_exists.assert_called_once_with(
+            "https://github.com/sample/repo", "nonexistent-branch")
         mock_instance.git.fetch.assert_not_called()
         mock_instance.git.checkout.assert_not_called()
 
-    @patch("util.repo_manager.Repo")
+    @patch("util.repo_manager.git.Repo")
     def test_checkout_commit_after_clone_git_command_error(self, mock_repo):
         """Test _checkout_commit_after_clone when a GitCommandError is raised."""
-        repo_manager = RepoManager()
+        repo_manager = RepoManager(remote_refs=MagicMock())
         mock_instance = mock_repo.return_value
 
         # Simulate a GitCommandError
@@ -463,7 +508,7 @@ class TestRepoManager(unittest.TestCase):
         self.assertFalse(success)
         self.assertIn("Error during checkout", message)
 
-    @patch("util.repo_manager.Repo")
+    @patch("util.repo_manager.git.Repo")
     def test_checkout_commit_after_clone_branch_exists_but_commit_not_found(self, mock_repo):
         """Test _checkout_commit_after_clone when branch exists but the commit is not found."""
         repo_manager = RepoManager()
@@ -486,7 +531,7 @@ class TestRepoManager(unittest.TestCase):
         mock_instance.git.checkout.assert_called_once_with(c.DEFAULT_BRANCH)
         mock_instance.git.execute.assert_not_called()
 
-    @patch("util.repo_manager.Repo", autospec=True)
+    @patch("util.repo_manager.git.Repo", autospec=True)
     def test_checkout_branch_and_commit_success(self, mock_repo):
         """Test checkout_branch_and_commit with valid branch and commit hash."""
         repo_manager = RepoManager()
@@ -513,3 +558,92 @@ class TestRepoManager(unittest.TestCase):
         # Assert branch and commit actions
         # mock_instance.git.checkout.assert_called_once_with(c.DEFAULT_BRANCH)
         # mock_instance.git.execute.assert_called_once_with(["git", "reset", "--hard", "123abc"])
+
+
+class TestRepoManagerWorktree(unittest.TestCase):
+    """ Test the worktree checkout with a real local repository """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo_path = Path(self.tmp.name) / 'source'
+        self.repo = Repo.init(self.repo_path, initial_branch=c.DEFAULT_BRANCH)
+        with self.repo.config_writer() as writer:
+            writer.set_value('user', 'name', 'tester')
+            writer.set_value('user', 'email', 'tester@example.com')
+        self.first_commit = self._commit('first')
+        self.repo.git.checkout('-b', 'feature')
+        self.feature_commit = self._commit('feature')
+        self.repo.git.checkout(c.DEFAULT_BRANCH)
+        self.repo_manager = RepoManager(
+            worktree_manager=WorktreeManager(root_dir=Path(self.tmp.name) / 'worktrees'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _commit(self, content: str) -> str:
+        (self.repo_path / 'README.md').write_text(content, encoding='utf-8')
+        self.repo.index.add(['README.md'])
+        return self.repo.index.commit(content).hexsha
+
+    def test_acquire_worktree_branch_with_dirty_checkout(self):
+        """ other branch is materialized even when the developer checkout is dirty """
+        (self.repo_path / 'README.md').write_text('uncommitted', encoding='utf-8')
+        success, _, details = self.repo_manager.acquire_worktree(
+            branch='feature', repo_path=str(self.repo_path))
+        self.assertTrue(success)
+        self.assertEqual(details[c.FIELD_BRANCH], 'feature')
+        self.assertEqual(details[c.FIELD_COMMIT_HASH], self.feature_commit)
+        worktree_readme = Path(details['worktree_path']) / 'README.md'
+        self.assertEqual(worktree_readme.read_text(encoding='utf-8'), 'feature')
+        # developer checkout untouched
+        self.assertEqual(self.repo.active_branch.name, c.DEFAULT_BRANCH)
+        self.assertEqual((self.repo_path / 'README.md').read_text(encoding='utf-8'),
+                         'uncommitted')
+        self.assertTrue(self.repo_manager.release_worktree(details['worktree_path']))
+        self.assertFalse(Path(details['worktree_path']).exists())
+
+    def test_acquire_worktree_commit_not_on_branch(self):
+        """ commit from another branch is rejected """
+        success, message, details = self.repo_manager.acquire_worktree(
+            branch=c.DEFAULT_BRANCH, commit_hash=self.feature_commit,
+            repo_path=str(self.repo_path))
+        self.assertFalse(success)
+        self.assertIn("does not exist on branch", message)
+        self.assertEqual(details, {})
+
+    def test_acquire_worktree_invalid_branch(self):
+        """ unknown branch without remote is rejected """
+        success, message, _ = self.repo_manager.acquire_worktree(
+            branch='unknown', repo_path=str(self.repo_path))
+        self.assertFalse(success)
+        self.assertIn("Branch 'unknown' does not exist", message)
+
+    def test_list_commits(self):
+        """ range listed oldest first, revision list resolved in given order """
+        second_commit = self._commit('second')
+        success, _, commits = self.repo_manager.list_commits(
+            rev_range=f"{self.first_commit}..{c.DEFAULT_BRANCH}", repo_path=str(self.repo_path))
+        self.assertTrue(success)
+        self.assertEqual(commits, [second_commit])
+
+        success, _, commits = self.repo_manager.list_commits(
+            revisions=[second_commit[:8], self.first_commit], repo_path=str(self.repo_path))
+        self.assertTrue(success)
+        self.assertEqual(commits, [second_commit, self.first_commit])
+
+        success, message, commits = self.repo_manager.list_commits(
+            revisions=['unknown'], repo_path=str(self.repo_path))
+        self.assertFalse(success)
+        self.assertIn("Invalid commit range or revision", message)
+
+    def test_get_changed_files(self):
+        """ files changed between two commits, None for unknown commit """
+        (self.repo_path / 'service').mkdir()
+        (self.repo_path / 'service' / 'app.py').write_text('app', encoding='utf-8')
+        self.repo.index.add(['service/app.py'])
+        second_commit = self.repo.index.commit('add service').hexsha
+        changed = self.repo_manager.get_changed_files(
+            self.first_commit, second_commit, repo_path=str(self.repo_path))
+        self.assertEqual(changed, ['service/app.py'])
+        self.assertIsNone(self.repo_manager.get_changed_files(
+            '0' * 40, second_commit, repo_path=str(self.repo_path)))
@@ -1,10 +1,13 @@
 import os
 import json
+import tempfile
 import unittest
+from unittest.mock import patch
 from collections import OrderedDict
 import ruamel.yaml
 import util.constant as c
 from util.yaml_parser import YamlParser
+from util.config_cache import ConfigCache
 from util.config_tools import ConfigChecker
 from util.common_utils import get_logger
 logger = get_logger("tests.test_util.test_yaml_parser")
@@ -151,3 +154,90 @@ class TestYamlParser(unittest.TestCase):
         result_dict = result.model_dump(by_alias=True)
         expected_dict = self.expected_ans_json['test_validate_config_invalid']
         assert result_dict == expected_dict
+
+    def test_get_pipeline_files_cached(self):
+        """ Test unchanged files are not parsed again to locate a pipeline
+        """
+        valid_dir = os.path.join(os.path.dirname(__file__), 'test_data/valid_directory/')
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ConfigCache(cache_dir=tmp)
+            expected = YamlParser(cache=cache).get_pipeline_files(valid_dir)
+            assert expected["valid_pipeline"] == os.path.join(valid_dir, "valid_config.yml")
+
+            parser = YamlParser(cache=ConfigCache(cache_dir=tmp))
+            with patch.object(parser, "_read_pipeline_name") as mock_read:
+                assert parser.get_pipeline_files(valid_dir) == expected
+                mock_read.assert_not_called()
+            extracted = parser.parse_yaml_by_pipeline_name("valid_pipeline", valid_dir)
+            assert extracted.pipeline_config == self.expected_ans_json['test_parse_yaml_file_valid']
+
+    def test_duplicate_pipeline_name_cached(self):
+        """ Test duplicate pipeline names are still reported with a warm cache
+        """
+        duplicate_name_path = os.path.join(os.path.dirname(__file__),
+                                           'test_data/duplicate_pipeline_name')
+        with tempfile.TemporaryDirectory() as tmp:
+            for _ in range(2):
+                with self.assertRaisesRegex(ValueError, "Duplicate key error"):
+                    YamlParser(cache=ConfigCache(cache_dir=tmp)).get_pipeline_files(
+                        duplicate_name_path)
+
+    def test_parse_yaml_by_pipeline_name_prescan(self):
+        """ Test only the target file is fully parsed when locating a pipeline by name
+        """
+        valid_dir = os.path.join(os.path.dirname(__file__), 'test_data/valid_directory/')
+        with patch.object(self.parser.yaml, "load", wraps=self.parser.yaml.load) as mock_load:
+            extracted = self.parser.parse_yaml_by_pipeline_name("cycle_pipeline", valid_dir)
+        assert extracted.pipeline_file_name == "cycle_config.yml"
+        # duplicate_keys.yml cannot be determined by the pre-scan and is fully parsed
+        assert mock_load.call_count == 2
+
+    def test_scan_pipeline_name_fallback(self):
+        """ Test the pre-scan give up on alias and on later duplicate definition of a
+        pipeline_name declared by a broken file
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            alias_file = os.path.join(tmp, 'alias.yml')
+            with open(alias_file, 'w', encoding='utf-8') as f:
+                f.write("name: &name aliased\nglobal:\n  pipeline_name: *name\n")
+            assert self.parser._scan_pipeline_name(alias_file) is None
+            assert self.parser.get_pipeline_files(tmp) == {"aliased": alias_file}
+
+            # a file with the same name but a duplicate key outside the global section
+            broken_file = os.path.join(tmp, 'broken.yml')
+            with open(broken_file, 'w', encoding='utf-8') as f:
+                f.write("global:\n  pipeline_name: aliased\nstages: [a]\nstages: [b]\n")
+            assert self.parser._scan_pipeline_name(broken_file) == "aliased"
+            assert YamlParser().get_pipeline_file("aliased", tmp) == alias_file
+
+    def test_parse_yaml_file_without_lc(self):
+        """ Test the fast path return the same content without line information
+        """
+        valid_file_path = os.path.join(os.path.dirname(__file__),
+                                       'test_data/valid_directory/valid_config.yml')
+        extracted = self.parser.parse_yaml_file(valid_file_path, track_lc=False)
+        assert extracted == self.expected_ans_json['test_parse_yaml_file_valid']
+        assert not hasattr(extracted[c.KEY_GLOBAL][c.KEY_PIPE_NAME], 'lc')
+
+        duplicate_keys_path = os.path.join(os.path.dirname(__file__),
+                                           'test_data/valid_directory/duplicate_keys.yml')
+        with self.assertRaises(ruamel.yaml.YAMLError):
+            self.parser.parse_yaml_file(duplicate_keys_path, track_lc=False)
+
+    def test_parse_yaml_file_after_index(self):
+        """ Test the content parsed by the index is not returned once the file changed,
+        nor for the fast path
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            yaml_file = os.path.join(tmp, 'pipeline.yml')
+            with open(yaml_file, 'w', encoding='utf-8') as f:
+                f.write("name: &name first\nglobal:\n  pipeline_name: *name\n")
+            assert self.parser.get_pipeline_file("first", tmp) == yaml_file
+            extracted = self.parser.parse_yaml_file(yaml_file, track_lc=False)
+            assert not hasattr(extracted[c.KEY_GLOBAL][c.KEY_PIPE_NAME], 'lc')
+
+            self.parser.get_pipeline_files(tmp)
+            with open(yaml_file, 'w', encoding='utf-8') as f:
+                f.write("global:\n  pipeline_name: second_name\n")
+            extracted = self.parser.parse_yaml_file(yaml_file)
+            assert extracted[c.KEY_GLOBAL][c.KEY_PIPE_NAME] == "second_name"